@@ -61,6 +61,7 @@ def create_app():
     from routes.timetable_routes import timetable_bp
     from routes.marks_routes import marks_bp
     from routes.ai_routes import ai_bp
+    from routes.upload_routes import upload_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(classroom_bp)
@@ -76,6 +77,7 @@ def create_app():
     app.register_blueprint(timetable_bp)
     app.register_blueprint(marks_bp)
     app.register_blueprint(ai_bp)
+    app.register_blueprint(upload_bp)
 
     import os as _os
     _os.makedirs(_os.path.join(_os.getcwd(), 'uploads', 'avatars'), exist_ok=True)
@@ -101,10 +103,12 @@ def create_app():
     
     @app.route('/api/health', methods=['GET'])
     def health_check():
+        from utils import storage
         return jsonify({
             'status': 'healthy',
             'service': 'IAPS Backend API',
-            'version': '1.0.0'
+            'version': '1.0.0',
+            'storage_cache': storage.cache_stats(),
         }), 200
     
     @app.route('/', methods=['GET'])
@@ -0,0 +1,178 @@
+"""
+marks_benchmark.py — per-document loop vs utils.marks_analytics for whole-class
+marks analytics.
+
+Generates a synthetic class (students × the exam structure below), then times
+two ways of producing the same report — every student's weighted score,
+percentile rank and z-score, per-exam means, and the percentage each student
+needs in their remaining exams to reach a target:
+
+  loop        — marks_stats.weighted_score per document plus plain-Python
+                ranking, the way the routes worked before marks_analytics
+  vectorized  — ClassMarks.load once, then the NumPy passes
+
+Both paths are checked against each other before any timing is reported.
+
+    python -m benchmarks.marks_benchmark
+    python -m benchmarks.marks_benchmark --students 500 2000 10000 --repeat 5
+    python -m benchmarks.marks_benchmark --out report.json
+
+Needs NumPy only — no MongoDB.
+"""
+import os
+import sys
+import json
+import time
+import random
+import bisect
+import argparse
+import statistics
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+import numpy as np
+
+from utils.marks_stats import weighted_score, exam_key
+from utils.marks_analytics import ClassMarks
+
+STRUCTURE = [
+    {'name': 'Quiz 1', 'max_marks': 10.0, 'weightage': 5.0},
+    {'name': 'Quiz 2', 'max_marks': 10.0, 'weightage': 5.0},
+    {'name': 'Mid', 'max_marks': 50.0, 'weightage': 25.0},
+    {'name': 'Lab', 'max_marks': 40.0, 'weightage': 15.0},
+    {'name': 'End', 'max_marks': 100.0, 'weightage': 50.0},
+]
+TARGET = 70.0
+
+
+def make_class(n, seed=0, completion=0.8):
+    """n synthetic subject_marks documents; each student has entered each
+    exam with probability `completion`."""
+    rng = random.Random(seed)
+    docs = []
+    for i in range(n):
+        ability = rng.uniform(0.3, 1.0)
+        entries = []
+        for e in STRUCTURE:
+            if rng.random() > completion:
+                continue
+            obtained = round(min(e['max_marks'], max(0.0, rng.gauss(ability, 0.1) * e['max_marks'])), 1)
+            entries.append({**e, 'marks_obtained': obtained})
+        docs.append({'user_id': f'u{i}', 'entries': entries, 'grade': ''})
+    return docs
+
+
+def loop_report(structure, docs, target):
+    """The per-document version of ClassMarks' report."""
+    scores = [weighted_score(d['entries']) for d in docs]
+    scored = sorted(s for s in scores if s is not None)
+    n = len(scored)
+    mean = sum(scored) / n if n else 0.0
+    std = (sum((s - mean) ** 2 for s in scored) / n) ** 0.5 if n else 0.0
+    percentiles, z_scores = [], []
+    for s in scores:
+        if s is None:
+            percentiles.append(None)
+            z_scores.append(None)
+            continue
+        below = bisect.bisect_left(scored, s)
+        upto = bisect.bisect_right(scored, s)
+        percentiles.append((below + (upto - below) / 2) / n * 100)
+        z_scores.append((s - mean) / std if std > 0 else 0.0)
+
+    exam_means = []
+    for e in structure:
+        key = exam_key(e['name'])
+        pcts = [
+            float(x['marks_obtained']) / float(x['max_marks']) * 100
+            for d in docs for x in d['entries']
+            if exam_key(x['name']) == key and float(x['max_marks']) > 0
+        ]
+        exam_means.append(sum(pcts) / len(pcts) if pcts else None)
+
+    needed = []
+    for d in docs:
+        done = {exam_key(x['name']) for x in d['entries']}
+        current = sum(
+            float(x['marks_obtained']) / float(x['max_marks']) * float(x['weightage'])
+            for x in d['entries'] if float(x['max_marks']) > 0
+        )
+        remaining = sum(float(e['weightage']) for e in structure if exam_key(e['name']) not in done)
+        gap = target - current
+        needed.append(0.0 if gap <= 0 else (gap * 100 / remaining if remaining > 0 else None))
+    return {'scores': scores, 'percentiles': percentiles, 'z_scores': z_scores,
+            'exam_means': exam_means, 'needed': needed}
+
+
+def vectorized_report(structure, docs, target):
+    cm = ClassMarks.load(structure, docs)
+    scores = cm.scores()
+    pct, z = cm.standing()
+    exams = cm.exam_difficulty()
+    _, _, needed, _ = cm.what_if(target)
+    return {'scores': scores, 'percentiles': pct, 'z_scores': z,
+            'exam_means': [e['mean_pct'] for e in exams], 'needed': needed}
+
+
+def _as_array(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def check_agreement(a, b):
+    """Raise AssertionError if the two reports differ beyond rounding."""
+    for key in ('scores', 'percentiles', 'z_scores', 'needed'):
+        np.testing.assert_allclose(_as_array(a[key]), _as_array(b[key]), atol=0.011, err_msg=key)
+    np.testing.assert_allclose(_as_array(a['exam_means']), _as_array(b['exam_means']), atol=0.011,
+                               err_msg='exam_means')
+
+
+def _time(fn, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - start) * 1000)
+    return statistics.median(runs)
+
+
+def run(sizes, repeat=3, seed=0):
+    rows = []
+    for n in sizes:
+        docs = make_class(n, seed)
+        check_agreement(loop_report(STRUCTURE, docs, TARGET), vectorized_report(STRUCTURE, docs, TARGET))
+        loop_ms = _time(lambda: loop_report(STRUCTURE, docs, TARGET), repeat)
+        vec_ms = _time(lambda: vectorized_report(STRUCTURE, docs, TARGET), repeat)
+        load_ms = _time(lambda: ClassMarks.load(STRUCTURE, docs), repeat)
+        rows.append({
+            'students': n,
+            'loop_ms': round(loop_ms, 2),
+            'vectorized_ms': round(vec_ms, 2),
+            'vectorized_load_ms': round(load_ms, 2),
+            'speedup': round(loop_ms / vec_ms, 1) if vec_ms else None,
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, nargs='+', default=[100, 500, 2000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write the rows as JSON here')
+    args = parser.parse_args(argv)
+
+    rows = run(args.students, args.repeat, args.seed)
+    print(f"{'students':>9} {'loop ms':>10} {'numpy ms':>10} {'(load)':>8} {'speedup':>8}")
+    for r in rows:
+        print(f"{r['students']:>9} {r['loop_ms']:>10.2f} {r['vectorized_ms']:>10.2f} "
+              f"{r['vectorized_load_ms']:>8.2f} {r['speedup']:>7}x")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(rows, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+rag_benchmark.py — offline retrieval benchmark for the AI Study Tools RAG pipeline.
+
+Runs routes.ai_routes._hybrid_rag against a fixture corpus of PDFs with labeled
+question → chunk pairs, so a retrieval change (fusion weights, candidate_n,
+turning the cross-encoder off, a different Chroma backend) can be judged on
+recall@k / MRR / per-stage latency before it ever sees production traffic.
+The production `ai_rag_metrics` collection only knows how many chunks came
+back and how long it took — it can't tell a good retrieval from a bad one.
+
+    python -m benchmarks.rag_benchmark
+    python -m benchmarks.rag_benchmark --k 1 3 5 --out report.json
+    python -m benchmarks.rag_benchmark --save-baseline benchmarks/rag_baseline.json
+    python -m benchmarks.rag_benchmark --baseline benchmarks/rag_baseline.json
+
+With --baseline, exits non-zero if any configuration regressed beyond the
+tolerances (quality drops are absolute, latency is relative to baseline p95).
+
+Manifest format (benchmarks/fixtures/rag/manifest.json):
+    {
+      "documents": [
+        {"id": "thermo", "file": "thermodynamics.pdf",
+         "queries": [{"question": "...", "relevant": [0, 1]}]}
+      ],
+      "configs": [{"name": "...", "rerank": true, "candidate_n": 15, "backend": "local"}]
+    }
+`rerank` takes anything _hybrid_rag accepts: true/false, or a RAG_RERANK_MODE
+value ('always' / 'adaptive' / 'off').
+`relevant` holds chunk indices as produced by ai_routes._chunk_text — the same
+`chunk_index` stored in Chroma metadata. `configs` is optional; DEFAULT_CONFIGS
+is used when it's missing.
+
+Needs the AI extras from requirements.txt (PyMuPDF, chromadb,
+sentence-transformers, rank-bm25) but no MongoDB and no Groq key — the corpus
+is indexed straight into a throwaway Chroma client, never the app's own.
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+BACKEND_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND_ROOT not in sys.path:
+    sys.path.insert(0, BACKEND_ROOT)
+
+DEFAULT_MANIFEST = os.path.join(BACKEND_ROOT, 'benchmarks', 'fixtures', 'rag', 'manifest.json')
+
+STAGES = ('embed', 'vector', 'bm25', 'rrf', 'rerank')
+
+DEFAULT_CONFIGS = [
+    {'name': 'hybrid+rerank',        'rerank': True,       'candidate_n': None, 'backend': 'local'},
+    {'name': 'hybrid',               'rerank': False,      'candidate_n': None, 'backend': 'local'},
+    {'name': 'hybrid+adaptive',      'rerank': 'adaptive', 'candidate_n': None, 'backend': 'local'},
+    {'name': 'hybrid+rerank (c=8)',  'rerank': True,       'candidate_n': 8,    'backend': 'local'},
+    {'name': 'hybrid+rerank (c=30)', 'rerank': True,       'candidate_n': 30,   'backend': 'local'},
+    {'name': 'hybrid+rerank (http)', 'rerank': True,       'candidate_n': None, 'backend': 'http'},
+]
+
+
+# ── Metrics ────────────────────────────────────────────────────────────────────
+
+def recall_at_k(ranked: list, relevant, k: int) -> float:
+    """Fraction of the relevant chunk indices that appear in the top k."""
+    relevant = set(relevant)
+    if not relevant:
+        return 0.0
+    return len(relevant.intersection(ranked[:k])) / len(relevant)
+
+
+def reciprocal_rank(ranked: list, relevant) -> float:
+    """1/rank of the first relevant chunk, 0 if none was retrieved."""
+    relevant = set(relevant)
+    for pos, idx in enumerate(ranked, start=1):
+        if idx in relevant:
+            return 1.0 / pos
+    return 0.0
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile — same convention as get_rag_metrics' p95."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = max(0, int(round(len(ordered) * pct / 100.0)) - 1)
+    return ordered[min(idx, len(ordered) - 1)]
+
+
+def _latency_summary(values: list) -> dict:
+    if not values:
+        return {'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0}
+    return {
+        'mean_ms': round(sum(values) / len(values), 2),
+        'p50_ms':  round(percentile(values, 50), 2),
+        'p95_ms':  round(percentile(values, 95), 2),
+    }
+
+
+def summarize(per_query: list, ks: list) -> dict:
+    """Aggregate per-query results ({'ranked', 'relevant', 'timings', 'total_ms'})
+    into one config's report row."""
+    n = len(per_query)
+    report = {'queries': n}
+    for k in ks:
+        report[f'recall@{k}'] = round(
+            sum(recall_at_k(q['ranked'], q['relevant'], k) for q in per_query) / n, 4) if n else 0.0
+    report['mrr'] = round(sum(reciprocal_rank(q['ranked'], q['relevant']) for q in per_query) / n, 4) if n else 0.0
+    report['latency'] = {
+        stage: _latency_summary([q['timings'][stage] for q in per_query if stage in q['timings']])
+        for stage in STAGES
+    }
+    report['latency']['total'] = _latency_summary([q['total_ms'] for q in per_query])
+    decisions = {}
+    for q in per_query:
+        if q.get('rerank'):
+            decisions[q['rerank']] = decisions.get(q['rerank'], 0) + 1
+    report['rerank_decisions'] = decisions
+    return report
+
+
+def find_regressions(report: dict, baseline: dict, quality_tol: float = 0.02,
+                     latency_tol: float = 0.25) -> list:
+    """Compare two reports config-by-config. Quality metrics (recall@k, mrr) may
+    drop by at most `quality_tol` absolute; total p95 latency may grow by at most
+    `latency_tol` relative. Configs missing from either side are skipped."""
+    problems = []
+    for name, base in baseline.get('configs', {}).items():
+        cur = report.get('configs', {}).get(name)
+        if not cur or cur.get('skipped') or base.get('skipped'):
+            continue
+        for metric, base_val in base.items():
+            if not (metric.startswith('recall@') or metric == 'mrr'):
+                continue
+            cur_val = cur.get(metric)
+            if cur_val is not None and cur_val < base_val - quality_tol:
+                problems.append(f'{name}: {metric} {base_val:.3f} -> {cur_val:.3f}')
+        base_p95 = base.get('latency', {}).get('total', {}).get('p95_ms')
+        cur_p95  = cur.get('latency', {}).get('total', {}).get('p95_ms')
+        if base_p95 and cur_p95 and cur_p95 > base_p95 * (1 + latency_tol):
+            problems.append(f'{name}: p95 latency {base_p95:.1f}ms -> {cur_p95:.1f}ms')
+    return problems
+
+
+# ── Corpus indexing ────────────────────────────────────────────────────────────
+
+def _make_backend(kind: str, workdir: str):
+    """Build a Chroma client for one benchmark backend, or None if it can't be
+    used here ('http' needs CHROMA_HOST pointing at a running server)."""
+    import chromadb
+    if kind == 'local':
+        return chromadb.PersistentClient(path=os.path.join(workdir, 'chroma'))
+    if kind == 'http':
+        host = os.environ.get('CHROMA_HOST', '').strip()
+        if not host:
+            return None
+        return chromadb.HttpClient(host=host, port=int(os.environ.get('CHROMA_PORT', '8000')))
+    raise ValueError(f'Unknown backend: {kind}')
+
+
+def load_corpus(manifest_path: str) -> dict:
+    """Read the manifest and extract + chunk every fixture PDF."""
+    import fitz  # PyMuPDF
+    from routes.ai_routes import _chunk_text
+
+    with open(manifest_path, encoding='utf-8') as fh:
+        manifest = json.load(fh)
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    for doc in manifest['documents']:
+        pdf = fitz.open(os.path.join(base_dir, doc['file']))
+        text = '\n'.join(page.get_text() for page in pdf)
+        pdf.close()
+        doc['chunks'] = _chunk_text(text)
+    return manifest
+
+
+def index_corpus(client, documents: list, run_id: str) -> dict:
+    """Embed and add every fixture document to `client` under a run-scoped pdf_id,
+    mirroring what ai_routes._index_pdf writes. Returns {doc id: pdf_id}."""
+    from routes.ai_routes import _get_embedder, _collection_name
+
+    embedder = _get_embedder()
+    pdf_ids  = {}
+    for doc in documents:
+        pdf_id = f"bench_{run_id}_{doc['id']}"
+        try:
+            client.delete_collection(_collection_name(pdf_id))
+        except Exception:
+            pass
+        col    = client.get_or_create_collection(_collection_name(pdf_id))
+        chunks = doc['chunks']
+        if chunks:
+            vecs = embedder.encode(chunks, normalize_embeddings=True, batch_size=32).tolist()
+            col.add(
+                documents=chunks, embeddings=vecs,
+                metadatas=[{'pdf_id': pdf_id, 'chunk_index': i} for i in range(len(chunks))],
+                ids=[f'{pdf_id}_c{i}' for i in range(len(chunks))],
+            )
+        pdf_ids[doc['id']] = pdf_id
+    return pdf_ids
+
+
+def _drop_corpus(client, pdf_ids: dict):
+    """Remove the benchmark collections — matters for the 'http' backend, which
+    is a real shared Chroma server rather than a temp directory."""
+    from routes.ai_routes import _collection_name
+    for pdf_id in pdf_ids.values():
+        try:
+            client.delete_collection(_collection_name(pdf_id))
+        except Exception:
+            pass
+
+
+# ── Runner ─────────────────────────────────────────────────────────────────────
+
+def run_config(config: dict, documents: list, ks: list, pdf_ids: dict) -> list:
+    """Run every labeled query in the corpus through _hybrid_rag with one config."""
+    import time
+    from routes import ai_routes
+
+    depth = max(ks)
+    per_query = []
+    for doc in documents:
+        index_of = {}
+        for i, chunk in enumerate(doc['chunks']):
+            index_of.setdefault(chunk, i)
+        for q in doc['queries']:
+            timings, rerank_info = {}, {}
+            t0 = time.perf_counter()
+            chunks = ai_routes._hybrid_rag(
+                pdf_ids[doc['id']], q['question'], n=depth,
+                candidate_n=config.get('candidate_n'),
+                rerank=config.get('rerank', True),
+                timings=timings,
+                rerank_info=rerank_info,
+            )
+            total_ms = round((time.perf_counter() - t0) * 1000, 2)
+            per_query.append({
+                'ranked':   [index_of.get(c, -1) for c in chunks],
+                'relevant': q['relevant'],
+                'timings':  timings,
+                'total_ms': total_ms,
+                'rerank':   rerank_info.get('decision'),
+            })
+    return per_query
+
+
+def run_benchmark(manifest_path: str = DEFAULT_MANIFEST, ks=(1, 3, 5), configs=None,
+                  warmup: bool = True) -> dict:
+    from routes import ai_routes
+
+    ks       = sorted(set(ks))
+    manifest = load_corpus(manifest_path)
+    configs  = configs or manifest.get('configs') or DEFAULT_CONFIGS
+    documents = manifest['documents']
+
+    report = {
+        'manifest':  os.path.relpath(manifest_path, BACKEND_ROOT),
+        'ks':        ks,
+        'documents': len(documents),
+        'chunks':    sum(len(d['chunks']) for d in documents),
+        'configs':   {},
+    }
+
+    original_client = ai_routes._chroma_client
+    backends = {}  # kind -> (client, pdf_ids), or None when unavailable
+    with tempfile.TemporaryDirectory(prefix='rag_bench_') as workdir:
+        try:
+            for config in configs:
+                kind = config.get('backend', 'local')
+                if kind not in backends:
+                    client = _make_backend(kind, workdir)
+                    backends[kind] = (client, index_corpus(client, documents, run_id=kind)) if client is not None else None
+                if backends[kind] is None:
+                    report['configs'][config['name']] = {'skipped': f'backend {kind!r} unavailable'}
+                    continue
+
+                client, pdf_ids = backends[kind]
+                ai_routes._chroma_client = client
+                if warmup:
+                    # First call pays for model loading — keep it out of the numbers
+                    run_config(config, documents[:1], ks, pdf_ids)
+                per_query = run_config(config, documents, ks, pdf_ids)
+                report['configs'][config['name']] = {
+                    **summarize(per_query, ks),
+                    'rerank':      config.get('rerank', True),
+                    'candidate_n': config.get('candidate_n') or max(ks) * 3,
+                    'backend':     kind,
+                }
+        finally:
+            ai_routes._chroma_client = original_client
+            for backend in backends.values():
+                if backend is not None:
+                    _drop_corpus(*backend)
+    return report
+
+
+def format_report(report: dict) -> str:
+    ks = report['ks']
+    header = ['config'] + [f'R@{k}' for k in ks] + ['MRR'] + [f'{s} p50' for s in STAGES] + ['total p95']
+    rows, skipped = [header], []
+    for name, r in report['configs'].items():
+        if r.get('skipped'):
+            skipped.append(f"{name}: skipped ({r['skipped']})")
+            continue
+        lat = r['latency']
+        rows.append(
+            [name]
+            + [f"{r[f'recall@{k}']:.3f}" for k in ks]
+            + [f"{r['mrr']:.3f}"]
+            + [f"{lat[s]['p50_ms']:.1f}" for s in STAGES]
+            + [f"{lat['total']['p95_ms']:.1f}"]
+        )
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    lines = ['  '.join(cell.ljust(widths[i]) for i, cell in enumerate(row)).rstrip() for row in rows]
+    return '\n'.join(lines + skipped)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Offline RAG retrieval benchmark')
+    parser.add_argument('--manifest', default=DEFAULT_MANIFEST)
+    parser.add_argument('--k', type=int, nargs='+', default=[1, 3, 5])
+    parser.add_argument('--out', help='write the full JSON report here')
+    parser.add_argument('--baseline', help='compare against a previously saved report')
+    parser.add_argument('--save-baseline', help='write this run as the new baseline')
+    parser.add_argument('--quality-tol', type=float, default=0.02)
+    parser.add_argument('--latency-tol', type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    report = run_benchmark(args.manifest, ks=args.k)
+    print(format_report(report))
+
+    for path in (args.out, args.save_baseline):
+        if path:
+            with open(path, 'w', encoding='utf-8') as fh:
+                json.dump(report, fh, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as fh:
+            baseline = json.load(fh)
+        problems = find_regressions(report, baseline, args.quality_tol, args.latency_tol)
+        if problems:
+            print('\nRegressions vs baseline:')
+            for p in problems:
+                print(f'  - {p}')
+            return 1
+        print('\nNo regressions vs baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
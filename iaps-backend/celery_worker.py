@@ -8,5 +8,6 @@ the worker only needs the task definitions and a DB connection, not the web stac
 """
 from celery_app import celery_app
 from routes.ai_routes import _index_pdf_task  # noqa: F401 — registers the task
+from routes.timetable_routes import _timetable_cascade_task, _extract_timetable_task  # noqa: F401
 
 __all__ = ['celery_app']
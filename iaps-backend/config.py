@@ -27,4 +27,8 @@ class Config:
     COOKIE_SAMESITE = os.getenv('COOKIE_SAMESITE', 'Lax')
     COOKIE_HTTPONLY = True
 
-    GROQ_API_KEY = os.getenv('GROQ_API_KEY')
\ No newline at end of file
+    GROQ_API_KEY = os.getenv('GROQ_API_KEY')
+
+    # Behind Apache mod_xsendfile / lighttpd: send_file answers with an
+    # X-Sendfile header and the server streams the file (see utils/file_delivery.py)
+    USE_X_SENDFILE = os.getenv('USE_X_SENDFILE', 'False') == 'True'
\ No newline at end of file
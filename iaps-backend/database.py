@@ -66,6 +66,73 @@ class Database:
                 name="chat_messages_classroom_time"
             )
 
+            # chat_messages — keyset pagination of a semester's history
+            # (get_messages / _history_page: semester_id equality, _id range + sort)
+            self._db.chat_messages.create_index(
+                [("semester_id", ASCENDING), ("_id", DESCENDING)],
+                name="chat_messages_semester_id"
+            )
+
+            # academic_resources / documents — all-resources branches
+            # (semester_id $in, newest first)
+            self._db.academic_resources.create_index(
+                [("semester_id", ASCENDING), ("created_at", DESCENDING)],
+                name="academic_resources_semester_created"
+            )
+            self._db.documents.create_index(
+                [("semester_id", ASCENDING), ("created_at", DESCENDING)],
+                name="documents_semester_created"
+            )
+
+            # academic_resources — "is this chat file already linked?" $lookup
+            self._db.academic_resources.create_index(
+                [("chat_message_id", ASCENDING)],
+                name="academic_resources_chat_message"
+            )
+
+            # subject_marks — one doc per student per subject; class stats
+            # rebuilds scan by subject_id
+            self._db.subject_marks.create_index(
+                [("subject_id", ASCENDING), ("user_id", ASCENDING)],
+                name="subject_marks_subject_user"
+            )
+
+            # subject_mark_stats — materialized class statistics (utils.marks_stats)
+            self._db.subject_mark_stats.create_index(
+                [("subject_id", ASCENDING)], unique=True,
+                name="subject_mark_stats_subject"
+            )
+
+            # users — calendar feed lookup by its URL token (timetable_routes.calendar_feed)
+            self._db.users.create_index(
+                [("calendar_feed_token", ASCENDING)], unique=True, sparse=True,
+                name="users_calendar_feed_token"
+            )
+
+            # timetable_extractions — extraction jobs, whose results double as a
+            # cache (by content hash, or perceptual hash within a semester);
+            # kept for 30 days
+            self._db.timetable_extractions.create_index(
+                [("sha256", ASCENDING)], name="timetable_extractions_sha256"
+            )
+            self._db.timetable_extractions.create_index(
+                [("semester_id", ASCENDING), ("created_at", DESCENDING)],
+                name="timetable_extractions_semester_created"
+            )
+            self._db.timetable_extractions.create_index(
+                [("created_at", ASCENDING)],
+                expireAfterSeconds=30 * 24 * 3600,
+                name="timetable_extractions_ttl"
+            )
+
+            # upload_sessions — resumable uploads (routes/upload_routes.py);
+            # expires_at is pushed forward by every chunk
+            self._db.upload_sessions.create_index(
+                [("expires_at", ASCENDING)],
+                expireAfterSeconds=0,
+                name="upload_sessions_ttl"
+            )
+
             # chat_read_status — one doc per user per classroom
             self._db.chat_read_status.create_index(
                 [("user_id", ASCENDING), ("classroom_id", ASCENDING)],
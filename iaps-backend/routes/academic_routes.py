@@ -1,7 +1,7 @@
 """academic_routes.py — Per-subject academic resource management.
 
 REST:
-  GET  /all-resources                                                  — all resources (cross-semester)
+  GET  /all-resources                                                  — paged resources (cross-semester, filterable)
   GET  /my-semesters                                                   — semesters user can access
   GET  /<semester_id>/resources                                        — resources for semester (optional ?subject_id=)
   GET  /<semester_id>/subjects/<subject_id>/sections                  — sections for subject
@@ -16,20 +16,26 @@ REST:
 """
 
 import os
+import re
+import json
+import base64
 import logging
 from datetime import datetime, timezone
 
-from flask import Blueprint, request, jsonify, send_file, redirect
+from flask import Blueprint, request, jsonify, redirect
 from bson import ObjectId
+from pymongo.errors import OperationFailure
 import jwt
-from werkzeug.utils import secure_filename
 
 from middleware import token_required, SECRET_KEY
 from utils.mime_check import is_dangerous
+from utils import resolve_users, display_name
+from utils import http_cache, file_delivery, resumable, ingest, storage
 
 academic_bp = Blueprint('academic', __name__, url_prefix='/api/academics')
 logger = logging.getLogger(__name__)
 
+# Uploads from before the blob store (utils/storage.py); new ones are blobs
 UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads', 'academics')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
@@ -115,6 +121,21 @@ def _validate_category(db, semester_id, subject_id, category):
         return False
 
 
+def _resource_path(resource):
+    """Where an uploaded resource's file lives: its blob, or UPLOAD_DIR/
+    stored_name for uploads from before the blob store. None if neither."""
+    if resource.get('blob'):
+        return storage.blob_ref(resource['blob'])
+    if resource.get('stored_name'):
+        return os.path.join(UPLOAD_DIR, resource['stored_name'])
+    return None
+
+
+def release_resource_file(db, resource):
+    """Release a deleted resource's file (see storage.release_file)."""
+    storage.release_file(db, resource.get('blob'), _resource_path(resource))
+
+
 def _delete_resources_for_section(db, semester_id, subject_id, section_id):
     """Delete all resources in a section for a subject, including disk files."""
     resources = list(db.academic_resources.find({
@@ -123,11 +144,7 @@ def _delete_resources_for_section(db, semester_id, subject_id, section_id):
         'category': section_id,
     }))
     for resource in resources:
-        if resource.get('stored_name'):
-            try:
-                os.remove(os.path.join(UPLOAD_DIR, resource['stored_name']))
-            except OSError:
-                pass
+        release_resource_file(db, resource)
     db.academic_resources.delete_many({
         'semester_id': semester_id,
         'subject_id': subject_id,
@@ -135,126 +152,316 @@ def _delete_resources_for_section(db, semester_id, subject_id, section_id):
     })
 
 
+# ─── All-resources view ───────────────────────────────────────────────────────
+#
+# /all-resources merges three collections into one list: academic_resources,
+# the older per-semester `documents`, and chat attachments that were never
+# linked into a subject. Each source is a pipeline that projects its rows
+# onto the same shape; on MongoDB 4.4+ they run as one aggregation chained
+# with $unionWith, otherwise (older servers, mongomock) each runs on its own
+# and the pages are merged here. Either way every branch does its own
+# filter + sort + limit first, so no request reads more than `limit + 1`
+# rows per source.
+
+ALL_RESOURCES_KINDS = ('resource', 'document', 'chat')
+ALL_RESOURCES_PAGE_SIZE = 100
+ALL_RESOURCES_MAX_PAGE = 500
+ALL_RESOURCES_SORTS = {
+    'newest': ('created_at', -1),
+    'oldest': ('created_at', 1),
+    'name': ('name_key', 1),
+}
+
+_union_supported = True
+
+
+def _resource_rows(semester_ids, subject_id):
+    match = {'semester_id': {'$in': semester_ids}}
+    if subject_id:
+        match['subject_id'] = subject_id
+    return [
+        {'$match': match},
+        {'$project': {
+            'kind': {'$literal': 'resource'},
+            'name': {'$ifNull': ['$name', '']},
+            'name_key': {'$toLower': {'$ifNull': ['$name', '']}},
+            'mime_type': 1, 'size': 1, 'created_at': 1, 'semester_id': 1,
+            'uploaded_by': 1, 'uploaded_by_name': 1, 'source': 1, 'chat_message_id': 1,
+            'subject_id': 1, 'category': 1, 'folder_id': 1, 'is_public': 1,
+        }},
+    ]
+
+
+def _document_rows(semester_ids, subject_id):
+    return [
+        {'$match': {'semester_id': {'$in': semester_ids}}},
+        {'$project': {
+            'kind': {'$literal': 'document'},
+            'name': {'$ifNull': ['$filename', 'Document']},
+            'name_key': {'$toLower': {'$ifNull': ['$filename', 'Document']}},
+            'mime_type': 1, 'size': '$file_size', 'created_at': 1, 'semester_id': 1,
+            'uploaded_by': 1,
+        }},
+    ]
+
+
+def _chat_rows(semester_ids, subject_id):
+    # "Unlinked" means no academic resource points back at the message. An
+    # equality $lookup on chat_message_id replaces the old `_id: {$nin: [...]}`
+    # list, which grew with every file anyone had ever linked.
+    return [
+        {'$match': {'semester_id': {'$in': semester_ids}, 'file': {'$exists': True, '$ne': None}}},
+        {'$addFields': {'message_id': {'$toString': '$_id'}}},
+        {'$lookup': {
+            'from': 'academic_resources',
+            'localField': 'message_id',
+            'foreignField': 'chat_message_id',
+            'as': 'linked',
+        }},
+        {'$match': {'linked': {'$size': 0}}},
+        {'$project': {
+            'kind': {'$literal': 'chat'},
+            'name': {'$ifNull': ['$file.name', 'Chat File']},
+            'name_key': {'$toLower': {'$ifNull': ['$file.name', 'Chat File']}},
+            'mime_type': '$file.mime_type', 'size': '$file.size', 'created_at': 1,
+            'semester_id': 1, 'uploaded_by': '$user_id', 'full_name': 1, 'username': 1,
+        }},
+    ]
+
+
+_RESOURCE_SOURCES = {
+    'resource': _resource_rows,
+    'document': _document_rows,
+    'chat': _chat_rows,
+}
+_RESOURCE_COLLECTIONS = {
+    'resource': 'academic_resources',
+    'document': 'documents',
+    'chat': 'chat_messages',
+}
+
+
+def _resource_sort_key(row, sort):
+    field, _ = ALL_RESOURCES_SORTS[sort]
+    key = row.get(field)
+    if key is None:
+        # Mongo sorts a missing value below everything else
+        key = datetime.min if field == 'created_at' else ''
+    return key, row['_id']
+
+
+def _encode_resource_cursor(row, sort):
+    key, oid = _resource_sort_key(row, sort)
+    if isinstance(key, datetime):
+        key = key.isoformat()
+    raw = json.dumps([sort, key, str(oid)]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_resource_cursor(token, sort):
+    """(sort key, ObjectId) from a next_cursor; ValueError if malformed or if
+    it was issued for a different sort."""
+    try:
+        issued_for, key, oid = json.loads(base64.urlsafe_b64decode(token.encode()))
+        if issued_for != sort:
+            raise ValueError
+        if ALL_RESOURCES_SORTS[sort][0] == 'created_at':
+            key = datetime.fromisoformat(key).replace(tzinfo=None)
+        elif not isinstance(key, str):
+            raise ValueError
+        return key, ObjectId(oid)
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def _resource_page_stages(sort, after, limit, match):
+    """Filter, keyset and sort stages shared by every branch and the union."""
+    field, direction = ALL_RESOURCES_SORTS[sort]
+    clauses = [match] if match else []
+    if after is not None:
+        op = '$lt' if direction < 0 else '$gt'
+        key, oid = after
+        clauses.append({'$or': [
+            {field: {op: key}},
+            {field: key, '_id': {op: oid}},
+        ]})
+    stages = []
+    if clauses:
+        stages.append({'$match': clauses[0] if len(clauses) == 1 else {'$and': clauses}})
+    stages.append({'$sort': {field: direction, '_id': direction}})
+    stages.append({'$limit': limit})
+    return stages
+
+
+def _run_resource_union(db, branches, sort, tail, limit):
+    """Run the per-source pipelines and return at most `limit` rows in sort
+    order. Uses a single $unionWith aggregation when the server has it."""
+    global _union_supported
+    kinds = list(branches)
+    if _union_supported and len(kinds) > 1:
+        pipeline = list(branches[kinds[0]])
+        for k in kinds[1:]:
+            pipeline.append({'$unionWith': {'coll': _RESOURCE_COLLECTIONS[k], 'pipeline': branches[k]}})
+        try:
+            return list(db[_RESOURCE_COLLECTIONS[kinds[0]]].aggregate(pipeline + tail))
+        except (NotImplementedError, OperationFailure) as e:
+            logger.info(f"$unionWith unavailable, merging resource pages in Python: {e}")
+            _union_supported = False
+    rows = []
+    for k in kinds:
+        rows.extend(db[_RESOURCE_COLLECTIONS[k]].aggregate(branches[k]))
+    rows.sort(key=lambda r: _resource_sort_key(r, sort), reverse=ALL_RESOURCES_SORTS[sort][1] < 0)
+    return rows[:limit]
+
+
 # ─── All resources (cross-semester) ───────────────────────────────────────────
 
 @academic_bp.route('/all-resources', methods=['GET'])
 @token_required
 def all_resources():
-    """Return all academic resources across every semester the user can access."""
+    """One page of files across every semester the user can access.
+
+    Query params (all optional):
+      classroom_id, semester_id, subject_id — narrow the scope
+      type    — resource | document | chat
+      q       — case-insensitive match on file, subject, semester or classroom name
+      sort    — newest (default) | oldest | name
+      limit   — page size (default 100, max 500)
+      cursor  — next_cursor from the previous page
+    """
     from database import get_db
     try:
         user_id = request.user['user_id']
         db = get_db()
 
+        sort = request.args.get('sort', 'newest')
+        if sort not in ALL_RESOURCES_SORTS:
+            return jsonify({'error': 'Invalid sort'}), 400
+        kinds = list(ALL_RESOURCES_KINDS)
+        kind = request.args.get('type', '').strip()
+        if kind:
+            if kind not in ALL_RESOURCES_KINDS:
+                return jsonify({'error': 'Invalid type'}), 400
+            kinds = [kind]
+        try:
+            limit = max(1, min(int(request.args.get('limit', ALL_RESOURCES_PAGE_SIZE)),
+                               ALL_RESOURCES_MAX_PAGE))
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        after = None
+        if request.args.get('cursor'):
+            try:
+                after = _decode_resource_cursor(request.args['cursor'], sort)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+
         classrooms = list(db.classrooms.find({'members': ObjectId(user_id)}, {'_id': 1, 'name': 1}))
         classroom_map = {str(c['_id']): c['name'] for c in classrooms}
-        classroom_ids = list(classroom_map.keys())
+        classroom_filter = request.args.get('classroom_id', '').strip()
+        if classroom_filter:
+            classroom_map = {cid: name for cid, name in classroom_map.items() if cid == classroom_filter}
 
         semesters = list(db.semesters.find(
-            {'classroom_id': {'$in': classroom_ids}},
+            {'classroom_id': {'$in': list(classroom_map.keys())}},
             {'_id': 1, 'name': 1, 'classroom_id': 1},
         ))
         semester_map = {
             str(s['_id']): {'name': s['name'], 'classroom_id': s.get('classroom_id', '')}
             for s in semesters
         }
+        semester_filter = request.args.get('semester_id', '').strip()
+        if semester_filter:
+            semester_map = {sid: s for sid, s in semester_map.items() if sid == semester_filter}
         semester_ids = list(semester_map.keys())
 
         if not semester_ids:
-            return jsonify({'resources': []}), 200
+            return jsonify({'resources': [], 'next_cursor': None}), 200
 
         subjects = list(db.subjects.find(
             {'semester_id': {'$in': semester_ids}},
             {'_id': 1, 'name': 1, 'semester_id': 1},
         ))
         subject_map = {str(s['_id']): s.get('name', '') for s in subjects}
-
-        resources = list(db.academic_resources.find(
-            {'semester_id': {'$in': semester_ids}},
-            sort=[('created_at', -1)],
-        ))
-
-        # Collect chat_message_ids already linked to academic resources (to avoid duplicates)
-        linked_chat_ids = {
-            str(r['chat_message_id'])
-            for r in resources
-            if r.get('source') == 'chat' and r.get('chat_message_id')
+        subject_filter = request.args.get('subject_id', '').strip()
+        if subject_filter:
+            # Only academic resources belong to a subject
+            kinds = [k for k in kinds if k == 'resource']
+
+        match = {}
+        q = request.args.get('q', '').strip()
+        if q:
+            pattern = re.compile(re.escape(q), re.IGNORECASE)
+            match = {'$or': [
+                {'name': {'$regex': re.escape(q), '$options': 'i'}},
+                {'semester_id': {'$in': [
+                    sid for sid, s in semester_map.items()
+                    if pattern.search(s['name'])
+                    or pattern.search(classroom_map.get(s['classroom_id'], ''))
+                ]}},
+                {'subject_id': {'$in': [sid for sid, name in subject_map.items() if pattern.search(name)]}},
+            ]}
+        tail = _resource_page_stages(sort, after, limit + 1, match)
+
+        branches = {
+            k: _RESOURCE_SOURCES[k](semester_ids, subject_filter or None) + tail
+            for k in kinds
         }
+        rows = _run_resource_union(db, branches, sort, tail, limit + 1)
 
-        result = []
-        for r in resources:
-            sem = semester_map.get(r['semester_id'], {})
-            result.append({
-                **_serialize(r),
-                'classroom_name': classroom_map.get(sem.get('classroom_id', ''), ''),
-                'semester_name': sem.get('name', ''),
-                'subject_name': subject_map.get(r.get('subject_id', ''), ''),
-                'section_name': CATEGORY_LABELS.get(r.get('category', ''), r.get('category', '')),
-                'classroom_id': sem.get('classroom_id', ''),
-                'semester_id': r['semester_id'],
-            })
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = _encode_resource_cursor(rows[-1], sort)
 
-        # Add semester documents (old upload system via SemesterDetail)
-        docs = list(db.documents.find(
-            {'semester_id': {'$in': semester_ids}},
-            sort=[('created_at', -1)],
-        ))
-        for doc in docs:
-            sem_id = doc.get('semester_id', '')
-            sem = semester_map.get(sem_id, {})
-            uploader = db.users.find_one({'_id': ObjectId(doc['uploaded_by'])}, {'fullName': 1, 'username': 1}) if doc.get('uploaded_by') else None
-            uploader_name = (uploader.get('fullName') or uploader.get('username') or '') if uploader else ''
-            result.append({
-                'id': str(doc['_id']),
-                'name': doc.get('filename') or 'Document',
-                'mime_type': doc.get('mime_type', ''),
-                'size': doc.get('file_size', 0),
-                'created_at': doc['created_at'].isoformat() if 'created_at' in doc else '',
-                'uploaded_by': str(doc.get('uploaded_by', '')),
-                'uploaded_by_name': uploader_name,
-                'source': 'document',
-                'subject_name': '—',
-                'section_name': 'Documents',
-                'classroom_name': classroom_map.get(sem.get('classroom_id', ''), ''),
-                'semester_name': sem.get('name', ''),
-                'classroom_id': sem.get('classroom_id', ''),
-                'semester_id': sem_id,
-                'document_id': str(doc['_id']),
-            })
-
-        # Add unlinked chat files — chat messages store file info under msg['file'] subdoc
-        linked_msg_oids = [ObjectId(cid) for cid in linked_chat_ids if cid]
-        chat_msgs = list(db.chat_messages.find(
-            {
-                'semester_id': {'$in': semester_ids},
-                'file': {'$exists': True, '$ne': None},
-                '_id': {'$nin': linked_msg_oids},
-            },
-            sort=[('created_at', -1)],
-        ))
-        for msg in chat_msgs:
-            sem_id = msg.get('semester_id', '')
-            sem = semester_map.get(sem_id, {})
-            file_sub = msg.get('file') or {}
-            result.append({
-                'id': str(msg['_id']),
-                'name': file_sub.get('name') or 'Chat File',
-                'mime_type': file_sub.get('mime_type', ''),
-                'size': file_sub.get('size', 0),
-                'created_at': msg['created_at'].isoformat() if 'created_at' in msg else '',
-                'uploaded_by': str(msg.get('user_id', '')),
-                'uploaded_by_name': msg.get('full_name') or msg.get('username') or '',
-                'source': 'chat_unlinked',
-                'subject_name': '—',
-                'section_name': 'Chat Files',
+        uploaders = resolve_users(db, [r.get('uploaded_by') for r in rows if r['kind'] == 'document'])
+        result = []
+        for r in rows:
+            sem = semester_map.get(r.get('semester_id', ''), {})
+            item = {
+                'id': str(r['_id']),
+                'name': r.get('name', ''),
+                'mime_type': r.get('mime_type') or '',
+                'size': r.get('size') or 0,
+                'created_at': r['created_at'].isoformat() if r.get('created_at') else '',
+                'uploaded_by': str(r.get('uploaded_by') or ''),
                 'classroom_name': classroom_map.get(sem.get('classroom_id', ''), ''),
                 'semester_name': sem.get('name', ''),
                 'classroom_id': sem.get('classroom_id', ''),
-                'semester_id': sem_id,
-                'chat_message_id': str(msg['_id']),
-            })
+                'semester_id': r.get('semester_id', ''),
+            }
+            if r['kind'] == 'resource':
+                item.update({
+                    'subject_id': r.get('subject_id'),
+                    'category': r.get('category'),
+                    'folder_id': r.get('folder_id'),
+                    'mime_type': r.get('mime_type') or 'application/octet-stream',
+                    'uploaded_by': r.get('uploaded_by'),
+                    'uploaded_by_name': r.get('uploaded_by_name', ''),
+                    'source': r.get('source', 'upload'),
+                    'chat_message_id': r.get('chat_message_id'),
+                    'is_public': r.get('is_public', True),
+                    'subject_name': subject_map.get(r.get('subject_id', ''), ''),
+                    'section_name': CATEGORY_LABELS.get(r.get('category', ''), r.get('category', '')),
+                })
+            elif r['kind'] == 'document':
+                item.update({
+                    'uploaded_by_name': display_name(uploaders.get(str(r.get('uploaded_by')))),
+                    'source': 'document',
+                    'subject_name': '—',
+                    'section_name': 'Documents',
+                    'document_id': str(r['_id']),
+                })
+            else:
+                item.update({
+                    'uploaded_by_name': r.get('full_name') or r.get('username') or '',
+                    'source': 'chat_unlinked',
+                    'subject_name': '—',
+                    'section_name': 'Chat Files',
+                    'chat_message_id': str(r['_id']),
+                })
+            result.append(item)
 
-        return jsonify({'resources': result}), 200
+        return jsonify({'resources': result, 'next_cursor': next_cursor}), 200
     except Exception as e:
         logger.error(f"all_resources error: {e}")
         return jsonify({'error': 'Failed to fetch resources'}), 500
@@ -678,74 +885,115 @@ def upload_resource(semester_id):
     try:
         user_id = request.user['user_id']
         db = get_db()
-        if not _is_member(db, semester_id, user_id):
-            return jsonify({'error': 'Not a member'}), 403
-
-        subject_id = request.form.get('subject_id', '').strip() or None
-        category = request.form.get('category', '').strip()
-
-        if not subject_id:
-            return jsonify({'error': 'subject_id is required'}), 400
-        if not category:
-            return jsonify({'error': 'category is required'}), 400
-        if not _validate_category(db, semester_id, subject_id, category):
-            return jsonify({'error': 'Invalid category'}), 400
-        if category in CR_ONLY_CATEGORIES and not _is_cr(db, semester_id, user_id):
-            return jsonify({'error': 'Only the CR can upload to this section'}), 403
+        if ingest.body_too_large(MAX_FILE_SIZE):
+            return jsonify({'error': 'File too large (max 50 MB)'}), 413
+        denied = _check_upload(db, semester_id, user_id, request.form)
+        if denied:
+            return denied
 
         file = request.files.get('file')
         if not file:
             return jsonify({'error': 'No file provided'}), 400
 
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_FILE_SIZE:
+        original_name = file.filename or 'file'
+        incoming = storage.incoming_path()
+        try:
+            saved = ingest.save(file, incoming, max_size=MAX_FILE_SIZE)
+        except ingest.TooLarge:
             return jsonify({'error': 'File too large (max 50 MB)'}), 413
-        if is_dangerous(file):
+        except ingest.DisallowedType:
             return jsonify({'error': 'File type not allowed'}), 400
+        storage.put_blob(db, incoming, saved.sha256, saved.size)
 
-        original_name = file.filename or 'file'
-        safe_name = secure_filename(original_name) or 'file'
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
-        stored_name = f"{timestamp}_{user_id}_{safe_name}"
-        file.save(os.path.join(UPLOAD_DIR, stored_name))
-
-        user_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1})
-        uploader_name = ((user_doc.get('fullName') or user_doc.get('username', '')) if user_doc else '')
-
-        folder_id = request.form.get('folder_id', '').strip() or None
-
-        # is_public: CRs choose public/private for PYQ/Books; non-CRs always private
-        is_public_raw = request.form.get('is_public', 'true').lower()
-        is_public = is_public_raw != 'false'
-        if category in ('pyq', 'books') and not _is_cr(db, semester_id, user_id):
-            is_public = False  # members' uploads to Books/PYQ are always private
-
-        resource = {
-            'semester_id': semester_id,
-            'subject_id': subject_id,
-            'category': category,
-            'folder_id': folder_id,
-            'name': original_name,
-            'stored_name': stored_name,
-            'mime_type': file.content_type or 'application/octet-stream',
-            'size': size,
-            'uploaded_by': user_id,
-            'uploaded_by_name': uploader_name,
-            'source': 'upload',
-            'chat_message_id': None,
-            'is_public': is_public,
-            'created_at': datetime.now(timezone.utc),
-        }
-        result = db.academic_resources.insert_one(resource)
-        resource['_id'] = result.inserted_id
+        resource = _create_resource(db, semester_id, user_id, request.form,
+                                    original_name, file.content_type or 'application/octet-stream',
+                                    saved.size, saved.sha256)
         return jsonify({'resource': _serialize(resource)}), 201
     except Exception as e:
         logger.error(f"upload_resource error: {e}")
         return jsonify({'error': 'Failed to upload resource'}), 500
 
 
+def _check_upload(db, semester_id, user_id, fields):
+    """Error response if the upload described by `fields` (subject_id,
+    category) isn't allowed, else None."""
+    if not _is_member(db, semester_id, user_id):
+        return jsonify({'error': 'Not a member'}), 403
+
+    subject_id = (fields.get('subject_id') or '').strip() or None
+    category = (fields.get('category') or '').strip()
+
+    if not subject_id:
+        return jsonify({'error': 'subject_id is required'}), 400
+    if not category:
+        return jsonify({'error': 'category is required'}), 400
+    if not _validate_category(db, semester_id, subject_id, category):
+        return jsonify({'error': 'Invalid category'}), 400
+    if category in CR_ONLY_CATEGORIES and not _is_cr(db, semester_id, user_id):
+        return jsonify({'error': 'Only the CR can upload to this section'}), 403
+    return None
+
+
+def _create_resource(db, semester_id, user_id, fields, original_name,
+                     mime_type, size, sha256):
+    """Insert the resource for a file already stored as the blob `sha256`."""
+    subject_id = fields['subject_id'].strip()
+    category = fields['category'].strip()
+
+    user_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1})
+    uploader_name = ((user_doc.get('fullName') or user_doc.get('username', '')) if user_doc else '')
+
+    folder_id = (fields.get('folder_id') or '').strip() or None
+
+    # is_public: CRs choose public/private for PYQ/Books; non-CRs always private
+    is_public_raw = (fields.get('is_public') or 'true').lower()
+    is_public = is_public_raw != 'false'
+    if category in ('pyq', 'books') and not _is_cr(db, semester_id, user_id):
+        is_public = False  # members' uploads to Books/PYQ are always private
+
+    resource = {
+        'semester_id': semester_id,
+        'subject_id': subject_id,
+        'category': category,
+        'folder_id': folder_id,
+        'name': original_name,
+        'stored_name': None,
+        'blob': sha256,
+        'mime_type': mime_type,
+        'size': size,
+        'sha256': sha256,
+        'uploaded_by': user_id,
+        'uploaded_by_name': uploader_name,
+        'source': 'upload',
+        'chat_message_id': None,
+        'is_public': is_public,
+        'created_at': datetime.now(timezone.utc),
+    }
+    result = db.academic_resources.insert_one(resource)
+    resource['_id'] = result.inserted_id
+    return resource
+
+
+# Resumable uploads (utils/resumable.py) — params: semester_id and the
+# upload_resource form fields
+
+def _authorize_resumable(db, user, params, filename):
+    return _check_upload(db, params.get('semester_id', ''), user['user_id'], params)
+
+
+def _finalize_resumable(db, user, params, upload):
+    with open(upload.path, 'rb') as f:
+        if is_dangerous(f):
+            return jsonify({'error': 'File type not allowed'}), 400
+    storage.put_blob(db, upload.path, upload.sha256, upload.size)
+    resource = _create_resource(db, params['semester_id'], user['user_id'], params,
+                                upload.filename, upload.mime_type, upload.size, upload.sha256)
+    return jsonify({'resource': _serialize(resource)}), 201
+
+
+resumable.register('academic', _authorize_resumable, _finalize_resumable, MAX_FILE_SIZE)
+
+
 # ─── Link chat file ────────────────────────────────────────────────────────────
 
 @academic_bp.route('/<semester_id>/link-chat-file', methods=['POST'])
@@ -928,11 +1176,7 @@ def delete_resource(semester_id, resource_id):
             return jsonify({'error': 'Resource not found'}), 404
         if resource['uploaded_by'] != user_id and not _is_cr(db, semester_id, user_id):
             return jsonify({'error': 'Not authorized'}), 403
-        if resource.get('stored_name'):
-            try:
-                os.remove(os.path.join(UPLOAD_DIR, resource['stored_name']))
-            except OSError:
-                pass
+        release_resource_file(db, resource)
         db.academic_resources.delete_one({'_id': ObjectId(resource_id)})
         return jsonify({'message': 'Resource deleted'}), 200
     except Exception as e:
@@ -989,27 +1233,41 @@ def list_chat_files(semester_id):
 
 @academic_bp.route('/file/<resource_id>', methods=['GET'])
 def serve_academic_file(resource_id):
+    """Accepts a signed URL from GET /file/<id>/url or a JWT (?token= / header)."""
     from database import get_db
     try:
-        token = request.args.get('token') or request.headers.get('Authorization', '')
-        if token.startswith('Bearer '):
-            token = token[7:]
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            user_id = file_delivery.signed_user('academic', resource_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        signed = user_id is not None
+        if not signed:
+            token = request.args.get('token') or request.headers.get('Authorization', '')
+            if token.startswith('Bearer '):
+                token = token[7:]
+            if not token:
+                return jsonify({'error': 'Token is missing'}), 401
+            try:
+                data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'error': 'Token has expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            user_id = data['user_id']
 
         db = get_db()
         resource = db.academic_resources.find_one({'_id': ObjectId(resource_id)})
         if not resource:
             return jsonify({'error': 'Resource not found'}), 404
 
-        user_id = data['user_id']
-        if not _is_member(db, resource['semester_id'], user_id):
+        if resource.get('source') != 'chat':
+            # Revalidation of a copy the browser already holds: skip the membership lookup
+            cached = http_cache.not_modified(resource.get('sha256'))
+            if cached:
+                return cached
+
+        # A signed URL is only issued to a member
+        if not signed and not _is_member(db, resource['semester_id'], user_id):
             return jsonify({'error': 'Not a member'}), 403
 
         if resource.get('source') == 'chat' and resource.get('chat_message_id'):
@@ -1018,29 +1276,46 @@ def serve_academic_file(resource_id):
                 # Stale reference — clean up and return gone
                 db.academic_resources.delete_one({'_id': resource['_id']})
                 return jsonify({'error': 'File no longer available'}), 410
-            abs_path = os.path.join(os.getcwd(), chat_msg['file']['path'])
-            if not os.path.exists(abs_path):
+            path = storage.message_file_ref(chat_msg['file'])
+            if not path or not storage.exists(path):
                 return jsonify({'error': 'File not found on disk'}), 404
-            return send_file(
-                abs_path,
+            return file_delivery.deliver(
+                path,
+                etag=chat_msg['file'].get('sha256'),
                 mimetype=chat_msg['file'].get('mime_type', 'application/octet-stream'),
-                as_attachment=False,
                 download_name=chat_msg['file'].get('name', 'file'),
             )
 
-        stored_name = resource.get('stored_name', '')
-        if not stored_name:
-            return jsonify({'error': 'File not found on disk'}), 404
-        abs_path = os.path.join(UPLOAD_DIR, stored_name)
-        if not os.path.exists(abs_path):
+        path = _resource_path(resource)
+        if not path or not storage.exists(path):
             return jsonify({'error': 'File not found on disk'}), 404
 
-        return send_file(
-            abs_path,
+        return file_delivery.deliver(
+            path,
+            etag=resource.get('sha256'),
             mimetype=resource.get('mime_type', 'application/octet-stream'),
-            as_attachment=False,
             download_name=resource.get('name', 'file'),
         )
     except Exception as e:
         logger.error(f"serve_academic_file error: {e}")
         return jsonify({'error': 'Failed to serve file'}), 500
+
+
+@academic_bp.route('/file/<resource_id>/url', methods=['GET'])
+@token_required
+def get_academic_file_url(resource_id):
+    """Short-lived signed URL for a resource file (see utils/file_delivery.py)."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        resource = db.academic_resources.find_one({'_id': ObjectId(resource_id)}, {'semester_id': 1})
+        if not resource:
+            return jsonify({'error': 'Resource not found'}), 404
+        if not _is_member(db, resource['semester_id'], user_id):
+            return jsonify({'error': 'Not a member'}), 403
+        url = file_delivery.sign_path(f'/api/academics/file/{resource_id}', 'academic', resource_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"get_academic_file_url error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
@@ -25,6 +25,8 @@ REST:
   POST   /api/ai/pdf/<pdf_id>/mock-paper/generate — pattern-aware mock paper
   POST   /api/ai/pdf/<pdf_id>/study-planner       — day-by-day study plan
   GET    /api/ai/pdf/<pdf_id>/performance         — quiz performance analytics
+  GET    /api/ai/pdf/<pdf_id>/rag-metrics         — retrieval latency / stage histograms
+  GET    /api/ai/rag-metrics                      — same, across all of the user's PDFs
 
   POST   /api/ai/semester/<semester_id>/chat-summarise — classroom chat summary
 """
@@ -32,10 +34,11 @@ REST:
 import os
 import re
 import json
-import shutil
+import hashlib
 import logging
 import threading
 import time
+from bisect import bisect_left
 from collections import OrderedDict
 from uuid import uuid4
 from datetime import datetime, timezone
@@ -46,7 +49,9 @@ from werkzeug.utils import secure_filename
 
 from middleware import token_required, is_member_of_classroom
 from celery_app import celery_app
-from utils.storage import save_file, resolve_local, delete_file
+from utils.storage import open_read, delete_file
+from utils.metrics_buffer import MetricsBuffer
+from utils import resumable, ingest, storage
 
 ai_bp = Blueprint('ai', __name__, url_prefix='/api/ai')
 logger = logging.getLogger(__name__)
@@ -79,6 +84,40 @@ _bm25_cache: 'OrderedDict[str, tuple]' = OrderedDict()
 _bm25_cache_lock = threading.Lock()
 
 
+def _rag_metrics_collection():
+    from database import get_db
+    return get_db().ai_rag_metrics
+
+
+# One background flusher writing batched insert_many calls, instead of a new
+# thread + insert_one per RAG query.
+_rag_metrics = MetricsBuffer(
+    _rag_metrics_collection,
+    batch_size=int(os.environ.get('RAG_METRICS_BATCH_SIZE', '50')),
+    flush_interval=float(os.environ.get('RAG_METRICS_FLUSH_SECONDS', '10')),
+)
+
+# ── Adaptive reranking ─────────────────────────────────────────────────────────
+# The cross-encoder is the most CPU-expensive retrieval stage on the web workers.
+# RAG_RERANK_MODE: 'always' runs it over every RRF candidate (the original
+# behavior), 'off' never runs it, and 'adaptive' (default) skips it when vector
+# and BM25 already agree on the top-n or the RRF score gap at the top-n cut is
+# decisive, and otherwise caps the number of pairs to fit RAG_RERANK_BUDGET_MS.
+_RERANK_MODE      = os.environ.get('RAG_RERANK_MODE', 'adaptive').strip().lower()
+_RERANK_AGREE     = float(os.environ.get('RAG_RERANK_AGREE', '0.8'))     # top-n overlap fraction
+_RERANK_MIN_GAP   = float(os.environ.get('RAG_RERANK_MIN_GAP', '0.25'))  # relative score gap at the cut
+_RERANK_BUDGET_MS = float(os.environ.get('RAG_RERANK_BUDGET_MS', '250'))  # 0 = no cap
+# (query hash, chunk hash) -> cross-encoder score. Bounded LRU like _bm25_cache.
+_RERANK_CACHE_MAX = int(os.environ.get('RAG_RERANK_CACHE_MAX', '5000'))
+_rerank_cache: 'OrderedDict[tuple, float]' = OrderedDict()
+_rerank_cache_lock = threading.Lock()
+# Moving average of observed cross-encoder cost per pair; updated under _rerank_cache_lock
+_ce_ms_per_pair = None
+
+# Upper bounds (ms) for the per-stage latency histograms in the rag-metrics endpoints
+_LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
 def _get_ai_cache(db, pdf_id: str, feature: str):
     """Return cached AI result or None. feature = 'summary'|'mindmap'|'formula'|'topics'"""
     rec = db.ai_result_cache.find_one({'pdf_id': pdf_id, 'feature': feature})
@@ -221,6 +260,14 @@ def _check_pdf_access(db, pdf_id: str, user_id: str):
     return doc
 
 
+def _pdf_ref(doc):
+    """Storage ref of a PDF record's file: its blob, or the `stored` ref
+    PDFs from before the blob store keep."""
+    if doc.get('blob'):
+        return storage.blob_ref(doc['blob'])
+    return doc.get('stored', '')
+
+
 def _collection_name(pdf_id: str) -> str:
     return f"pdf_{pdf_id}"
 
@@ -236,14 +283,18 @@ def _get_chunks(pdf_id: str) -> list:
         return []
 
 
-def _bm25_scores(pdf_id: str, chunks: list, query: str) -> list:
-    """Return BM25 relevance scores. Index is cached per pdf_id and rebuilt when chunk count changes."""
+def _bm25_scores(pdf_id: str, chunks: list, query: str, cache: dict = None) -> list:
+    """Return BM25 relevance scores. Index is cached per pdf_id and rebuilt when chunk count changes.
+    If `cache` is given, cache['bm25'] records whether the cached index was reused."""
     try:
         from rank_bm25 import BM25Okapi
         n = len(chunks)
         with _bm25_cache_lock:
             entry = _bm25_cache.get(pdf_id)
-            if entry is None or entry[0] != n:
+            hit   = entry is not None and entry[0] == n
+            if cache is not None:
+                cache['bm25'] = hit
+            if not hit:
                 tokenized = [c.lower().split() for c in chunks]
                 _bm25_cache[pdf_id] = (n, BM25Okapi(tokenized))
             _bm25_cache.move_to_end(pdf_id)
@@ -256,24 +307,90 @@ def _bm25_scores(pdf_id: str, chunks: list, query: str) -> list:
         return [0.0] * len(chunks)
 
 
-def _rerank(query: str, chunks: list, n: int) -> list:
-    """Cross-encoder reranking. Falls back to original order if model unavailable."""
+def _text_key(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+def _rerank(query: str, chunks: list, n: int, stats: dict = None) -> list:
+    """Cross-encoder reranking. Falls back to original order if model unavailable.
+    Scores are cached per (query, chunk), so a repeated question only pays for
+    pairs it hasn't seen; `stats` gets pairs_scored / pairs_cached."""
+    global _ce_ms_per_pair
     if len(chunks) <= 1:
         return chunks[:n]
     ce = _get_cross_encoder()
     if ce is None:
         return chunks[:n]
     try:
-        pairs  = [(query, chunk) for chunk in chunks]
-        scores = ce.predict(pairs)
-        ranked = sorted(zip(chunks, scores), key=lambda x: float(x[1]), reverse=True)
+        # The cache key is the exact query the model scores. The checkpoint's
+        # tokenizer lowercases anyway, so normalising costs nothing in scores.
+        query  = ' '.join(query.split()).lower()
+        q_key  = _text_key(query)
+        keys   = [(q_key, _text_key(chunk)) for chunk in chunks]
+        scores = [None] * len(chunks)
+        with _rerank_cache_lock:
+            for i, key in enumerate(keys):
+                if key in _rerank_cache:
+                    scores[i] = _rerank_cache[key]
+                    _rerank_cache.move_to_end(key)
+        missing = [i for i, sc in enumerate(scores) if sc is None]
+        if missing:
+            t0        = time.perf_counter()
+            predicted = ce.predict([(query, chunks[i]) for i in missing])
+            per_pair  = (time.perf_counter() - t0) * 1000 / len(missing)
+            with _rerank_cache_lock:
+                _ce_ms_per_pair = per_pair if _ce_ms_per_pair is None else 0.8 * _ce_ms_per_pair + 0.2 * per_pair
+                for i, score in zip(missing, predicted):
+                    scores[i] = float(score)
+                    _rerank_cache[keys[i]] = float(score)
+                while len(_rerank_cache) > _RERANK_CACHE_MAX:
+                    _rerank_cache.popitem(last=False)
+        if stats is not None:
+            stats['pairs_scored'] = len(missing)
+            stats['pairs_cached'] = len(chunks) - len(missing)
+        ranked = sorted(zip(chunks, scores), key=lambda x: x[1], reverse=True)
         return [c for c, _ in ranked[:n]]
     except Exception as exc:
         logger.warning(f"Reranking failed: {exc}")
         return chunks[:n]
 
 
-def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3) -> list:
+def _plan_rerank(mode: str, candidates: list, scores: list, n: int,
+                 vec_top: list = None, bm25_top: list = None):
+    """Decide how much cross-encoder work a query gets. Returns (decision, pairs):
+    pairs == 0 means skip and keep the fused order.
+
+    `scores` are the fusion scores aligned with `candidates` (RRF, or raw BM25
+    on the vector-down fallback). `vec_top`/`bm25_top` are each retriever's own
+    top-n, used for the agreement check — absent on the fallback path."""
+    if mode == 'off':
+        return 'off', 0
+    if mode == 'always':
+        return 'full', len(candidates)
+    if len(candidates) <= n:
+        # Reranking could only reorder — the final set is already decided
+        return 'skip_small', 0
+    if vec_top and bm25_top:
+        overlap = len(set(vec_top) & set(bm25_top)) / min(n, len(vec_top))
+        if overlap >= _RERANK_AGREE:
+            return 'skip_agree', 0
+    s_in, s_out = scores[n - 1], scores[n]
+    if s_in > 0 and (s_in - s_out) / s_in >= _RERANK_MIN_GAP:
+        return 'skip_gap', 0
+    if _RERANK_BUDGET_MS > 0 and _ce_ms_per_pair:
+        cap = max(n, int(_RERANK_BUDGET_MS / _ce_ms_per_pair))
+        if cap < len(candidates):
+            return 'capped', cap
+    return 'full', len(candidates)
+
+
+def _elapsed_ms(t0: float) -> float:
+    return round((time.perf_counter() - t0) * 1000, 2)
+
+
+def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3,
+                candidate_n: int = None, rerank=None, timings: dict = None,
+                cache: dict = None, rerank_info: dict = None) -> list:
     """
     Advanced RAG pipeline:
       1. Vector search  (top candidate_n results)
@@ -281,12 +398,30 @@ def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3) -> list:
       3. Reciprocal Rank Fusion (RRF) to merge both rankings
       4. Cross-encoder reranking of the RRF top results → final top-n
     Returns a list of n chunk strings.
+
+    `candidate_n` (default n*3) and `rerank` exist so the offline benchmark
+    (benchmarks/rag_benchmark.py) can compare configurations. `rerank` is a
+    RAG_RERANK_MODE value ('always' / 'adaptive' / 'off'), True/False for
+    always/off, or None to follow the env setting. Pass a dict as `timings` to
+    have per-stage wall time (embed/vector/bm25/rrf/rerank, in ms) written into
+    it, as `cache` to have cache hits recorded, and as `rerank_info` to get the
+    rerank decision for this query.
     """
-    candidate_n = n * 3
+    candidate_n = candidate_n or n * 3
+    if timings is None:
+        timings = {}
+    if rerank is None:
+        rerank = _RERANK_MODE
+    elif isinstance(rerank, bool):
+        rerank = 'always' if rerank else 'off'
 
     # ── Stage 1: Vector search ────────────────────────────────────────────────
+    t0        = time.perf_counter()
     embedder  = _get_embedder()
     q_vec     = embedder.encode([query], normalize_embeddings=True).tolist()[0]
+    timings['embed'] = _elapsed_ms(t0)
+
+    t0         = time.perf_counter()
     vec_chunks = []
     last_err   = None
     for attempt in range(retries):
@@ -294,6 +429,7 @@ def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3) -> list:
             col   = _get_chroma().get_or_create_collection(_collection_name(pdf_id))
             count = col.count()
             if count == 0:
+                timings['vector'] = _elapsed_ms(t0)
                 return []
             res        = col.query(query_embeddings=[q_vec], n_results=min(candidate_n, count), include=['documents'])
             vec_chunks = res['documents'][0] if res.get('documents') else []
@@ -302,8 +438,10 @@ def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3) -> list:
             last_err = exc
             if attempt < retries - 1:
                 time.sleep(0.4 * (attempt + 1))
+    timings['vector'] = _elapsed_ms(t0)
 
     # Fetch all chunks once — reused for BM25 and as vector-search fallback
+    t0         = time.perf_counter()
     all_chunks = _get_chunks(pdf_id)
 
     if not vec_chunks:
@@ -311,39 +449,87 @@ def _hybrid_rag(pdf_id: str, query: str, n: int = 5, retries: int = 3) -> list:
             logger.warning(f"_hybrid_rag vector search failed for {pdf_id}: {last_err}")
         # Fall back to BM25-only when vector search is completely unavailable
         if not all_chunks:
+            timings['bm25'] = _elapsed_ms(t0)
             return []
-        bm25_raw    = _bm25_scores(pdf_id, all_chunks, query)
+        bm25_raw    = _bm25_scores(pdf_id, all_chunks, query, cache)
         bm25_ranked = sorted(range(len(all_chunks)), key=lambda i: bm25_raw[i], reverse=True)[:candidate_n]
-        return _rerank(query, [all_chunks[i] for i in bm25_ranked], n)
+        timings['bm25'] = _elapsed_ms(t0)
+        return _rerank_stage(query, [all_chunks[i] for i in bm25_ranked], [bm25_raw[i] for i in bm25_ranked],
+                             n, rerank, timings, cache, rerank_info)
 
     # ── Stage 2 & 3: BM25 + RRF ──────────────────────────────────────────────
+    bm25_ranked = []
+    if all_chunks:
+        bm25_raw    = _bm25_scores(pdf_id, all_chunks, query, cache)
+        bm25_ranked = sorted(enumerate(bm25_raw), key=lambda x: x[1], reverse=True)[:candidate_n]
+    timings['bm25'] = _elapsed_ms(t0)
+
+    t0 = time.perf_counter()
     rrf: dict = {}
     for rank, chunk in enumerate(vec_chunks):
         rrf[chunk] = rrf.get(chunk, 0.0) + 1.0 / (rank + 60)
+    for rank, (idx, score) in enumerate(bm25_ranked):
+        if score > 0:
+            chunk = all_chunks[idx]
+            rrf[chunk] = rrf.get(chunk, 0.0) + 1.0 / (rank + 60)
 
-    if all_chunks:
-        bm25_raw    = _bm25_scores(pdf_id, all_chunks, query)
-        bm25_ranked = sorted(enumerate(bm25_raw), key=lambda x: x[1], reverse=True)[:candidate_n]
-        for rank, (idx, score) in enumerate(bm25_ranked):
-            if score > 0:
-                chunk = all_chunks[idx]
-                rrf[chunk] = rrf.get(chunk, 0.0) + 1.0 / (rank + 60)
-
-    candidates = [c for c, _ in sorted(rrf.items(), key=lambda x: x[1], reverse=True)][:candidate_n]
+    fused      = sorted(rrf.items(), key=lambda x: x[1], reverse=True)[:candidate_n]
+    candidates = [c for c, _ in fused]
+    timings['rrf'] = _elapsed_ms(t0)
 
     # ── Stage 4: Cross-encoder reranking ─────────────────────────────────────
-    return _rerank(query, candidates, n)
-
-
-def _rag_search(pdf_id: str, query: str, n: int = 5, retries: int = 3):
+    vec_top  = vec_chunks[:n]
+    bm25_top = [all_chunks[idx] for idx, score in bm25_ranked[:n] if score > 0]
+    return _rerank_stage(query, candidates, [sc for _, sc in fused], n, rerank, timings,
+                         cache, rerank_info, vec_top, bm25_top)
+
+
+def _rerank_stage(query: str, candidates: list, scores: list, n: int, mode: str, timings: dict,
+                  cache: dict = None, rerank_info: dict = None,
+                  vec_top: list = None, bm25_top: list = None) -> list:
+    decision, pairs = _plan_rerank(mode, candidates, scores, n, vec_top, bm25_top)
+    if rerank_info is not None:
+        rerank_info.update({'decision': decision, 'candidates': len(candidates), 'pairs': pairs})
+    if not pairs:
+        return candidates[:n]
+    t0     = time.perf_counter()
+    stats  = {}
+    result = _rerank(query, candidates[:pairs], n, stats=stats)
+    timings['rerank'] = _elapsed_ms(t0)
+    if rerank_info is not None:
+        rerank_info.update(stats)
+    if cache is not None and stats:
+        cache['rerank'] = stats['pairs_scored'] == 0
+    return result
+
+
+def _rag_search(pdf_id: str, query: str, n: int = 5, retries: int = 3, trace: dict = None):
     """
     Public retrieval entry point — runs the full hybrid pipeline and tracks metrics.
     Returns {'documents': [[...]], 'metadatas': [[]]} for backward compatibility.
+
+    Callers that go on to call the LLM pass a dict as `trace`: the retrieval half
+    is filled in here, the caller adds stages['llm'] and hands it to
+    _record_rag_trace once the answer is back. Without `trace` the metric is
+    recorded straight away.
     """
-    t0     = time.time()
-    chunks = _hybrid_rag(pdf_id, query, n=n, retries=retries)
-    latency = round((time.time() - t0) * 1000, 1)
-    threading.Thread(target=_track_rag_metric, args=(pdf_id, len(chunks), latency), daemon=True).start()
+    owns_trace = trace is None
+    if owns_trace:
+        trace = {}
+    stages, cache, rerank_info = {}, {}, {}
+    t0     = time.perf_counter()
+    chunks = _hybrid_rag(pdf_id, query, n=n, retries=retries, timings=stages, cache=cache,
+                         rerank_info=rerank_info)
+    trace.update({
+        'pdf_id':           pdf_id,
+        'chunks_retrieved': len(chunks),
+        'latency_ms':       round((time.perf_counter() - t0) * 1000, 1),
+        'stages':           stages,
+        'cache':            cache,
+        'rerank':           rerank_info,
+    })
+    if owns_trace:
+        _record_rag_trace(trace)
     return {'documents': [chunks], 'metadatas': [[{}] * len(chunks)]}
 
 
@@ -363,18 +549,30 @@ def _get_full_text_from_db(pdf_id: str) -> str:
         return ''
 
 
-def _track_rag_metric(pdf_id: str, chunks_retrieved: int, latency_ms: float):
-    """Persist a single RAG query metric (non-critical, fire-and-forget)."""
+def _record_rag_trace(trace: dict, endpoint: str = None):
+    """Queue one RAG query metric for the next batched write (non-critical).
+    A trace that never reached retrieval (e.g. _rag_search mocked out) is ignored."""
+    if not trace.get('pdf_id'):
+        return
+    _rag_metrics.record({
+        'pdf_id':           trace['pdf_id'],
+        'chunks_retrieved': trace.get('chunks_retrieved', 0),
+        'latency_ms':       trace.get('latency_ms', 0.0),
+        'stages':           trace.get('stages', {}),
+        'cache':            trace.get('cache', {}),
+        'rerank':           trace.get('rerank', {}),
+        'endpoint':         endpoint,
+        'ts':               datetime.now(timezone.utc),
+    })
+
+
+def _timed_llm(trace: dict, messages: list, **kwargs) -> str:
+    """_groq_complete, with its wall time added to the RAG trace as stages['llm']."""
+    t0 = time.perf_counter()
     try:
-        from database import get_db
-        get_db().ai_rag_metrics.insert_one({
-            'pdf_id':           pdf_id,
-            'chunks_retrieved': chunks_retrieved,
-            'latency_ms':       latency_ms,
-            'ts':               datetime.now(timezone.utc),
-        })
-    except Exception:
-        pass
+        return _groq_complete(messages, **kwargs)
+    finally:
+        trace.setdefault('stages', {})['llm'] = _elapsed_ms(t0)
 
 
 def _parse_json_response(raw: str):
@@ -393,18 +591,32 @@ def _clean_prose(text: str) -> str:
     return re.sub(r'^#{1,6}\s*', '', text, flags=re.MULTILINE)
 
 
+def _chunk_text(text: str, chunk_size: int = 400, overlap: int = 80) -> list:
+    """Split extracted PDF text into overlapping word windows. Shared by indexing
+    and the offline benchmark so both see exactly the same chunk boundaries."""
+    words  = text.split()
+    chunks = []
+    for i in range(0, max(1, len(words) - overlap), chunk_size - overlap):
+        chunk = ' '.join(words[i: i + chunk_size])
+        if len(chunk.strip()) < 50:
+            continue
+        chunks.append(chunk)
+    return chunks
+
+
 def _index_pdf(path: str, pdf_id: str):
     """Background: extract, chunk, embed and store a PDF in its own ChromaDB collection.
-    `path` is a storage reference (local path, or 's3://...') — resolved to a local
-    file here so this works whether the caller is the same process/machine that
-    saved the upload, or a separate Celery worker instance."""
+    `path` is a storage reference (local path, or 's3://...') — read through
+    storage.open_read so this works whether the caller is the same process/machine
+    that saved the upload, or a separate Celery worker instance, without first
+    downloading an S3 object to disk."""
     from database import get_db
     logger.info(f"Indexing PDF {pdf_id} …")
-    local_path = resolve_local(path, AI_PDF_DIR, f'{pdf_id}.pdf')
     with _index_semaphore:  # serialize writes to avoid ChromaDB lock contention
         try:
             import fitz  # PyMuPDF
-            doc  = fitz.open(local_path)
+            with open_read(path, AI_PDF_DIR, f'{pdf_id}.pdf') as f:
+                doc = fitz.open(stream=f.read(), filetype='pdf')
             text = '\n'.join(page.get_text() for page in doc)
             doc.close()
 
@@ -419,19 +631,9 @@ def _index_pdf(path: str, pdf_id: str):
             except Exception:
                 pass  # non-critical
 
-            words      = text.split()
-            chunk_size = 400
-            overlap    = 80
-            chunks, metas, ids = [], [], []
-
-            for i in range(0, max(1, len(words) - overlap), chunk_size - overlap):
-                chunk = ' '.join(words[i: i + chunk_size])
-                if len(chunk.strip()) < 50:
-                    continue
-                idx = len(chunks)
-                chunks.append(chunk)
-                metas.append({'pdf_id': pdf_id, 'chunk_index': idx})
-                ids.append(f"{pdf_id}_c{idx}")
+            chunks = _chunk_text(text)
+            metas  = [{'pdf_id': pdf_id, 'chunk_index': idx} for idx in range(len(chunks))]
+            ids    = [f"{pdf_id}_c{idx}" for idx in range(len(chunks))]
 
             if chunks:
                 embedder = _get_embedder()
@@ -488,33 +690,38 @@ def _dispatch_index_pdf(path: str, pdf_id: str):
 def upload_pdf():
     from database import get_db
     user_id = request.user['user_id']
+    if ingest.body_too_large(MAX_PDF_SIZE):
+        return jsonify({'error': 'File exceeds 20 MB limit'}), 413
     if 'file' not in request.files:
         return jsonify({'error': 'No file provided'}), 400
 
     file = request.files['file']
     if not file.filename.lower().endswith('.pdf'):
         return jsonify({'error': 'Only PDF files are accepted'}), 400
-    if request.content_length and request.content_length > MAX_PDF_SIZE:
-        return jsonify({'error': 'File exceeds 20 MB limit'}), 413
 
     pdf_id   = str(uuid4())
     filename = secure_filename(file.filename)
-    dst      = os.path.join(AI_PDF_DIR, f'{pdf_id}.pdf')
-    file.save(dst)
-    size = os.path.getsize(dst)
-
-    if size > MAX_PDF_SIZE:
-        os.remove(dst)
+    incoming = storage.incoming_path()
+    try:
+        saved = ingest.save(file, incoming, max_size=MAX_PDF_SIZE)
+    except ingest.TooLarge:
         return jsonify({'error': 'File exceeds 20 MB limit'}), 413
+    except ingest.DisallowedType:
+        return jsonify({'error': 'Only PDF files are accepted'}), 400
 
-    stored_ref = save_file(dst, f'ai_pdfs/{pdf_id}.pdf')
+    _add_user_pdf(get_db(), user_id, pdf_id, filename, incoming, saved.size, saved.sha256)
+    return jsonify({'pdf_id': pdf_id, 'filename': filename, 'size': saved.size}), 201
+
+
+def _add_user_pdf(db, user_id, pdf_id, filename, local_path, size, sha256):
+    """Store the PDF at `local_path` as a blob, record it and start indexing."""
+    stored_ref = storage.put_blob(db, local_path, sha256, size)
 
-    db = get_db()
     db.ai_user_pdfs.insert_one({
         'pdf_id':      pdf_id,
         'user_id':     user_id,
         'filename':    filename,
-        'stored':      stored_ref,
+        'blob':        sha256,
         'size':        size,
         'indexed':     False,
         'source':      'upload',
@@ -523,7 +730,24 @@ def upload_pdf():
     })
 
     _dispatch_index_pdf(stored_ref, pdf_id)
-    return jsonify({'pdf_id': pdf_id, 'filename': filename, 'size': size}), 201
+
+
+# Resumable uploads (utils/resumable.py) — no params
+
+def _authorize_resumable(db, user, params, filename):
+    if not filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Only PDF files are accepted'}), 400
+    return None
+
+
+def _finalize_resumable(db, user, params, upload):
+    pdf_id   = str(uuid4())
+    filename = secure_filename(upload.filename)
+    _add_user_pdf(db, user['user_id'], pdf_id, filename, upload.path, upload.size, upload.sha256)
+    return jsonify({'pdf_id': pdf_id, 'filename': filename, 'size': upload.size}), 201
+
+
+resumable.register('ai_pdf', _authorize_resumable, _finalize_resumable, MAX_PDF_SIZE)
 
 
 @ai_bp.route('/pdf/list', methods=['GET'])
@@ -565,7 +789,7 @@ def reindex_pdf(pdf_id):
          '$unset': {'index_error': ''}},
     )
     _invalidate_ai_cache(db, pdf_id)
-    _dispatch_index_pdf(doc['stored'], pdf_id)
+    _dispatch_index_pdf(_pdf_ref(doc), pdf_id)
     return jsonify({'message': 'Reindexing started'}), 200
 
 
@@ -580,8 +804,11 @@ def delete_pdf(pdf_id):
     except ValueError as e:
         return jsonify({'error': str(e)}), 403
 
-    # Remove file
-    delete_file(doc.get('stored', ''), AI_PDF_DIR, f'{pdf_id}.pdf')
+    # Release the file (PDFs from before the blob store own theirs)
+    if doc.get('blob'):
+        storage.release_blob(db, doc['blob'])
+    else:
+        delete_file(doc.get('stored', ''), AI_PDF_DIR, f'{pdf_id}.pdf')
 
     # Remove ChromaDB collection
     try:
@@ -717,13 +944,11 @@ def import_resource_pdf():
         if not msg:
             return jsonify({'error': 'Chat message not found'}), 404
         f = msg.get('file') or {}
-        rel_path = f.get('path', '')
-        # path is stored as e.g. "uploads\chat\..." — normalise to absolute
-        rel_path = rel_path.replace('\\', '/')
-        src = os.path.join(os.getcwd(), rel_path) if not os.path.isabs(rel_path) else rel_path
-        if not rel_path or not os.path.exists(src):
+        src = storage.message_file_ref(f)
+        if not src or not storage.exists(src):
             return jsonify({'error': 'File not found on disk'}), 404
         filename = f.get('name', 'attachment.pdf')
+        blob, size = f.get('blob'), f.get('size')
     else:
         # academic resource
         try:
@@ -733,26 +958,32 @@ def import_resource_pdf():
         if not resource:
             return jsonify({'error': 'Resource not found'}), 404
         stored = resource.get('stored_name', '')
-        src    = os.path.join(ACADEMICS_DIR, stored)
-        if not stored or not os.path.exists(src):
+        src    = storage.blob_ref(resource['blob']) if resource.get('blob') else os.path.join(ACADEMICS_DIR, stored)
+        if not (resource.get('blob') or stored) or not storage.exists(src):
             return jsonify({'error': 'File not found on disk'}), 404
         filename = resource.get('name') or stored
+        blob, size = resource.get('blob'), resource.get('size')
 
-    pdf_id = str(uuid4())
-    dst    = os.path.join(AI_PDF_DIR, f'{pdf_id}.pdf')
-    try:
-        shutil.copy2(src, dst)
-    except (FileNotFoundError, OSError):
-        # Source could have been deleted between the exists() check above and here
-        return jsonify({'error': 'File not found on disk'}), 404
-    size   = os.path.getsize(dst)
-    stored_ref = save_file(dst, f'ai_pdfs/{pdf_id}.pdf')
+    # The same bytes are already a blob: share it rather than copy it
+    if blob and storage.retain_blob(db, blob):
+        stored_ref = src
+    else:
+        incoming = storage.incoming_path()
+        try:
+            with storage.open_read(src) as f:
+                saved = ingest.save(f, incoming, allow_dangerous=True)
+        except (FileNotFoundError, OSError):
+            # Source could have been deleted between the exists() check above and here
+            return jsonify({'error': 'File not found on disk'}), 404
+        blob, size = saved.sha256, saved.size
+        stored_ref = storage.put_blob(db, incoming, blob, size)
 
+    pdf_id = str(uuid4())
     db.ai_user_pdfs.insert_one({
         'pdf_id':      pdf_id,
         'user_id':     user_id,
         'filename':    filename,
-        'stored':      stored_ref,
+        'blob':        blob,
         'size':        size,
         'indexed':     False,
         'source':      source_type,
@@ -853,8 +1084,9 @@ def chat_with_pdf(pdf_id):
     if not question and not attachment:
         return jsonify({'error': 'question is required'}), 400
 
-    rag_n = 10 if deep_research else 5
-    results = _rag_search(pdf_id, question or (attachment or {}).get('name', ''), n=rag_n)
+    rag_n     = 10 if deep_research else 5
+    rag_trace = {}
+    results   = _rag_search(pdf_id, question or (attachment or {}).get('name', ''), n=rag_n, trace=rag_trace)
     chunks  = results['documents'][0] if results.get('documents') else []
     metas   = results['metadatas'][0]  if results.get('metadatas')  else []
     context = '\n\n---\n\n'.join(chunks) if chunks else ''
@@ -922,14 +1154,16 @@ def chat_with_pdf(pdf_id):
         model = 'llama-3.3-70b-versatile'
 
     try:
-        answer = _clean_prose(_groq_complete(
-            messages, max_tokens=1600 if deep_research else 800, model=model))
+        answer = _clean_prose(_timed_llm(
+            rag_trace, messages, max_tokens=1600 if deep_research else 800, model=model))
         return jsonify({'answer': answer, 'sources': sources}), 200
     except RuntimeError as e:
         return jsonify({'error': str(e)}), 503
     except Exception as e:
         logger.error(f"Chat error: {e}")
         return jsonify({'error': 'Failed to answer'}), 500
+    finally:
+        _record_rag_trace(rag_trace, endpoint='chat')
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1416,12 +1650,14 @@ def formula_sheet(pdf_id):
             return jsonify({'formulas': cached, 'cached': True}), 200
 
     # Use RAG to find formula-dense sections
-    query   = "equations formulas mathematical expressions constants variables"
-    results = _rag_search(pdf_id, query, n=8)
-    chunks  = results['documents'][0] if results.get('documents') else []
-    context = '\n\n'.join(chunks) if chunks else _get_all_text(pdf_id, max_chars=8000)
+    query     = "equations formulas mathematical expressions constants variables"
+    rag_trace = {}
+    results   = _rag_search(pdf_id, query, n=8, trace=rag_trace)
+    chunks    = results['documents'][0] if results.get('documents') else []
+    context   = '\n\n'.join(chunks) if chunks else _get_all_text(pdf_id, max_chars=8000)
 
     if not context:
+        _record_rag_trace(rag_trace, endpoint='formula_sheet')
         return jsonify({'error': 'PDF not yet indexed.'}), 400
 
     prompt = f"""Extract all formulas, equations, and mathematical expressions from the following content.
@@ -1439,8 +1675,8 @@ Content:
 Return only the JSON array. If no formulas found, return an empty array []."""
 
     try:
-        formulas = _parse_json_response(_groq_complete(
-            [{'role': 'user', 'content': prompt}], max_tokens=2000))
+        formulas = _parse_json_response(_timed_llm(
+            rag_trace, [{'role': 'user', 'content': prompt}], max_tokens=2000))
         _set_ai_cache(db, pdf_id, 'formula', formulas)
         return jsonify({'formulas': formulas}), 200
     except RuntimeError as e:
@@ -1450,6 +1686,8 @@ Return only the JSON array. If no formulas found, return an empty array []."""
     except Exception as e:
         logger.error(f"Formula sheet error: {e}")
         return jsonify({'error': 'Failed to extract formulas'}), 500
+    finally:
+        _record_rag_trace(rag_trace, endpoint='formula_sheet')
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1785,11 +2023,13 @@ def study_planner(pdf_id):
         days_between = 1
 
     # Use RAG to find topic overview
-    results = _rag_search(pdf_id, 'topics chapters syllabus overview introduction', n=8)
-    chunks  = results['documents'][0] if results.get('documents') else []
-    context = '\n\n'.join(chunks) if chunks else _get_all_text(pdf_id, max_chars=6000)
+    rag_trace = {}
+    results   = _rag_search(pdf_id, 'topics chapters syllabus overview introduction', n=8, trace=rag_trace)
+    chunks    = results['documents'][0] if results.get('documents') else []
+    context   = '\n\n'.join(chunks) if chunks else _get_all_text(pdf_id, max_chars=6000)
 
     if not context:
+        _record_rag_trace(rag_trace, endpoint='study_planner')
         return jsonify({'error': 'PDF not yet indexed.'}), 400
 
     weak_str = f"\nWeak areas to prioritise: {', '.join(weak_topics)}" if weak_topics else ''
@@ -1826,8 +2066,8 @@ Prioritise weak areas. Build from fundamentals to advanced. Include revision day
 Return only the JSON object, no other text."""
 
     try:
-        plan = _parse_json_response(_groq_complete(
-            [{'role': 'user', 'content': prompt}], max_tokens=4000))
+        plan = _parse_json_response(_timed_llm(
+            rag_trace, [{'role': 'user', 'content': prompt}], max_tokens=4000))
         return jsonify({'plan': plan}), 200
     except RuntimeError as e:
         return jsonify({'error': str(e)}), 503
@@ -1836,6 +2076,8 @@ Return only the JSON object, no other text."""
     except Exception as e:
         logger.error(f"Study planner error: {e}")
         return jsonify({'error': 'Failed to generate study plan'}), 500
+    finally:
+        _record_rag_trace(rag_trace, endpoint='study_planner')
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -1899,6 +2141,72 @@ def get_performance(pdf_id):
 # RAG Metrics (retrieval quality evaluation)
 # ══════════════════════════════════════════════════════════════════════════════
 
+def _percentile(sorted_vals: list, q: float) -> float:
+    return sorted_vals[max(0, int(len(sorted_vals) * q) - 1)]
+
+
+def _latency_histogram(values: list) -> list:
+    """Bucket counts against _LATENCY_BUCKETS_MS; the last bucket (le=None) is overflow."""
+    counts = [0] * (len(_LATENCY_BUCKETS_MS) + 1)
+    for v in values:
+        counts[bisect_left(_LATENCY_BUCKETS_MS, v)] += 1
+    return [{'le': le, 'count': c} for le, c in zip(list(_LATENCY_BUCKETS_MS) + [None], counts)]
+
+
+def _summarize_rag_metrics(records: list) -> dict:
+    latencies   = [r['latency_ms'] for r in records]
+    retrievals  = [r['chunks_retrieved'] for r in records]
+    success_pct = round(sum(1 for c in retrievals if c > 0) / len(retrievals) * 100, 1)
+    sorted_lat  = sorted(latencies)
+
+    # Per-stage breakdown — only records written since stage tracing was added carry it
+    stage_values: dict = {}
+    for r in records:
+        for stage, ms in (r.get('stages') or {}).items():
+            stage_values.setdefault(stage, []).append(ms)
+    stages = {}
+    for stage, values in stage_values.items():
+        ordered = sorted(values)
+        stages[stage] = {
+            'count':     len(values),
+            'avg_ms':    round(sum(values) / len(values), 1),
+            'p50_ms':    round(_percentile(ordered, 0.50), 1),
+            'p95_ms':    round(_percentile(ordered, 0.95), 1),
+            'histogram': _latency_histogram(values),
+        }
+
+    cache_hits: dict = {}
+    for r in records:
+        for name, hit in (r.get('cache') or {}).items():
+            entry = cache_hits.setdefault(name, {'hits': 0, 'lookups': 0})
+            entry['lookups'] += 1
+            entry['hits']    += 1 if hit else 0
+    for entry in cache_hits.values():
+        entry['hit_pct'] = round(entry['hits'] / entry['lookups'] * 100, 1)
+
+    # Adaptive rerank decisions — how often the cross-encoder was skipped or capped
+    decisions: dict = {}
+    pairs = []
+    for r in records:
+        info = r.get('rerank') or {}
+        if info.get('decision'):
+            decisions[info['decision']] = decisions.get(info['decision'], 0) + 1
+            pairs.append(info.get('pairs', 0))
+    rerank = {'decisions': decisions, 'avg_pairs': round(sum(pairs) / len(pairs), 1)} if pairs else {}
+
+    return {
+        'total_queries':         len(records),
+        'avg_latency_ms':        round(sum(latencies) / len(latencies), 1),
+        'p95_latency_ms':        round(_percentile(sorted_lat, 0.95), 1),
+        'avg_chunks_retrieved':  round(sum(retrievals) / len(retrievals), 1),
+        'retrieval_success_pct': success_pct,
+        'latency_histogram':     _latency_histogram(latencies),
+        'stages':                stages,
+        'cache':                 cache_hits,
+        'rerank':                rerank,
+    }
+
+
 @ai_bp.route('/pdf/<pdf_id>/rag-metrics', methods=['GET'])
 @token_required
 def get_rag_metrics(pdf_id):
@@ -1910,28 +2218,17 @@ def get_rag_metrics(pdf_id):
     except ValueError as e:
         return jsonify({'error': str(e)}), 403
 
+    _rag_metrics.flush()  # include this process's not-yet-written queries
     records = list(db.ai_rag_metrics.find(
         {'pdf_id': pdf_id},
-        {'_id': 0, 'chunks_retrieved': 1, 'latency_ms': 1, 'ts': 1},
+        {'_id': 0, 'chunks_retrieved': 1, 'latency_ms': 1, 'stages': 1, 'cache': 1,
+         'rerank': 1, 'endpoint': 1, 'ts': 1},
     ).sort('ts', -1).limit(200))
 
     if not records:
         return jsonify({'metrics': [], 'summary': {}}), 200
 
-    latencies   = [r['latency_ms'] for r in records]
-    retrievals  = [r['chunks_retrieved'] for r in records]
-    success_pct = round(sum(1 for c in retrievals if c > 0) / len(retrievals) * 100, 1)
-    sorted_lat  = sorted(latencies)
-    p95_idx     = max(0, int(len(sorted_lat) * 0.95) - 1)
-
-    summary = {
-        'total_queries':         len(records),
-        'avg_latency_ms':        round(sum(latencies) / len(latencies), 1),
-        'p95_latency_ms':        round(sorted_lat[p95_idx], 1),
-        'avg_chunks_retrieved':  round(sum(retrievals) / len(retrievals), 1),
-        'retrieval_success_pct': success_pct,
-    }
-
+    summary = _summarize_rag_metrics(records)
     for r in records:
         if r.get('ts'):
             r['ts'] = r['ts'].isoformat()
@@ -1939,6 +2236,26 @@ def get_rag_metrics(pdf_id):
     return jsonify({'metrics': records, 'summary': summary}), 200
 
 
+@ai_bp.route('/rag-metrics', methods=['GET'])
+@token_required
+def get_all_rag_metrics():
+    """Aggregate stage histograms across every PDF the user owns (last 1000 queries)."""
+    from database import get_db
+    user_id = request.user['user_id']
+    db      = get_db()
+
+    pdf_ids = [p['pdf_id'] for p in db.ai_user_pdfs.find({'user_id': user_id}, {'pdf_id': 1})]
+    if not pdf_ids:
+        return jsonify({'summary': {}}), 200
+
+    _rag_metrics.flush()
+    records = list(db.ai_rag_metrics.find(
+        {'pdf_id': {'$in': pdf_ids}},
+        {'_id': 0, 'chunks_retrieved': 1, 'latency_ms': 1, 'stages': 1, 'cache': 1, 'rerank': 1},
+    ).sort('ts', -1).limit(1000))
+    return jsonify({'summary': _summarize_rag_metrics(records) if records else {}}), 200
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 # Chat Summariser (semester-level, kept separate)
 # ══════════════════════════════════════════════════════════════════════════════
@@ -12,15 +12,15 @@ Socket: connect / disconnect / join_room / send_message
 
 import os
 import re
+import base64
 import logging
 from datetime import datetime, timezone
 from typing import Optional
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from flask_socketio import join_room, emit
 from bson import ObjectId
 import jwt
-from werkzeug.utils import secure_filename
 
 from middleware import token_required, SECRET_KEY
 from socketio_instance import socketio
@@ -28,6 +28,9 @@ from utils.encryption import encrypt_text, decrypt_text
 from utils.mime_check import is_dangerous
 from utils import cas_update_reactions, ConcurrentUpdateError
 from utils import presence
+from utils import chat_cache
+from utils import user_cache
+from utils import http_cache, file_delivery, resumable, ingest, storage
 
 chat_bp = Blueprint('chat', __name__, url_prefix='/api/chat')
 logger = logging.getLogger(__name__)
@@ -42,11 +45,17 @@ def _safe_decrypt(value: Optional[str]) -> Optional[str]:
     except Exception:
         return None
 
+# Attachments from before the blob store (utils/storage.py); new ones are blobs
 CHAT_UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads', 'chat')
 os.makedirs(CHAT_UPLOAD_DIR, exist_ok=True)
 
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
 
+# History pages read at most limit × this many rows looking for messages the
+# reader hasn't hidden, so a user who hid a long run of messages still gets
+# constant-cost pages (possibly short ones, with a cursor to carry on from).
+HISTORY_SCAN_FACTOR = 4
+
 # Maps socket session ID → {user_id, username, full_name}
 _connected_users = {}
 
@@ -89,6 +98,28 @@ def notify_status_change(user_id, show_online):
         socketio.emit(event, {'user_id': user_id}, to=semester_id)
 
 
+def invalidate_user_rooms(user_id):
+    """Drop the hot history cache for every semester this user belongs to.
+
+    Cached messages carry the sender's profile_picture as it was when they were
+    serialized, so settings/classroom routes call this whenever a picture
+    changes; the next history load rebuilds those rooms from Mongo.
+    """
+    from database import get_db
+    for semester_id in _user_semester_ids(get_db(), user_id):
+        chat_cache.invalidate(semester_id)
+
+
+def refresh_cached_message(semester_id, message_id):
+    """Re-serialize one message from the DB into the hot history cache — for
+    changes made outside the handlers that already hold a fresh payload."""
+    from database import get_db
+    db = get_db()
+    msg = db.chat_messages.find_one({'_id': ObjectId(message_id)})
+    if msg:
+        chat_cache.replace(semester_id, _serialize_message(msg, _sender_pictures(db, [msg]).get(msg['user_id'])))
+
+
 # ─── Helpers ──────────────────────────────────────────────────────────────────
 
 def _delete_message_and_cascade(db, message_id, semester_id):
@@ -97,24 +128,44 @@ def _delete_message_and_cascade(db, message_id, semester_id):
         msg = db.chat_messages.find_one({'_id': ObjectId(message_id), 'semester_id': semester_id})
         if not msg:
             return
-        # Delete physical file from disk
-        if msg.get('file') and msg['file'].get('path'):
-            try:
-                abs_path = os.path.join(os.getcwd(), msg['file']['path'])
-                if os.path.exists(abs_path):
-                    os.remove(abs_path)
-            except OSError:
-                pass
+        # Release the file (deleted with its last reference)
+        if msg.get('file'):
+            storage.release_message_file(db, msg['file'])
         # Cascade: remove any academic_resources that reference this chat message
         db.academic_resources.delete_many({
             'chat_message_id': str(msg['_id']),
             'source': 'chat',
         })
         db.chat_messages.delete_one({'_id': ObjectId(message_id)})
+        chat_cache.remove(semester_id, message_id)
     except Exception as e:
         logger.warning(f"_delete_message_and_cascade error: {e}")
 
 
+def _sender_pictures(db, msgs):
+    """{user_id: profile_picture} for the senders of `msgs` — one user_cache
+    lookup, with any misses fetched in a single batch."""
+    users = user_cache.get_users(db, {m['user_id'] for m in msgs if m.get('user_id')})
+    return {uid: u.get('profile_picture') for uid, u in users.items()}
+
+
+def _load_hot_entries(db, semester_id):
+    """Read and serialize the newest HOT_SIZE messages for the hot cache,
+    oldest first. Unlike a history page this doesn't filter hidden_for — the
+    cache holds the room as everyone sees it and filters per reader."""
+    msgs = list(db.chat_messages.find(
+        {'semester_id': semester_id},
+        sort=[('_id', -1)],
+        limit=chat_cache.HOT_SIZE,
+    ))
+    msgs.reverse()
+    pic_map = _sender_pictures(db, msgs)
+    return [
+        {'m': _serialize_message(m, pic_map.get(m.get('user_id'))), 'h': list(m.get('hidden_for', []))}
+        for m in msgs
+    ]
+
+
 def _serialize_message(msg, profile_picture=None):
     deleted = msg.get('deleted_for_everyone', False)
     result = {
@@ -131,7 +182,8 @@ def _serialize_message(msg, profile_picture=None):
         'edited_at': msg['edited_at'].isoformat().replace('+00:00', '') + 'Z' if msg.get('edited_at') else None,
     }
     if msg.get('file') and not deleted:
-        result['file'] = msg['file']
+        # Never the storage path (older messages have one)
+        result['file'] = {k: v for k, v in msg['file'].items() if k != 'path'}
     if msg.get('reply_to') and not deleted:
         result['reply_to'] = msg['reply_to']
     if msg.get('poll') and not deleted:
@@ -149,6 +201,54 @@ def _serialize_message(msg, profile_picture=None):
     return result
 
 
+def _encode_cursor(oid) -> str:
+    """Opaque pagination token for "messages older than this one"."""
+    return base64.urlsafe_b64encode(ObjectId(oid).binary).decode()
+
+
+def _decode_cursor(token: str) -> ObjectId:
+    """Inverse of _encode_cursor; raises ValueError on anything malformed."""
+    try:
+        return ObjectId(base64.urlsafe_b64decode(token.encode()))
+    except Exception:
+        raise ValueError('invalid cursor')
+
+
+def _history_page(db, semester_id, user_id, limit, before=None):
+    """One page of history, newest first, as (messages, next_cursor).
+
+    Keyset pagination on (semester_id, _id) — served by the
+    chat_messages_semester_id index, so page 100 costs the same as page 1.
+    hidden_for is filtered here rather than in the query (a $nin can't use
+    that index); to still return full pages we over-read, up to
+    HISTORY_SCAN_FACTOR × limit rows. next_cursor is None once the semester's
+    history is exhausted.
+    """
+    query = {'semester_id': semester_id}
+    if before is not None:
+        query['_id'] = {'$lt': before}
+    scan_cap = limit * HISTORY_SCAN_FACTOR
+    rows = db.chat_messages.find(query, sort=[('_id', -1)], limit=scan_cap + 1, batch_size=limit + 1)
+    page, last_seen, scanned = [], None, 0
+    for m in rows:
+        if len(page) == limit or scanned == scan_cap:
+            return page, _encode_cursor(last_seen)
+        scanned += 1
+        last_seen = m['_id']
+        if user_id not in m.get('hidden_for', []):
+            page.append(m)
+    return page, None
+
+
+def _cached_cursor(page, limit):
+    """next_cursor for a first page served from the hot cache. The buffer only
+    knows its own window, so a full page always offers a cursor — at worst the
+    next request comes back empty with next_cursor null."""
+    if len(page) < limit:
+        return None
+    return _encode_cursor(page[0]['id'])
+
+
 def _is_cr_or_mod(db, semester_id, user_id):
     """Return True if user is a CR for this semester."""
     try:
@@ -192,10 +292,7 @@ def handle_connect():
         payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
         from database import get_db
         db = get_db()
-        user_doc = db.users.find_one(
-            {'_id': ObjectId(payload['user_id'])},
-            {'fullName': 1, 'show_online_status': 1}
-        )
+        user_doc = user_cache.get_user(db, payload['user_id'])
         full_name = (user_doc.get('fullName') or '') if user_doc else ''
         show_online = (user_doc.get('show_online_status', True)) if user_doc else True
         _connected_users[request.sid] = {
@@ -256,8 +353,8 @@ def handle_join_room(data):
     presence.join_room_presence(semester_id, user_data['user_id'])
     user_data['rooms'].add(semester_id)
     emit('joined', {'semester_id': semester_id})
-    # Re-read privacy setting from DB (may have changed since connect)
-    user_doc = db.users.find_one({'_id': ObjectId(user_data['user_id'])}, {'show_online_status': 1})
+    # Re-read privacy setting (may have changed since connect)
+    user_doc = user_cache.get_user(db, user_data['user_id'])
     show_online = user_doc.get('show_online_status', True) if user_doc else True
     user_data['show_online_status'] = show_online  # keep cache in sync
     if show_online:
@@ -299,7 +396,7 @@ def handle_send_message(data):
     db = get_db()
     if not _is_semester_member(db, semester_id, user_data['user_id']):
         return
-    sender_doc = db.users.find_one({'_id': ObjectId(user_data['user_id'])}, {'profile_picture': 1})
+    sender_doc = user_cache.get_user(db, user_data['user_id'])
     profile_picture = (sender_doc.get('profile_picture') or None) if sender_doc else None
 
     reply_to = None
@@ -333,6 +430,7 @@ def handle_send_message(data):
     result = db.chat_messages.insert_one(msg)
     msg['_id'] = result.inserted_id
     payload = _serialize_message(msg, profile_picture)
+    chat_cache.append(semester_id, payload)
     if local_id:
         payload['local_id'] = local_id
     emit('new_message', payload, to=semester_id)
@@ -374,42 +472,56 @@ def handle_send_message(data):
 @chat_bp.route('/<semester_id>/messages', methods=['GET'])
 @token_required
 def get_messages(semester_id):
-    """Return the last N messages for a semester (oldest first)."""
+    """Return the last N messages for a semester (oldest first), plus a
+    next_cursor to pass back as ?cursor= for the page before them (null once
+    there's nothing older).
+
+    The first page is answered from the per-semester hot cache (utils/chat_cache.py)
+    when possible; a cold room is filled from here. Scroll-back always reads
+    Mongo. The older ?before_id=<message id> form is still accepted.
+    """
     from database import get_db
     try:
         user_id = request.user['user_id']
         db = get_db()
         if not _is_semester_member(db, semester_id, user_id):
             return jsonify({'error': 'Not a member'}), 403
-        limit = min(int(request.args.get('limit', 50)), 200)
+        limit = max(1, min(int(request.args.get('limit', 50)), 200))
+        before = None
+        cursor = request.args.get('cursor', '')
         before_id = request.args.get('before_id', '')
-        query = {'semester_id': semester_id, 'hidden_for': {'$nin': [user_id]}}
-        if before_id:
+        if cursor:
             try:
-                query['_id'] = {'$lt': ObjectId(before_id)}
+                before = _decode_cursor(cursor)
+            except ValueError:
+                return jsonify({'error': 'Invalid cursor'}), 400
+        elif before_id:
+            try:
+                before = ObjectId(before_id)
             except Exception:
                 pass
-        msgs = list(db.chat_messages.find(
-            query,
-            sort=[('created_at', -1)],
-            limit=limit,
-        ))
-        msgs.reverse()
 
-        # Batch-fetch profile pictures for all senders
-        sender_ids = list({m['user_id'] for m in msgs if m.get('user_id')})
-        pic_map = {}
-        if sender_ids:
-            for u in db.users.find(
-                {'_id': {'$in': [ObjectId(uid) for uid in sender_ids]}},
-                {'profile_picture': 1},
-            ):
-                pic_map[str(u['_id'])] = u.get('profile_picture')
+        if before is None:
+            cached = chat_cache.page(semester_id, user_id, limit)
+            if cached is not None:
+                return jsonify({'messages': cached, 'next_cursor': _cached_cursor(cached, limit)}), 200
+            token = chat_cache.begin_fill(semester_id)
+            if token is not None:
+                entries = _load_hot_entries(db, semester_id)
+                complete = len(entries) < chat_cache.HOT_SIZE
+                chat_cache.fill(semester_id, entries, complete, token)
+                page = chat_cache.visible_page(entries, user_id, limit, complete)
+                if page is not None:
+                    return jsonify({'messages': page, 'next_cursor': _cached_cursor(page, limit)}), 200
+
+        msgs, next_cursor = _history_page(db, semester_id, user_id, limit, before)
+        msgs.reverse()
+        pic_map = _sender_pictures(db, msgs)
 
-        return jsonify({'messages': [
-            _serialize_message(m, pic_map.get(m.get('user_id')))
-            for m in msgs
-        ]}), 200
+        return jsonify({
+            'messages': [_serialize_message(m, pic_map.get(m.get('user_id'))) for m in msgs],
+            'next_cursor': next_cursor,
+        }), 200
     except Exception as e:
         logger.error(f"get_messages error: {e}")
         return jsonify({'error': 'Failed to fetch messages'}), 500
@@ -424,13 +536,11 @@ def upload_file(semester_id):
     from database import get_db
     try:
         user_id = request.user['user_id']
-        username = request.user.get('username', request.user.get('email', 'User'))
         db = get_db()
         if not _is_semester_member(db, semester_id, user_id):
             return jsonify({'error': 'Not a member'}), 403
-        user_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'profile_picture': 1})
-        full_name = (user_doc.get('fullName') or '') if user_doc else ''
-        profile_picture = (user_doc.get('profile_picture') or None) if user_doc else None
+        if ingest.body_too_large(MAX_FILE_SIZE):
+            return jsonify({'error': 'File too large (max 50 MB)'}), 413
 
         file = request.files.get('file')
         text = (request.form.get('text') or '').strip() or None
@@ -439,108 +549,179 @@ def upload_file(semester_id):
         if not file:
             return jsonify({'error': 'No file provided'}), 400
 
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_FILE_SIZE:
+        original_name = file.filename or 'file'
+        incoming = storage.incoming_path()
+        try:
+            saved = ingest.save(file, incoming, max_size=MAX_FILE_SIZE)
+        except ingest.TooLarge:
             return jsonify({'error': 'File too large (max 50 MB)'}), 413
-        if is_dangerous(file):
+        except ingest.DisallowedType:
             return jsonify({'error': 'File type not allowed'}), 400
+        storage.put_blob(db, incoming, saved.sha256, saved.size)
 
-        original_name = file.filename or 'file'
-        safe_name = secure_filename(original_name) or 'file'
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
-        stored_name = f"{timestamp}_{user_id}_{safe_name}"
-        file_path = os.path.join(CHAT_UPLOAD_DIR, stored_name)
-        file.save(file_path)
+        payload = _post_file_message(
+            db, request.user, semester_id, original_name,
+            file.content_type or 'application/octet-stream', saved.size,
+            saved.sha256, text, reply_to_id,
+        )
+        return jsonify({'message': payload}), 201
+    except Exception as e:
+        logger.error(f"upload_file error: {e}")
+        return jsonify({'error': 'Failed to upload file'}), 500
 
-        mime_type = file.content_type or 'application/octet-stream'
 
-        upload_reply_to = None
-        if reply_to_id:
-            try:
-                ref = db.chat_messages.find_one(
-                    {'_id': ObjectId(reply_to_id), 'semester_id': semester_id}
-                )
-                if ref and not ref.get('deleted_for_everyone'):
-                    upload_reply_to = {
-                        'id': str(ref['_id']),
-                        'text': (decrypt_text(ref.get('text')) or '')[:120],
-                        'username': ref.get('username', ''),
-                        'full_name': ref.get('full_name', ''),
-                        'has_file': bool(ref.get('file')),
-                    }
-            except Exception:
-                pass
+def _post_file_message(db, user, semester_id, original_name, mime_type,
+                       size, sha256, text, reply_to_id):
+    """Save and broadcast the chat message for a file already stored as the
+    blob `sha256` (utils/storage.py). Shared by upload_file and resumable uploads."""
+    user_id = user['user_id']
+    username = user.get('username', user.get('email', 'User'))
+    user_doc = user_cache.get_user(db, user_id)
+    full_name = (user_doc.get('fullName') or '') if user_doc else ''
+    profile_picture = (user_doc.get('profile_picture') or None) if user_doc else None
 
-        msg = {
-            'semester_id': semester_id,
-            'user_id': user_id,
-            'username': username,
-            'full_name': full_name,
-            'text': encrypt_text(text) if text else None,
-            'file': {
-                'name': original_name,
-                'path': os.path.join('uploads', 'chat', stored_name),
-                'mime_type': mime_type,
-                'size': size,
-            },
-            'created_at': datetime.now(timezone.utc),
-        }
-        if upload_reply_to:
-            msg['reply_to'] = upload_reply_to
-        result = db.chat_messages.insert_one(msg)
-        msg['_id'] = result.inserted_id
+    upload_reply_to = None
+    if reply_to_id:
+        try:
+            ref = db.chat_messages.find_one(
+                {'_id': ObjectId(reply_to_id), 'semester_id': semester_id}
+            )
+            if ref and not ref.get('deleted_for_everyone'):
+                upload_reply_to = {
+                    'id': str(ref['_id']),
+                    'text': (decrypt_text(ref.get('text')) or '')[:120],
+                    'username': ref.get('username', ''),
+                    'full_name': ref.get('full_name', ''),
+                    'has_file': bool(ref.get('file')),
+                }
+        except Exception:
+            pass
 
-        payload = _serialize_message(msg, profile_picture)
-        socketio.emit('new_message', payload, to=semester_id)
+    msg = {
+        'semester_id': semester_id,
+        'user_id': user_id,
+        'username': username,
+        'full_name': full_name,
+        'text': encrypt_text(text) if text else None,
+        'file': {
+            'name': original_name,
+            'mime_type': mime_type,
+            'size': size,
+            'sha256': sha256,
+            'blob': sha256,
+        },
+        'created_at': datetime.now(timezone.utc),
+    }
+    if upload_reply_to:
+        msg['reply_to'] = upload_reply_to
+    result = db.chat_messages.insert_one(msg)
+    msg['_id'] = result.inserted_id
 
-        return jsonify({'message': payload}), 201
-    except Exception as e:
-        logger.error(f"upload_file error: {e}")
-        return jsonify({'error': 'Failed to upload file'}), 500
+    payload = _serialize_message(msg, profile_picture)
+    chat_cache.append(semester_id, payload)
+    socketio.emit('new_message', payload, to=semester_id)
+    return payload
+
+
+# Resumable uploads (utils/resumable.py) — params: semester_id, text, reply_to_id
+
+def _authorize_resumable(db, user, params, filename):
+    if not _is_semester_member(db, params.get('semester_id', ''), user['user_id']):
+        return jsonify({'error': 'Not a member'}), 403
+    return None
+
+
+def _finalize_resumable(db, user, params, upload):
+    with open(upload.path, 'rb') as f:
+        if is_dangerous(f):
+            return jsonify({'error': 'File type not allowed'}), 400
+    storage.put_blob(db, upload.path, upload.sha256, upload.size)
+    payload = _post_file_message(
+        db, user, params['semester_id'], upload.filename, upload.mime_type,
+        upload.size, upload.sha256, (params.get('text') or '').strip() or None,
+        (params.get('reply_to_id') or '').strip(),
+    )
+    return jsonify({'message': payload}), 201
+
+
+resumable.register('chat', _authorize_resumable, _finalize_resumable, MAX_FILE_SIZE)
 
 
 # ─── REST: file serving ───────────────────────────────────────────────────────
 
+@chat_bp.route('/file/<message_id>/url', methods=['GET'])
+@token_required
+def get_file_url(message_id):
+    """Short-lived signed URL for a chat file (see utils/file_delivery.py)."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        msg = db.chat_messages.find_one(
+            {'_id': ObjectId(message_id)}, {'semester_id': 1, 'file': 1, 'deleted_for_everyone': 1},
+        )
+        if not msg or not msg.get('file') or msg.get('deleted_for_everyone'):
+            return jsonify({'error': 'File not found'}), 404
+        if not _is_semester_member(db, msg['semester_id'], user_id):
+            return jsonify({'error': 'Not a member'}), 403
+        url = file_delivery.sign_path(f'/api/chat/file/{message_id}', 'chat', message_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"get_file_url error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
+
+
 @chat_bp.route('/file/<message_id>', methods=['GET'])
 def serve_file(message_id):
     """Stream an uploaded chat file to the requesting member.
-    Accepts JWT via Authorization header OR ?token= query param (needed for browser
-    direct URL access: window.open, <img src>, <video src>, etc.)."""
+    Accepts a signed URL from GET /file/<id>/url, or a JWT via Authorization
+    header OR ?token= query param (needed for browser direct URL access:
+    window.open, <img src>, <video src>, etc.)."""
     from database import get_db
     try:
-        # Accept token from query param (browser direct requests) or header
-        token = request.args.get('token') or request.headers.get('Authorization', '')
-        if token.startswith('Bearer '):
-            token = token[7:]
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
-        user_id = data['user_id']
+            user_id = file_delivery.signed_user('chat', message_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        signed = user_id is not None
+        if not signed:
+            # Accept token from query param (browser direct requests) or header
+            token = request.args.get('token') or request.headers.get('Authorization', '')
+            if token.startswith('Bearer '):
+                token = token[7:]
+            if not token:
+                return jsonify({'error': 'Token is missing'}), 401
+            try:
+                data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'error': 'Token has expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            user_id = data['user_id']
         db = get_db()
         msg = db.chat_messages.find_one({'_id': ObjectId(message_id)})
         if not msg:
             return jsonify({'error': 'Message not found'}), 404
-        if not _is_semester_member(db, msg['semester_id'], user_id):
+        file_info = msg.get('file')
+        if file_info and not msg.get('deleted_for_everyone'):
+            # Revalidation of a copy the browser already holds: skip the membership lookup
+            cached = http_cache.not_modified(file_info.get('sha256'))
+            if cached:
+                return cached
+        # A signed URL is only issued to a member
+        if not signed and not _is_semester_member(db, msg['semester_id'], user_id):
             return jsonify({'error': 'Not a member'}), 403
         if msg.get('deleted_for_everyone'):
             return jsonify({'error': 'This file has been deleted'}), 410
-        file_info = msg.get('file')
         if not file_info:
             return jsonify({'error': 'No file in this message'}), 404
-        abs_path = os.path.join(os.getcwd(), file_info['path'])
-        if not os.path.exists(abs_path):
+        path = storage.message_file_ref(file_info)
+        if not path or not storage.exists(path):
             return jsonify({'error': 'File not found on disk'}), 404
-        return send_file(
-            abs_path,
+        return file_delivery.deliver(
+            path,
+            etag=file_info.get('sha256'),
             mimetype=file_info.get('mime_type', 'application/octet-stream'),
-            as_attachment=False,
             download_name=file_info.get('name', 'file'),
         )
     except Exception as e:
@@ -577,8 +758,8 @@ def warn_user(semester_id):
         if target_user_id in cr_ids:
             return jsonify({'error': 'Cannot warn a CR'}), 400
 
-        cr = db.users.find_one({'_id': ObjectId(cr_id)}, {'fullName': 1, 'username': 1})
-        target = db.users.find_one({'_id': ObjectId(target_user_id)}, {'fullName': 1, 'username': 1})
+        cr = user_cache.get_user(db, cr_id)
+        target = user_cache.get_user(db, target_user_id)
         if not target:
             return jsonify({'error': 'User not found'}), 404
 
@@ -779,15 +960,7 @@ def search_messages(semester_id):
             if len(matched) >= 40:
                 break
         matched.reverse()
-
-        sender_ids = list({m['user_id'] for m in matched if m.get('user_id')})
-        pic_map = {}
-        if sender_ids:
-            for u in db.users.find(
-                {'_id': {'$in': [ObjectId(uid) for uid in sender_ids]}},
-                {'profile_picture': 1},
-            ):
-                pic_map[str(u['_id'])] = u.get('profile_picture')
+        pic_map = _sender_pictures(db, matched)
         return jsonify({'messages': [
             _serialize_message(m, pic_map.get(m.get('user_id')))
             for m in matched
@@ -822,7 +995,7 @@ def create_poll(semester_id):
         if len(options) > 6:
             return jsonify({'error': 'Maximum 6 options allowed'}), 400
 
-        user_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1, 'profile_picture': 1})
+        user_doc = user_cache.get_user(db, user_id)
         username = request.user.get('username', '')
         full_name = (user_doc.get('fullName') or '') if user_doc else ''
         profile_picture = (user_doc.get('profile_picture') or None) if user_doc else None
@@ -845,6 +1018,7 @@ def create_poll(semester_id):
         result = db.chat_messages.insert_one(msg)
         msg['_id'] = result.inserted_id
         payload = _serialize_message(msg, profile_picture)
+        chat_cache.append(semester_id, payload)
         socketio.emit('new_message', payload, to=semester_id)
         return jsonify({'message': payload}), 201
     except Exception as e:
@@ -902,9 +1076,10 @@ def vote_poll(semester_id, message_id):
             return jsonify({'error': 'Too many concurrent votes — please try again'}), 409
         # Re-fetch to get updated doc and serialize
         updated = db.chat_messages.find_one({'_id': oid})
-        sender_doc = db.users.find_one({'_id': ObjectId(updated['user_id'])}, {'profile_picture': 1})
+        sender_doc = user_cache.get_user(db, updated['user_id'])
         pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
         payload = _serialize_message(updated, pic)
+        chat_cache.replace(semester_id, payload)
         socketio.emit('poll_updated', payload, to=semester_id)
         return jsonify({'message': payload}), 200
     except Exception as e:
@@ -932,9 +1107,10 @@ def close_poll(semester_id, message_id):
             {'$set': {'poll.is_closed': True}}
         )
         updated = db.chat_messages.find_one({'_id': ObjectId(message_id)})
-        sender_doc = db.users.find_one({'_id': ObjectId(updated['user_id'])}, {'profile_picture': 1})
+        sender_doc = user_cache.get_user(db, updated['user_id'])
         pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
         payload = _serialize_message(updated, pic)
+        chat_cache.replace(semester_id, payload)
         socketio.emit('poll_updated', payload, to=semester_id)
         return jsonify({'message': payload}), 200
     except Exception as e:
@@ -988,9 +1164,10 @@ def react_to_message(semester_id, message_id):
         if not msg:
             return jsonify({'error': 'Message not found'}), 404
         updated = db.chat_messages.find_one({'_id': oid})
-        sender_doc = db.users.find_one({'_id': ObjectId(updated['user_id'])}, {'profile_picture': 1})
+        sender_doc = user_cache.get_user(db, updated['user_id'])
         pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
         payload = _serialize_message(updated, pic)
+        chat_cache.replace(semester_id, payload)
         socketio.emit('reaction_updated', payload, to=semester_id)
         return jsonify({'message': payload}), 200
     except Exception as e:
@@ -1014,13 +1191,11 @@ def get_online_status():
             socket_online = {u['user_id'] for u in _connected_users.values() if u['user_id'] in user_ids}
         if not socket_online:
             return jsonify({'online_user_ids': []}), 200
-        # Always check DB for current privacy setting — cached value may be stale
-        db = get_db()
-        visible = db.users.find(
-            {'_id': {'$in': [ObjectId(uid) for uid in socket_online]}, 'show_online_status': {'$ne': False}},
-            {'_id': 1}
-        )
-        return jsonify({'online_user_ids': [str(u['_id']) for u in visible]}), 200
+        # Privacy setting comes from user_cache (invalidated by update_privacy),
+        # not the per-socket copy in _connected_users, which may be stale
+        users = user_cache.get_users(get_db(), socket_online)
+        visible = [uid for uid, u in users.items() if u.get('show_online_status', True) is not False]
+        return jsonify({'online_user_ids': visible}), 200
     except Exception as e:
         logger.error(f"get_online_status error: {e}")
         return jsonify({'online_user_ids': []}), 200
@@ -1048,12 +1223,11 @@ def get_online_members(semester_id):
             }
         if not socket_online:
             return jsonify({'online_user_ids': []}), 200
-        # Always check DB for current privacy setting — cached value may be stale
-        visible = db.users.find(
-            {'_id': {'$in': [ObjectId(uid) for uid in socket_online]}, 'show_online_status': {'$ne': False}},
-            {'_id': 1}
-        )
-        return jsonify({'online_user_ids': [str(u['_id']) for u in visible]}), 200
+        # Privacy setting comes from user_cache (invalidated by update_privacy),
+        # not the per-socket copy in _connected_users, which may be stale
+        users = user_cache.get_users(db, socket_online)
+        visible = [uid for uid, u in users.items() if u.get('show_online_status', True) is not False]
+        return jsonify({'online_user_ids': visible}), 200
     except Exception as e:
         logger.error(f"get_online_members error: {e}")
         return jsonify({'online_user_ids': []}), 200
@@ -1091,7 +1265,7 @@ def pin_message(semester_id):
             {'_id': ObjectId(semester_id)},
             {'$set': {'pinned_message_ids': existing}}
         )
-        sender_doc = db.users.find_one({'_id': ObjectId(msg['user_id'])}, {'profile_picture': 1}) if msg.get('user_id') else None
+        sender_doc = user_cache.get_user(db, msg['user_id']) if msg.get('user_id') else None
         pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
         pinned_data = _serialize_message(msg, pic)
         socketio.emit('message_pinned', {'message': pinned_data, 'pinned_ids': existing}, to=semester_id)
@@ -1125,23 +1299,20 @@ def delete_message(semester_id, message_id):
                 {'_id': ObjectId(message_id)},
                 {'$addToSet': {'hidden_for': user_id}}
             )
+            chat_cache.hide(semester_id, message_id, user_id)
             return jsonify({'message': 'Message hidden'}), 200
 
         if msg['user_id'] == user_id:
             if mode == 'for_everyone':
-                # Delete physical file and linked academic resources first
-                if msg.get('file') and msg['file'].get('path'):
-                    try:
-                        abs_path = os.path.join(os.getcwd(), msg['file']['path'])
-                        if os.path.exists(abs_path):
-                            os.remove(abs_path)
-                    except OSError:
-                        pass
+                # Release the file and delete linked academic resources first
+                if msg.get('file'):
+                    storage.release_message_file(db, msg['file'])
                 db.academic_resources.delete_many({'chat_message_id': str(msg['_id']), 'source': 'chat'})
                 db.chat_messages.update_one(
                     {'_id': ObjectId(message_id)},
                     {'$set': {'deleted_for_everyone': True, 'text': None, 'file': None}}
                 )
+                refresh_cached_message(semester_id, message_id)
                 socketio.emit('message_tombstoned', {'message_id': message_id}, to=semester_id)
                 return jsonify({'message': 'Message deleted for everyone'}), 200
             else:
@@ -1207,9 +1378,10 @@ def _get_list_msg(db, semester_id, message_id):
 def _emit_list_updated(db, semester_id, message_id):
     """Re-fetch, serialize, and broadcast list_updated. Returns the payload."""
     updated = db.chat_messages.find_one({'_id': ObjectId(message_id)})
-    sender_doc = db.users.find_one({'_id': ObjectId(updated['user_id'])}, {'profile_picture': 1})
+    sender_doc = user_cache.get_user(db, updated['user_id'])
     pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
     payload = _serialize_message(updated, pic)
+    chat_cache.replace(semester_id, payload)
     socketio.emit('list_updated', payload, to=semester_id)
     return payload
 
@@ -1248,9 +1420,10 @@ def edit_message(semester_id, message_id):
             {'$set': {'text': encrypt_text(new_text), 'edited_at': now}}
         )
         updated = db.chat_messages.find_one({'_id': ObjectId(message_id)})
-        sender_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'profile_picture': 1})
+        sender_doc = user_cache.get_user(db, user_id)
         pic = (sender_doc.get('profile_picture') or None) if sender_doc else None
         payload = _serialize_message(updated, pic)
+        chat_cache.replace(semester_id, payload)
         socketio.emit('message_edited', payload, to=semester_id)
         return jsonify({'message': payload}), 200
     except Exception as e:
@@ -1276,10 +1449,7 @@ def create_list_message(semester_id):
         if not prompt:
             return jsonify({'error': 'Prompt is required'}), 400
 
-        user_doc = db.users.find_one(
-            {'_id': ObjectId(user_id)},
-            {'fullName': 1, 'username': 1, 'profile_picture': 1}
-        )
+        user_doc = user_cache.get_user(db, user_id)
         username = request.user.get('username', '')
         full_name = (user_doc.get('fullName') or '') if user_doc else ''
         profile_picture = (user_doc.get('profile_picture') or None) if user_doc else None
@@ -1309,6 +1479,7 @@ def create_list_message(semester_id):
         result = db.chat_messages.insert_one(msg)
         msg['_id'] = result.inserted_id
         payload = _serialize_message(msg, profile_picture)
+        chat_cache.append(semester_id, payload)
         socketio.emit('new_message', payload, to=semester_id)
         return jsonify({'message': payload}), 201
     except Exception as e:
@@ -1338,7 +1509,7 @@ def add_list_entry(semester_id, message_id):
         if msg.get('deleted_for_everyone'):
             return jsonify({'error': 'List has been deleted'}), 400
 
-        user_doc = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1})
+        user_doc = user_cache.get_user(db, user_id)
         username = request.user.get('username', '')
         full_name = (user_doc.get('fullName') or '') if user_doc else ''
 
@@ -7,6 +7,8 @@ import string
 import os
 
 from middleware import token_required, is_member_of_classroom
+from utils import user_cache, resolve_users
+from utils import avatars, storage
 
 classroom_bp = Blueprint('classroom', __name__, url_prefix='/api/classroom')
 logger = logging.getLogger(__name__)
@@ -291,6 +293,13 @@ def list_classrooms():
         return jsonify({'error': 'Failed to retrieve classrooms'}), 500
 
 
+# Fields of each member document that get_classroom's response uses
+_MEMBER_FIELDS = (
+    'username', 'email', 'fullName', 'profile_picture', 'phone', 'phone_public',
+    'bio', 'bio_flagged_reason', 'bio_flagged_by',
+)
+
+
 @classroom_bp.route('/<classroom_id>', methods=['GET'])
 @token_required
 def get_classroom(classroom_id):
@@ -310,61 +319,60 @@ def get_classroom(classroom_id):
         if not is_member_of_classroom(classroom, user_oid):
             return jsonify({'error': 'Access denied'}), 403
 
-        members = list(db.users.find({'_id': {'$in': classroom.get('members', [])}}))
-
-        join_requests = []
-        for req in classroom.get('join_requests', []):
-            req_user = db.users.find_one({'_id': req['user_id']})
-            if req_user:
-                join_requests.append({
-                    'user_id': str(req['user_id']),
-                    'username': req_user['username'],
-                    'email': req_user['email'],
-                    'fullName': req_user.get('fullName'),
-                    'requested_at': req['requested_at'].isoformat()
-                })
+        # Constant query count however many semesters/subjects/join requests
+        # there are: every related collection is read once with $in and
+        # grouped here, rather than a subjects/nominations/users lookup per
+        # semester. Member docs are projected to what the response shows.
+        members = list(db.users.find(
+            {'_id': {'$in': classroom.get('members', [])}},
+            {f: 1 for f in _MEMBER_FIELDS},
+        ))
 
         semesters = list(db.semesters.find(
             {'classroom_id': str(classroom['_id'])}
         ).sort('created_at', -1))
+        sem_ids = [str(sem['_id']) for sem in semesters]
+
+        subjects_by_sem = {}
+        nominations = {}
+        if sem_ids:
+            for s in db.subjects.find(
+                {'semester_id': {'$in': sem_ids}}, {'name': 1, 'code': 1, 'semester_id': 1}
+            ).sort('name', 1):
+                subjects_by_sem.setdefault(s['semester_id'], []).append({
+                    'id': str(s['_id']),
+                    'name': s['name'],
+                    'code': s.get('code', '')
+                })
+            # Pending CR nominations for this user, at most one per semester
+            try:
+                for n in db.cr_nominations.find(
+                    {'semester_id': {'$in': sem_ids}, 'nominated_user_id': user_id}
+                ):
+                    nominations.setdefault(n['semester_id'], n)
+            except Exception as e:
+                logger.error(f"Nomination check error for classroom {classroom_id}: {e}")
+        nominators = resolve_users(db, [n.get('nominated_by_user_id') for n in nominations.values()])
 
         formatted_semesters = []
         for sem in semesters:
             cr_ids = [str(c) for c in sem.get('cr_ids', [])]
             sem_id = str(sem['_id'])
 
-            subjects = list(db.subjects.find({'semester_id': sem_id}).sort('name', 1))
-            formatted_subjects = [{
-                'id': str(s['_id']),
-                'name': s['name'],
-                'code': s.get('code', '')
-            } for s in subjects]
-
-            # Check for pending CR nomination for this user in this semester
             pending_nomination = None
-            try:
-                nomination = db.cr_nominations.find_one({
+            nomination = nominations.get(sem_id)
+            if nomination:
+                nominator = nominators.get(str(nomination.get('nominated_by_user_id')))
+                nominator_name = (
+                    (nominator.get('fullName') or nominator.get('username', 'Unknown'))
+                    if nominator else 'Unknown'
+                )
+                pending_nomination = {
+                    'nominated_by': nominator_name,
+                    'nomination_type': nomination.get('nomination_type', 'transfer'),
                     'semester_id': sem_id,
-                    'nominated_user_id': user_id
-                })
-                if nomination:
-                    nominator = db.users.find_one(
-                        {'_id': ObjectId(nomination['nominated_by_user_id'])},
-                        {'fullName': 1, 'username': 1}
-                    )
-                    nominator_name = (
-                        (nominator.get('fullName') or nominator.get('username', 'Unknown'))
-                        if nominator else 'Unknown'
-                    )
-                    pending_nomination = {
-                        'nominated_by': nominator_name,
-                        'nomination_type': nomination.get('nomination_type', 'transfer'),
-                        'semester_id': sem_id,
-                        'semester_name': sem['name'],
-                    }
-            except Exception as e:
-                logger.error(f"Nomination check error for sem {sem_id}: {e}")
-                pending_nomination = None
+                    'semester_name': sem['name'],
+                }
 
             formatted_semesters.append({
                 'id': sem_id,
@@ -375,7 +383,7 @@ def get_classroom(classroom_id):
                 'is_active': sem.get('is_active', False),
                 'cr_ids': cr_ids,
                 'is_user_cr': user_id in cr_ids,
-                'subjects': formatted_subjects,
+                'subjects': subjects_by_sem.get(sem_id, []),
                 'pending_nomination': pending_nomination,
                 'created_at': sem['created_at'].isoformat()
             })
@@ -384,6 +392,22 @@ def get_classroom(classroom_id):
         active_sem = next((s for s in formatted_semesters if s['is_active']), None)
         is_cr = active_sem['is_user_cr'] if active_sem else False
 
+        # Join requests are only shown to the CR — don't resolve them otherwise
+        join_requests = []
+        if is_cr:
+            pending = classroom.get('join_requests', [])
+            requesters = resolve_users(db, [r['user_id'] for r in pending], ('username', 'email', 'fullName'))
+            for req in pending:
+                req_user = requesters.get(str(req['user_id']))
+                if req_user:
+                    join_requests.append({
+                        'user_id': str(req['user_id']),
+                        'username': req_user['username'],
+                        'email': req_user['email'],
+                        'fullName': req_user.get('fullName'),
+                        'requested_at': req['requested_at'].isoformat()
+                    })
+
         return jsonify({
             'classroom': {
                 'id': str(classroom['_id']),
@@ -404,7 +428,7 @@ def get_classroom(classroom_id):
                     'bio_flagged_reason': m.get('bio_flagged_reason', ''),
                     'bio_flagged_by': m.get('bio_flagged_by', ''),
                 } for m in members],
-                'join_requests': join_requests if is_cr else [],
+                'join_requests': join_requests,
                 'semesters': formatted_semesters,
                 'is_cr': is_cr,
                 'member_count': len(classroom.get('members', [])),
@@ -510,7 +534,7 @@ def quit_cr(classroom_id, semester_id):
 
         # Notify remaining CRs
         try:
-            quitter = db.users.find_one({'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1})
+            quitter = user_cache.get_user(db, user_id)
             quitter_name = (quitter.get('fullName') or quitter.get('username', 'Someone')) if quitter else 'Someone'
             remaining_cr_ids = [c for c in cr_ids if c != user_id]
             for cr_id in remaining_cr_ids:
@@ -549,10 +573,7 @@ def get_pending_nominations(classroom_id):
                 'nominated_user_id': user_id,
             })
             if nomination:
-                nominator = db.users.find_one(
-                    {'_id': ObjectId(nomination['nominated_by_user_id'])},
-                    {'fullName': 1, 'username': 1}
-                )
+                nominator = user_cache.get_user(db, nomination['nominated_by_user_id'])
                 nominator_name = (
                     (nominator.get('fullName') or nominator.get('username', 'Unknown'))
                     if nominator else 'Unknown'
@@ -656,7 +677,7 @@ def remove_member(classroom_id):
         # Notify the removed user via socket
         try:
             from routes.chat_routes import emit_to_user
-            cr_user = db.users.find_one({'_id': ObjectId(cr_user_id)}, {'fullName': 1, 'username': 1})
+            cr_user = user_cache.get_user(db, cr_user_id)
             cr_name = (cr_user.get('fullName') or cr_user.get('username', 'CR')) if cr_user else 'CR'
             emit_to_user(target_user_id, 'member_removed', {
                 'classroom_id': classroom_id,
@@ -711,16 +732,10 @@ def remove_member_avatar(classroom_id):
         if not target.get('profile_picture'):
             return jsonify({'error': 'User has no profile photo'}), 400
 
-        # Delete file from disk
-        avatars_dir = os.path.join(os.getcwd(), 'uploads', 'avatars')
-        filepath = os.path.join(avatars_dir, target['profile_picture'])
-        if os.path.exists(filepath):
-            try:
-                os.remove(filepath)
-            except Exception as e:
-                logger.warning(f"Could not delete avatar file: {e}")
+        # Delete its files from disk
+        avatars.delete_avatar(target['profile_picture'])
 
-        cr = db.users.find_one({'_id': ObjectId(cr_user_id)}, {'fullName': 1, 'username': 1})
+        cr = user_cache.get_user(db, cr_user_id)
         cr_name = (cr.get('fullName') or cr.get('username', 'CR')) if cr else 'CR'
 
         db.users.update_one(
@@ -732,6 +747,12 @@ def remove_member_avatar(classroom_id):
                 'photo_removed_at': datetime.now(timezone.utc)
             }}
         )
+        user_cache.invalidate(target_user_id)
+        try:
+            from routes.chat_routes import invalidate_user_rooms
+            invalidate_user_rooms(target_user_id)
+        except Exception as cache_err:
+            logger.warning(f"invalidate_user_rooms error: {cache_err}")
 
         return jsonify({'message': 'Profile photo removed'}), 200
 
@@ -775,7 +796,7 @@ def flag_member_name(classroom_id):
         if not target:
             return jsonify({'error': 'User not found'}), 404
 
-        cr = db.users.find_one({'_id': ObjectId(cr_user_id)}, {'fullName': 1, 'username': 1})
+        cr = user_cache.get_user(db, cr_user_id)
         cr_name = (cr.get('fullName') or cr.get('username', 'CR')) if cr else 'CR'
 
         db.users.update_one(
@@ -827,7 +848,7 @@ def flag_member_bio(classroom_id):
         if not db.users.find_one({'_id': target_oid}):
             return jsonify({'error': 'User not found'}), 404
 
-        cr = db.users.find_one({'_id': ObjectId(cr_user_id)}, {'fullName': 1, 'username': 1})
+        cr = user_cache.get_user(db, cr_user_id)
         cr_name = (cr.get('fullName') or cr.get('username', 'CR')) if cr else 'CR'
 
         db.users.update_one(
@@ -942,13 +963,10 @@ def delete_classroom(classroom_id):
         semester_ids = [str(s['_id']) for s in db.semesters.find({'classroom_id': classroom_id}, {'_id': 1})]
 
         if semester_ids:
-            # Delete academic resource files + records
+            # Release academic resource files + delete records
+            from routes.academic_routes import release_resource_file
             for r in db.academic_resources.find({'semester_id': {'$in': semester_ids}}):
-                if r.get('stored_name'):
-                    try:
-                        os.remove(os.path.join(os.getcwd(), 'uploads', 'academics', r['stored_name']))
-                    except OSError:
-                        pass
+                release_resource_file(db, r)
             db.academic_resources.delete_many({'semester_id': {'$in': semester_ids}})
             db.custom_sections.delete_many({'semester_id': {'$in': semester_ids}})
             db.hidden_default_sections.delete_many({'semester_id': {'$in': semester_ids}})
@@ -966,17 +984,12 @@ def delete_classroom(classroom_id):
                     pass
         db.documents.delete_many({'classroom_id': classroom_id})
 
-        # Delete chat messages + attached files
-        for msg in db.chat_messages.find({'classroom_id': classroom_id}):
-            file_path = (msg.get('file') or {}).get('path')
-            if file_path:
-                abs_path = os.path.join(os.getcwd(), file_path)
-                if os.path.exists(abs_path):
-                    try:
-                        os.remove(abs_path)
-                    except OSError:
-                        pass
-        db.chat_messages.delete_many({'classroom_id': classroom_id})
+        # Delete chat messages (keyed by semester; classroom_id on old ones) + release attached files
+        chat_query = {'$or': [{'semester_id': {'$in': semester_ids}}, {'classroom_id': classroom_id}]}
+        for msg in db.chat_messages.find(chat_query, {'file': 1}):
+            if msg.get('file'):
+                storage.release_message_file(db, msg['file'])
+        db.chat_messages.delete_many(chat_query)
         db.chat_read_status.delete_many({'classroom_id': classroom_id})
 
         # Delete other classroom-level data
@@ -2,20 +2,22 @@ import os
 import logging
 from datetime import datetime, timezone
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from bson import ObjectId
 import jwt
-from werkzeug.utils import secure_filename
 
 from middleware import token_required, SECRET_KEY
 from socketio_instance import socketio
 from utils.mime_check import is_dangerous
 from utils import cas_update_reactions, ConcurrentUpdateError
 from utils.encryption import encrypt_text, decrypt_text
+from utils import user_cache
+from utils import http_cache, file_delivery, resumable, ingest, storage
 
 dm_bp = Blueprint('dm', __name__, url_prefix='/api/dm')
 logger = logging.getLogger(__name__)
 
+# Attachments from before the blob store (utils/storage.py); new ones are blobs
 DM_UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads', 'dm')
 os.makedirs(DM_UPLOAD_DIR, exist_ok=True)
 
@@ -64,7 +66,8 @@ def _serialize_dm(msg):
         'pinned': msg.get('pinned', False),
     }
     if msg.get('file') and not deleted:
-        result['file'] = msg['file']
+        # Never the storage path (older messages have one)
+        result['file'] = {k: v for k, v in msg['file'].items() if k != 'path'}
     if msg.get('reply_to'):
         result['reply_to'] = msg['reply_to']
     return result
@@ -144,9 +147,7 @@ def send_dm(classroom_id):
         if user_id not in cr_ids and to_user_id not in cr_ids:
             return jsonify({'error': 'You can only send personal messages to a CR'}), 403
 
-        sender_doc = db.users.find_one(
-            {'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1, 'profile_picture': 1}
-        )
+        sender_doc = user_cache.get_user(db, user_id)
         sender_name = (sender_doc.get('fullName') or sender_doc.get('username', '')) if sender_doc else ''
         profile_picture = (sender_doc.get('profile_picture') or None) if sender_doc else None
 
@@ -197,14 +198,11 @@ def upload_dm_file(classroom_id, to_user_id):
         user_id = request.user['user_id']
         db = get_db()
 
-        if not _is_classroom_member(db, classroom_id, user_id):
-            return jsonify({'error': 'Not a member'}), 403
-        if not _is_classroom_member(db, classroom_id, to_user_id):
-            return jsonify({'error': 'Recipient not found'}), 400
-
-        cr_ids = _get_cr_ids(db, classroom_id)
-        if user_id not in cr_ids and to_user_id not in cr_ids:
-            return jsonify({'error': 'You can only send personal messages to a CR'}), 403
+        denied = _check_dm_upload(db, classroom_id, user_id, to_user_id)
+        if denied:
+            return denied
+        if ingest.body_too_large(MAX_FILE_SIZE):
+            return jsonify({'error': 'File too large (max 50 MB)'}), 413
 
         file = request.files.get('file')
         text = (request.form.get('text') or '').strip() or None
@@ -212,47 +210,19 @@ def upload_dm_file(classroom_id, to_user_id):
         if not file:
             return jsonify({'error': 'No file provided'}), 400
 
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_FILE_SIZE:
+        original_name = file.filename or 'file'
+        incoming = storage.incoming_path()
+        try:
+            saved = ingest.save(file, incoming, max_size=MAX_FILE_SIZE)
+        except ingest.TooLarge:
             return jsonify({'error': 'File too large (max 50 MB)'}), 413
-        if is_dangerous(file):
+        except ingest.DisallowedType:
             return jsonify({'error': 'File type not allowed'}), 400
-
-        original_name = file.filename or 'file'
-        safe_name = secure_filename(original_name) or 'file'
-        timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
-        stored_name = f"{timestamp}_{user_id}_{safe_name}"
-        file.save(os.path.join(DM_UPLOAD_DIR, stored_name))
+        storage.put_blob(db, incoming, saved.sha256, saved.size)
         mime_type = file.content_type or 'application/octet-stream'
 
-        sender_doc = db.users.find_one(
-            {'_id': ObjectId(user_id)}, {'fullName': 1, 'username': 1, 'profile_picture': 1}
-        )
-        sender_name = (sender_doc.get('fullName') or sender_doc.get('username', '')) if sender_doc else ''
-        profile_picture = (sender_doc.get('profile_picture') or None) if sender_doc else None
-
-        msg = {
-            'classroom_id': classroom_id,
-            'sender_id': user_id,
-            'receiver_id': to_user_id,
-            'sender_name': sender_name,
-            'profile_picture': profile_picture,
-            'text': encrypt_text(text) if text else None,
-            'file': {
-                'name': original_name,
-                'path': os.path.join('uploads', 'dm', stored_name),
-                'mime_type': mime_type,
-                'size': size,
-            },
-            'created_at': datetime.now(timezone.utc),
-            'read_by': [user_id],
-        }
-        result = db.dm_messages.insert_one(msg)
-        msg['_id'] = result.inserted_id
-        payload = _serialize_dm(msg)
-        socketio.emit('dm_message', payload, to=_dm_room(classroom_id, user_id, to_user_id))
+        payload = _post_dm_file(db, classroom_id, user_id, to_user_id,
+                                original_name, mime_type, saved.size, saved.sha256, text)
         return jsonify({'message': payload}), 201
 
     except Exception as e:
@@ -260,6 +230,71 @@ def upload_dm_file(classroom_id, to_user_id):
         return jsonify({'error': 'Failed to upload file'}), 500
 
 
+def _check_dm_upload(db, classroom_id, user_id, to_user_id):
+    """Error response if user_id may not send a file to to_user_id, else None."""
+    if not _is_classroom_member(db, classroom_id, user_id):
+        return jsonify({'error': 'Not a member'}), 403
+    if not _is_classroom_member(db, classroom_id, to_user_id):
+        return jsonify({'error': 'Recipient not found'}), 400
+
+    cr_ids = _get_cr_ids(db, classroom_id)
+    if user_id not in cr_ids and to_user_id not in cr_ids:
+        return jsonify({'error': 'You can only send personal messages to a CR'}), 403
+    return None
+
+
+def _post_dm_file(db, classroom_id, user_id, to_user_id, original_name,
+                  mime_type, size, sha256, text):
+    """Save and emit the DM for a file already stored as the blob `sha256`."""
+    sender_doc = user_cache.get_user(db, user_id)
+    sender_name = (sender_doc.get('fullName') or sender_doc.get('username', '')) if sender_doc else ''
+    profile_picture = (sender_doc.get('profile_picture') or None) if sender_doc else None
+
+    msg = {
+        'classroom_id': classroom_id,
+        'sender_id': user_id,
+        'receiver_id': to_user_id,
+        'sender_name': sender_name,
+        'profile_picture': profile_picture,
+        'text': encrypt_text(text) if text else None,
+        'file': {
+            'name': original_name,
+            'mime_type': mime_type,
+            'size': size,
+            'sha256': sha256,
+            'blob': sha256,
+        },
+        'created_at': datetime.now(timezone.utc),
+        'read_by': [user_id],
+    }
+    result = db.dm_messages.insert_one(msg)
+    msg['_id'] = result.inserted_id
+    payload = _serialize_dm(msg)
+    socketio.emit('dm_message', payload, to=_dm_room(classroom_id, user_id, to_user_id))
+    return payload
+
+
+# Resumable uploads (utils/resumable.py) — params: classroom_id, to_user_id, text
+
+def _authorize_resumable(db, user, params, filename):
+    return _check_dm_upload(db, params.get('classroom_id', ''), user['user_id'],
+                            params.get('to_user_id', ''))
+
+
+def _finalize_resumable(db, user, params, upload):
+    with open(upload.path, 'rb') as f:
+        if is_dangerous(f):
+            return jsonify({'error': 'File type not allowed'}), 400
+    storage.put_blob(db, upload.path, upload.sha256, upload.size)
+    payload = _post_dm_file(db, params['classroom_id'], user['user_id'], params['to_user_id'],
+                            upload.filename, upload.mime_type, upload.size,
+                            upload.sha256, (params.get('text') or '').strip() or None)
+    return jsonify({'message': payload}), 201
+
+
+resumable.register('dm', _authorize_resumable, _finalize_resumable, MAX_FILE_SIZE)
+
+
 @dm_bp.route('/<classroom_id>/thread/<with_user_id>', methods=['GET'])
 @token_required
 def get_dm_thread(classroom_id, with_user_id):
@@ -376,6 +411,8 @@ def delete_dm_message(classroom_id, message_id):
             )
             return jsonify({'message': 'Message hidden'}), 200
         elif mode == 'for_everyone':
+            if msg.get('file') and msg['file'].get('blob'):
+                storage.release_blob(db, msg['file']['blob'])
             db.dm_messages.update_one(
                 {'_id': ObjectId(message_id)},
                 {'$set': {'deleted_for_everyone': True, 'text': None, 'file': None}}
@@ -383,13 +420,8 @@ def delete_dm_message(classroom_id, message_id):
             socketio.emit('dm_message_tombstoned', {'message_id': message_id}, to=room)
             return jsonify({'message': 'Message deleted for everyone'}), 200
         else:
-            if msg.get('file') and msg['file'].get('path'):
-                try:
-                    abs_path = os.path.join(os.getcwd(), msg['file']['path'])
-                    if os.path.exists(abs_path):
-                        os.remove(abs_path)
-                except OSError:
-                    pass
+            if msg.get('file'):
+                storage.release_message_file(db, msg['file'])
             db.dm_messages.delete_one({'_id': ObjectId(message_id)})
             socketio.emit('dm_message_deleted', {'message_id': message_id}, to=room)
             return jsonify({'message': 'Deleted'}), 200
@@ -401,21 +433,27 @@ def delete_dm_message(classroom_id, message_id):
 
 @dm_bp.route('/file/<message_id>', methods=['GET'])
 def serve_dm_file(message_id):
+    """Accepts a signed URL from GET /file/<id>/url or a JWT (?token= / header)."""
     from database import get_db
     try:
-        token = request.args.get('token') or request.headers.get('Authorization', '')
-        if token.startswith('Bearer '):
-            token = token[7:]
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
         try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            user_id = file_delivery.signed_user('dm', message_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        if user_id is None:
+            token = request.args.get('token') or request.headers.get('Authorization', '')
+            if token.startswith('Bearer '):
+                token = token[7:]
+            if not token:
+                return jsonify({'error': 'Token is missing'}), 401
+            try:
+                data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.ExpiredSignatureError:
+                return jsonify({'error': 'Token has expired'}), 401
+            except jwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            user_id = data['user_id']
 
-        user_id = data['user_id']
         db = get_db()
         msg = db.dm_messages.find_one({'_id': ObjectId(message_id)})
         if not msg:
@@ -427,14 +465,18 @@ def serve_dm_file(message_id):
         if not file_info:
             return jsonify({'error': 'No file in this message'}), 404
 
-        abs_path = os.path.join(os.getcwd(), file_info['path'])
-        if not os.path.exists(abs_path):
+        cached = http_cache.not_modified(file_info.get('sha256'))
+        if cached:
+            return cached
+
+        path = storage.message_file_ref(file_info)
+        if not path or not storage.exists(path):
             return jsonify({'error': 'File not found on disk'}), 404
 
-        return send_file(
-            abs_path,
+        return file_delivery.deliver(
+            path,
+            etag=file_info.get('sha256'),
             mimetype=file_info.get('mime_type', 'application/octet-stream'),
-            as_attachment=False,
             download_name=file_info.get('name', 'file'),
         )
     except Exception as e:
@@ -442,6 +484,28 @@ def serve_dm_file(message_id):
         return jsonify({'error': 'Failed to serve file'}), 500
 
 
+@dm_bp.route('/file/<message_id>/url', methods=['GET'])
+@token_required
+def get_dm_file_url(message_id):
+    """Short-lived signed URL for a DM file (see utils/file_delivery.py)."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        msg = db.dm_messages.find_one(
+            {'_id': ObjectId(message_id)}, {'sender_id': 1, 'receiver_id': 1, 'file': 1},
+        )
+        if not msg or not msg.get('file'):
+            return jsonify({'error': 'File not found'}), 404
+        if msg['sender_id'] != user_id and msg['receiver_id'] != user_id:
+            return jsonify({'error': 'Not authorized'}), 403
+        url = file_delivery.sign_path(f'/api/dm/file/{message_id}', 'dm', message_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"get_dm_file_url error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
+
+
 @dm_bp.route('/<classroom_id>/unread-by-sender', methods=['GET'])
 @token_required
 def get_unread_by_sender(classroom_id):
@@ -1,4 +1,4 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from datetime import datetime, timezone
 from bson import ObjectId
 from werkzeug.utils import secure_filename
@@ -6,6 +6,7 @@ import os
 import logging
 
 from middleware import token_required, is_member_of_classroom, is_cr_of
+from utils import http_cache, file_delivery, ingest
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +31,8 @@ def upload_document():
     from database import get_db
 
     try:
+        if ingest.body_too_large(MAX_FILE_SIZE):
+            return jsonify({'error': 'File too large (max 10 MB)'}), 413
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
 
@@ -66,7 +69,12 @@ def upload_document():
         unique_filename = f"{timestamp}_{user_id}_{filename}"
         file_path = os.path.join(UPLOAD_FOLDER, unique_filename)
 
-        file.save(file_path)
+        try:
+            saved = ingest.save(file, file_path, max_size=MAX_FILE_SIZE)
+        except ingest.TooLarge:
+            return jsonify({'error': 'File too large (max 10 MB)'}), 413
+        except ingest.DisallowedType:
+            return jsonify({'error': 'File type not allowed'}), 400
 
         doc_metadata = {
             'classroom_id': classroom_id,
@@ -78,7 +86,8 @@ def upload_document():
             'file_path': file_path,
             'mime_type': file.mimetype or 'application/octet-stream',
             'use_for_ai': use_for_ai,
-            'file_size': os.path.getsize(file_path),
+            'file_size': saved.size,
+            'sha256': saved.sha256,
             'created_at': datetime.now(timezone.utc)
         }
 
@@ -155,44 +164,81 @@ def list_documents(semester_id):
 
 @document_bp.route('/<document_id>/download', methods=['GET'])
 def download_document(document_id):
-    """Serve a document file to a classroom member. Accepts token via query param or Authorization header."""
+    """Serve a document file to a classroom member. Accepts a signed URL from
+    GET /<id>/download/url, or a token via query param or Authorization header."""
     import jwt as pyjwt
     from database import get_db
     try:
-        SECRET_KEY = os.getenv('JWT_SECRET', 'dev-secret-change-in-production')
-        token = request.args.get('token') or request.headers.get('Authorization', '')
-        if token.startswith('Bearer '):
-            token = token[7:]
-        if not token:
-            return jsonify({'error': 'Token is missing'}), 401
         try:
-            data = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except pyjwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token has expired'}), 401
-        except pyjwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
+            user_id = file_delivery.signed_user('document', document_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        signed = user_id is not None
+        if not signed:
+            SECRET_KEY = os.getenv('JWT_SECRET', 'dev-secret-change-in-production')
+            token = request.args.get('token') or request.headers.get('Authorization', '')
+            if token.startswith('Bearer '):
+                token = token[7:]
+            if not token:
+                return jsonify({'error': 'Token is missing'}), 401
+            try:
+                data = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except pyjwt.ExpiredSignatureError:
+                return jsonify({'error': 'Token has expired'}), 401
+            except pyjwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            user_id = data['user_id']
 
-        user_id = data['user_id']
         db = get_db()
         doc = db.documents.find_one({'_id': ObjectId(document_id)})
         if not doc:
             return jsonify({'error': 'Document not found'}), 404
-        semester = db.semesters.find_one({'_id': ObjectId(doc['semester_id'])})
-        classroom = db.classrooms.find_one({'_id': ObjectId(semester['classroom_id'])}) if semester else None
-        if not classroom or not is_member_of_classroom(classroom, user_id):
-            return jsonify({'error': 'Access denied'}), 403
         if doc.get('uploaded_by') != user_id:
             return jsonify({'error': 'Access denied'}), 403
+        # Revalidation of a copy the browser already holds: skip the classroom lookups
+        cached = http_cache.not_modified(doc.get('sha256'))
+        if cached:
+            return cached
+        # A signed URL is only issued to a classroom member
+        if not signed and not _in_document_classroom(db, doc, user_id):
+            return jsonify({'error': 'Access denied'}), 403
         file_path = doc.get('file_path', '')
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found on disk'}), 404
         mime = doc.get('mime_type') or 'application/octet-stream'
-        return send_file(file_path, mimetype=mime, as_attachment=False, download_name=doc.get('filename', 'file'))
+        return file_delivery.deliver(file_path, etag=doc.get('sha256'), mimetype=mime,
+                                     download_name=doc.get('filename', 'file'))
     except Exception as e:
         logger.error(f"Download document error: {e}")
         return jsonify({'error': 'Failed to serve document'}), 500
 
 
+def _in_document_classroom(db, doc, user_id):
+    semester = db.semesters.find_one({'_id': ObjectId(doc['semester_id'])})
+    classroom = db.classrooms.find_one({'_id': ObjectId(semester['classroom_id'])}) if semester else None
+    return bool(classroom) and is_member_of_classroom(classroom, user_id)
+
+
+@document_bp.route('/<document_id>/download/url', methods=['GET'])
+@token_required
+def get_document_url(document_id):
+    """Short-lived signed URL for a document (see utils/file_delivery.py)."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        doc = db.documents.find_one({'_id': ObjectId(document_id)}, {'semester_id': 1, 'uploaded_by': 1})
+        if not doc:
+            return jsonify({'error': 'Document not found'}), 404
+        if doc.get('uploaded_by') != user_id or not _in_document_classroom(db, doc, user_id):
+            return jsonify({'error': 'Access denied'}), 403
+        url = file_delivery.sign_path(f'/api/document/{document_id}/download', 'document', document_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"Sign document URL error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
+
+
 @document_bp.route('/<document_id>', methods=['DELETE'])
 @token_required
 def delete_document(document_id):
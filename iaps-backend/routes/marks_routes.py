@@ -5,23 +5,38 @@ REST:
   POST /api/marks/structure/<subject_id>             — CR creates/replaces exam structure
   GET  /api/marks/my/<subject_id>                    — get my marks for a subject
   POST /api/marks/my/<subject_id>                    — save/update my marks
+  POST /api/marks/import/<subject_id>                — CR: bulk-set marks from a CSV/XLSX sheet
+  GET  /api/marks/export/<subject_id>                — CR: class marks sheet (?format=csv|xlsx)
   GET  /api/marks/analytics/<subject_id>             — list analytics files
   POST /api/marks/analytics/<subject_id>             — upload analytics file (any member)
   DELETE /api/marks/analytics/<subject_id>/<file_id> — delete analytics file
   GET  /api/marks/analytics/file/<file_id>           — serve analytics file (token in query)
+  GET  /api/marks/trend/<classroom_id>               — my per-semester scores
+  GET  /api/marks/semester-analytics/<semester_id>   — my per-subject scores for a semester
+  GET  /api/marks/cr-class-average/<semester_id>     — CR: class statistics per subject
+  GET  /api/marks/class-analytics/<subject_id>       — CR: per-student standing, exam difficulty
+  GET  /api/marks/standing/<subject_id>              — my percentile / z-score in the class
+  GET  /api/marks/what-if/<subject_id>               — % needed in remaining exams (?target= / ?grade=)
 """
 
+import io
 import os
+import csv
+import tempfile
 from uuid import uuid4
 import logging
 from datetime import datetime, timezone
 
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 from bson import ObjectId
+from pymongo import ReplaceOne
 import jwt
 from werkzeug.utils import secure_filename
 
 from middleware import token_required, is_member_of_classroom, SECRET_KEY
+from utils import resolve_users, display_name, run_in_transaction
+from utils import marks_stats, marks_analytics
+from utils import http_cache, file_delivery, resumable, ingest
 
 marks_bp = Blueprint('marks', __name__, url_prefix='/api/marks')
 logger = logging.getLogger(__name__)
@@ -110,24 +125,26 @@ def save_exam_structure(subject_id):
             if float(e.get('weightage', 0)) < 0:
                 return jsonify({'error': 'Weightage cannot be negative'}), 400
 
-        db.exam_structures.replace_one(
-            {'subject_id': subject_id},
-            {
-                'subject_id': subject_id,
-                'semester_id': subject['semester_id'],
-                'exams': [
-                    {
-                        'name': e['name'].strip(),
-                        'max_marks': float(e['max_marks']),
-                        'weightage': float(e['weightage']),
-                    }
-                    for e in exams
-                ],
-                'updated_by': user_id,
-                'updated_at': datetime.now(timezone.utc),
-            },
-            upsert=True,
-        )
+        structure = {
+            'subject_id': subject_id,
+            'semester_id': subject['semester_id'],
+            'exams': [
+                {
+                    'name': e['name'].strip(),
+                    'max_marks': float(e['max_marks']),
+                    'weightage': float(e['weightage']),
+                }
+                for e in exams
+            ],
+            'updated_by': user_id,
+            'updated_at': datetime.now(timezone.utc),
+        }
+
+        def _save(session):
+            db.exam_structures.replace_one({'subject_id': subject_id}, structure, upsert=True, session=session)
+            # The per-exam statistics are keyed to the structure's exams
+            marks_stats.rebuild(db, subject_id, subject['semester_id'], structure['exams'], session=session)
+        run_in_transaction(db, _save)
         return jsonify({'message': 'Exam structure saved'}), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 403
@@ -201,25 +218,30 @@ def save_my_marks(subject_id):
         if total_scaled > 100.01:
             return jsonify({'error': f'Total scaled marks ({total_scaled:.2f}) exceed 100'}), 400
 
-        db.subject_marks.replace_one(
-            {'subject_id': subject_id, 'user_id': user_id},
-            {
-                'subject_id': subject_id,
-                'user_id': user_id,
-                'entries': [
-                    {
-                        'name': e['name'].strip(),
-                        'max_marks': float(e['max_marks']),
-                        'weightage': float(e['weightage']),
-                        'marks_obtained': float(e.get('marks_obtained', 0) or 0),
-                    }
-                    for e in entries
-                ],
-                'grade': grade,
-                'updated_at': datetime.now(timezone.utc),
-            },
-            upsert=True,
-        )
+        marks = {
+            'subject_id': subject_id,
+            'user_id': user_id,
+            'entries': [
+                {
+                    'name': e['name'].strip(),
+                    'max_marks': float(e['max_marks']),
+                    'weightage': float(e['weightage']),
+                    'marks_obtained': float(e.get('marks_obtained', 0) or 0),
+                }
+                for e in entries
+            ],
+            'grade': grade,
+            'updated_at': datetime.now(timezone.utc),
+        }
+
+        def _save(session):
+            # find_one_and_replace hands back the previous version, so the
+            # class statistics can swap this student's old score for the new one
+            previous = db.subject_marks.find_one_and_replace(
+                {'subject_id': subject_id, 'user_id': user_id}, marks, upsert=True, session=session,
+            )
+            marks_stats.record_change(db, subject_id, previous, marks, session=session)
+        run_in_transaction(db, _save)
         return jsonify({'message': 'Marks saved'}), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 403
@@ -228,6 +250,296 @@ def save_my_marks(subject_id):
         return jsonify({'error': 'Failed to save marks'}), 500
 
 
+# ── Bulk import / export (CR) ─────────────────────────────────────────────────
+
+MAX_IMPORT_ROWS = 2000
+EXPORT_BATCH = 200
+STUDENT_COLUMNS = ('username', 'email')
+# A text cell starting with one of these is run as a formula by Excel/Sheets
+# (CSV injection) — and names in the export are whatever students typed
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def _csv_cell(value):
+    """Text that would read as a formula, quoted with a leading apostrophe."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def _xlsx_cell(ws, value):
+    """Formula-looking text as an explicit string cell, so it stays text."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        from openpyxl.cell import WriteOnlyCell
+        cell = WriteOnlyCell(ws, value)
+        cell.data_type = 's'
+        return cell
+    return value
+
+
+def _import_cell(value):
+    """Undo _csv_cell's apostrophe, so an exported sheet imports unchanged."""
+    if value.startswith("'") and value[1:].startswith(FORMULA_PREFIXES):
+        value = value[1:]
+    return value.strip()
+
+
+def _read_sheet(upload):
+    """Yield rows (lists of cell strings) from an uploaded .csv or .xlsx
+    without loading the whole sheet — the first row is the header."""
+    name = (upload.filename or '').lower()
+    if name.endswith('.csv'):
+        text = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', newline='')
+        for row in csv.reader(text):
+            yield [_import_cell(c) for c in row]
+    elif name.endswith('.xlsx'):
+        from openpyxl import load_workbook
+        wb = load_workbook(upload.stream, read_only=True, data_only=True)
+        try:
+            for row in wb.worksheets[0].iter_rows(values_only=True):
+                yield ['' if c is None else _import_cell(str(c)) for c in row]
+        finally:
+            wb.close()
+    else:
+        raise ValueError('Upload a .csv or .xlsx file')
+
+
+def _parse_import_header(header, exams):
+    """Map header cells to (student_column, {col: exam index}, grade_col) or
+    raise ValueError naming what's wrong."""
+    keys = [h.strip().lower() for h in header]
+    if not keys or keys[0] not in STUDENT_COLUMNS:
+        raise ValueError("First column must be 'username' or 'email'")
+    exam_index = {marks_stats.exam_key(e['name']): i for i, e in enumerate(exams)}
+    exam_cols, grade_col, unknown = {}, None, []
+    for col, key in enumerate(keys[1:], start=1):
+        if key == 'grade':
+            grade_col = col
+        elif key in exam_index:
+            exam_cols[col] = exam_index[key]
+        elif key and key not in ('name', 'full name', 'score'):
+            unknown.append(header[col])
+    if unknown:
+        raise ValueError(f"Columns not in the exam structure: {', '.join(unknown)}")
+    return keys[0], exam_cols, grade_col
+
+
+@marks_bp.route('/import/<subject_id>', methods=['POST'])
+@token_required
+def import_marks(subject_id):
+    """
+    CR-only: set many students' marks from one sheet.
+
+    Columns: username (or email), one per exam in the exam structure (matched
+    by name), optional grade. Blank cells leave that exam untouched; a
+    student's own extra exams are kept. The whole sheet is validated before
+    anything is written, then applied as one bulk_write of upserts.
+    Export (GET /export/<subject_id>) produces a sheet in the same format.
+    """
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        subject, _, classroom, is_cr = _check_subject_access(db, subject_id, user_id)
+        if not is_cr:
+            return jsonify({'error': 'Only a CR can import marks'}), 403
+
+        struct = db.exam_structures.find_one({'subject_id': subject_id})
+        exams = struct.get('exams', []) if struct else []
+        if not exams:
+            return jsonify({'error': 'Set the exam structure before importing marks'}), 400
+        upload = request.files.get('file')
+        if not upload:
+            return jsonify({'error': 'No file provided'}), 400
+
+        try:
+            rows = _read_sheet(upload)
+            header = next(rows, None)
+            if header is None:
+                return jsonify({'error': 'The file is empty'}), 400
+            student_col, exam_cols, grade_col = _parse_import_header(header, exams)
+
+            parsed, errors = [], []
+            for line, row in enumerate(rows, start=2):
+                if not any(row):
+                    continue
+                if len(parsed) >= MAX_IMPORT_ROWS:
+                    return jsonify({'error': f'At most {MAX_IMPORT_ROWS} rows per import'}), 400
+                ident = row[0].lower() if row else ''
+                if not ident:
+                    errors.append({'row': line, 'error': f'Missing {student_col}'})
+                    continue
+                marks = {}
+                for col, i in exam_cols.items():
+                    cell = row[col] if col < len(row) else ''
+                    if cell == '':
+                        continue
+                    try:
+                        value = float(cell)
+                    except ValueError:
+                        errors.append({'row': line, 'error': f"{exams[i]['name']}: '{cell}' is not a number"})
+                        continue
+                    if not 0 <= value <= exams[i]['max_marks']:
+                        errors.append({'row': line,
+                                       'error': f"{exams[i]['name']}: {value:g} is outside 0–{exams[i]['max_marks']:g}"})
+                        continue
+                    marks[i] = value
+                grade = (row[grade_col] if grade_col is not None and grade_col < len(row) else '') or None
+                parsed.append((line, ident, marks, grade))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        # Resolve every student with one query over the classroom's members
+        field = 'email' if student_col == 'email' else 'username'
+        by_ident = {
+            (u.get(field) or '').lower(): str(u['_id'])
+            for u in db.users.find({'_id': {'$in': classroom.get('members', [])}}, {field: 1})
+        }
+
+        seen = {}
+        for line, ident, _, _ in parsed:
+            if ident not in by_ident:
+                errors.append({'row': line, 'error': f"No classroom member with {field} '{ident}'"})
+            elif ident in seen:
+                errors.append({'row': line, 'error': f"'{ident}' already appears on row {seen[ident]}"})
+            else:
+                seen[ident] = line
+        if errors:
+            return jsonify({'error': 'Nothing was imported', 'errors': sorted(errors, key=lambda e: e['row'])}), 400
+
+        student_ids = [by_ident[ident] for _, ident, _, _ in parsed]
+        existing = {
+            m['user_id']: m
+            for m in db.subject_marks.find({'subject_id': subject_id, 'user_id': {'$in': student_ids}})
+        }
+        exam_keys = [marks_stats.exam_key(e['name']) for e in exams]
+        now = datetime.now(timezone.utc)
+        ops = []
+        for (_, ident, marks, grade), sid in zip(parsed, student_ids):
+            prev = existing.get(sid, {})
+            entries = {}
+            for e in prev.get('entries', []):
+                entries.setdefault(marks_stats.exam_key(e.get('name')), e)
+            for i, value in marks.items():
+                entries[exam_keys[i]] = {
+                    'name': exams[i]['name'],
+                    'max_marks': exams[i]['max_marks'],
+                    'weightage': exams[i]['weightage'],
+                    'marks_obtained': value,
+                }
+            doc = {
+                'subject_id': subject_id,
+                'user_id': sid,
+                'entries': list(entries.values()),
+                'grade': grade if grade is not None else prev.get('grade', ''),
+                'updated_at': now,
+            }
+            score = _compute_weighted_score(doc['entries'])
+            if score is not None and score > 100.01:
+                return jsonify({'error': f"Total scaled marks for '{ident}' would exceed 100"}), 400
+            ops.append(ReplaceOne({'subject_id': subject_id, 'user_id': sid}, doc, upsert=True))
+
+        if ops:
+            def _write(session):
+                db.subject_marks.bulk_write(ops, ordered=False, session=session)
+                marks_stats.rebuild(db, subject_id, subject['semester_id'], exams, session=session)
+            run_in_transaction(db, _write)
+        return jsonify({'message': f'Imported marks for {len(ops)} students', 'imported': len(ops)}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        logger.error(f"Import marks error: {e}")
+        return jsonify({'error': 'Failed to import marks'}), 500
+
+
+def _export_rows(db, subject_id, classroom, exams):
+    """Yield the header then one row per classroom member, reading members'
+    names and marks EXPORT_BATCH at a time."""
+    exam_keys = [marks_stats.exam_key(e['name']) for e in exams]
+    yield ['username', 'name'] + [e['name'] for e in exams] + ['score', 'grade']
+    members = classroom.get('members', [])
+    for start in range(0, len(members), EXPORT_BATCH):
+        batch = members[start:start + EXPORT_BATCH]
+        users = resolve_users(db, batch)
+        marks = _marks_for_users(db, subject_id, [str(m) for m in batch])
+        for member in batch:
+            uid = str(member)
+            user = users.get(uid)
+            if not user:
+                continue
+            doc = marks.get(uid, {})
+            by_exam = {}
+            for e in doc.get('entries', []):
+                by_exam.setdefault(marks_stats.exam_key(e.get('name')), e.get('marks_obtained'))
+            score = _compute_weighted_score(doc.get('entries', []))
+            yield ([user.get('username', ''), user.get('fullName', '')]
+                   + [by_exam.get(k, '') for k in exam_keys]
+                   + ['' if score is None else score, doc.get('grade', '')])
+
+
+def _marks_for_users(db, subject_id, user_ids):
+    return {
+        m['user_id']: m
+        for m in db.subject_marks.find({'subject_id': subject_id, 'user_id': {'$in': user_ids}})
+    }
+
+
+@marks_bp.route('/export/<subject_id>', methods=['GET'])
+@token_required
+def export_marks(subject_id):
+    """CR-only: class marks sheet (?format=csv, the default, or xlsx). CSV is
+    streamed row by row; XLSX is written in openpyxl's write-only mode to a
+    temp file. Either can be edited and sent back to /import/<subject_id>."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        subject, _, classroom, is_cr = _check_subject_access(db, subject_id, user_id)
+        if not is_cr:
+            return jsonify({'error': 'Only a CR can export marks'}), 403
+        fmt = request.args.get('format', 'csv').lower()
+        if fmt not in ('csv', 'xlsx'):
+            return jsonify({'error': 'format must be csv or xlsx'}), 400
+
+        struct = db.exam_structures.find_one({'subject_id': subject_id})
+        exams = struct.get('exams', []) if struct else []
+        filename = secure_filename(f"{subject.get('name', 'subject')}_marks.{fmt}") or f'marks.{fmt}'
+        rows = _export_rows(db, subject_id, classroom, exams)
+
+        if fmt == 'xlsx':
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet('Marks')
+            for row in rows:
+                ws.append([_xlsx_cell(ws, v) for v in row])
+            out = tempfile.TemporaryFile()
+            wb.save(out)
+            out.seek(0)
+            return send_file(
+                out, as_attachment=True, download_name=filename,
+                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+            )
+
+        def generate():
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            for row in rows:
+                writer.writerow([_csv_cell(v) for v in row])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+
+        return Response(
+            stream_with_context(generate()), mimetype='text/csv',
+            headers={'Content-Disposition': f'attachment; filename="{filename}"'},
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        logger.error(f"Export marks error: {e}")
+        return jsonify({'error': 'Failed to export marks'}), 500
+
+
 # ── Analytics Files ───────────────────────────────────────────────────────────
 
 @marks_bp.route('/analytics/<subject_id>', methods=['GET'])
@@ -256,13 +568,10 @@ def list_analytics(subject_id):
 
         files = list(db.subject_analytics.find(query).sort('created_at', -1))
 
+        uploaders = resolve_users(db, [f.get('uploaded_by') for f in files])
         result = []
         for f in files:
-            uploader = db.users.find_one(
-                {'_id': ObjectId(f['uploaded_by'])},
-                {'fullName': 1, 'username': 1}
-            ) if f.get('uploaded_by') else None
-            uploader_name = (uploader.get('fullName') or uploader.get('username', '')) if uploader else ''
+            uploader_name = display_name(uploaders.get(f.get('uploaded_by')))
             result.append({
                 'id': str(f['_id']),
                 'filename': f['filename'],
@@ -290,6 +599,8 @@ def upload_analytics(subject_id):
         user_id = request.user['user_id']
         db = get_db()
         subject, semester, classroom, is_cr = _check_subject_access(db, subject_id, user_id)
+        if ingest.body_too_large(MAX_FILE_SIZE):
+            return jsonify({'error': 'File too large (max 50 MB)'}), 400
 
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -300,42 +611,23 @@ def upload_analytics(subject_id):
         if not _allowed(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
 
-        # Size check
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_FILE_SIZE:
-            return jsonify({'error': 'File too large (max 50 MB)'}), 400
-
-        # Visibility: CRs choose public/cr_only; students always personal
-        if is_cr:
-            visibility = request.form.get('visibility', 'public')
-            if visibility not in ('public', 'cr_only'):
-                visibility = 'public'
-        else:
-            visibility = 'personal'
-
         original_name = secure_filename(file.filename)
         stored_name = f"{uuid4().hex}_{original_name}"
-        file.save(os.path.join(ANALYTICS_DIR, stored_name))
-
-        doc = {
-            'subject_id': subject_id,
-            'filename': original_name,
-            'stored_name': stored_name,
-            'size': size,
-            'visibility': visibility,
-            'uploaded_by': user_id,
-            'created_at': datetime.now(timezone.utc),
-        }
-        result = db.subject_analytics.insert_one(doc)
+        try:
+            saved = ingest.save(file, os.path.join(ANALYTICS_DIR, stored_name), max_size=MAX_FILE_SIZE)
+        except ingest.TooLarge:
+            return jsonify({'error': 'File too large (max 50 MB)'}), 400
+        except ingest.DisallowedType:
+            return jsonify({'error': 'File type not allowed'}), 400
 
+        doc = _add_analytics_file(db, subject_id, user_id, is_cr, request.form.get('visibility'),
+                                  stored_name, original_name, saved.size, saved.sha256)
         return jsonify({
             'message': 'File uploaded',
             'file': {
-                'id': str(result.inserted_id),
+                'id': str(doc['_id']),
                 'filename': original_name,
-                'size': size,
+                'size': saved.size,
             }
         }), 201
     except ValueError as e:
@@ -345,6 +637,66 @@ def upload_analytics(subject_id):
         return jsonify({'error': 'Failed to upload file'}), 500
 
 
+def _add_analytics_file(db, subject_id, user_id, is_cr, visibility, stored_name,
+                        original_name, size, sha256):
+    """Record a file already written to ANALYTICS_DIR/stored_name."""
+    # Visibility: CRs choose public/cr_only; students always personal
+    if is_cr:
+        visibility = visibility or 'public'
+        if visibility not in ('public', 'cr_only'):
+            visibility = 'public'
+    else:
+        visibility = 'personal'
+
+    doc = {
+        'subject_id': subject_id,
+        'filename': original_name,
+        'stored_name': stored_name,
+        'size': size,
+        'sha256': sha256,
+        'visibility': visibility,
+        'uploaded_by': user_id,
+        'created_at': datetime.now(timezone.utc),
+    }
+    doc['_id'] = db.subject_analytics.insert_one(doc).inserted_id
+    return doc
+
+
+# Resumable uploads (utils/resumable.py) — params: subject_id, visibility
+
+def _authorize_resumable(db, user, params, filename):
+    if not ObjectId.is_valid(params.get('subject_id', '')):
+        return jsonify({'error': 'Subject not found'}), 403
+    try:
+        _check_subject_access(db, params['subject_id'], user['user_id'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    if not _allowed(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    return None
+
+
+def _finalize_resumable(db, user, params, upload):
+    subject_id = params['subject_id']
+    _, _, _, is_cr = _check_subject_access(db, subject_id, user['user_id'])
+    original_name = secure_filename(upload.filename)
+    stored_name = f"{uuid4().hex}_{original_name}"
+    os.replace(upload.path, os.path.join(ANALYTICS_DIR, stored_name))
+    doc = _add_analytics_file(db, subject_id, user['user_id'], is_cr, params.get('visibility'),
+                              stored_name, original_name, upload.size, upload.sha256)
+    return jsonify({
+        'message': 'File uploaded',
+        'file': {
+            'id': str(doc['_id']),
+            'filename': original_name,
+            'size': upload.size,
+        }
+    }), 201
+
+
+resumable.register('analytics', _authorize_resumable, _finalize_resumable, MAX_FILE_SIZE)
+
+
 @marks_bp.route('/analytics/<subject_id>/<file_id>', methods=['DELETE'])
 @token_required
 def delete_analytics(subject_id, file_id):
@@ -417,23 +769,20 @@ def update_analytics_visibility(subject_id, file_id):
 
 # ── Shared score helper ───────────────────────────────────────────────────────
 
-def _compute_weighted_score(entries):
-    """
-    Given a list of exam entry dicts, return the weighted percentage score
-    (0–100) or None if there are no entries or zero total weightage.
-    """
-    if not entries:
-        return None
-    total_weight = sum(float(e.get('weightage', 0)) for e in entries)
-    if total_weight == 0:
-        return None
-    weighted_sum = sum(
-        (float(e.get('marks_obtained', 0)) / float(e.get('max_marks', 1)))
-        * float(e.get('weightage', 0))
-        for e in entries
-        if float(e.get('max_marks', 0)) > 0  # guard against zero/missing max_marks
-    )
-    return round(weighted_sum, 2)
+# The scoring rule lives in utils.marks_stats so the per-student views here
+# and the materialized class statistics can't drift apart.
+_compute_weighted_score = marks_stats.weighted_score
+
+
+def _my_marks_by_subject(db, user_id, subject_ids):
+    """{subject_id: this user's subject_marks doc} in one query."""
+    return {
+        m['subject_id']: m
+        for m in db.subject_marks.find({
+            'subject_id': {'$in': [str(s) for s in subject_ids]},
+            'user_id': user_id,
+        })
+    }
 
 
 def _semester_label(sem):
@@ -484,20 +833,23 @@ def get_marks_trend(classroom_id):
             {'_id': 1, 'name': 1, 'type': 1, 'year': 1, 'session': 1}
         ).sort('_id', 1))
 
+        subjects_by_sem = {}
+        for sub in db.subjects.find(
+            {'semester_id': {'$in': [str(s['_id']) for s in semesters]}, 'classroom_id': classroom_id},
+            {'_id': 1, 'name': 1, 'semester_id': 1}
+        ):
+            subjects_by_sem.setdefault(sub['semester_id'], []).append(sub)
+        my_marks = _my_marks_by_subject(db, user_id, [
+            sub['_id'] for subs in subjects_by_sem.values() for sub in subs
+        ])
+
         result = []
         for sem in semesters:
             sem_id = str(sem['_id'])
-            subjects = list(db.subjects.find(
-                {'semester_id': sem_id, 'classroom_id': classroom_id},
-                {'_id': 1, 'name': 1}
-            ))
-
             sem_subjects = []
             scored = []
-            for sub in subjects:
-                marks_doc = db.subject_marks.find_one(
-                    {'subject_id': str(sub['_id']), 'user_id': user_id}
-                )
+            for sub in subjects_by_sem.get(sem_id, []):
+                marks_doc = my_marks.get(str(sub['_id']))
                 entries = marks_doc.get('entries', []) if marks_doc else []
                 score = _compute_weighted_score(entries)
                 grade = marks_doc.get('grade', '') if marks_doc else ''
@@ -562,10 +914,11 @@ def get_semester_analytics(semester_id):
             {'_id': 1, 'name': 1}
         ))
 
+        my_marks = _my_marks_by_subject(db, user_id, [sub['_id'] for sub in subjects])
         result_subjects = []
         for sub in subjects:
             sub_id = str(sub['_id'])
-            marks_doc = db.subject_marks.find_one({'subject_id': sub_id, 'user_id': user_id})
+            marks_doc = my_marks.get(sub_id)
             entries = marks_doc.get('entries', []) if marks_doc else []
             result_subjects.append({
                 'subject_id': sub_id,
@@ -588,7 +941,12 @@ def get_semester_analytics(semester_id):
 @marks_bp.route('/cr-class-average/<semester_id>', methods=['GET'])
 @token_required
 def get_cr_class_average(semester_id):
-    """CR-only: per-subject class-average score across all students for this semester."""
+    """CR-only: per-subject class statistics across all students for this semester.
+
+    Read from the materialized subject_mark_stats documents (utils.marks_stats),
+    so the cost doesn't depend on class size. Percentiles are estimated from
+    the 10-point score histogram.
+    """
     from database import get_db
     try:
         user_id = request.user['user_id']
@@ -610,17 +968,23 @@ def get_cr_class_average(semester_id):
             {'_id': 1, 'name': 1},
         ))
 
+        stats = marks_stats.get_stats(db, [sub['_id'] for sub in subjects])
         result = []
         for sub in subjects:
             sub_id = str(sub['_id'])
-            all_marks = list(db.subject_marks.find({'subject_id': sub_id}, {'entries': 1}))
-            scores = [_compute_weighted_score(m.get('entries', [])) for m in all_marks]
-            scored = [s for s in scores if s is not None]
+            summary = marks_stats.summarize(stats[sub_id])
             result.append({
                 'subject_id': sub_id,
                 'name': sub['name'],
-                'class_avg': round(sum(scored) / len(scored), 2) if scored else None,
-                'count': len(scored),
+                'class_avg': summary['mean'],
+                'count': summary['count'],
+                'std_dev': summary['std_dev'],
+                'p25': summary['p25'],
+                'median': summary['median'],
+                'p75': summary['p75'],
+                'histogram': summary['histogram'],
+                'grades': summary['grades'],
+                'exams': summary['exams'],
             })
 
         return jsonify({'subjects': result}), 200
@@ -629,44 +993,236 @@ def get_cr_class_average(semester_id):
         return jsonify({'error': 'Failed to fetch class average'}), 500
 
 
+# ── Whole-class analytics (utils.marks_analytics) ─────────────────────────────
+
+def _load_class_marks(db, subject_id):
+    struct = db.exam_structures.find_one({'subject_id': subject_id}, {'exams': 1})
+    docs = db.subject_marks.find({'subject_id': subject_id}, {'user_id': 1, 'entries': 1, 'grade': 1})
+    return marks_analytics.ClassMarks.load(struct.get('exams', []) if struct else [], docs)
+
+
+def _num(value):
+    """NumPy scalar → JSON-friendly float (None for NaN), 2 dp."""
+    value = float(value)
+    return None if value != value else round(value, 2)
+
+
+@marks_bp.route('/class-analytics/<subject_id>', methods=['GET'])
+@token_required
+def get_class_analytics(subject_id):
+    """
+    CR-only: every student's score with percentile rank and z-score, the
+    class distribution, and per-exam difficulty. With ?target=<score> or
+    ?grade=<grade>, each student also gets the average percentage they need
+    in the exams they haven't entered yet.
+    """
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        _, _, _, is_cr = _check_subject_access(db, subject_id, user_id)
+        if not is_cr:
+            return jsonify({'error': 'CR access required'}), 403
+
+        target = None
+        if request.args.get('target') or request.args.get('grade'):
+            try:
+                target = marks_analytics.target_for(request.args.get('grade'), request.args.get('target'))
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+
+        cm = _load_class_marks(db, subject_id)
+        scores = cm.scores()
+        pct, z = cm.standing()
+        names = resolve_users(db, cm.user_ids)
+        if target is not None:
+            _, remaining, needed, status = cm.what_if(target)
+
+        students = []
+        for i, uid in enumerate(cm.user_ids):
+            row = {
+                'user_id': uid,
+                'name': display_name(names.get(uid), 'Unknown'),
+                'score': _num(scores[i]),
+                'percentile': _num(pct[i]),
+                'z_score': _num(z[i]),
+            }
+            if target is not None:
+                row.update({
+                    'remaining_weight': _num(remaining[i]),
+                    'needed_pct': _num(needed[i]),
+                    'status': str(status[i]),
+                })
+            students.append(row)
+        students.sort(key=lambda r: (r['score'] is None, -(r['score'] or 0)))
+
+        return jsonify({
+            'summary': cm.summary(),
+            'exams': cm.exam_difficulty(),
+            'target': target,
+            'students': students,
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        logger.error(f"Class analytics error: {e}")
+        return jsonify({'error': 'Failed to compute class analytics'}), 500
+
+
+@marks_bp.route('/standing/<subject_id>', methods=['GET'])
+@token_required
+def get_my_standing(subject_id):
+    """Where the caller stands in the class: their score, percentile rank and
+    z-score, against the anonymous class distribution and exam difficulty."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        _check_subject_access(db, subject_id, user_id)
+
+        cm = _load_class_marks(db, subject_id)
+        pct, z = cm.standing()
+        me = cm.user_ids.index(user_id) if user_id in cm.user_ids else None
+        return jsonify({
+            'score': _num(cm.scores()[me]) if me is not None else None,
+            'percentile': _num(pct[me]) if me is not None else None,
+            'z_score': _num(z[me]) if me is not None else None,
+            'summary': cm.summary(),
+            'exams': cm.exam_difficulty(),
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        logger.error(f"Standing error: {e}")
+        return jsonify({'error': 'Failed to compute standing'}), 500
+
+
+@marks_bp.route('/what-if/<subject_id>', methods=['GET'])
+@token_required
+def get_what_if(subject_id):
+    """
+    ?target=<score> or ?grade=<grade>: the average percentage the caller needs
+    across the exam-structure exams they haven't entered marks for yet.
+
+    Response: {target, current, max_possible, remaining_exams: [...],
+               needed_pct, status: secured | reachable | out_of_reach}
+    """
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        _check_subject_access(db, subject_id, user_id)
+        try:
+            target = marks_analytics.target_for(request.args.get('grade'), request.args.get('target'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        struct = db.exam_structures.find_one({'subject_id': subject_id}, {'exams': 1})
+        mine = db.subject_marks.find_one({'subject_id': subject_id, 'user_id': user_id})
+        cm = marks_analytics.ClassMarks.load(
+            struct.get('exams', []) if struct else [],
+            [mine or {'user_id': user_id, 'entries': []}],
+        )
+        current, remaining, needed, status = cm.what_if(target)
+        return jsonify({
+            'target': target,
+            'current': _num(current[0]),
+            'max_possible': _num(current[0] + remaining[0]),
+            'remaining_exams': cm.remaining_exams(0),
+            'needed_pct': _num(needed[0]),
+            'status': str(status[0]),
+        }), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 403
+    except Exception as e:
+        logger.error(f"What-if error: {e}")
+        return jsonify({'error': 'Failed to compute projection'}), 500
+
+
+def _analytics_access_error(db, f, user_id):
+    """None if `user_id` may read analytics file `f`, else the error message.
+    Same rule as list_analytics: CRs see everything; students see 'public'
+    files and their own 'personal' uploads only."""
+    try:
+        _, _, _, is_cr = _check_subject_access(db, f['subject_id'], user_id)
+    except ValueError as e:
+        return str(e)
+    visibility = f.get('visibility', 'public')
+    if not is_cr and not (
+        visibility == 'public' or
+        (visibility == 'personal' and f.get('uploaded_by') == user_id)
+    ):
+        return 'Access denied'
+    return None
+
+
 @marks_bp.route('/analytics/file/<file_id>', methods=['GET'])
 def serve_analytics_file(file_id):
-    """Serve analytics file. Auth via ?token= query param.
-    Access follows the same rule as list_analytics: CRs see everything;
-    students see 'public' files and their own 'personal' uploads only."""
+    """Serve analytics file. Auth via a signed URL from
+    GET /analytics/file/<id>/url, or the ?token= query param."""
     from database import get_db
     try:
-        token = request.args.get('token', '')
-        if not token:
-            return jsonify({'error': 'Token required'}), 401
         try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Invalid token'}), 401
-        user_id = payload['user_id']
+            user_id = file_delivery.signed_user('analytics', file_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        signed = user_id is not None
+        if not signed:
+            token = request.args.get('token', '')
+            if not token:
+                return jsonify({'error': 'Token required'}), 401
+            try:
+                payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            except jwt.InvalidTokenError:
+                return jsonify({'error': 'Invalid token'}), 401
+            user_id = payload['user_id']
 
         db = get_db()
         f = db.subject_analytics.find_one({'_id': ObjectId(file_id)})
         if not f:
             return jsonify({'error': 'File not found'}), 404
 
-        try:
-            _, _, _, is_cr = _check_subject_access(db, f['subject_id'], user_id)
-        except ValueError as e:
-            return jsonify({'error': str(e)}), 403
-
         visibility = f.get('visibility', 'public')
-        if not is_cr and not (
-            visibility == 'public' or
-            (visibility == 'personal' and f.get('uploaded_by') == user_id)
-        ):
-            return jsonify({'error': 'Access denied'}), 403
+        if visibility == 'public' or (visibility == 'personal' and f.get('uploaded_by') == user_id):
+            # Revalidation of a copy the browser already holds: skip the subject access lookups
+            cached = http_cache.not_modified(f.get('sha256'))
+            if cached:
+                return cached
+
+        # A signed URL is only issued after the same check
+        if not signed:
+            error = _analytics_access_error(db, f, user_id)
+            if error:
+                return jsonify({'error': error}), 403
 
         path = os.path.join(ANALYTICS_DIR, f['stored_name'])
         if not os.path.exists(path):
             return jsonify({'error': 'File not found on disk'}), 404
 
-        return send_file(path, as_attachment=False, download_name=f['filename'])
+        return file_delivery.deliver(path, etag=f.get('sha256'), download_name=f['filename'])
     except Exception as e:
         logger.error(f"Serve analytics error: {e}")
         return jsonify({'error': 'Failed to serve file'}), 500
+
+
+@marks_bp.route('/analytics/file/<file_id>/url', methods=['GET'])
+@token_required
+def get_analytics_file_url(file_id):
+    """Short-lived signed URL for an analytics file (see utils/file_delivery.py)."""
+    from database import get_db
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        f = db.subject_analytics.find_one(
+            {'_id': ObjectId(file_id)}, {'subject_id': 1, 'visibility': 1, 'uploaded_by': 1},
+        )
+        if not f:
+            return jsonify({'error': 'File not found'}), 404
+        error = _analytics_access_error(db, f, user_id)
+        if error:
+            return jsonify({'error': error}), 403
+        url = file_delivery.sign_path(f'/api/marks/analytics/file/{file_id}', 'analytics', file_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"Sign analytics URL error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
@@ -1,20 +1,24 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta, timezone
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
 from bson import ObjectId
+from pymongo import ReturnDocument
 import jwt
 import os
 import logging
+import tempfile
+from uuid import uuid4
 
 from database import db
 from middleware import token_required, SECRET_KEY
-from utils.mime_check import is_image, is_dangerous
+from utils.mime_check import is_image
+from utils import user_cache, resolve_classrooms
+from utils import http_cache, file_delivery, avatars, ingest, storage
 
 settings_bp = Blueprint('settings', __name__, url_prefix='/api/settings')
 logger = logging.getLogger(__name__)
 
-AVATARS_DIR = os.path.join(os.getcwd(), 'uploads', 'avatars')
 ALLOWED_IMAGE_EXTS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 MAX_AVATAR_SIZE = 2 * 1024 * 1024  # 2 MB
 
@@ -144,6 +148,7 @@ def update_profile():
             return jsonify({'error': 'No fields to update'}), 400
 
         database.users.update_one({'_id': ObjectId(user_id)}, {'$set': updates})
+        user_cache.invalidate(user_id)
         user = database.users.find_one({'_id': ObjectId(user_id)})
         new_token = _create_token(user)
         return jsonify({
@@ -172,6 +177,7 @@ def update_privacy():
         if not updates:
             return jsonify({'error': 'No fields to update'}), 400
         database.users.update_one({'_id': ObjectId(user_id)}, {'$set': updates})
+        user_cache.invalidate(user_id)
         user = database.users.find_one({'_id': ObjectId(user_id)})
         # Immediately broadcast status change to any active socket rooms
         if 'show_online_status' in updates:
@@ -193,6 +199,8 @@ def update_privacy():
 @token_required
 def upload_avatar():
     try:
+        if ingest.body_too_large(MAX_AVATAR_SIZE):
+            return jsonify({'error': 'Image must be under 2 MB'}), 413
         if 'avatar' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
 
@@ -208,41 +216,44 @@ def upload_avatar():
         if not is_image(file):
             return jsonify({'error': 'File content does not match an image format'}), 400
 
-        # Check size
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_AVATAR_SIZE:
-            return jsonify({'error': 'Image must be under 2 MB'}), 400
-
         user_id = request.user['user_id']
-        safe_name = secure_filename(file.filename)
-        filename = f"{user_id}_{safe_name}"
-        os.makedirs(AVATARS_DIR, exist_ok=True)
-
-        # Remove old avatar files for this user
-        for f_name in os.listdir(AVATARS_DIR):
-            if f_name.startswith(f"{user_id}_"):
-                try:
-                    os.remove(os.path.join(AVATARS_DIR, f_name))
-                except Exception:
-                    pass
-
-        filepath = os.path.join(AVATARS_DIR, filename)
-        file.save(filepath)
+        # Size-checked in one pass into a temp file, then decoded from there
+        tmp_path = os.path.join(tempfile.gettempdir(), f'avatar_{uuid4().hex}')
+        try:
+            ingest.save(file, tmp_path, max_size=MAX_AVATAR_SIZE)
+            with open(tmp_path, 'rb') as fh:
+                name = avatars.save_avatar(user_id, fh)
+        except ingest.TooLarge:
+            return jsonify({'error': 'Image must be under 2 MB'}), 413
+        except (ingest.DisallowedType, ValueError):
+            return jsonify({'error': 'File content does not match an image format'}), 400
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
 
         database = db.get_db()
-        database.users.update_one(
-            {'_id': ObjectId(user_id)},
-            {'$set': {
-                'profile_picture': filename,
-                'photo_removed_reason': None,
-                'photo_removed_by': None,
-                'photo_removed_at': None,
-            }}
+        fields = {
+            'profile_picture': name,
+            'photo_removed_reason': None,
+            'photo_removed_by': None,
+            'photo_removed_at': None,
+        }
+        user = database.users.find_one_and_update(
+            {'_id': ObjectId(user_id)}, {'$set': fields}, return_document=ReturnDocument.BEFORE,
         )
-        user = database.users.find_one({'_id': ObjectId(user_id)})
-        return jsonify({'message': 'Avatar uploaded', 'user': _format_user(user)}), 200
+        if user is None:
+            # Deleted while holding a valid token — don't leave the renditions behind
+            avatars.delete_avatar(name)
+            return jsonify({'error': 'User not found'}), 404
+        if user.get('profile_picture') not in (None, name):
+            avatars.delete_avatar(user['profile_picture'])
+        user_cache.invalidate(user_id)
+        try:
+            from routes.chat_routes import invalidate_user_rooms
+            invalidate_user_rooms(user_id)
+        except Exception as cache_err:
+            logger.warning(f"invalidate_user_rooms error: {cache_err}")
+        return jsonify({'message': 'Avatar uploaded', 'user': _format_user({**user, **fields})}), 200
     except Exception as e:
         logger.error(f"upload_avatar error: {e}")
         return jsonify({'error': 'Failed to upload avatar'}), 500
@@ -253,17 +264,27 @@ def upload_avatar():
 # ---------------------------------------------------------------------------
 @settings_bp.route('/avatar/<user_id>', methods=['GET'])
 def serve_avatar(user_id):
+    """?size=<px> picks the smallest thumbnail covering that size (the full
+    picture without it). ?v=<profile_picture> (as the frontend builds it)
+    names this exact picture and is cached for good; without it the browser
+    revalidates."""
     try:
+        size = request.args.get('size', type=int)
         database = db.get_db()
-        user = database.users.find_one({'_id': ObjectId(user_id)})
+        user = database.users.find_one({'_id': ObjectId(user_id)}, {'profile_picture': 1})
         if not user or not user.get('profile_picture'):
             return jsonify({'error': 'Avatar not found'}), 404
 
-        filepath = os.path.join(AVATARS_DIR, user['profile_picture'])
+        if request.args.get('v') == user['profile_picture']:
+            cache_control = http_cache.IMMUTABLE
+        else:
+            cache_control = http_cache.PUBLIC_REVALIDATE
+
+        filepath = avatars.avatar_path(user['profile_picture'], size)
         if not os.path.exists(filepath):
             return jsonify({'error': 'Avatar file not found'}), 404
 
-        return send_file(filepath)
+        return file_delivery.deliver(filepath, cache_control=cache_control)
     except Exception as e:
         logger.error(f"serve_avatar error: {e}")
         return jsonify({'error': 'Failed to serve avatar'}), 500
@@ -316,17 +337,15 @@ def serve_avatar_fullscreen(user_id):
             return jsonify({'error': 'Token mismatch'}), 403
 
         database = db.get_db()
-        user = database.users.find_one({'_id': ObjectId(user_id)})
+        user = database.users.find_one({'_id': ObjectId(user_id)}, {'profile_picture': 1})
         if not user or not user.get('profile_picture'):
             return jsonify({'error': 'Avatar not found'}), 404
 
-        filepath = os.path.join(AVATARS_DIR, user['profile_picture'])
+        filepath = avatars.avatar_path(user['profile_picture'])
         if not os.path.exists(filepath):
             return jsonify({'error': 'Avatar file not found'}), 404
 
-        response = send_file(filepath)
-        response.headers['Cache-Control'] = 'no-store'
-        return response
+        return file_delivery.deliver(filepath, cache_control='no-store')
     except Exception as e:
         logger.error(f"serve_avatar_fullscreen error: {e}")
         return jsonify({'error': 'Failed to serve avatar'}), 500
@@ -382,24 +401,26 @@ def get_chat_files():
             'file': {'$ne': None}
         }).sort('created_at', -1))
 
-        # Build a map of classroom names
-        classroom_ids = list({m['classroom_id'] for m in messages})
-        classrooms = {}
-        for cid in classroom_ids:
-            try:
-                c = database.classrooms.find_one({'_id': ObjectId(cid)})
-                if c:
-                    classrooms[cid] = c.get('name', cid)
-            except Exception:
-                classrooms[cid] = cid
+        # Chat messages are semester-scoped; map each one to its classroom via
+        # one semesters query and one classrooms query, not a lookup per message
+        semester_oids = list({ObjectId(m['semester_id']) for m in messages
+                              if ObjectId.is_valid(m.get('semester_id') or '')})
+        sem_classroom = {
+            str(s['_id']): s.get('classroom_id', '')
+            for s in database.semesters.find({'_id': {'$in': semester_oids}}, {'classroom_id': 1})
+        } if semester_oids else {}
+        msg_classroom_ids = [
+            m.get('classroom_id') or sem_classroom.get(m.get('semester_id'), '') for m in messages
+        ]
+        classrooms = resolve_classrooms(database, msg_classroom_ids)
 
         files = []
-        for msg in messages:
+        for msg, cid in zip(messages, msg_classroom_ids):
             file_info = msg.get('file', {}) or {}
             files.append({
                 'message_id': str(msg['_id']),
-                'classroom_id': msg['classroom_id'],
-                'classroom_name': classrooms.get(msg['classroom_id'], msg['classroom_id']),
+                'classroom_id': cid,
+                'classroom_name': classrooms.get(cid, {}).get('name', cid),
                 'filename': file_info.get('name', 'file'),
                 'mime_type': file_info.get('mime_type', ''),
                 'size': file_info.get('size', 0),
@@ -449,21 +470,19 @@ def delete_chat_file(message_id):
         if not msg.get('file'):
             return jsonify({'error': 'No file attached to this message'}), 400
 
-        # Delete the file from disk (path is stored relative to cwd)
-        file_info = msg['file'] or {}
-        rel_path = file_info.get('path')
-        disk_path = os.path.join(os.getcwd(), rel_path) if rel_path else None
-        if disk_path and os.path.exists(disk_path):
-            try:
-                os.remove(disk_path)
-            except Exception as del_err:
-                logger.warning(f"Could not delete file {disk_path}: {del_err}")
+        # Release the file (deleted with its last reference)
+        storage.release_message_file(database, msg['file'])
 
         # Clear file from the message (keep text)
         database.chat_messages.update_one(
             {'_id': ObjectId(message_id)},
             {'$set': {'file': None}}
         )
+        try:
+            from routes.chat_routes import refresh_cached_message
+            refresh_cached_message(msg['semester_id'], message_id)
+        except Exception as cache_err:
+            logger.warning(f"refresh_cached_message error: {cache_err}")
 
         return jsonify({'message': 'File deleted'}), 200
     except Exception as e:
@@ -511,25 +530,24 @@ def upload_personal_doc():
     """Upload a personal document with a label."""
     try:
         user_id = request.user['user_id']
+        if ingest.body_too_large(MAX_PERSONAL_DOC_SIZE):
+            return jsonify({'error': 'File too large (max 20 MB)'}), 413
         file = request.files.get('file')
         label = (request.form.get('label') or '').strip()
 
         if not file:
             return jsonify({'error': 'No file provided'}), 400
 
-        file.seek(0, 2)
-        size = file.tell()
-        file.seek(0)
-        if size > MAX_PERSONAL_DOC_SIZE:
-            return jsonify({'error': 'File too large (max 20 MB)'}), 413
-        if is_dangerous(file):
-            return jsonify({'error': 'File type not allowed'}), 400
-
         original_name = secure_filename(file.filename or 'document')
         timestamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
         stored_name = f"{timestamp}_{user_id}_{original_name}"
-        file_path = os.path.join(PERSONAL_DOCS_DIR, stored_name)
-        file.save(file_path)
+        try:
+            saved = ingest.save(file, os.path.join(PERSONAL_DOCS_DIR, stored_name),
+                                max_size=MAX_PERSONAL_DOC_SIZE)
+        except ingest.TooLarge:
+            return jsonify({'error': 'File too large (max 20 MB)'}), 413
+        except ingest.DisallowedType:
+            return jsonify({'error': 'File type not allowed'}), 400
 
         database = db.get_db()
         doc = {
@@ -538,7 +556,8 @@ def upload_personal_doc():
             'filename': original_name,
             'stored_name': stored_name,
             'mime_type': file.content_type or 'application/octet-stream',
-            'size': size,
+            'size': saved.size,
+            'sha256': saved.sha256,
             'created_at': datetime.now(timezone.utc),
         }
         result = database.personal_docs.insert_one(doc)
@@ -559,17 +578,23 @@ def upload_personal_doc():
 
 @settings_bp.route('/personal-docs/<doc_id>', methods=['GET'])
 def download_personal_doc(doc_id):
-    """Serve a personal document — owner only, token from header or ?token= query param."""
+    """Serve a personal document — owner only. Signed URL from
+    GET /personal-docs/<id>/url, or token from header or ?token= query param."""
     try:
-        token = request.args.get('token') or request.headers.get('Authorization', '')
-        if token.startswith('Bearer '):
-            token = token[7:]
-        if not token:
-            return jsonify({'error': 'Authentication required'}), 401
-
-        import jwt as pyjwt
-        data = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = data.get('user_id')
+        try:
+            user_id = file_delivery.signed_user('personal_doc', doc_id)
+        except file_delivery.InvalidSignature as e:
+            return jsonify({'error': str(e)}), 401
+        if user_id is None:
+            token = request.args.get('token') or request.headers.get('Authorization', '')
+            if token.startswith('Bearer '):
+                token = token[7:]
+            if not token:
+                return jsonify({'error': 'Authentication required'}), 401
+
+            import jwt as pyjwt
+            data = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+            user_id = data.get('user_id')
 
         database = db.get_db()
         doc = database.personal_docs.find_one({'_id': ObjectId(doc_id)})
@@ -578,18 +603,41 @@ def download_personal_doc(doc_id):
         if doc['user_id'] != user_id:
             return jsonify({'error': 'Access denied'}), 403
 
+        cached = http_cache.not_modified(doc.get('sha256'))
+        if cached:
+            return cached
+
         file_path = os.path.join(PERSONAL_DOCS_DIR, doc['stored_name'])
         if not os.path.exists(file_path):
             return jsonify({'error': 'File not found on disk'}), 404
 
         mime = doc.get('mime_type', 'application/octet-stream')
-        return send_file(file_path, mimetype=mime, as_attachment=False,
-                         download_name=doc.get('filename', 'document'))
+        return file_delivery.deliver(file_path, etag=doc.get('sha256'), mimetype=mime,
+                                     download_name=doc.get('filename', 'document'))
     except Exception as e:
         logger.error(f"download_personal_doc error: {e}")
         return jsonify({'error': 'Failed to serve document'}), 500
 
 
+@settings_bp.route('/personal-docs/<doc_id>/url', methods=['GET'])
+@token_required
+def get_personal_doc_url(doc_id):
+    """Short-lived signed URL for a personal document (see utils/file_delivery.py)."""
+    try:
+        user_id = request.user['user_id']
+        database = db.get_db()
+        doc = database.personal_docs.find_one({'_id': ObjectId(doc_id)}, {'user_id': 1})
+        if not doc:
+            return jsonify({'error': 'Document not found'}), 404
+        if doc['user_id'] != user_id:
+            return jsonify({'error': 'Access denied'}), 403
+        url = file_delivery.sign_path(f'/api/settings/personal-docs/{doc_id}', 'personal_doc', doc_id, user_id)
+        return jsonify({'url': url}), 200
+    except Exception as e:
+        logger.error(f"get_personal_doc_url error: {e}")
+        return jsonify({'error': 'Failed to sign file URL'}), 500
+
+
 @settings_bp.route('/login-activity', methods=['GET'])
 @token_required
 def get_login_activity():
@@ -1,4 +1,3 @@
-import os
 import re
 from flask import Blueprint, request, jsonify
 from datetime import datetime, timezone
@@ -7,8 +6,6 @@ import logging
 
 from middleware import token_required, is_member_of_classroom, is_cr_of
 
-UPLOAD_DIR = os.path.join(os.getcwd(), 'uploads', 'academics')
-
 subject_bp = Blueprint('subject', __name__, url_prefix='/api/subject')
 logger = logging.getLogger(__name__)
 
@@ -182,16 +179,13 @@ def delete_subject(subject_id):
 
         db.subjects.delete_one({'_id': ObjectId(subject_id)})
 
-        # Cascade: delete all academic resources (and their disk files) for this subject
+        # Cascade: delete all academic resources (and release their files) for this subject
+        from routes.academic_routes import release_resource_file
         resources = list(db.academic_resources.find(
             {'semester_id': subject['semester_id'], 'subject_id': subject_id}
         ))
         for r in resources:
-            if r.get('stored_name'):
-                try:
-                    os.remove(os.path.join(UPLOAD_DIR, r['stored_name']))
-                except OSError:
-                    pass
+            release_resource_file(db, r)
         db.academic_resources.delete_many(
             {'semester_id': subject['semester_id'], 'subject_id': subject_id}
         )
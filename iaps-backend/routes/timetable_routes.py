@@ -5,16 +5,27 @@ Collections used:
   timetable_overrides — day-specific CR overrides (cancel/reschedule/edit)
   academic_calendars  — semester academic calendar (holidays, exams, sem dates)
 """
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from datetime import datetime, date, timedelta, timezone
 from bson import ObjectId
+import os
+import bisect
 import logging
+import threading
+import uuid
 
 from middleware import token_required, is_member_of_classroom, is_cr_of as _is_cr
+from celery_app import celery_app
+from utils import timetable_cache
 
 timetable_bp = Blueprint('timetable', __name__, url_prefix='/api/timetable')
 logger = logging.getLogger(__name__)
 
+# A cascade holds its semester's lease this long. A task that finds the
+# lease taken re-queues itself for when it lapses, so saves that land while
+# the holder is dying still get cascaded.
+CASCADE_LEASE_SECONDS = 300
+
 # ── Helpers ──────────────────────────────────────────────────────────────────
 
 
@@ -66,33 +77,54 @@ def _serialize_override(doc):
 _TT_BLOCKED = {'Free', 'Lunch', 'Library', 'Break', 'Holiday', 'Cancelled', 'Exam', ''}
 
 
-def _sync_subjects_from_grid(db, semester_id, classroom_id, grid, user_id):
-    """Create or re-link Subject records from timetable grid strings."""
-    import re
-    from datetime import datetime, timezone
-
-    tt_names = set()
+def _grid_subject_names(grid):
+    """Subject names in a grid, skipping free/break/blocked cells."""
+    names = set()
     for day_slots in grid.values():
         for cell in day_slots.values():
             name = (cell.get('subject') or '').strip()
             if name and cell.get('type', 'Free') not in _TT_BLOCKED:
-                tt_names.add(name)
+                names.add(name)
+    return names
 
-    for tt_name in tt_names:
-        escaped = re.escape(tt_name)
-        existing = db.subjects.find_one({
-            'semester_id': semester_id,
-            'personal': {'$ne': True},
-            '$or': [
-                {'timetable_name': {'$regex': f'^{escaped}$', '$options': 'i'}},
-                {'name': {'$regex': f'^{escaped}$', '$options': 'i'}},
-            ]
-        })
+
+def _class_subjects(db, semester_id):
+    """Every non-personal subject of the semester, in one read — the cascades
+    below match names against this list instead of one regex query each."""
+    return list(db.subjects.find({'semester_id': semester_id, 'personal': {'$ne': True}}))
+
+
+def _match_subject(subjects, name):
+    """First subject whose timetable_name or name equals `name` ignoring
+    case (the in-memory form of the old `^name$` / 'i' regex lookups)."""
+    key = name.lower()
+    for subj in subjects:
+        if (subj.get('timetable_name') or '').lower() == key or (subj.get('name') or '').lower() == key:
+            return subj
+    return None
+
+
+def _sync_subjects_from_grid(db, semester_id, classroom_id, grid, user_id, names=None, subjects=None):
+    """Create or re-link Subject records from timetable grid strings.
+    `names` limits the sync to those subject names (a patch only touches
+    one cell); `subjects` is a _class_subjects() list to reuse."""
+    from pymongo import UpdateOne
+
+    tt_names = _grid_subject_names(grid) if names is None else set(names)
+    if not tt_names:
+        return
+    if subjects is None:
+        subjects = _class_subjects(db, semester_id)
+
+    link_ops, new_docs = [], []
+    for tt_name in sorted(tt_names):
+        existing = _match_subject(subjects, tt_name)
         if existing:
             if not existing.get('timetable_name'):
-                db.subjects.update_one({'_id': existing['_id']}, {'$set': {'timetable_name': tt_name}})
+                existing['timetable_name'] = tt_name
+                link_ops.append(UpdateOne({'_id': existing['_id']}, {'$set': {'timetable_name': tt_name}}))
         else:
-            db.subjects.insert_one({
+            doc = {
                 'classroom_id': classroom_id,
                 'semester_id': semester_id,
                 'name': tt_name,
@@ -104,102 +136,196 @@ def _sync_subjects_from_grid(db, semester_id, classroom_id, grid, user_id):
                 'timetable_name': tt_name,
                 'created_by': user_id,
                 'created_at': datetime.now(timezone.utc),
-            })
+            }
+            new_docs.append(doc)
+            subjects.append(doc)
+    if link_ops:
+        db.subjects.bulk_write(link_ops, ordered=False)
+    if new_docs:
+        db.subjects.insert_many(new_docs)
 
 
-def _cascade_slot_changes(db, semester_id, changed_cells, old_grid, new_grid):
+def _cascade_slot_changes(db, semester_id, changed_cells, old_grid, new_grid, subjects=None):
     """
     When timetable slots change:
     1. Update pending attendance sessions for those slots to the new subject/type.
     2. When a subject name changes (old no longer in grid, new appears), update
        the Subject record in-place so marks/resources stay linked via the same _id.
+    Pending-session updates for every changed cell go out as one bulk_write;
+    subject lookups are matched against one _class_subjects() read.
     """
-    import re
-    from bson import ObjectId
+    from pymongo import UpdateMany, UpdateOne
 
     # Update attendance sessions for each changed slot
+    session_ops = []
     for day, slot, new_cell in changed_cells:
         new_subj = (new_cell.get('subject') or '').strip()
         new_type = new_cell.get('type', 'Free')
+        query = {'semester_id': semester_id, 'day': day, 'slot': slot, 'status': 'pending'}
         if not new_subj or new_type in _TT_BLOCKED:
             # Slot is now free — cancel any pending sessions for this slot
-            db.attendance_sessions.update_many(
-                {'semester_id': semester_id, 'day': day, 'slot': slot, 'status': 'pending'},
-                {'$set': {'status': 'cancelled'}}
-            )
+            session_ops.append(UpdateMany(query, {'$set': {'status': 'cancelled'}}))
         else:
             # Update pending sessions to the new subject/type
-            db.attendance_sessions.update_many(
-                {'semester_id': semester_id, 'day': day, 'slot': slot,
-                 'status': {'$in': ['pending']}},
-                {'$set': {'subject': new_subj, 'type': new_type}}
-            )
+            session_ops.append(UpdateMany(query, {'$set': {'subject': new_subj, 'type': new_type}}))
+    if session_ops:
+        db.attendance_sessions.bulk_write(session_ops, ordered=False)
 
     # Detect renamed subjects: names removed from grid vs names added to grid
-    old_names = set()
-    for day_slots in old_grid.values():
-        for cell in day_slots.values():
-            n = (cell.get('subject') or '').strip()
-            if n and cell.get('type', 'Free') not in _TT_BLOCKED:
-                old_names.add(n)
-
-    new_names = set()
-    for day_slots in new_grid.values():
-        for cell in day_slots.values():
-            n = (cell.get('subject') or '').strip()
-            if n and cell.get('type', 'Free') not in _TT_BLOCKED:
-                new_names.add(n)
-
+    old_names = _grid_subject_names(old_grid)
+    new_names = _grid_subject_names(new_grid)
     removed = old_names - new_names   # no longer in timetable
     added   = new_names - old_names   # newly appeared
+    if not removed or not added:
+        return
+    if subjects is None:
+        subjects = _class_subjects(db, semester_id)
 
     # For each removed name, check if there's an added name that has no existing Subject
     # record yet — if so, rename the Subject in-place (preserving _id → marks/resources follow)
-    for old_name in removed:
-        old_escaped = re.escape(old_name)
-        old_subj = db.subjects.find_one({
-            'semester_id': semester_id,
-            'personal': {'$ne': True},
-            '$or': [
-                {'timetable_name': {'$regex': f'^{old_escaped}$', '$options': 'i'}},
-                {'name': {'$regex': f'^{old_escaped}$', '$options': 'i'}},
-            ]
-        })
+    subject_ops, renames = [], []
+    for old_name in sorted(removed):
+        old_subj = _match_subject(subjects, old_name)
         if not old_subj:
             continue
 
         # Find an added name that has no Subject record yet
-        for new_name in list(added):
-            new_escaped = re.escape(new_name)
-            new_exists = db.subjects.find_one({
-                'semester_id': semester_id,
-                'personal': {'$ne': True},
-                '$or': [
-                    {'timetable_name': {'$regex': f'^{new_escaped}$', '$options': 'i'}},
-                    {'name': {'$regex': f'^{new_escaped}$', '$options': 'i'}},
-                ]
-            })
-            if not new_exists:
-                # Rename old Subject in-place — all marks/resources keep their subject_id
-                db.subjects.update_one(
-                    {'_id': old_subj['_id']},
-                    {'$set': {'name': new_name, 'timetable_name': new_name}}
-                )
-                # Also update attendance records that reference the old name
-                db.attendance_sessions.update_many(
-                    {'semester_id': semester_id, 'subject': old_name},
-                    {'$set': {'subject': new_name}}
-                )
-                db.attendance_records.update_many(
-                    {'semester_id': semester_id, 'subject': old_name},
-                    {'$set': {'subject': new_name}}
-                )
-                db.subject_attendance_config.update_many(
-                    {'semester_id': semester_id, 'subject': old_name},
-                    {'$set': {'subject': new_name}}
-                )
-                added.discard(new_name)
-                break
+        for new_name in sorted(added):
+            if _match_subject(subjects, new_name):
+                continue
+            # Rename old Subject in-place — all marks/resources keep their subject_id
+            old_subj['name'] = old_subj['timetable_name'] = new_name
+            subject_ops.append(UpdateOne(
+                {'_id': old_subj['_id']},
+                {'$set': {'name': new_name, 'timetable_name': new_name}}
+            ))
+            renames.append((old_name, new_name))
+            added.discard(new_name)
+            break
+
+    if subject_ops:
+        db.subjects.bulk_write(subject_ops, ordered=False)
+    # Also update attendance records that reference the old names
+    if renames:
+        rename_ops = [
+            UpdateMany({'semester_id': semester_id, 'subject': old}, {'$set': {'subject': new}})
+            for old, new in renames
+        ]
+        for coll in (db.attendance_sessions, db.attendance_records, db.subject_attendance_config):
+            coll.bulk_write(rename_ops, ordered=False)
+
+
+def _changed_cells(old_grid, new_grid):
+    """(day, slot, new_cell) for every cell whose subject/type/teacher/room
+    differs between the two grids."""
+    changed = []
+    for day in sorted(set(old_grid) | set(new_grid)):
+        old_day, new_day = old_grid.get(day, {}), new_grid.get(day, {})
+        for slot in sorted(set(old_day) | set(new_day)):
+            old_cell, new_cell = old_day.get(slot, {}), new_day.get(slot, {})
+            if any(old_cell.get(k, '') != new_cell.get(k, '') for k in ('subject', 'type', 'teacher', 'room')):
+                changed.append((day, slot, new_cell))
+    return changed
+
+
+def _apply_timetable_cascade(db, semester_id, classroom_id, old_grid, new_grid, user_id, full_sync):
+    """Attendance/subject cascades for the cells that differ between the two
+    grids, then the Subject sync — for the whole grid after a full save,
+    otherwise just the changed cells' subjects."""
+    changed_cells = _changed_cells(old_grid, new_grid)
+    subjects = _class_subjects(db, semester_id)
+    if changed_cells:
+        try:
+            _cascade_slot_changes(db, semester_id, changed_cells, old_grid, new_grid, subjects)
+        except Exception as casc_err:
+            logger.warning(f"Slot cascade failed: {casc_err}")
+    names = None if full_sync else {
+        (cell.get('subject') or '').strip() for _, _, cell in changed_cells
+        if (cell.get('subject') or '').strip() and cell.get('type', 'Free') not in _TT_BLOCKED
+    }
+    try:
+        _sync_subjects_from_grid(db, semester_id, classroom_id, new_grid, user_id, names, subjects)
+    except Exception as subj_err:
+        logger.warning(f"Subject sync from timetable failed: {subj_err}")
+
+
+def _run_timetable_cascade(semester_id, classroom_id, user_id, old_grid=None):
+    """The slow half of a timetable save, run off the request (see
+    _dispatch_timetable_cascade).
+
+    Saves only flag the timetable `cascade_pending`; whichever task holds
+    the semester's lease re-reads the current grid and cascades it against
+    `cascaded_grid`, the grid the last cascade applied. Tasks may run on
+    any worker in any order — a late or duplicate one finds nothing pending
+    and returns, and a save landing mid-cascade is picked up before the
+    lease is released. A task that finds the lease held by another one
+    tries again once it lapses, in case the holder dies before then.
+    `old_grid` is only the baseline for timetables saved before
+    `cascaded_grid` existed."""
+    from database import get_db
+    from pymongo import ReturnDocument
+
+    db = get_db()
+    lease = uuid.uuid4().hex
+    fields = {'grid': 1, 'cascaded_grid': 1, 'cascade_full_sync': 1}
+
+    def _take(query, **done):
+        until = datetime.now(timezone.utc) + timedelta(seconds=CASCADE_LEASE_SECONDS)
+        return db.timetables.find_one_and_update(
+            {'semester_id': semester_id, 'cascade_pending': True, **query},
+            {'$set': {'cascade_pending': False, 'cascade_lease': lease, 'cascade_lease_until': until, **done},
+             '$unset': {'cascade_full_sync': ''}},
+            projection=fields, return_document=ReturnDocument.BEFORE,
+        )
+
+    doc = _take({'$or': [{'cascade_lease_until': None},
+                         {'cascade_lease_until': {'$lt': datetime.now(timezone.utc)}}]})
+    if doc is None:
+        held = db.timetables.find_one({'semester_id': semester_id, 'cascade_pending': True},
+                                      {'cascade_lease_until': 1})
+        if held and held.get('cascade_lease_until'):
+            until = held['cascade_lease_until']
+            if until.tzinfo is None:
+                until = until.replace(tzinfo=timezone.utc)
+            wait = (until - datetime.now(timezone.utc)).total_seconds()
+            _dispatch_timetable_cascade(semester_id, classroom_id, user_id, old_grid,
+                                        countdown=max(1, int(wait) + 1))
+        return
+    while doc:
+        grid = doc.get('grid', {})
+        base = doc.get('cascaded_grid', old_grid or {})
+        _apply_timetable_cascade(db, semester_id, classroom_id, base, grid, user_id,
+                                 bool(doc.get('cascade_full_sync')))
+        released = db.timetables.update_one(
+            {'semester_id': semester_id, 'cascade_lease': lease, 'cascade_pending': False},
+            {'$set': {'cascaded_grid': grid}, '$unset': {'cascade_lease': '', 'cascade_lease_until': ''}},
+        )
+        if released.matched_count:
+            break
+        # Another save landed while this one ran — carry on from this grid
+        doc = _take({'cascade_lease': lease}, cascaded_grid=grid)
+
+
+@celery_app.task(name='timetable.cascade', ignore_result=True)
+def _timetable_cascade_task(semester_id, classroom_id, user_id, old_grid=None):
+    _run_timetable_cascade(semester_id, classroom_id, user_id, old_grid)
+
+
+def _dispatch_timetable_cascade(semester_id, classroom_id, user_id, old_grid, countdown=0):
+    """Run the cascade via Celery when REDIS_URL is configured, else on a
+    background thread — same opt-in as ai_routes._dispatch_index_pdf. The
+    CR's save returns as soon as the grid itself is written; the caller
+    must have set `cascade_pending` in that same write. `countdown` delays
+    the run by that many seconds."""
+    args = (semester_id, classroom_id, user_id, old_grid)
+    if os.environ.get('REDIS_URL', '').strip():
+        _timetable_cascade_task.apply_async(args, countdown=countdown)
+    elif countdown:
+        timer = threading.Timer(countdown, _run_timetable_cascade, args=args)
+        timer.daemon = True
+        timer.start()
+    else:
+        threading.Thread(target=_run_timetable_cascade, args=args, daemon=True).start()
 
 
 def _apply_overrides_to_week(grid, days, time_slots, overrides, week_start_date):
@@ -305,14 +431,330 @@ def _apply_overrides_to_week(grid, days, time_slots, overrides, week_start_date)
     return week_grid, day_overrides
 
 
+# An event's date range is expanded day by day into the index; cap it so one
+# bad end_date can't blow up the calendar document.
+MAX_EVENT_DAYS = 366
+
+
+def _event_days(ev):
+    """The ISO dates an academic calendar event covers (date … end_date)."""
+    try:
+        start = date.fromisoformat(ev.get('date') or '')
+        end = date.fromisoformat(ev.get('end_date') or ev['date'])
+    except ValueError:
+        return []
+    span = min((end - start).days, MAX_EVENT_DAYS - 1)
+    return [(start + timedelta(days=i)).isoformat() for i in range(span + 1)]
+
+
+def _index_calendar_events(events):
+    """
+    Build the date → events lookup stored on the academic calendar as
+    `event_index`: `dates` is every covered date, sorted, and `events[i]` the
+    positions in `events` of what falls on dates[i]. Built once per save so a
+    week view is two binary searches instead of a scan of every event.
+    """
+    by_date = {}
+    for i, ev in enumerate(events):
+        for day in _event_days(ev):
+            by_date.setdefault(day, []).append(i)
+    dates = sorted(by_date)
+    return {'dates': dates, 'events': [by_date[d] for d in dates]}
+
+
+def _week_ac_events(ac_doc, week_dates):
+    """{date: [event, ...]} for the academic calendar events on week_dates."""
+    if not ac_doc:
+        return {}
+    events = ac_doc.get('events', [])
+    # Calendars saved before event_index existed are indexed on the fly
+    index = ac_doc.get('event_index') or _index_calendar_events(events)
+    dates = index['dates']
+    lo = bisect.bisect_left(dates, week_dates[0])
+    hi = bisect.bisect_right(dates, week_dates[-1])
+    ac_events = {}
+    for day, positions in zip(dates[lo:hi], index['events'][lo:hi]):
+        ac_events[day] = [{
+            'type': events[i].get('type', 'Other'),
+            'title': events[i].get('title', ''),
+            'start_time': events[i].get('start_time', ''),
+            'end_time': events[i].get('end_time', ''),
+        } for i in positions]
+    return ac_events
+
+
+def _build_week(db, semester_id, week_start):
+    """
+    The part of a week view that is the same for every member: base grid,
+    overrides and academic calendar events for the week starting on
+    week_start (a Monday). None if the semester has no timetable.
+    Served through timetable_cache — see utils/timetable_cache.py.
+    """
+    doc = db.timetables.find_one({'semester_id': semester_id})
+    if not doc:
+        return None
+
+    # Fetch overrides for this week (both 'this_day' for the week dates and 'all_future')
+    week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
+    overrides_cursor = db.timetable_overrides.find({
+        'semester_id': semester_id,
+        '$or': [
+            {'date': {'$in': week_dates}},
+            {'scope': 'all_future'},
+        ]
+    })
+    overrides = [_serialize_override(ov) for ov in overrides_cursor]
+
+    week_grid, day_overrides = _apply_overrides_to_week(
+        doc.get('grid', {}),
+        doc.get('days', []),
+        doc.get('time_slots', []),
+        overrides,
+        week_start,
+    )
+
+    # Fetch academic calendar events that fall within this week
+    ac_events = {}
+    try:
+        ac_events = _week_ac_events(db.academic_calendars.find_one({'semester_id': semester_id}), week_dates)
+    except Exception as ac_err:
+        logger.warning(f"Failed to fetch AC events for week view: {ac_err}")
+
+    return {
+        'timetable': _serialize_timetable(doc),
+        'week_dates': week_dates,
+        'week_grid': week_grid,
+        'day_overrides': day_overrides,
+        'ac_events': ac_events,
+    }
+
+
+def _get_week(db, semester_id, week_start):
+    return timetable_cache.get_week(semester_id, week_start, lambda: _build_week(db, semester_id, week_start))
+
+
+# ── Schedule expansion ───────────────────────────────────────────────────────
+
+MAX_SCHEDULE_DAYS = 200
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 120
+_DAY_NAMES = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def _expand_schedule(db, semester_id, start, end, user_id=None):
+    """
+    Materialize a semester's schedule for every date in [start, end] from one
+    read each of the timetable, the overrides touching the range, the
+    academic calendar and (with user_id) that user's personal skips.
+
+    Each week is merged with _apply_overrides_to_week — the same rules as the
+    week view — using only the overrides that belong to it, so a range is one
+    pass over pre-bucketed data rather than one week-view request per week.
+    Returns {'timetable', 'days': [{date, day, classes, day_override,
+    events}]} or None if the semester has no timetable.
+    """
+    doc = db.timetables.find_one({'semester_id': semester_id})
+    if not doc:
+        return None
+    first_monday = start - timedelta(days=start.weekday())
+    start_str, end_str = start.isoformat(), end.isoformat()
+
+    # this_day overrides are bucketed by the Monday of their week (the week
+    # view fetches them by date from the whole week); all_future ones apply
+    # to every week, as they do there.
+    all_future, by_week = [], {}
+    for ov in db.timetable_overrides.find({
+        'semester_id': semester_id,
+        '$or': [
+            {'date': {'$gte': first_monday.isoformat(), '$lte': end_str}},
+            {'scope': 'all_future'},
+        ]
+    }):
+        ov = _serialize_override(ov)
+        if ov['scope'] == 'all_future':
+            all_future.append(ov)
+            continue
+        try:
+            ov_date = date.fromisoformat(ov['date'])
+        except ValueError:
+            continue
+        by_week.setdefault(ov_date - timedelta(days=ov_date.weekday()), []).append(ov)
+
+    ac_doc = db.academic_calendars.find_one({'semester_id': semester_id})
+    skipped = set()
+    if user_id:
+        for ps in db.personal_skips.find({
+            'user_id': user_id,
+            'semester_id': semester_id,
+            'date': {'$gte': start_str, '$lte': end_str},
+        }, {'date': 1, 'slot': 1}):
+            skipped.add((ps['date'], ps['slot']))
+
+    days = []
+    week_start = first_monday
+    while week_start <= end:
+        week_grid, day_overrides = _apply_overrides_to_week(
+            doc.get('grid', {}),
+            doc.get('days', []),
+            doc.get('time_slots', []),
+            all_future + by_week.get(week_start, []),
+            week_start,
+        )
+        week_dates = [(week_start + timedelta(days=i)).isoformat() for i in range(7)]
+        ac_events = _week_ac_events(ac_doc, week_dates)
+        for i, date_str in enumerate(week_dates):
+            if not start_str <= date_str <= end_str:
+                continue
+            day = _DAY_NAMES[i]
+            classes = [
+                {'slot': slot, **cell, 'skipped': (date_str, slot) in skipped}
+                for slot, cell in week_grid.get(day, {}).items()
+            ]
+            days.append({
+                'date': date_str,
+                'day': day,
+                'classes': classes,
+                'day_override': day_overrides.get(day),
+                'events': ac_events.get(date_str, []),
+            })
+        week_start += timedelta(days=7)
+
+    return {'timetable': _serialize_timetable(doc), 'days': days}
+
+
+def _feed_events(semester_id, classroom_name, schedule):
+    """iCalendar events (see utils/ical.py) for one expanded semester:
+    classes at their slot times, academic calendar entries as all-day
+    events. Free/break cells and the user's personal skips are left out;
+    cancelled classes stay in with STATUS:CANCELLED so calendars show them
+    struck through rather than silently vanishing."""
+    from utils import ical
+
+    events = []
+    for d in schedule['days']:
+        day = date.fromisoformat(d['date'])
+        for c in d['classes']:
+            if c['skipped'] or not c.get('subject') or c.get('type') in ('Free', 'Lunch', 'Library', 'Break'):
+                continue
+            times = ical.parse_slot(c['slot'])
+            if times is None:
+                continue
+            summary = c['subject']
+            if c.get('type') and c['type'] != 'Lecture':
+                summary = f"{summary} ({c['type']})"
+            notes = [f"Teacher: {c['teacher']}" if c.get('teacher') else '',
+                     c.get('override_reason') or '',
+                     f"Rescheduled to {c.get('rescheduled_date', '')} {c.get('rescheduled_time', '')}".strip()
+                     if c.get('rescheduled_time') or c.get('rescheduled_date') else '',
+                     c.get('notes') or '', c.get('link') or '']
+            events.append({
+                'uid': f"{semester_id}-{d['date']}-{c['slot']}@iaps".replace(' ', ''),
+                'start': datetime.combine(day, times[0]),
+                'end': datetime.combine(day, times[1]),
+                'summary': f'{summary} — {classroom_name}' if classroom_name else summary,
+                'location': c.get('room', ''),
+                'description': '\n'.join(n for n in notes if n),
+                'status': 'CANCELLED' if c['status'] == 'cancelled' else 'CONFIRMED',
+            })
+        for n, ev in enumerate(d['events']):
+            events.append({
+                'uid': f"{semester_id}-{d['date']}-ac{n}@iaps",
+                'start': day,
+                'end': day + timedelta(days=1),
+                'summary': f"{ev['type']}: {ev['title']}" if ev.get('title') else ev['type'],
+            })
+    return events
+
+
+def _notify_base_change(db, semester_id, user_id, now, notif_msg):
+    """Post a base-timetable change to the semester chat and socket room."""
+    cr_user = db.users.find_one({'_id': ObjectId(user_id)})
+    cr_name = (cr_user.get('fullName') or cr_user.get('username', 'CR')) if cr_user else 'CR'
+    try:
+        db.messages.insert_one({
+            'semester_id': semester_id,
+            'user_id': user_id,
+            'username': cr_name,
+            'text': f"[TIMETABLE UPDATE] {notif_msg}",
+            'is_system': True,
+            'created_at': now,
+            'files': [],
+        })
+    except Exception as chat_err:
+        logger.warning(f"Failed to post chat notification: {chat_err}")
+
+    try:
+        from socketio_instance import socketio
+        socketio.emit('timetable_override', {
+            'semester_id': semester_id,
+            'message': notif_msg,
+        }, room=f'semester_{semester_id}')
+    except Exception as sock_err:
+        logger.warning(f"Socket emit failed: {sock_err}")
+
+
 # ── Routes ────────────────────────────────────────────────────────────────────
 
+# ── Timetable extraction jobs ────────────────────────────────────────────────
+# timetable_extractions holds one doc per upload: the prepared page images
+# while the job is pending, then the result. Finished results double as the
+# cache — a later upload with the same SHA-256 or perceptual hash (see
+# utils.timetable_ml.image_fingerprint) is answered from it without another
+# vision call.
+
+EXTRACT_JOB_TIMEOUT = timedelta(minutes=3)
+
+
+def _run_extraction(job_id):
+    """Worker side of an extraction job: read the prepared images, call the
+    vision model, store the outcome and drop the images."""
+    from database import get_db
+    from utils.timetable_ml import extract_timetable_from_images
+
+    db = get_db()
+    job = db.timetable_extractions.find_one({'_id': ObjectId(job_id)}, {'images': 1})
+    if not job:
+        return
+    images = [(bytes(img['data']), img['mime']) for img in job.get('images', [])]
+    try:
+        result = extract_timetable_from_images(images)
+    except Exception as e:
+        result = {'success': False, 'error': f'Extraction failed: {e}'}
+    update = {'finished_at': datetime.now(timezone.utc)}
+    if result['success']:
+        update.update({'status': 'done', 'result': result['data']})
+    else:
+        update.update({'status': 'failed', 'error': result['error']})
+    db.timetable_extractions.update_one(
+        {'_id': job['_id']}, {'$set': update, '$unset': {'images': ''}},
+    )
+
+
+@celery_app.task(name='timetable.extract', ignore_result=True)
+def _extract_timetable_task(job_id):
+    _run_extraction(job_id)
+
+
+def _dispatch_extraction(job_id):
+    """Celery when REDIS_URL is configured, else a background thread."""
+    if os.environ.get('REDIS_URL', '').strip():
+        _extract_timetable_task.delay(job_id)
+    else:
+        threading.Thread(target=_run_extraction, args=(job_id,), daemon=True).start()
+
+
 @timetable_bp.route('/semester/<semester_id>/extract', methods=['POST'])
 @token_required
 def extract_timetable(semester_id):
-    """CR uploads image → ML extracts timetable → returns JSON for review."""
+    """
+    CR uploads image/PDF → ML extracts timetable → returns JSON for review.
+    A previously seen image answers 200 {extracted, cached: true} at once;
+    otherwise the extraction runs as a job and this returns 202 {job_id} —
+    poll GET /semester/<id>/extract/<job_id>.
+    """
     from database import get_db
-    from utils.timetable_ml import extract_timetable_from_image
+    from bson.binary import Binary
+    from utils import timetable_ml
 
     try:
         user_id = request.user['user_id']
@@ -334,36 +776,99 @@ def extract_timetable(semester_id):
         image_data = file.read()
         mime_type = file.content_type or 'image/jpeg'
 
-        # If PDF, convert first page to image
+        images = None
+        # If PDF, render its pages to images
         if mime_type == 'application/pdf' or file.filename.lower().endswith('.pdf'):
             try:
-                import io
-                from PIL import Image
-                import fitz  # PyMuPDF
-                pdf_doc = fitz.open(stream=image_data, filetype='pdf')
-                page = pdf_doc[0]
-                pix = page.get_pixmap(dpi=150)
-                img = Image.frombytes('RGB', [pix.width, pix.height], pix.samples)
-                buf = io.BytesIO()
-                img.save(buf, format='JPEG', quality=90)
-                image_data = buf.getvalue()
-                mime_type = 'image/jpeg'
+                images = timetable_ml.render_pdf_pages(image_data)
             except ImportError:
                 # PyMuPDF not installed — attempt as image anyway
                 mime_type = 'image/jpeg'
+            if images == []:
+                return jsonify({'error': 'The PDF has no pages'}), 400
+        if images is None:
+            images = [timetable_ml.prepare_image(image_data, mime_type)]
+
+        sha256, phash = timetable_ml.image_fingerprint(images)
+        cached = db.timetable_extractions.find_one(
+            {'status': 'done', 'sha256': sha256}, {'result': 1}, sort=[('created_at', -1)],
+        )
+        if not cached:
+            # A perceptual match is only trusted within the same semester, where
+            # it's a re-shot or re-saved copy rather than another class's
+            # timetable printed on the same template.
+            for prev in db.timetable_extractions.find(
+                {'semester_id': semester_id, 'status': 'done'}, {'phash': 1, 'result': 1},
+            ).sort('created_at', -1).limit(20):
+                distance = timetable_ml.phash_distance(phash, prev.get('phash', ''))
+                if distance is not None and distance <= timetable_ml.PHASH_MAX_DISTANCE:
+                    cached = prev
+                    break
+        if cached:
+            return jsonify({'extracted': cached['result'], 'cached': True}), 200
 
-        result = extract_timetable_from_image(image_data, mime_type)
-
-        if not result['success']:
-            return jsonify({'error': result['error'], 'retry': True}), 422
-
-        return jsonify({'extracted': result['data']}), 200
+        now = datetime.now(timezone.utc)
+        result = db.timetable_extractions.insert_one({
+            'semester_id': semester_id,
+            'user_id': user_id,
+            'status': 'pending',
+            'sha256': sha256,
+            'phash': phash,
+            'images': [{'data': Binary(data), 'mime': mime} for data, mime in images],
+            'created_at': now,
+        })
+        job_id = str(result.inserted_id)
+        _dispatch_extraction(job_id)
+        return jsonify({'job_id': job_id, 'status': 'pending'}), 202
 
     except Exception as e:
         logger.error(f"Extract timetable error: {e}")
         return jsonify({'error': 'Extraction failed', 'retry': True}), 500
 
 
+@timetable_bp.route('/semester/<semester_id>/extract/<job_id>', methods=['GET'])
+@token_required
+def get_extraction(semester_id, job_id):
+    """Poll an extraction job started by POST /semester/<id>/extract."""
+    from database import get_db
+
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+
+        semester, classroom, is_cr = _get_semester_and_check(db, semester_id, user_id)
+        if semester is None:
+            return jsonify({'error': 'Semester not found or access denied'}), 404
+        if not is_cr:
+            return jsonify({'error': 'Only a CR can upload the timetable'}), 403
+        if not ObjectId.is_valid(job_id):
+            return jsonify({'error': 'Extraction not found'}), 404
+
+        job = db.timetable_extractions.find_one(
+            {'_id': ObjectId(job_id), 'semester_id': semester_id},
+            {'status': 1, 'result': 1, 'error': 1, 'created_at': 1},
+        )
+        if not job:
+            return jsonify({'error': 'Extraction not found'}), 404
+
+        status = job['status']
+        if status == 'pending':
+            created = job['created_at']
+            if created.tzinfo is None:
+                created = created.replace(tzinfo=timezone.utc)
+            if datetime.now(timezone.utc) - created > EXTRACT_JOB_TIMEOUT:
+                # The worker never reported back (e.g. a redeploy mid-job)
+                return jsonify({'status': 'failed', 'error': 'Extraction timed out', 'retry': True}), 422
+            return jsonify({'status': 'pending'}), 200
+        if status == 'failed':
+            return jsonify({'status': 'failed', 'error': job.get('error', 'Extraction failed'), 'retry': True}), 422
+        return jsonify({'status': 'done', 'extracted': job['result']}), 200
+
+    except Exception as e:
+        logger.error(f"Get extraction error: {e}")
+        return jsonify({'error': 'Failed to fetch extraction'}), 500
+
+
 @timetable_bp.route('/semester/<semester_id>', methods=['POST'])
 @token_required
 def save_timetable(semester_id):
@@ -393,8 +898,6 @@ def save_timetable(semester_id):
 
         if existing:
             old_grid = existing.get('grid', {})
-            old_days = existing.get('days', [])
-            old_slots = existing.get('time_slots', [])
 
             db.timetables.update_one(
                 {'_id': existing['_id']},
@@ -404,6 +907,8 @@ def save_timetable(semester_id):
                     'grid': grid,
                     'updated_by': user_id,
                     'updated_at': now,
+                    'cascade_pending': True,
+                    'cascade_full_sync': True,
                 }}
             )
             doc = db.timetables.find_one({'_id': existing['_id']})
@@ -415,54 +920,16 @@ def save_timetable(semester_id):
                 'is_base_edit': True,
             })
 
-            # Detect changed cells for notifications and GCal resync
-            all_days_union = set(old_days) | set(days)
-            all_slots_union = set(old_slots) | set(time_slots)
-            changed_cells = []
-            for day in all_days_union:
-                for slot in all_slots_union:
-                    old_cell = old_grid.get(day, {}).get(slot, {})
-                    new_cell = grid.get(day, {}).get(slot, {})
-                    if (old_cell.get('subject', '') != new_cell.get('subject', '') or
-                            old_cell.get('type', '') != new_cell.get('type', '') or
-                            old_cell.get('teacher', '') != new_cell.get('teacher', '') or
-                            old_cell.get('room', '') != new_cell.get('room', '')):
-                        changed_cells.append((day, slot, new_cell))
-
+            # Detect changed cells for notifications
+            changed_cells = _changed_cells(old_grid, grid)
             if changed_cells:
-                cr_user = db.users.find_one({'_id': ObjectId(user_id)})
-                cr_name = (cr_user.get('fullName') or cr_user.get('username', 'CR')) if cr_user else 'CR'
-
-                notif_msg = f"Timetable updated: {len(changed_cells)} slot(s) changed in the base timetable."
-                try:
-                    db.messages.insert_one({
-                        'semester_id': semester_id,
-                        'user_id': user_id,
-                        'username': cr_name,
-                        'text': f"[TIMETABLE UPDATE] {notif_msg}",
-                        'is_system': True,
-                        'created_at': now,
-                        'files': [],
-                    })
-                except Exception as chat_err:
-                    logger.warning(f"Failed to post chat notification: {chat_err}")
-
-                try:
-                    from socketio_instance import socketio
-                    socketio.emit('timetable_override', {
-                        'semester_id': semester_id,
-                        'message': notif_msg,
-                    }, room=f'semester_{semester_id}')
-                except Exception as sock_err:
-                    logger.warning(f"Socket emit failed: {sock_err}")
-
-                # Update pending attendance sessions and subject records for changed slots
-                try:
-                    _cascade_slot_changes(db, semester_id, changed_cells, old_grid, grid)
-                except Exception as casc_err:
-                    logger.warning(f"Slot cascade failed: {casc_err}")
+                _notify_base_change(
+                    db, semester_id, user_id, now,
+                    f"Timetable updated: {len(changed_cells)} slot(s) changed in the base timetable.",
+                )
 
         else:
+            old_grid = {}
             result = db.timetables.insert_one({
                 'semester_id': semester_id,
                 'classroom_id': str(semester['classroom_id']),
@@ -473,16 +940,17 @@ def save_timetable(semester_id):
                 'updated_by': user_id,
                 'created_at': now,
                 'updated_at': now,
+                'cascaded_grid': {},
+                'cascade_pending': True,
+                'cascade_full_sync': True,
             })
             doc = db.timetables.find_one({'_id': result.inserted_id})
 
-        # Sync Subject records from timetable grid
-        try:
-            import re as _re
-            from datetime import datetime as _dt, timezone as _tz
-            _sync_subjects_from_grid(db, semester_id, str(semester['classroom_id']), grid, user_id)
-        except Exception as subj_err:
-            logger.warning(f"Subject sync from timetable failed: {subj_err}")
+        timetable_cache.invalidate(semester_id)
+
+        # Update pending attendance sessions and subject records for changed
+        # slots, then sync Subject records from the grid — in the background
+        _dispatch_timetable_cascade(semester_id, str(semester['classroom_id']), user_id, old_grid)
 
         return jsonify({'timetable': _serialize_timetable(doc)}), 200
 
@@ -491,6 +959,81 @@ def save_timetable(semester_id):
         return jsonify({'error': 'Failed to save timetable'}), 500
 
 
+CELL_FIELDS = ('subject', 'teacher', 'room', 'type', 'subject_name')
+
+
+@timetable_bp.route('/semester/<semester_id>/cell', methods=['PATCH'])
+@token_required
+def patch_timetable_cell(semester_id):
+    """
+    Edit one cell of the base timetable (CR only).
+    Body: {"day": "Mon", "slot": "9:00-10:00", "cell": {subject, teacher, room, type}}
+    Only `grid.<day>.<slot>` is written, and only that cell's cascades run
+    (in the background, like save_timetable's).
+    """
+    from database import get_db
+    from pymongo import ReturnDocument
+
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+
+        semester, classroom, is_cr = _get_semester_and_check(db, semester_id, user_id)
+        if semester is None:
+            return jsonify({'error': 'Semester not found or access denied'}), 404
+        if not is_cr:
+            return jsonify({'error': 'Only a CR can edit the timetable'}), 403
+
+        data = request.get_json() or {}
+        day, slot, cell = data.get('day'), data.get('slot'), data.get('cell')
+        if not day or not slot or not isinstance(cell, dict):
+            return jsonify({'error': 'day, slot, and cell are required'}), 400
+        new_cell = {k: str(cell.get(k) or '').strip() for k in CELL_FIELDS if k in cell}
+        new_cell.setdefault('type', 'Free')
+
+        existing = db.timetables.find_one({'semester_id': semester_id}, {'days': 1, 'time_slots': 1})
+        if not existing:
+            return jsonify({'error': 'Save a timetable first'}), 404
+        if day not in existing.get('days', []) or slot not in existing.get('time_slots', []):
+            return jsonify({'error': 'day and slot must be in the timetable'}), 400
+
+        now = datetime.now(timezone.utc)
+        # Slot labels like "9.00-10.00" can't be used in a field path, so
+        # those cells are written through their day's map instead.
+        path_ok = '.' not in slot and not slot.startswith('$')
+        if path_ok:
+            update = {f'grid.{day}.{slot}': new_cell}
+        else:
+            day_map = (db.timetables.find_one({'_id': existing['_id']}, {'grid': 1}) or {}).get('grid', {}).get(day, {})
+            update = {f'grid.{day}': {**day_map, slot: new_cell}}
+        update.update({'updated_by': user_id, 'updated_at': now, 'cascade_pending': True})
+        before = db.timetables.find_one_and_update(
+            {'_id': existing['_id']}, {'$set': update}, projection={'grid': 1},
+            return_document=ReturnDocument.BEFORE,
+        )
+
+        old_grid = before.get('grid', {})
+        old_cell = old_grid.get(day, {}).get(slot, {})
+
+        # A base edit supersedes any base-edit override left on this cell
+        db.timetable_overrides.delete_many({
+            'semester_id': semester_id, 'is_base_edit': True, 'day': day, 'slot': slot,
+        })
+        timetable_cache.invalidate(semester_id)
+
+        changed = any(old_cell.get(k, '') != new_cell.get(k, '') for k in ('subject', 'type', 'teacher', 'room'))
+        if changed:
+            _notify_base_change(db, semester_id, user_id, now,
+                                f"Timetable updated: {day} {slot} changed in the base timetable.")
+            _dispatch_timetable_cascade(semester_id, str(semester['classroom_id']), user_id, old_grid)
+
+        return jsonify({'day': day, 'slot': slot, 'cell': new_cell, 'changed': changed}), 200
+
+    except Exception as e:
+        logger.error(f"Patch timetable cell error: {e}")
+        return jsonify({'error': 'Failed to update cell'}), 500
+
+
 @timetable_bp.route('/semester/<semester_id>', methods=['GET'])
 @token_required
 def get_timetable(semester_id):
@@ -533,10 +1076,6 @@ def get_week_view(semester_id):
         if semester is None:
             return jsonify({'error': 'Semester not found or access denied'}), 404
 
-        doc = db.timetables.find_one({'semester_id': semester_id})
-        if not doc:
-            return jsonify({'timetable': None, 'week_grid': {}, 'is_cr': is_cr}), 200
-
         # Determine week start (Monday)
         date_str = request.args.get('date')
         if date_str:
@@ -550,48 +1089,10 @@ def get_week_view(semester_id):
         week_start = ref_date - timedelta(days=ref_date.weekday())  # Monday
         week_end = week_start + timedelta(days=6)
 
-        # Fetch overrides for this week (both 'this_day' for the week dates and 'all_future')
-        week_dates = [(week_start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(7)]
-
-        overrides_cursor = db.timetable_overrides.find({
-            'semester_id': semester_id,
-            '$or': [
-                {'date': {'$in': week_dates}},
-                {'scope': 'all_future'},
-            ]
-        })
-        overrides = [_serialize_override(ov) for ov in overrides_cursor]
-
-        week_grid, day_overrides = _apply_overrides_to_week(
-            doc.get('grid', {}),
-            doc.get('days', []),
-            doc.get('time_slots', []),
-            overrides,
-            week_start,
-        )
-
-        # Fetch academic calendar events that fall within this week
-        ac_events = {}
-        try:
-            ac_doc = db.academic_calendars.find_one({'semester_id': semester_id})
-            if ac_doc:
-                for ev in ac_doc.get('events', []):
-                    if not ev.get('date'):
-                        continue
-                    ev_start = ev['date']
-                    ev_end = ev.get('end_date') or ev_start
-                    for date_str in week_dates:
-                        if ev_start <= date_str <= ev_end:
-                            if date_str not in ac_events:
-                                ac_events[date_str] = []
-                            ac_events[date_str].append({
-                                'type': ev.get('type', 'Other'),
-                                'title': ev.get('title', ''),
-                                'start_time': ev.get('start_time', ''),
-                                'end_time': ev.get('end_time', ''),
-                            })
-        except Exception as ac_err:
-            logger.warning(f"Failed to fetch AC events for week view: {ac_err}")
+        week = _get_week(db, semester_id, week_start)
+        if week is None:
+            return jsonify({'timetable': None, 'week_grid': {}, 'is_cr': is_cr}), 200
+        week_dates = week['week_dates']
 
         # Fetch this user's personal skips for the week
         personal_skips_cursor = db.personal_skips.find({
@@ -605,13 +1106,13 @@ def get_week_view(semester_id):
         ]
 
         return jsonify({
-            'timetable': _serialize_timetable(doc),
-            'week_grid': week_grid,
+            'timetable': week['timetable'],
+            'week_grid': week['week_grid'],
             'week_start': week_start.isoformat(),
             'week_end': week_end.isoformat(),
             'is_cr': is_cr,
-            'ac_events': ac_events,
-            'day_overrides': day_overrides,
+            'ac_events': week['ac_events'],
+            'day_overrides': week['day_overrides'],
             'personal_skips': personal_skips,
         }), 200
 
@@ -634,40 +1135,22 @@ def get_today(semester_id):
         if semester is None:
             return jsonify({'error': 'Semester not found or access denied'}), 404
 
-        doc = db.timetables.find_one({'semester_id': semester_id})
-        if not doc:
-            return jsonify({'classes': [], 'day': '', 'is_cr': is_cr}), 200
-
         today = date.today()
         day_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
         today_day = day_names[today.weekday()]
-        today_str = today.strftime('%Y-%m-%d')
 
-        if today_day not in doc.get('days', []):
-            return jsonify({'classes': [], 'day': today_day, 'is_cr': is_cr}), 200
-
-        overrides_cursor = db.timetable_overrides.find({
-            'semester_id': semester_id,
-            'day': today_day,
-            '$or': [
-                {'date': today_str},
-                {'scope': 'all_future'},
-            ]
-        })
-        overrides = [_serialize_override(ov) for ov in overrides_cursor]
+        # Today is one column of this week's cached view
+        week = _get_week(db, semester_id, today - timedelta(days=today.weekday()))
+        if week is None:
+            return jsonify({'classes': [], 'day': '', 'is_cr': is_cr}), 200
 
-        week_start = today - timedelta(days=today.weekday())
-        week_grid, _ = _apply_overrides_to_week(
-            doc.get('grid', {}),
-            [today_day],
-            doc.get('time_slots', []),
-            overrides,
-            week_start,
-        )
+        timetable = week['timetable']
+        if today_day not in timetable['days']:
+            return jsonify({'classes': [], 'day': today_day, 'is_cr': is_cr}), 200
 
-        today_slots = week_grid.get(today_day, {})
+        today_slots = week['week_grid'].get(today_day, {})
         classes = []
-        for slot in doc.get('time_slots', []):
+        for slot in timetable['time_slots']:
             cell = today_slots.get(slot, {})
             classes.append({'slot': slot, **cell})
 
@@ -678,6 +1161,161 @@ def get_today(semester_id):
         return jsonify({'error': 'Failed to fetch today\'s classes'}), 500
 
 
+@timetable_bp.route('/semester/<semester_id>/schedule', methods=['GET'])
+@token_required
+def get_schedule(semester_id):
+    """
+    The caller's schedule for a date range in one request — base grid,
+    overrides, academic calendar events and their personal skips.
+    Query params: ?start=YYYY-MM-DD&end=YYYY-MM-DD (inclusive, at most
+    MAX_SCHEDULE_DAYS days apart).
+    """
+    from database import get_db
+
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+
+        semester, classroom, is_cr = _get_semester_and_check(db, semester_id, user_id)
+        if semester is None:
+            return jsonify({'error': 'Semester not found or access denied'}), 404
+
+        try:
+            start = date.fromisoformat(request.args.get('start', ''))
+            end = date.fromisoformat(request.args.get('end', ''))
+        except ValueError:
+            return jsonify({'error': 'start and end must be YYYY-MM-DD dates'}), 400
+        if end < start:
+            return jsonify({'error': 'end must not be before start'}), 400
+        if (end - start).days >= MAX_SCHEDULE_DAYS:
+            return jsonify({'error': f'At most {MAX_SCHEDULE_DAYS} days per request'}), 400
+
+        schedule = _expand_schedule(db, semester_id, start, end, user_id)
+        if schedule is None:
+            return jsonify({'timetable': None, 'days': [], 'is_cr': is_cr}), 200
+        return jsonify({**schedule, 'start': start.isoformat(), 'end': end.isoformat(), 'is_cr': is_cr}), 200
+
+    except Exception as e:
+        logger.error(f"Get schedule error: {e}")
+        return jsonify({'error': 'Failed to fetch schedule'}), 500
+
+
+# ── Calendar feed (.ics) ─────────────────────────────────────────────────────
+# Calendar apps can't send a Bearer token, so the feed URL carries a random
+# per-user token instead (users.calendar_feed_token). Resetting it revokes
+# every subscription made with the old URL.
+
+def _feed_path(token):
+    return f'/api/timetable/feed/{token}.ics'
+
+
+def _new_feed_token(db, user_id):
+    import secrets
+    token = secrets.token_urlsafe(24)
+    db.users.update_one({'_id': ObjectId(user_id)}, {'$set': {'calendar_feed_token': token}})
+    return token
+
+
+@timetable_bp.route('/feed', methods=['GET'])
+@token_required
+def get_calendar_feed():
+    """Return the caller's calendar subscription URL, creating it on first use."""
+    from database import get_db
+
+    try:
+        user_id = request.user['user_id']
+        db = get_db()
+        user = db.users.find_one({'_id': ObjectId(user_id)}, {'calendar_feed_token': 1})
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+        token = user.get('calendar_feed_token') or _new_feed_token(db, user_id)
+        return jsonify({'path': _feed_path(token)}), 200
+
+    except Exception as e:
+        logger.error(f"Get calendar feed error: {e}")
+        return jsonify({'error': 'Failed to fetch calendar feed'}), 500
+
+
+@timetable_bp.route('/feed/reset', methods=['POST'])
+@token_required
+def reset_calendar_feed():
+    """Issue a new subscription URL; the old one stops working."""
+    from database import get_db
+
+    try:
+        db = get_db()
+        token = _new_feed_token(db, request.user['user_id'])
+        return jsonify({'path': _feed_path(token)}), 200
+
+    except Exception as e:
+        logger.error(f"Reset calendar feed error: {e}")
+        return jsonify({'error': 'Failed to reset calendar feed'}), 500
+
+
+@timetable_bp.route('/feed/<token>.ics', methods=['GET'])
+def calendar_feed(token):
+    """
+    iCalendar feed of the user's classes across the active semester of every
+    classroom they're in, from FEED_PAST_DAYS ago to FEED_FUTURE_DAYS ahead
+    (clipped to the academic calendar's semester dates when set).
+    Sends an ETag of the body and answers If-None-Match with 304, so calendar
+    apps polling an unchanged schedule don't download it again.
+    """
+    from database import get_db
+    from utils import ical
+    import hashlib
+
+    try:
+        db = get_db()
+        user = db.users.find_one({'calendar_feed_token': token}, {'_id': 1}) if token else None
+        if not user:
+            return jsonify({'error': 'Calendar feed not found'}), 404
+        user_id = str(user['_id'])
+
+        classrooms = {
+            str(c['_id']): c.get('name', '')
+            for c in db.classrooms.find({'members': user['_id']}, {'name': 1})
+        }
+        semesters = list(db.semesters.find(
+            {'classroom_id': {'$in': list(classrooms)}, 'is_active': True}, {'classroom_id': 1},
+        ))
+
+        today = date.today()
+        events, stamp = [], datetime(2000, 1, 1, tzinfo=timezone.utc)
+        for sem in semesters:
+            semester_id = str(sem['_id'])
+            start = today - timedelta(days=FEED_PAST_DAYS)
+            end = today + timedelta(days=FEED_FUTURE_DAYS)
+            cal = db.academic_calendars.find_one(
+                {'semester_id': semester_id}, {'semester_start': 1, 'semester_end': 1},
+            ) or {}
+            try:
+                if cal.get('semester_start'):
+                    start = max(start, date.fromisoformat(cal['semester_start']))
+                if cal.get('semester_end'):
+                    end = min(end, date.fromisoformat(cal['semester_end']))
+            except ValueError:
+                pass
+            if end < start:
+                continue
+            schedule = _expand_schedule(db, semester_id, start, end, user_id)
+            if schedule is None:
+                continue
+            stamp = max(stamp, datetime.fromisoformat(schedule['timetable']['updated_at']).replace(tzinfo=timezone.utc))
+            events += _feed_events(semester_id, classrooms.get(sem['classroom_id'], ''), schedule)
+
+        body = ical.render_calendar('IAPS timetable', events, stamp).encode('utf-8')
+        resp = current_app.response_class(body, mimetype='text/calendar')
+        resp.headers['Content-Disposition'] = 'inline; filename="timetable.ics"'
+        resp.headers['Cache-Control'] = 'private, max-age=900'
+        resp.set_etag(hashlib.sha256(body).hexdigest())
+        return resp.make_conditional(request)
+
+    except Exception as e:
+        logger.error(f"Calendar feed error: {e}")
+        return jsonify({'error': 'Failed to build calendar feed'}), 500
+
+
 @timetable_bp.route('/semester/<semester_id>/override', methods=['POST'])
 @token_required
 def add_override(semester_id):
@@ -733,6 +1371,7 @@ def add_override(semester_id):
 
         result = db.timetable_overrides.insert_one(override_doc)
         override_doc['_id'] = result.inserted_id
+        timetable_cache.invalidate(semester_id)
 
         # Build notification message
         action_text = {
@@ -804,6 +1443,7 @@ def delete_override(semester_id, override_id):
             return jsonify({'error': 'Override not found'}), 404
 
         db.timetable_overrides.delete_one({'_id': ObjectId(override_id)})
+        timetable_cache.invalidate(semester_id)
         return jsonify({'message': 'Override deleted'}), 200
 
     except Exception as e:
@@ -961,6 +1601,7 @@ def save_academic_calendar(semester_id):
             'semester_start': semester_start,
             'semester_end': semester_end,
             'events': events,
+            'event_index': _index_calendar_events(events),
             'updated_by': user_id,
             'updated_at': now,
         }
@@ -974,47 +1615,45 @@ def save_academic_calendar(semester_id):
             result = db.academic_calendars.insert_one(cal_doc)
             cal_doc['_id'] = result.inserted_id
 
-        # Mark holidays on the timetable (store separately as overrides for display)
-        # Holidays with type=="Holiday" auto-appear as cancelled days for all
-        holiday_events = [e for e in events if e.get('type') == 'Holiday']
-        for holiday in holiday_events:
-            h_date = holiday.get('date', '')
-            if not h_date:
-                continue
-            try:
-                d = date.fromisoformat(h_date)
-                day_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
-                day = day_names[d.weekday()]
-            except ValueError:
+        # Mark holidays on the timetable: one day-level cancel (slot 'ALL') per
+        # holiday date, written in a single insert_many. Dates that already
+        # have a holiday override are skipped, so re-saving doesn't duplicate.
+        holiday_days = {}
+        for holiday in events:
+            if holiday.get('type') != 'Holiday':
                 continue
+            for h_date in _event_days(holiday):
+                holiday_days.setdefault(h_date, holiday.get('title') or 'Holiday')
 
-            # Check if there's already an override for this date (don't duplicate)
-            existing_ov = db.timetable_overrides.find_one({
+        if holiday_days:
+            already = set(db.timetable_overrides.distinct('date', {
                 'semester_id': semester_id,
-                'date': h_date,
+                'date': {'$in': list(holiday_days)},
                 'action': 'cancel',
                 'is_holiday': True,
-            })
-            if not existing_ov:
-                timetable = db.timetables.find_one({'semester_id': semester_id})
-                time_slots = timetable.get('time_slots', []) if timetable else []
-                for slot in time_slots:
-                    db.timetable_overrides.insert_one({
-                        'timetable_id': str(timetable['_id']) if timetable else '',
-                        'semester_id': semester_id,
-                        'classroom_id': str(semester.get('classroom_id', '')),
-                        'date': h_date,
-                        'day': day,
-                        'slot': slot,
-                        'action': 'cancel',
-                        'scope': 'this_day',
-                        'changes': {},
-                        'reason': holiday.get('title', 'Holiday'),
-                        'created_by': user_id,
-                        'created_by_name': 'Academic Calendar',
-                        'is_holiday': True,
-                        'created_at': datetime.now(timezone.utc),
-                    })
+            }))
+            missing = [d for d in sorted(holiday_days) if d not in already]
+            if missing:
+                timetable = db.timetables.find_one({'semester_id': semester_id}, {'_id': 1})
+                day_names = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+                db.timetable_overrides.insert_many([{
+                    'timetable_id': str(timetable['_id']) if timetable else '',
+                    'semester_id': semester_id,
+                    'classroom_id': str(semester.get('classroom_id', '')),
+                    'date': h_date,
+                    'day': day_names[date.fromisoformat(h_date).weekday()],
+                    'slot': 'ALL',
+                    'action': 'cancel',
+                    'scope': 'this_day',
+                    'changes': {},
+                    'reason': holiday_days[h_date],
+                    'created_by': user_id,
+                    'created_by_name': 'Academic Calendar',
+                    'is_holiday': True,
+                    'created_at': now,
+                } for h_date in missing])
+
+        timetable_cache.invalidate(semester_id)
 
         return jsonify({
             'message': 'Academic calendar saved',
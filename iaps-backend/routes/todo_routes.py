@@ -4,6 +4,7 @@ from bson import ObjectId
 import logging
 
 from middleware import token_required, is_member_of_classroom
+from utils import user_cache, resolve_users
 
 todo_bp = Blueprint('todo', __name__, url_prefix='/api/todo')
 logger = logging.getLogger(__name__)
@@ -52,7 +53,7 @@ def create_todo():
 
         result = db.todos.insert_one(todo)
 
-        creator = db.users.find_one({'_id': ObjectId(user_id)})
+        creator = user_cache.get_user(db, user_id)
 
         return jsonify({
             'message': 'Todo created',
@@ -97,9 +98,10 @@ def list_todos(semester_id):
             {'semester_id': semester_id, 'created_by': user_id}
         ).sort('created_at', -1))
 
+        creators = resolve_users(db, [t['created_by'] for t in todos], ('username',))
         result = []
         for todo in todos:
-            creator = db.users.find_one({'_id': ObjectId(todo['created_by'])})
+            creator = creators.get(todo['created_by'])
             result.append({
                 'id': str(todo['_id']),
                 'text': todo['text'],
@@ -0,0 +1,226 @@
+"""
+upload_routes.py — resumable chunked uploads for the large-file features.
+
+The protocol, storage and hash handling are described in utils/resumable.py;
+this module only keeps the session records in `upload_sessions` and hands a
+completed file to the finalize hook its feature registered.
+"""
+from datetime import datetime, timedelta, timezone
+import logging
+
+from flask import Blueprint, request, jsonify
+from bson import ObjectId
+from werkzeug.http import parse_content_range_header
+
+from middleware import token_required
+from utils import resumable
+
+upload_bp = Blueprint('upload', __name__, url_prefix='/api/uploads')
+logger = logging.getLogger(__name__)
+
+# How long a PUT or finalize may hold a session before another request may
+# take it over (a worker killed mid-chunk never releases it)
+LEASE_SECONDS = 600
+
+
+def _expiry():
+    return datetime.now(timezone.utc) + timedelta(seconds=resumable.SESSION_TTL_SECONDS)
+
+
+def _param(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _find_session(db, upload_id, user_id):
+    if not ObjectId.is_valid(upload_id):
+        return None
+    return db.upload_sessions.find_one({'_id': ObjectId(upload_id), 'user_id': user_id})
+
+
+def _claim(db, session):
+    """Take the session's write lease if nobody holds it and `received` is
+    still what we read — so two requests never write the same part file."""
+    now = datetime.now(timezone.utc)
+    return db.upload_sessions.find_one_and_update(
+        {'_id': session['_id'], 'received': session['received'],
+         '$or': [{'busy_until': None}, {'busy_until': {'$lt': now}}]},
+        {'$set': {'busy_until': now + timedelta(seconds=LEASE_SECONDS)}},
+    )
+
+
+def _release(db, session):
+    db.upload_sessions.update_one({'_id': session['_id']}, {'$set': {'busy_until': None}})
+
+
+def _status(session):
+    return {
+        'upload_id': str(session['_id']),
+        'kind': session['kind'],
+        'filename': session['filename'],
+        'size': session['size'],
+        'received': session['received'],
+        'chunk_size': resumable.CHUNK_MAX_BYTES,
+    }
+
+
+@upload_bp.route('', methods=['POST'])
+@token_required
+def init_upload():
+    """Start an upload session after the feature's own access checks."""
+    from database import get_db
+    try:
+        data = request.get_json(silent=True) or {}
+        user_id = request.user['user_id']
+
+        kind = resumable.get_kind(data.get('kind'))
+        if not kind:
+            return jsonify({'error': 'Unknown upload kind'}), 400
+        filename = (data.get('filename') or '').strip()
+        if not filename:
+            return jsonify({'error': 'filename is required'}), 400
+        try:
+            size = int(data.get('size'))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'size is required'}), 400
+        if size < 0:
+            return jsonify({'error': 'Invalid size'}), 400
+        if size > kind.max_size:
+            return jsonify({'error': f'File too large (max {kind.max_size // (1024 * 1024)} MB)'}), 413
+        params = data.get('params') or {}
+        if not isinstance(params, dict):
+            return jsonify({'error': 'params must be an object'}), 400
+        params = {k: _param(v) for k, v in params.items() if v is not None}
+
+        db = get_db()
+        denied = kind.authorize(db, request.user, params, filename)
+        if denied:
+            return denied
+
+        resumable.sweep()
+        session = {
+            'user_id': user_id,
+            'kind': data['kind'],
+            'filename': filename,
+            'mime_type': (data.get('mime_type') or '').strip() or 'application/octet-stream',
+            'size': size,
+            'params': params,
+            'received': 0,
+            'busy_until': None,
+            'created_at': datetime.now(timezone.utc),
+            'expires_at': _expiry(),
+        }
+        session['_id'] = db.upload_sessions.insert_one(session).inserted_id
+        resumable.create(str(session['_id']))
+        return jsonify(_status(session)), 201
+    except Exception as e:
+        logger.error(f"init_upload error: {e}")
+        return jsonify({'error': 'Failed to start upload'}), 500
+
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+@token_required
+def get_upload(upload_id):
+    """How much of the file the server holds — where a client resumes from."""
+    from database import get_db
+    session = _find_session(get_db(), upload_id, request.user['user_id'])
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    return jsonify(_status(session)), 200
+
+
+@upload_bp.route('/<upload_id>', methods=['PUT'])
+@token_required
+def put_chunk(upload_id):
+    """Append one chunk. Content-Range must start at the current `received`."""
+    from database import get_db
+    try:
+        db = get_db()
+        session = _find_session(db, upload_id, request.user['user_id'])
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+
+        rng = parse_content_range_header(request.headers.get('Content-Range'))
+        if rng is None or rng.start is None or rng.length != session['size']:
+            return jsonify({'error': 'Content-Range bytes <start>-<end>/<size> is required'}), 400
+        length = rng.stop - rng.start
+        if length > resumable.CHUNK_MAX_BYTES:
+            return jsonify({'error': 'Chunk too large'}), 413
+        if rng.start != session['received']:
+            return jsonify({'error': 'Chunk does not start at the received offset',
+                            'received': session['received']}), 409
+        if not _claim(db, session):
+            return jsonify({'error': 'Another request is writing this upload',
+                            'received': session['received']}), 409
+
+        try:
+            resumable.write_chunk(upload_id, rng.start, request.stream, length)
+        except resumable.IncompleteChunk as e:
+            _release(db, session)
+            return jsonify({'error': str(e), 'received': session['received']}), 400
+        except Exception:
+            _release(db, session)
+            raise
+
+        db.upload_sessions.update_one(
+            {'_id': session['_id']},
+            {'$set': {'received': rng.stop, 'busy_until': None, 'expires_at': _expiry()}},
+        )
+        return jsonify({'upload_id': upload_id, 'received': rng.stop}), 200
+    except Exception as e:
+        logger.error(f"put_chunk error: {e}")
+        return jsonify({'error': 'Failed to store chunk'}), 500
+
+
+@upload_bp.route('/<upload_id>/finalize', methods=['POST'])
+@token_required
+def finalize_upload(upload_id):
+    """Hand the complete file to its feature; returns that feature's response."""
+    from database import get_db
+    try:
+        db = get_db()
+        session = _find_session(db, upload_id, request.user['user_id'])
+        if not session:
+            return jsonify({'error': 'Upload not found'}), 404
+        if session['received'] != session['size']:
+            return jsonify({'error': 'Upload incomplete', 'received': session['received']}), 409
+        kind = resumable.get_kind(session['kind'])
+        if not kind or not _claim(db, session):
+            return jsonify({'error': 'Another request is writing this upload'}), 409
+
+        # Access may have changed since init (left the classroom, role change)
+        resp = kind.authorize(db, request.user, session['params'], session['filename'])
+        if not resp:
+            upload = resumable.Upload(
+                path=resumable.part_path(upload_id),
+                filename=session['filename'],
+                size=session['size'],
+                mime_type=session['mime_type'],
+                sha256=resumable.hexdigest(upload_id, session['size']),
+            )
+            try:
+                resp = kind.finalize(db, request.user, session['params'], upload)
+            except Exception:
+                _release(db, session)
+                raise
+
+        db.upload_sessions.delete_one({'_id': session['_id']})
+        resumable.discard(upload_id)
+        return resp
+    except Exception as e:
+        logger.error(f"finalize_upload error: {e}")
+        return jsonify({'error': 'Failed to upload file'}), 500
+
+
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+@token_required
+def abort_upload(upload_id):
+    from database import get_db
+    db = get_db()
+    session = _find_session(db, upload_id, request.user['user_id'])
+    if not session:
+        return jsonify({'error': 'Upload not found'}), 404
+    db.upload_sessions.delete_one({'_id': session['_id']})
+    resumable.discard(upload_id)
+    return jsonify({'message': 'Upload cancelled'}), 200
@@ -5,6 +5,7 @@ Uses mongomock so no running MongoDB is required for the route/unit tests.
 """
 import os
 import sys
+import threading
 import pytest
 import mongomock
 import jwt
@@ -25,6 +26,22 @@ os.environ.setdefault('MAIL_DEFAULT_SENDER', 'test@example.com')
 SECRET_KEY = os.environ['JWT_SECRET']
 
 
+def _accept_bulk_sort(method):
+    """pymongo >= 4.9 passes `sort=` into the bulk builder for ReplaceOne /
+    UpdateOne; mongomock's builder predates it. Drop it when unset so
+    bulk_write works against either pymongo version."""
+    def wrapper(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError('mongomock bulk ops do not support sort')
+        return method(self, *args, **kwargs)
+    return wrapper
+
+
+for _op in ('add_replace', 'add_update'):
+    _builder = mongomock.collection.BulkOperationBuilder
+    setattr(_builder, _op, _accept_bulk_sort(getattr(_builder, _op)))
+
+
 # ---------------------------------------------------------------------------
 # App / client fixtures
 # ---------------------------------------------------------------------------
@@ -55,12 +72,107 @@ def db(app):
 
 @pytest.fixture(autouse=True)
 def clean_db(db):
-    """Wipe all collections before each test for isolation."""
+    """Wipe all collections (and the in-process caches built from them)
+    before each test for isolation."""
+    from utils import chat_cache, user_cache, timetable_cache
     for col in db.list_collection_names():
         db.drop_collection(col)
+    chat_cache.clear()
+    user_cache.clear()
+    timetable_cache.clear()
     yield
 
 
+@pytest.fixture(autouse=True)
+def upload_dirs(tmp_path, monkeypatch):
+    """Point every module's uploads/ directory at the test's temp dir, so a
+    run leaves the working tree's uploads/ untouched."""
+    from routes import (academic_routes, ai_routes, chat_routes, dm_routes,
+                        document_routes, marks_routes, settings_routes)
+    from utils import avatars, file_delivery, resumable, storage
+    root = tmp_path / 'uploads'
+    for module, attr, sub in (
+        (marks_routes, 'ANALYTICS_DIR', 'analytics'),
+        (ai_routes, 'AI_PDF_DIR', 'ai_pdfs'),
+        (ai_routes, 'CHROMA_DIR', 'chroma_db'),
+        (ai_routes, 'ACADEMICS_DIR', 'academics'),
+        (academic_routes, 'UPLOAD_DIR', 'academics'),
+        (chat_routes, 'CHAT_UPLOAD_DIR', 'chat'),
+        (dm_routes, 'DM_UPLOAD_DIR', 'dm'),
+        (settings_routes, 'PERSONAL_DOCS_DIR', 'personal_docs'),
+        (document_routes, 'UPLOAD_FOLDER', ''),
+        (file_delivery, 'UPLOADS_ROOT', ''),
+        (resumable, 'TMP_DIR', 'tmp'),
+        (avatars, 'AVATARS_DIR', 'avatars'),
+        (storage, 'CACHE_DIR', 'cache'),
+    ):
+        # the modules create theirs at import and write into them directly
+        (root / sub).mkdir(parents=True, exist_ok=True)
+        monkeypatch.setattr(module, attr, str(root / sub) if sub else str(root))
+    # The Chroma client is opened lazily on CHROMA_DIR; start each test without one
+    monkeypatch.setattr(ai_routes, '_chroma_client', None)
+    return root
+
+
+@pytest.fixture(autouse=True)
+def blob_dir(tmp_path, monkeypatch):
+    """Keep each test's uploaded blobs (utils/storage.py) in its own temp dir."""
+    from utils import storage
+    monkeypatch.setattr(storage, 'BLOBS_DIR', str(tmp_path / 'uploads' / 'blobs'))
+    return tmp_path / 'uploads' / 'blobs'
+
+
+class QueryCounter:
+    """Counts top-level collection operations issued against the mock DB.
+
+    Only the outermost call is counted — mongomock's find_one/update_one are
+    themselves built on find — so the numbers match the round trips a real
+    MongoDB would see. `by_collection` breaks the total down per collection.
+    """
+    OPS = (
+        'find', 'find_one', 'aggregate', 'count_documents', 'distinct',
+        'insert_one', 'insert_many', 'update_one', 'update_many', 'replace_one',
+        'delete_one', 'delete_many', 'bulk_write',
+        'find_one_and_update', 'find_one_and_replace', 'find_one_and_delete',
+    )
+
+    def __init__(self):
+        self.by_collection = {}
+        self._local = threading.local()
+
+    @property
+    def total(self):
+        return sum(self.by_collection.values())
+
+    def reset(self):
+        self.by_collection.clear()
+
+    def wrap(self, original):
+        counter = self
+
+        def wrapper(coll, *args, **kwargs):
+            depth = getattr(counter._local, 'depth', 0)
+            if depth == 0:
+                counter.by_collection[coll.name] = counter.by_collection.get(coll.name, 0) + 1
+            counter._local.depth = depth + 1
+            try:
+                return original(coll, *args, **kwargs)
+            finally:
+                counter._local.depth = depth
+        return wrapper
+
+
+@pytest.fixture
+def query_counter(monkeypatch):
+    """Count DB operations made while a test runs; call .reset() before the
+    request you want to measure."""
+    counter = QueryCounter()
+    for op in QueryCounter.OPS:
+        original = getattr(mongomock.collection.Collection, op)
+        monkeypatch.setattr(mongomock.collection.Collection, op, counter.wrap(original))
+    return counter
+
+
 @pytest.fixture
 def client(app):
     """Flask test client."""
@@ -54,3 +54,18 @@ def make_subject(db, classroom_id, semester_id, creator_id, name='Math', is_pers
     }
     db.subjects.insert_one(subj)
     return subj
+
+
+def make_grid_image(size=(1200, 800), angle=0.0, fmt='PNG'):
+    """Image bytes of a white sheet with dark horizontal rules, like a printed timetable."""
+    import io
+    from PIL import Image, ImageDraw
+    img = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(img)
+    for y in range(60, size[1] - 40, 70):
+        draw.rectangle([40, y, size[0] - 40, y + 6], fill='black')
+    if angle:
+        img = img.rotate(angle, resample=Image.BICUBIC, fillcolor='white')
+    buf = io.BytesIO()
+    img.save(buf, format=fmt)
+    return buf.getvalue()
@@ -0,0 +1,173 @@
+"""Tests for routes/academic_routes.py"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from tests.conftest import auth_header
+from tests.helpers import make_classroom, make_subject
+
+URL = '/api/academics/all-resources'
+BASE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def _add_resource(db, semester, subject, name, minutes, **extra):
+    doc = {
+        'semester_id': str(semester['_id']), 'subject_id': str(subject['_id']),
+        'category': 'pyq', 'name': name, 'mime_type': 'application/pdf', 'size': 10,
+        'uploaded_by': 'u', 'uploaded_by_name': 'Uploader', 'source': 'upload',
+        'created_at': BASE + timedelta(minutes=minutes),
+    }
+    doc.update(extra)
+    return db.academic_resources.insert_one(doc).inserted_id
+
+
+def _add_document(db, semester, user, name, minutes):
+    return db.documents.insert_one({
+        'semester_id': str(semester['_id']), 'filename': name, 'file_size': 5,
+        'uploaded_by': str(user['_id']), 'created_at': BASE + timedelta(minutes=minutes),
+    }).inserted_id
+
+
+def _add_chat_file(db, semester, user, name, minutes):
+    return db.chat_messages.insert_one({
+        'semester_id': str(semester['_id']), 'user_id': str(user['_id']),
+        'username': 'testuser', 'full_name': 'Test User',
+        'file': {'name': name, 'mime_type': 'image/png', 'size': 7},
+        'created_at': BASE + timedelta(minutes=minutes),
+    }).inserted_id
+
+
+def _get(client, token, **params):
+    resp = client.get(URL, query_string=params, headers=auth_header(token))
+    return resp.status_code, resp.get_json()
+
+
+@pytest.fixture
+def library(db, registered_user):
+    """One semester holding a resource, a document, a linked and an unlinked chat file."""
+    user, token = registered_user
+    classroom, semester = make_classroom(db, user['_id'], name='Physics Club')
+    subject = make_subject(db, classroom['_id'], semester['_id'], user['_id'], name='Optics')
+    linked = _add_chat_file(db, semester, user, 'linked.png', 1)
+    _add_resource(db, semester, subject, 'Lens notes.pdf', 2,
+                  source='chat', chat_message_id=str(linked))
+    _add_document(db, semester, user, 'syllabus.pdf', 3)
+    _add_chat_file(db, semester, user, 'board.png', 4)
+    return classroom, semester, subject, token
+
+
+class TestAllResources:
+    def test_merges_sources_newest_first(self, client, library):
+        _, _, _, token = library
+        status, body = _get(client, token)
+        assert status == 200
+        assert [r['name'] for r in body['resources']] == ['board.png', 'syllabus.pdf', 'Lens notes.pdf']
+        assert [r['source'] for r in body['resources']] == ['chat_unlinked', 'document', 'chat']
+        assert body['resources'][1]['uploaded_by_name'] == 'Test User'
+        assert body['resources'][2]['subject_name'] == 'Optics'
+        assert body['resources'][2]['section_name'] == 'PYQ'
+        assert body['resources'][0]['classroom_name'] == 'Physics Club'
+        assert body['next_cursor'] is None
+
+    def test_linked_chat_file_not_listed_twice(self, client, library):
+        _, _, _, token = library
+        _, body = _get(client, token, type='chat')
+        assert [r['name'] for r in body['resources']] == ['board.png']
+
+    def test_keyset_pages_cover_everything_once(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        subject = make_subject(db, classroom['_id'], semester['_id'], user['_id'])
+        for i in range(4):
+            _add_resource(db, semester, subject, f'r{i}', i * 3)
+            _add_document(db, semester, user, f'd{i}', i * 3 + 1)
+            _add_chat_file(db, semester, user, f'c{i}', i * 3 + 2)
+
+        names, cursor = [], None
+        while True:
+            params = {'limit': 5, 'sort': 'oldest'}
+            if cursor:
+                params['cursor'] = cursor
+            status, body = _get(client, token, **params)
+            assert status == 200
+            assert len(body['resources']) <= 5
+            names += [r['name'] for r in body['resources']]
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        assert names == [f'{k}{i}' for i in range(4) for k in ('r', 'd', 'c')]
+
+    def test_sort_by_name_case_insensitive(self, client, library):
+        _, _, _, token = library
+        _, body = _get(client, token, sort='name')
+        assert [r['name'] for r in body['resources']] == ['board.png', 'Lens notes.pdf', 'syllabus.pdf']
+
+    def test_subject_filter_only_returns_resources(self, client, library):
+        _, _, subject, token = library
+        _, body = _get(client, token, subject_id=str(subject['_id']))
+        assert [r['name'] for r in body['resources']] == ['Lens notes.pdf']
+
+    def test_text_search_matches_file_and_subject_names(self, client, library):
+        _, _, _, token = library
+        _, body = _get(client, token, q='SYLL')
+        assert [r['name'] for r in body['resources']] == ['syllabus.pdf']
+        _, body = _get(client, token, q='optics')
+        assert [r['name'] for r in body['resources']] == ['Lens notes.pdf']
+        _, body = _get(client, token, q='physics')
+        assert len(body['resources']) == 3
+
+    def test_scope_filters(self, client, registered_user, db, library):
+        user, _ = registered_user
+        classroom, semester, _, token = library
+        other_classroom, other_semester = make_classroom(db, user['_id'], name='Other')
+        _add_document(db, other_semester, user, 'other.pdf', 9)
+
+        _, body = _get(client, token, classroom_id=str(other_classroom['_id']))
+        assert [r['name'] for r in body['resources']] == ['other.pdf']
+        _, body = _get(client, token, semester_id=str(semester['_id']))
+        assert len(body['resources']) == 3
+
+    def test_other_users_classrooms_are_invisible(self, client, second_user, db, library):
+        _, token2 = second_user
+        classroom, _, _, _ = library
+        status, body = _get(client, token2, classroom_id=str(classroom['_id']))
+        assert status == 200
+        assert body == {'resources': [], 'next_cursor': None}
+
+    def test_rejects_bad_params(self, client, library):
+        _, _, _, token = library
+        assert _get(client, token, cursor='not-a-cursor')[0] == 400
+        assert _get(client, token, sort='size')[0] == 400
+        assert _get(client, token, type='video')[0] == 400
+        assert _get(client, token, limit='lots')[0] == 400
+
+    def test_cursor_from_other_sort_rejected(self, client, library):
+        _, _, _, token = library
+        _, body = _get(client, token, limit=1)
+        assert _get(client, token, sort='name', cursor=body['next_cursor'])[0] == 400
+
+    def test_union_pipeline_chains_every_source(self, monkeypatch):
+        """On a server with $unionWith the branches run as one aggregate."""
+        from routes import academic_routes
+        monkeypatch.setattr(academic_routes, '_union_supported', True)
+
+        class FakeCollection:
+            def __init__(self):
+                self.pipelines = []
+
+            def aggregate(self, pipeline):
+                self.pipelines.append(pipeline)
+                return iter([])
+
+        coll = FakeCollection()
+        fake_db = {'academic_resources': coll}
+        tail = academic_routes._resource_page_stages('newest', None, 11, {})
+        branches = {
+            k: academic_routes._RESOURCE_SOURCES[k](['s1'], None) + tail
+            for k in academic_routes.ALL_RESOURCES_KINDS
+        }
+        academic_routes._run_resource_union(fake_db, branches, 'newest', tail, 11)
+        assert len(coll.pipelines) == 1
+        unions = [s['$unionWith'] for s in coll.pipelines[0] if '$unionWith' in s]
+        assert [u['coll'] for u in unions] == ['documents', 'chat_messages']
+        assert coll.pipelines[0][-1] == {'$limit': 11}
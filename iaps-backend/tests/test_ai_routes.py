@@ -358,6 +358,70 @@ class TestRagMetrics:
         assert 'avg_latency_ms' in s
 
 
+    def test_stage_histograms_and_cache_rate(self, client, registered_user, db):
+        user, token = registered_user
+        _insert_pdf(db, str(user['_id']))
+        for i, hit in enumerate([True, True, False, True]):
+            db.ai_rag_metrics.insert_one({
+                'pdf_id': 'test-pdf-123',
+                'chunks_retrieved': 5,
+                'latency_ms': 40.0,
+                'stages': {'embed': 3.0 + i, 'vector': 20.0, 'llm': 900.0},
+                'cache': {'bm25': hit},
+                'ts': datetime.now(timezone.utc),
+            })
+        resp = client.get('/api/ai/pdf/test-pdf-123/rag-metrics', headers=auth_header(token))
+        s = resp.get_json()['summary']
+        assert s['stages']['embed']['count'] == 4
+        assert s['stages']['llm']['avg_ms'] == 900.0
+        llm_hist = {b['le']: b['count'] for b in s['stages']['llm']['histogram']}
+        assert llm_hist[1000] == 4
+        assert sum(llm_hist.values()) == 4
+        assert s['cache']['bm25']['hit_pct'] == 75.0
+
+    def test_rag_search_buffers_metric_without_spawning_thread(self, client, registered_user, db):
+        user, token = registered_user
+        _insert_pdf(db, str(user['_id']))
+        import threading
+        with patch('routes.ai_routes._hybrid_rag', return_value=['a', 'b']):
+            from routes.ai_routes import _rag_search, _rag_metrics
+            _rag_search('test-pdf-123', 'q')  # may start the one shared flusher
+            before = threading.active_count()
+            for _ in range(5):
+                _rag_search('test-pdf-123', 'q')
+            assert threading.active_count() == before
+            _rag_metrics.flush()
+        assert db.ai_rag_metrics.count_documents({'pdf_id': 'test-pdf-123'}) == 6
+        rec = db.ai_rag_metrics.find_one({'pdf_id': 'test-pdf-123'})
+        assert rec['chunks_retrieved'] == 2
+        assert 'stages' in rec
+
+    def test_chat_records_llm_stage(self, client, registered_user, db):
+        user, token = registered_user
+        _insert_pdf(db, str(user['_id']))
+        with patch('routes.ai_routes._hybrid_rag', return_value=['relevant chunk']), \
+             patch('routes.ai_routes._get_groq', return_value=_groq_mock('An answer.')):
+            resp = client.post('/api/ai/pdf/test-pdf-123/chat', headers=auth_header(token),
+                               json={'question': 'What is this?'})
+        assert resp.status_code == 200
+        resp = client.get('/api/ai/pdf/test-pdf-123/rag-metrics', headers=auth_header(token))
+        metric = resp.get_json()['metrics'][0]
+        assert metric['endpoint'] == 'chat'
+        assert 'llm' in metric['stages']
+
+    def test_user_wide_metrics_only_cover_own_pdfs(self, client, registered_user, second_user, db):
+        user, token = registered_user
+        _insert_pdf(db, str(user['_id']))
+        for pdf_id in ('test-pdf-123', 'someone-elses-pdf'):
+            db.ai_rag_metrics.insert_one({
+                'pdf_id': pdf_id, 'chunks_retrieved': 1, 'latency_ms': 10.0,
+                'ts': datetime.now(timezone.utc),
+            })
+        resp = client.get('/api/ai/rag-metrics', headers=auth_header(token))
+        assert resp.status_code == 200
+        assert resp.get_json()['summary']['total_queries'] == 1
+
+
 # ── _hybrid_rag unit tests ────────────────────────────────────────────────────
 
 class TestHybridRag:
@@ -384,7 +448,7 @@ class TestHybridRag:
         with patch('routes.ai_routes._get_embedder') as me, \
              patch('routes.ai_routes._get_chroma') as mc, \
              patch('routes.ai_routes._get_chunks', return_value=chunks), \
-             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n: c[:n]):
+             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n, **kw: c[:n]):
             me.return_value.encode.return_value.tolist.return_value = [[0.1] * 384]
             col = MagicMock()
             col.count.return_value = 3
@@ -412,7 +476,7 @@ class TestHybridRag:
         with patch('routes.ai_routes._get_embedder') as me, \
              patch('routes.ai_routes._get_chroma') as mc, \
              patch('routes.ai_routes._get_chunks', return_value=chunks), \
-             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n: c[:n]):
+             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n, **kw: c[:n]):
             me.return_value.encode.return_value.tolist.return_value = [[0.0] * 384]
             mc.return_value.get_or_create_collection.side_effect = Exception('unavailable')
 
@@ -422,6 +486,133 @@ class TestHybridRag:
         assert len(result) <= 2
 
 
+    def test_records_stage_timings(self):
+        chunks = ['alpha beta gamma', 'delta epsilon zeta', 'alpha zeta theta']
+        with patch('routes.ai_routes._get_embedder') as me, \
+             patch('routes.ai_routes._get_chroma') as mc, \
+             patch('routes.ai_routes._get_chunks', return_value=chunks), \
+             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n, **kw: c[:n]):
+            me.return_value.encode.return_value.tolist.return_value = [[0.1] * 384]
+            col = MagicMock()
+            col.count.return_value = 3
+            col.query.return_value = {'documents': [chunks[:2]]}
+            mc.return_value.get_or_create_collection.return_value = col
+
+            from routes.ai_routes import _hybrid_rag
+            timings = {}
+            _hybrid_rag('test-pdf', 'alpha zeta', n=2, rerank=True, timings=timings)
+        assert set(timings) == {'embed', 'vector', 'bm25', 'rrf', 'rerank'}
+
+    def test_rerank_disabled_skips_cross_encoder(self):
+        chunks = ['alpha beta gamma', 'delta epsilon zeta', 'alpha zeta theta']
+        with patch('routes.ai_routes._get_embedder') as me, \
+             patch('routes.ai_routes._get_chroma') as mc, \
+             patch('routes.ai_routes._get_chunks', return_value=chunks), \
+             patch('routes.ai_routes._rerank') as mock_rerank:
+            me.return_value.encode.return_value.tolist.return_value = [[0.1] * 384]
+            col = MagicMock()
+            col.count.return_value = 3
+            col.query.return_value = {'documents': [chunks[:2]]}
+            mc.return_value.get_or_create_collection.return_value = col
+
+            from routes.ai_routes import _hybrid_rag
+            timings = {}
+            result = _hybrid_rag('test-pdf', 'alpha zeta', n=2, rerank=False, timings=timings)
+        mock_rerank.assert_not_called()
+        assert 'rerank' not in timings
+        assert len(result) == 2
+
+    def test_candidate_n_limits_vector_query(self):
+        with patch('routes.ai_routes._get_embedder') as me, \
+             patch('routes.ai_routes._get_chroma') as mc, \
+             patch('routes.ai_routes._get_chunks', return_value=[]), \
+             patch('routes.ai_routes._rerank', side_effect=lambda q, c, n, **kw: c[:n]):
+            me.return_value.encode.return_value.tolist.return_value = [[0.1] * 384]
+            col = MagicMock()
+            col.count.return_value = 50
+            col.query.return_value = {'documents': [['chunk']]}
+            mc.return_value.get_or_create_collection.return_value = col
+
+            from routes.ai_routes import _hybrid_rag
+            _hybrid_rag('test-pdf', 'q', n=5, candidate_n=7)
+        assert col.query.call_args.kwargs['n_results'] == 7
+
+
+# ── Adaptive reranking ───────────────────────────────────────────────────────
+
+class TestAdaptiveRerank:
+
+    CANDS = ['c0', 'c1', 'c2', 'c3', 'c4', 'c5']
+    FLAT  = [0.030, 0.029, 0.028, 0.027, 0.026, 0.025]  # no decisive gap anywhere
+
+    def test_modes_off_and_always(self):
+        from routes.ai_routes import _plan_rerank
+        assert _plan_rerank('off', self.CANDS, self.FLAT, 2) == ('off', 0)
+        assert _plan_rerank('always', self.CANDS, self.FLAT, 2) == ('full', 6)
+
+    def test_skip_when_candidates_fit(self):
+        from routes.ai_routes import _plan_rerank
+        assert _plan_rerank('adaptive', self.CANDS[:2], self.FLAT[:2], 2)[0] == 'skip_small'
+
+    def test_skip_when_vector_and_bm25_agree(self):
+        from routes.ai_routes import _plan_rerank
+        decision, pairs = _plan_rerank('adaptive', self.CANDS, self.FLAT, 2,
+                                       vec_top=['c0', 'c1'], bm25_top=['c1', 'c0'])
+        assert (decision, pairs) == ('skip_agree', 0)
+
+    def test_skip_on_large_score_gap(self):
+        from routes.ai_routes import _plan_rerank
+        scores = [0.033, 0.032, 0.016, 0.016, 0.015, 0.015]
+        decision, _ = _plan_rerank('adaptive', self.CANDS, scores, 2,
+                                   vec_top=['c0', 'c5'], bm25_top=['c1', 'c4'])
+        assert decision == 'skip_gap'
+
+    def test_caps_pairs_to_latency_budget(self):
+        from routes.ai_routes import _plan_rerank
+        with patch('routes.ai_routes._ce_ms_per_pair', 50.0), \
+             patch('routes.ai_routes._RERANK_BUDGET_MS', 150.0):
+            assert _plan_rerank('adaptive', self.CANDS, self.FLAT, 2) == ('capped', 3)
+
+    def test_full_when_unsure_and_no_cost_estimate(self):
+        from routes.ai_routes import _plan_rerank
+        with patch('routes.ai_routes._ce_ms_per_pair', None):
+            assert _plan_rerank('adaptive', self.CANDS, self.FLAT, 2) == ('full', 6)
+
+    def test_scores_cached_per_query_and_chunk(self):
+        ce = MagicMock()
+        ce.predict.side_effect = lambda pairs: [float(len(c)) for _, c in pairs]
+        with patch('routes.ai_routes._get_cross_encoder', return_value=ce):
+            from routes.ai_routes import _rerank, _rerank_cache
+            _rerank_cache.clear()
+            first, second = {}, {}
+            r1 = _rerank('What is entropy?', ['short', 'a longer chunk'], 1, stats=first)
+            r2 = _rerank('what is entropy?  ', ['short', 'a longer chunk', 'new one'], 1, stats=second)
+        assert r1 == r2 == ['a longer chunk']
+        assert first == {'pairs_scored': 2, 'pairs_cached': 0}
+        assert second == {'pairs_scored': 1, 'pairs_cached': 2}
+        assert ce.predict.call_args_list[1].args[0] == [('what is entropy?', 'new one')]
+        assert {q for q, _ in ce.predict.call_args_list[0].args[0]} == {'what is entropy?'}
+
+    def test_hybrid_rag_reports_decision(self):
+        chunks = ['alpha beta gamma', 'delta epsilon zeta', 'alpha zeta theta']
+        with patch('routes.ai_routes._get_embedder') as me, \
+             patch('routes.ai_routes._get_chroma') as mc, \
+             patch('routes.ai_routes._get_chunks', return_value=chunks), \
+             patch('routes.ai_routes._rerank') as mock_rerank:
+            me.return_value.encode.return_value.tolist.return_value = [[0.1] * 384]
+            col = MagicMock()
+            col.count.return_value = 3
+            col.query.return_value = {'documents': [chunks]}
+            mc.return_value.get_or_create_collection.return_value = col
+
+            from routes.ai_routes import _hybrid_rag
+            info = {}
+            result = _hybrid_rag('test-pdf', 'alpha beta gamma', n=3, rerank='adaptive', rerank_info=info)
+        mock_rerank.assert_not_called()
+        assert info['decision'] == 'skip_small'
+        assert len(result) == 3
+
+
 # ── POST /api/ai/pdf/<pdf_id>/flashcards/generate ────────────────────────────
 
 class TestFlashcardGenerate:
@@ -740,3 +740,338 @@ class TestVotePoll:
         updated = db.chat_messages.find_one({'_id': msg['_id']})
         assert str(user1['_id']) in updated['poll']['options'][0]['voters']
         assert str(user2['_id']) in updated['poll']['options'][1]['voters']
+
+
+# ── TestHotHistoryCache ───────────────────────────────────────────────────────
+
+class TestHotHistoryCache:
+    """First-page history comes from utils/chat_cache once a room is warm, and
+    every write path patches the cached copy instead of leaving it stale."""
+
+    def _history(self, client, token, semester, **params):
+        resp = client.get(f'/api/chat/{_sid(semester)}/messages',
+                          query_string=params,
+                          headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 200
+        return resp.get_json()['messages']
+
+    def test_warm_first_page_skips_mongo(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        _insert_message(db, semester['_id'], user['_id'], text='one')
+        _insert_message(db, semester['_id'], user['_id'], text='two')
+        assert [m['text'] for m in self._history(client, token, semester)] == ['one', 'two']
+
+        # Gone from Mongo but still served — the second load never queried it.
+        db.chat_messages.delete_many({})
+        assert [m['text'] for m in self._history(client, token, semester)] == ['one', 'two']
+
+    def test_before_id_reads_database(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        first = _insert_message(db, semester['_id'], user['_id'], text='old')
+        last = _insert_message(db, semester['_id'], user['_id'], text='new')
+        self._history(client, token, semester)
+        db.chat_messages.delete_one({'_id': first['_id']})
+        assert self._history(client, token, semester, before_id=_mid(last)) == []
+
+    def test_new_message_is_appended(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        _insert_message(db, semester['_id'], user['_id'], text='before')
+        self._history(client, token, semester)
+        resp = client.post(f'/api/chat/{_sid(semester)}/lists',
+                           json={'prompt': 'Bring what?'},
+                           headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 201
+        history = self._history(client, token, semester)
+        assert [m.get('type') for m in history] == ['text', 'list']
+
+    def test_edit_patches_cached_copy(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        msg = _insert_message(db, semester['_id'], user['_id'], text='draft')
+        self._history(client, token, semester)
+        client.put(f'/api/chat/{_sid(semester)}/messages/{_mid(msg)}',
+                   json={'text': 'final'},
+                   headers={'Authorization': f'Bearer {token}'})
+        [cached] = self._history(client, token, semester)
+        assert cached['text'] == 'final'
+        assert cached['edited_at'] is not None
+
+    def test_reaction_patches_cached_copy(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        msg = _insert_message(db, semester['_id'], user['_id'])
+        self._history(client, token, semester)
+        client.post(f'/api/chat/{_sid(semester)}/messages/{_mid(msg)}/react',
+                    json={'emoji': '👍'},
+                    headers={'Authorization': f'Bearer {token}'})
+        [cached] = self._history(client, token, semester)
+        assert cached['reactions'] == [{'emoji': '👍', 'user_ids': [str(user['_id'])]}]
+
+    def test_delete_for_me_hides_only_for_that_reader(self, client, registered_user, second_user, db):
+        user1, token1 = registered_user
+        user2, token2 = second_user
+        classroom, semester = make_classroom(db, user1['_id'])
+        _add_member(db, classroom, user2['_id'])
+        msg = _insert_message(db, semester['_id'], user1['_id'])
+        self._history(client, token1, semester)
+        client.delete(f'/api/chat/{_sid(semester)}/messages/{_mid(msg)}?mode=for_me',
+                      headers={'Authorization': f'Bearer {token1}'})
+        assert self._history(client, token1, semester) == []
+        assert len(self._history(client, token2, semester)) == 1
+
+    def test_tombstone_and_hard_delete(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        gone = _insert_message(db, semester['_id'], user['_id'], text='gone')
+        tomb = _insert_message(db, semester['_id'], user['_id'], text='tomb')
+        self._history(client, token, semester)
+        client.delete(f'/api/chat/{_sid(semester)}/messages/{_mid(gone)}',
+                      headers={'Authorization': f'Bearer {token}'})
+        client.delete(f'/api/chat/{_sid(semester)}/messages/{_mid(tomb)}?mode=for_everyone',
+                      headers={'Authorization': f'Bearer {token}'})
+        [cached] = self._history(client, token, semester)
+        assert cached['id'] == _mid(tomb)
+        assert cached['deleted_for_everyone'] is True
+        assert cached['text'] is None
+
+    def test_avatar_change_invalidates_rooms(self, client, registered_user, db):
+        from routes.chat_routes import invalidate_user_rooms
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        _insert_message(db, semester['_id'], user['_id'])
+        self._history(client, token, semester)
+        from utils import user_cache
+        # What upload_avatar / remove_member_avatar do after writing the picture
+        db.users.update_one({'_id': user['_id']}, {'$set': {'profile_picture': 'new.png'}})
+        user_cache.invalidate(str(user['_id']))
+        invalidate_user_rooms(str(user['_id']))
+        [cached] = self._history(client, token, semester)
+        assert cached['profile_picture'] == 'new.png'
+
+
+class TestChatCacheRing:
+    def _entry(self, i):
+        return {'m': {'id': str(i), 'text': str(i)}, 'h': []}
+
+    def test_ring_drops_oldest_and_stops_claiming_completeness(self, monkeypatch):
+        from utils import chat_cache
+        monkeypatch.setattr(chat_cache, 'HOT_SIZE', 3)
+        token = chat_cache.begin_fill('room')
+        assert chat_cache.fill('room', [self._entry(i) for i in range(2)], True, token)
+        chat_cache.append('room', {'id': '2'})
+        chat_cache.append('room', {'id': '3'})
+        assert [m['id'] for m in chat_cache.page('room', 'u', 3)] == ['1', '2', '3']
+        # Only three held and the oldest was evicted, so a bigger page must miss
+        assert chat_cache.page('room', 'u', 4) is None
+
+    def test_write_during_fill_discards_snapshot(self):
+        from utils import chat_cache
+        token = chat_cache.begin_fill('room')
+        chat_cache.append('room', {'id': 'late'})
+        assert chat_cache.fill('room', [self._entry(1)], True, token) is False
+        assert chat_cache.page('room', 'u', 10) is None
+
+    def test_append_of_already_filled_message_does_not_duplicate(self):
+        from utils import chat_cache
+        token = chat_cache.begin_fill('room')
+        chat_cache.fill('room', [self._entry(1)], True, token)
+        chat_cache.append('room', {'id': '1', 'text': 'again'})
+        assert chat_cache.page('room', 'u', 10) == [{'id': '1', 'text': 'again'}]
+
+
+# ── TestHistoryPagination ─────────────────────────────────────────────────────
+
+class TestHistoryPagination:
+    """Keyset pagination on (semester_id, _id) with an opaque cursor."""
+
+    def _get(self, client, token, semester, **params):
+        return client.get(f'/api/chat/{_sid(semester)}/messages',
+                          query_string=params,
+                          headers={'Authorization': f'Bearer {token}'})
+
+    def _seed(self, db, semester, user, n, hidden_for=None):
+        return [
+            _insert_message(db, semester['_id'], user['_id'], text=f'm{i}',
+                            extra={'hidden_for': hidden_for(i)} if hidden_for else None)
+            for i in range(n)
+        ]
+
+    def test_walks_full_history_with_cursor(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        self._seed(db, semester, user, 7)
+        seen, cursor = [], None
+        while True:
+            params = {'limit': 3, **({'cursor': cursor} if cursor else {})}
+            body = self._get(client, token, semester, **params).get_json()
+            seen = [m['text'] for m in body['messages']] + seen
+            cursor = body['next_cursor']
+            if not cursor:
+                break
+        assert seen == [f'm{i}' for i in range(7)]
+
+    def test_last_page_has_no_cursor(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        msgs = self._seed(db, semester, user, 3)
+        body = self._get(client, token, semester, limit=5).get_json()
+        assert body['next_cursor'] is None
+        from routes.chat_routes import _encode_cursor
+        body = self._get(client, token, semester, limit=5, cursor=_encode_cursor(msgs[1]['_id'])).get_json()
+        assert [m['text'] for m in body['messages']] == ['m0']
+        assert body['next_cursor'] is None
+
+    def test_hidden_messages_are_compensated_by_over_read(self, client, registered_user, db):
+        user, token = registered_user
+        uid = str(user['_id'])
+        classroom, semester = make_classroom(db, user['_id'])
+        msgs = self._seed(db, semester, user, 8, hidden_for=lambda i: [uid] if i % 2 else [])
+        from routes.chat_routes import _encode_cursor
+        body = self._get(client, token, semester, limit=3, cursor=_encode_cursor(msgs[-1]['_id'])).get_json()
+        assert [m['text'] for m in body['messages']] == ['m2', 'm4', 'm6']
+        assert body['next_cursor'] is not None
+
+    def test_scan_is_capped_when_everything_is_hidden(self, client, registered_user, db, monkeypatch):
+        import routes.chat_routes as chat_routes
+        monkeypatch.setattr(chat_routes, 'HISTORY_SCAN_FACTOR', 2)
+        user, token = registered_user
+        uid = str(user['_id'])
+        classroom, semester = make_classroom(db, user['_id'])
+        msgs = self._seed(db, semester, user, 10, hidden_for=lambda i: [uid] if i >= 3 else [])
+        body = self._get(client, token, semester, limit=2,
+                         cursor=chat_routes._encode_cursor(msgs[-1]['_id'])).get_json()
+        # Four rows scanned, all hidden: short page, but a cursor to carry on from
+        assert body['messages'] == []
+        body = self._get(client, token, semester, limit=2, cursor=body['next_cursor']).get_json()
+        assert [m['text'] for m in body['messages']] == ['m1', 'm2']
+
+    def test_invalid_cursor_rejected(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        assert self._get(client, token, semester, cursor='not-a-cursor').status_code == 400
+
+    def test_before_id_still_supported(self, client, registered_user, db):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        msgs = self._seed(db, semester, user, 3)
+        body = self._get(client, token, semester, before_id=_mid(msgs[2])).get_json()
+        assert [m['text'] for m in body['messages']] == ['m0', 'm1']
+
+
+class TestFileServing:
+    CONTENT = b'0123456789' * 100
+
+    @pytest.fixture
+    def uploaded(self, client, registered_user, db, tmp_path, monkeypatch):
+        """A file uploaded to a semester chat, stored under a temp cwd."""
+        import io
+        monkeypatch.chdir(tmp_path)   # CHAT_UPLOAD_DIR is already under it (conftest.upload_dirs)
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        resp = client.post(f'/api/chat/{_sid(semester)}/upload',
+                           data={'file': (io.BytesIO(self.CONTENT), 'notes.txt', 'text/plain')},
+                           content_type='multipart/form-data',
+                           headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 201, resp.get_json()
+        return resp.get_json()['message'], token
+
+    def _get(self, client, msg, token, **headers):
+        return client.get(f"/api/chat/file/{msg['id']}", query_string={'token': token}, headers=headers)
+
+    def test_upload_records_content_hash(self, uploaded):
+        import hashlib
+        msg, _ = uploaded
+        assert msg['file']['sha256'] == hashlib.sha256(self.CONTENT).hexdigest()
+        # Where the server keeps it is never sent to clients
+        assert 'path' not in msg['file']
+
+    def test_serves_with_etag_and_private_cache_control(self, client, uploaded):
+        msg, token = uploaded
+        resp = self._get(client, msg, token)
+        assert resp.status_code == 200
+        assert resp.data == self.CONTENT
+        assert resp.headers['ETag'] == f'"{msg["file"]["sha256"]}"'
+        assert resp.headers['Cache-Control'] == 'private, no-cache'
+        assert resp.headers['Accept-Ranges'] == 'bytes'
+        assert 'Last-Modified' in resp.headers
+
+    def test_revalidation_skips_membership_lookup(self, client, uploaded, query_counter):
+        msg, token = uploaded
+        etag = self._get(client, msg, token).headers['ETag']
+        query_counter.reset()
+        resp = self._get(client, msg, token, **{'If-None-Match': etag})
+        assert resp.status_code == 304
+        assert resp.data == b''
+        assert query_counter.by_collection == {'chat_messages': 1}
+
+    def test_range_request(self, client, uploaded):
+        msg, token = uploaded
+        resp = self._get(client, msg, token, Range='bytes=10-19')
+        assert resp.status_code == 206
+        assert resp.data == self.CONTENT[10:20]
+        assert resp.headers['Content-Range'] == f'bytes 10-19/{len(self.CONTENT)}'
+
+    def test_deleted_file_is_not_revalidated(self, client, db, uploaded):
+        msg, token = uploaded
+        etag = self._get(client, msg, token).headers['ETag']
+        db.chat_messages.update_one({'_id': ObjectId(msg['id'])}, {'$set': {'deleted_for_everyone': True}})
+        assert self._get(client, msg, token, **{'If-None-Match': etag}).status_code == 410
+
+    def test_non_member_denied(self, client, uploaded, second_user):
+        msg, _ = uploaded
+        _, token2 = second_user
+        assert self._get(client, msg, token2).status_code == 403
+
+    def _signed(self, client, msg, token):
+        resp = client.get(f"/api/chat/file/{msg['id']}/url", headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 200
+        return resp.get_json()['url']
+
+    def test_signed_url_skips_membership_lookup(self, client, uploaded, query_counter):
+        msg, token = uploaded
+        url = self._signed(client, msg, token)
+        assert 'token=' not in url
+        query_counter.reset()
+        resp = client.get(url)
+        assert resp.status_code == 200
+        assert resp.data == self.CONTENT
+        assert query_counter.by_collection == {'chat_messages': 1}
+
+    def test_signed_url_is_stable_within_a_window(self, client, uploaded):
+        msg, token = uploaded
+        assert self._signed(client, msg, token) == self._signed(client, msg, token)
+
+    def test_tampered_or_expired_signature_rejected(self, client, uploaded, second_user, monkeypatch):
+        msg, token = uploaded
+        user2, _ = second_user
+        url = self._signed(client, msg, token)
+        from urllib.parse import parse_qs, urlsplit
+        params = {k: v[0] for k, v in parse_qs(urlsplit(url).query).items()}
+        path = urlsplit(url).path
+        assert client.get(path, query_string={**params, 'uid': str(user2['_id'])}).status_code == 401
+        from utils import file_delivery
+        monkeypatch.setattr(file_delivery.time, 'time', lambda: int(params['exp']) + 1)
+        resp = client.get(path, query_string=params)
+        assert resp.status_code == 401
+        assert resp.get_json()['error'] == 'Link expired'
+
+    def test_non_member_cannot_sign(self, client, uploaded, second_user):
+        msg, _ = uploaded
+        _, token2 = second_user
+        resp = client.get(f"/api/chat/file/{msg['id']}/url", headers={'Authorization': f'Bearer {token2}'})
+        assert resp.status_code == 403
+
+    def test_offloads_to_proxy(self, client, uploaded, tmp_path, monkeypatch):
+        from utils import file_delivery
+        monkeypatch.setattr(file_delivery, 'ACCEL_REDIRECT_PREFIX', '/_protected/')
+        msg, token = uploaded
+        resp = client.get(self._signed(client, msg, token))
+        assert resp.status_code == 200
+        assert resp.data == b''
+        sha = msg['file']['sha256']
+        assert resp.headers['X-Accel-Redirect'] == f'/_protected/blobs/{sha[:2]}/{sha}'
+        assert resp.headers['Content-Type'].startswith('text/plain')
+        assert resp.headers['ETag'] == f'"{msg["file"]["sha256"]}"'
@@ -0,0 +1,27 @@
+"""Tests for utils/file_delivery.py — URL signing and delivery selection."""
+from unittest.mock import patch
+
+import pytest
+
+from utils import file_delivery
+
+
+def test_signature_binds_kind_object_and_user(app):
+    url = file_delivery.sign_path('/api/dm/file/abc', 'dm', 'abc', 'u1')
+    query = url.split('?', 1)[1]
+    with app.test_request_context(f'/api/dm/file/abc?{query}'):
+        assert file_delivery.signed_user('dm', 'abc') == 'u1'
+    for kind, object_id in (('chat', 'abc'), ('dm', 'abd')):
+        with app.test_request_context(f'/x?{query}'), pytest.raises(file_delivery.InvalidSignature):
+            file_delivery.signed_user(kind, object_id)
+    with app.test_request_context('/api/dm/file/abc?token=jwt'):
+        assert file_delivery.signed_user('dm', 'abc') is None
+
+
+def test_s3_refs_redirect_to_presigned_url(app):
+    with app.test_request_context('/'), \
+            patch.object(file_delivery.storage, 'presigned_url', return_value='https://bucket/k?X-Amz=1') as sign:
+        resp = file_delivery.deliver('s3://bucket/chat/k', mimetype='video/mp4', download_name='k.mp4')
+    assert resp.status_code == 302
+    assert resp.headers['Location'] == 'https://bucket/k?X-Amz=1'
+    sign.assert_called_once_with('s3://bucket/chat/k', 'k.mp4', 'video/mp4')
@@ -0,0 +1,90 @@
+"""Tests for utils/ingest.py — single-pass upload saving."""
+import hashlib
+import io
+
+import pytest
+from flask import request
+
+from utils import ingest
+
+
+class CountingStream(io.BytesIO):
+    """BytesIO that records how many bytes were read and caps each read."""
+
+    def __init__(self, data, max_read=None):
+        super().__init__(data)
+        self.consumed = 0
+        self.max_read = max_read
+
+    def read(self, n=-1):
+        if self.max_read:
+            n = min(n, self.max_read)
+        block = super().read(n)
+        self.consumed += len(block)
+        return block
+
+
+@pytest.fixture
+def out_dir(tmp_path):
+    path = tmp_path / 'out'
+    path.mkdir()
+    return path
+
+
+def test_saves_hashes_and_sniffs_in_one_pass(out_dir):
+    data = b'%PDF-1.4\n' + bytes(range(256)) * 10_000
+    dest = out_dir / 'notes.pdf'
+    saved = ingest.save(CountingStream(data), str(dest))
+    assert saved == (len(data), hashlib.sha256(data).hexdigest(), 'application/pdf')
+    assert dest.read_bytes() == data
+    assert list(out_dir.iterdir()) == [dest]
+
+
+def test_stops_reading_once_over_the_limit(out_dir):
+    source = CountingStream(b'x' * ingest.CHUNK_SIZE * 10)
+    with pytest.raises(ingest.TooLarge):
+        ingest.save(source, str(out_dir / 'big.bin'), max_size=ingest.CHUNK_SIZE + 1)
+    assert source.consumed == ingest.CHUNK_SIZE * 2
+    assert list(out_dir.iterdir()) == []
+
+
+def test_rejects_executables_even_in_tiny_reads(out_dir):
+    with pytest.raises(ingest.DisallowedType):
+        ingest.save(CountingStream(b'#!/bin/sh\nrm -rf /', max_read=1), str(out_dir / 'run.sh'))
+    assert list(out_dir.iterdir()) == []
+    saved = ingest.save(io.BytesIO(b'MZ' + b'\x00' * 64), str(out_dir / 'app.exe'), allow_dangerous=True)
+    assert saved.mime == '__executable__'
+
+
+def test_body_too_large_allows_multipart_overhead(app):
+    limit = 1024 * 1024
+
+    def too_large(length):
+        with app.test_request_context('/', method='POST', environ_overrides={'CONTENT_LENGTH': str(length)}):
+            return ingest.body_too_large(limit)
+
+    assert not too_large(limit + 1000)
+    assert too_large(limit + ingest.MULTIPART_OVERHEAD + 1)
+
+
+def test_unknown_length_body_is_cut_off_at_the_limit(app):
+    limit = 1024 * 1024
+    body = (b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.bin"\r\n\r\n'
+            + b'x' * limit * 4 + b'\r\n--b--\r\n')
+    stream = CountingStream(body)
+    with app.test_request_context('/', method='POST', input_stream=stream,
+                                  content_type='multipart/form-data; boundary=b',
+                                  environ_overrides={'wsgi.input_terminated': True}):
+        del request.environ['CONTENT_LENGTH']
+        assert ingest.body_too_large(limit)
+    assert stream.consumed < limit * 2
+
+
+def test_body_within_limit_is_parsed_into_request_files(app):
+    body = (b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.txt"\r\n\r\n'
+            b'hello\r\n--b\r\nContent-Disposition: form-data; name="label"\r\n\r\nnotes\r\n--b--\r\n')
+    with app.test_request_context('/', method='POST', data=body,
+                                  content_type='multipart/form-data; boundary=b'):
+        assert not ingest.body_too_large(1024)
+        assert request.files['file'].read() == b'hello'
+        assert request.form['label'] == 'notes'
@@ -532,3 +532,209 @@ class TestCrClassAverage:
         subj = resp.get_json()['subjects'][0]
         for field in ('subject_id', 'name', 'class_avg', 'count'):
             assert field in subj, f"Missing field: {field}"
+
+
+# ── Materialized class statistics (utils.marks_stats) ─────────────────────────
+
+class TestMaterializedMarksStats:
+    """Class statistics are maintained incrementally by the save endpoints."""
+
+    def _setup(self, db, registered_user, second_user):
+        user1, token1 = registered_user
+        user2, token2 = second_user
+        classroom, semester = make_classroom(db, user1['_id'])
+        db.classrooms.update_one({'_id': classroom['_id']}, {'$addToSet': {'members': user2['_id']}})
+        subj = make_subject(db, classroom['_id'], semester['_id'], user1['_id'], name='IT250')
+        return semester, subj, token1, token2
+
+    def _save(self, client, token, subj, obtained, grade=''):
+        resp = client.post(f'/api/marks/my/{subj["_id"]}', json={
+            'entries': [{'name': 'Mid', 'max_marks': 50, 'weightage': 100, 'marks_obtained': obtained}],
+            'grade': grade,
+        }, headers=auth_header(token))
+        assert resp.status_code == 200
+
+    def _class_stats(self, client, token, semester):
+        resp = client.get(f'/api/marks/cr-class-average/{semester["_id"]}', headers=auth_header(token))
+        assert resp.status_code == 200
+        return resp.get_json()['subjects'][0]
+
+    def test_resave_replaces_students_contribution(self, client, registered_user, second_user, db):
+        semester, subj, token1, token2 = self._setup(db, registered_user, second_user)
+        self._save(client, token1, subj, 40, 'A')      # 80
+        self._class_stats(client, token1, semester)    # builds the stats doc
+        self._save(client, token2, subj, 30, 'B')      # 60
+        self._save(client, token1, subj, 45, 'A+')     # 80 → 90
+
+        stats = db.subject_mark_stats.find_one({'subject_id': str(subj['_id'])})
+        assert stats['count'] == 2
+        assert stats['sum'] == pytest.approx(150.0)
+        assert stats['hist'][9] == 1 and stats['hist'][6] == 1 and stats['hist'][8] == 0
+
+        data = self._class_stats(client, token1, semester)
+        assert data['class_avg'] == 75.0
+        assert data['count'] == 2
+        assert data['std_dev'] == 15.0
+        assert data['grades'] == {'A+': 1, 'B': 1}
+
+    def test_stats_read_does_not_scan_marks(self, client, registered_user, second_user, db, query_counter):
+        semester, subj, token1, token2 = self._setup(db, registered_user, second_user)
+        self._save(client, token1, subj, 40)
+        self._save(client, token2, subj, 30)
+        self._class_stats(client, token1, semester)
+
+        query_counter.reset()
+        data = self._class_stats(client, token1, semester)
+        assert data['class_avg'] == 70.0
+        assert 'subject_marks' not in query_counter.by_collection
+
+    def test_structure_save_tracks_exams(self, client, registered_user, second_user, db):
+        semester, subj, token1, token2 = self._setup(db, registered_user, second_user)
+        self._save(client, token1, subj, 40)
+        self._save(client, token2, subj, 20)
+        resp = client.post(f'/api/marks/structure/{subj["_id"]}', json={'exams': [
+            {'name': 'mid ', 'max_marks': 50, 'weightage': 100},
+        ]}, headers=auth_header(token1))
+        assert resp.status_code == 200
+
+        exams = self._class_stats(client, token1, semester)['exams']
+        assert exams == [{'name': 'mid', 'count': 2, 'mean': 60.0, 'std_dev': 20.0}]
+
+        self._save(client, token2, subj, 30)
+        exams = self._class_stats(client, token1, semester)['exams']
+        assert exams[0]['mean'] == 70.0
+
+    def test_percentiles_from_histogram(self):
+        from utils import marks_stats
+        doc = {'count': 4, 'sum': 0, 'sumsq': 0, 'hist': [0, 0, 0, 0, 0, 2, 0, 0, 2, 0]}
+        summary = marks_stats.summarize(doc)
+        assert summary['p25'] == 55.0
+        assert summary['median'] == 60.0
+        assert summary['p75'] == 85.0
+
+
+# ── Vectorized class analytics (utils.marks_analytics) ────────────────────────
+
+STRUCTURE = [
+    {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0},
+    {'name': 'End', 'max_marks': 100.0, 'weightage': 60.0},
+]
+
+
+class TestClassMarks:
+
+    def test_scores_match_scalar_rule(self):
+        import random
+        from utils.marks_analytics import ClassMarks
+        from utils.marks_stats import weighted_score
+        rng = random.Random(7)
+        docs = []
+        for i in range(60):
+            entries = [
+                {'name': rng.choice(['Mid', 'End', 'Quiz', 'mid ']), 'max_marks': rng.choice([0.0, 10.0, 50.0]),
+                 'weightage': rng.choice([0.0, 10.0, 40.0]), 'marks_obtained': rng.uniform(0, 10)}
+                for _ in range(rng.randint(0, 4))
+            ]
+            docs.append({'user_id': f'u{i}', 'entries': entries})
+        scores = ClassMarks.load(STRUCTURE, docs).scores()
+        for doc, score in zip(docs, scores):
+            expected = weighted_score(doc['entries'])
+            assert (score != score) if expected is None else score == expected
+
+    def test_standing_percentile_and_z(self):
+        from utils.marks_analytics import ClassMarks
+        docs = [
+            {'user_id': 'a', 'entries': [{'name': 'End', 'max_marks': 100.0, 'weightage': 100.0, 'marks_obtained': m}]}
+            for m in (40.0, 60.0, 60.0, 80.0)
+        ] + [{'user_id': 'none', 'entries': []}]
+        pct, z = ClassMarks.load([], docs).standing()
+        assert list(pct[:4]) == [12.5, 50.0, 50.0, 87.5]
+        assert z[0] == pytest.approx(-20 / (200 ** 0.5))
+        assert z[1] == 0.0
+        assert pct[4] != pct[4]  # no score → NaN
+
+    def test_what_if_needed_percentage(self):
+        from utils.marks_analytics import ClassMarks
+        docs = [
+            {'user_id': 'half', 'entries': [{'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': 25.0}]},
+            {'user_id': 'top', 'entries': [{'name': 'mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': 50.0}]},
+            {'user_id': 'done', 'entries': [
+                {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': 10.0},
+                {'name': 'End', 'max_marks': 100.0, 'weightage': 60.0, 'marks_obtained': 50.0},
+            ]},
+        ]
+        cm = ClassMarks.load(STRUCTURE, docs)
+        current, remaining, needed, status = cm.what_if(40.0)
+        assert list(current) == [20.0, 40.0, 38.0]
+        assert list(remaining) == [60.0, 60.0, 0.0]
+        assert needed[0] == pytest.approx(100 / 3)
+        assert list(status) == ['reachable', 'secured', 'out_of_reach']
+        assert cm.remaining_exams(0) == ['End']
+
+    def test_exam_difficulty(self):
+        from utils.marks_analytics import ClassMarks
+        docs = [
+            {'user_id': f'u{i}', 'entries': [
+                {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': mid},
+                {'name': 'End', 'max_marks': 100.0, 'weightage': 60.0, 'marks_obtained': end},
+            ]}
+            for i, (mid, end) in enumerate([(50.0, 30.0), (40.0, 20.0), (30.0, 10.0)])
+        ]
+        mid, end = ClassMarks.load(STRUCTURE, docs).exam_difficulty()
+        assert mid['mean_pct'] == 80.0 and mid['difficulty'] == 0.2
+        assert end['mean_pct'] == 20.0 and end['difficulty'] == 0.8
+        assert mid['discrimination'] == 1.0
+
+
+class TestClassAnalyticsEndpoints:
+
+    def _setup(self, client, db, registered_user, second_user):
+        user1, token1 = registered_user
+        user2, token2 = second_user
+        classroom, semester = make_classroom(db, user1['_id'])
+        db.classrooms.update_one({'_id': classroom['_id']}, {'$addToSet': {'members': user2['_id']}})
+        subj = make_subject(db, classroom['_id'], semester['_id'], user1['_id'])
+        db.exam_structures.insert_one({'subject_id': str(subj['_id']), 'exams': STRUCTURE})
+        _insert_marks(db, subj['_id'], user1['_id'], [
+            {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': 40.0}])
+        _insert_marks(db, subj['_id'], user2['_id'], [
+            {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0, 'marks_obtained': 20.0}])
+        return subj, token1, token2
+
+    def test_class_analytics_cr_only(self, client, registered_user, second_user, db):
+        subj, token1, token2 = self._setup(client, db, registered_user, second_user)
+        resp = client.get(f'/api/marks/class-analytics/{subj["_id"]}', headers=auth_header(token2))
+        assert resp.status_code == 403
+
+        resp = client.get(f'/api/marks/class-analytics/{subj["_id"]}?target=50', headers=auth_header(token1))
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body['summary']['count'] == 2 and body['summary']['mean'] == 24.0
+        top, bottom = body['students']
+        assert (top['name'], top['score'], top['percentile'], top['z_score']) == ('Test User', 32.0, 75.0, 1.0)
+        assert bottom['needed_pct'] == 56.67 and bottom['status'] == 'reachable'
+        assert [e['name'] for e in body['exams']] == ['Mid', 'End']
+
+    def test_standing_is_anonymous(self, client, registered_user, second_user, db):
+        subj, _, token2 = self._setup(client, db, registered_user, second_user)
+        resp = client.get(f'/api/marks/standing/{subj["_id"]}', headers=auth_header(token2))
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body['score'] == 16.0 and body['percentile'] == 25.0 and body['z_score'] == -1.0
+        assert 'students' not in body
+
+    def test_what_if(self, client, registered_user, second_user, db):
+        subj, _, token2 = self._setup(client, db, registered_user, second_user)
+        resp = client.get(f'/api/marks/what-if/{subj["_id"]}?grade=bb', headers=auth_header(token2))
+        assert resp.status_code == 200
+        body = resp.get_json()
+        assert body['target'] == 70.0
+        assert body['remaining_exams'] == ['End']
+        assert body['max_possible'] == 76.0
+        assert body['needed_pct'] == 90.0 and body['status'] == 'reachable'
+
+        assert client.get(f'/api/marks/what-if/{subj["_id"]}', headers=auth_header(token2)).status_code == 400
+        assert client.get(f'/api/marks/what-if/{subj["_id"]}?grade=ZZ',
+                          headers=auth_header(token2)).status_code == 400
+        assert client.get(f'/api/marks/what-if/{subj["_id"]}?target=120',
+                          headers=auth_header(token2)).status_code == 400
@@ -0,0 +1,15 @@
+"""Tests for benchmarks/marks_benchmark.py — the two report paths must agree."""
+from benchmarks.marks_benchmark import (
+    STRUCTURE, TARGET, make_class, loop_report, vectorized_report, check_agreement, run,
+)
+
+
+def test_loop_and_vectorized_reports_agree():
+    docs = make_class(300, seed=3, completion=0.6)
+    check_agreement(loop_report(STRUCTURE, docs, TARGET), vectorized_report(STRUCTURE, docs, TARGET))
+
+
+def test_run_reports_each_size():
+    rows = run([20, 40], repeat=1)
+    assert [r['students'] for r in rows] == [20, 40]
+    assert all(r['loop_ms'] >= 0 and r['vectorized_ms'] >= 0 for r in rows)
@@ -6,7 +6,7 @@ from uuid import uuid4
 import pytest
 from bson import ObjectId
 from tests.helpers import make_classroom, make_subject
-from routes.marks_routes import ANALYTICS_DIR
+from routes import marks_routes
 
 
 # ── helpers ──────────────────────────────────────────────────────────────────
@@ -297,7 +297,7 @@ class TestServeAnalyticsFile:
 
     def _make_file(self, db, subject_id, uploaded_by, visibility='public'):
         stored_name = f"{uuid4().hex}_test.csv"
-        with open(os.path.join(ANALYTICS_DIR, stored_name), 'w') as fh:
+        with open(os.path.join(marks_routes.ANALYTICS_DIR, stored_name), 'w') as fh:
             fh.write('col1,col2\n1,2\n')
         result = db.subject_analytics.insert_one({
             'subject_id': subject_id,
@@ -361,3 +361,117 @@ class TestServeAnalyticsFile:
         file_id = self._make_file(db, str(subject['_id']), str(user2['_id']), 'personal')
         resp = client.get(f'/api/marks/analytics/file/{file_id}?token={token2}')
         assert resp.status_code == 200
+
+
+class TestBulkMarks:
+    """CR bulk import (CSV/XLSX) and the matching export."""
+
+    EXAMS = [
+        {'name': 'Mid', 'max_marks': 50.0, 'weightage': 40.0},
+        {'name': 'End', 'max_marks': 100.0, 'weightage': 60.0},
+    ]
+
+    def _setup(self, db, registered_user, second_user):
+        user1, token1 = registered_user
+        user2, token2 = second_user
+        classroom, _, subject = _make_class_and_subject(db, user1['_id'])
+        db.classrooms.update_one({'_id': classroom['_id']}, {'$push': {'members': user2['_id']}})
+        db.exam_structures.insert_one({'subject_id': str(subject['_id']), 'exams': self.EXAMS})
+        return subject, token1, token2
+
+    def _import(self, client, token, subject, body, filename='marks.csv'):
+        import io
+        return client.post(
+            f'/api/marks/import/{subject["_id"]}',
+            data={'file': (io.BytesIO(body if isinstance(body, bytes) else body.encode()), filename)},
+            headers=_auth(token), content_type='multipart/form-data',
+        )
+
+    def test_csv_import_upserts_and_keeps_own_exams(self, client, db, registered_user, second_user):
+        subject, token1, _ = self._setup(db, registered_user, second_user)
+        user2 = second_user[0]
+        db.subject_marks.insert_one({
+            'subject_id': str(subject['_id']), 'user_id': str(user2['_id']), 'grade': 'B',
+            'entries': [{'name': 'Quiz', 'max_marks': 10.0, 'weightage': 0.0, 'marks_obtained': 7.0}],
+        })
+        resp = self._import(client, token1, subject, 'Username,mid,END,grade\ntestuser,40,80,A\nSecondUser,25,,\n')
+        assert resp.status_code == 200, resp.get_json()
+        assert resp.get_json()['imported'] == 2
+
+        mine = db.subject_marks.find_one({'subject_id': str(subject['_id']), 'user_id': str(registered_user[0]['_id'])})
+        assert [(e['name'], e['marks_obtained']) for e in mine['entries']] == [('Mid', 40.0), ('End', 80.0)]
+        assert mine['grade'] == 'A'
+        theirs = db.subject_marks.find_one({'subject_id': str(subject['_id']), 'user_id': str(user2['_id'])})
+        assert sorted(e['name'] for e in theirs['entries']) == ['Mid', 'Quiz']
+        assert theirs['grade'] == 'B'
+
+        stats = db.subject_mark_stats.find_one({'subject_id': str(subject['_id'])})
+        assert stats['count'] == 2
+
+    def test_invalid_rows_reject_whole_sheet(self, client, db, registered_user, second_user):
+        subject, token1, _ = self._setup(db, registered_user, second_user)
+        resp = self._import(client, token1, subject,
+                            'username,Mid\ntestuser,60\nseconduser,abc\nnobody,10\ntestuser,5\n')
+        assert resp.status_code == 400
+        errors = resp.get_json()['errors']
+        assert [e['row'] for e in errors] == [2, 3, 4, 5]
+        assert db.subject_marks.count_documents({}) == 0
+
+    def test_unknown_column_and_non_cr_rejected(self, client, db, registered_user, second_user):
+        subject, token1, token2 = self._setup(db, registered_user, second_user)
+        resp = self._import(client, token1, subject, 'username,Lab\ntestuser,5\n')
+        assert resp.status_code == 400
+        assert 'Lab' in resp.get_json()['error']
+        resp = self._import(client, token2, subject, 'username,Mid\ntestuser,5\n')
+        assert resp.status_code == 403
+
+    def test_xlsx_round_trip(self, client, db, registered_user, second_user):
+        import io
+        from openpyxl import Workbook, load_workbook
+        subject, token1, _ = self._setup(db, registered_user, second_user)
+        wb = Workbook()
+        wb.active.append(['email', 'Mid', 'End'])
+        wb.active.append(['second@example.com', 50, 100])
+        buf = io.BytesIO()
+        wb.save(buf)
+        resp = self._import(client, token1, subject, buf.getvalue(), 'marks.xlsx')
+        assert resp.status_code == 200, resp.get_json()
+
+        resp = client.get(f'/api/marks/export/{subject["_id"]}?format=xlsx', headers=_auth(token1))
+        assert resp.status_code == 200
+        rows = list(load_workbook(io.BytesIO(resp.data)).active.iter_rows(values_only=True))
+        assert rows[0] == ('username', 'name', 'Mid', 'End', 'score', 'grade')
+        assert ('seconduser', 'Second User', 50, 100, 100, None) in rows
+
+    def test_export_keeps_formula_like_names_as_text(self, client, db, registered_user, second_user):
+        import io
+        from openpyxl import load_workbook
+        subject, token1, _ = self._setup(db, registered_user, second_user)
+        db.users.update_one({'_id': second_user[0]['_id']},
+                            {'$set': {'fullName': '=1+1', 'username': '-seconduser'}})
+        self._import(client, token1, subject, 'username,Mid\n-seconduser,30\n')
+
+        resp = client.get(f'/api/marks/export/{subject["_id"]}', headers=_auth(token1))
+        assert "'-seconduser,'=1+1,30.0,,24.0," in resp.get_data(as_text=True).splitlines()
+        # ...and the escaped sheet imports unchanged
+        resp = self._import(client, token1, subject, resp.data)
+        assert resp.status_code == 200, resp.get_json()
+
+        resp = client.get(f'/api/marks/export/{subject["_id"]}?format=xlsx', headers=_auth(token1))
+        ws = load_workbook(io.BytesIO(resp.data)).active
+        row = next(r for r in ws.iter_rows() if r[0].value == '-seconduser')
+        assert row[1].value == '=1+1'
+        assert row[1].data_type == 's'
+        resp = self._import(client, token1, subject, resp.data, 'marks.xlsx')
+        assert resp.status_code == 200, resp.get_json()
+
+    def test_csv_export_lists_every_member(self, client, db, registered_user, second_user):
+        subject, token1, _ = self._setup(db, registered_user, second_user)
+        self._import(client, token1, subject, 'username,Mid\ntestuser,25\n')
+        resp = client.get(f'/api/marks/export/{subject["_id"]}', headers=_auth(token1))
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/csv'
+        lines = resp.get_data(as_text=True).splitlines()
+        assert lines[0] == 'username,name,Mid,End,score,grade'
+        assert 'testuser,Test User,25.0,,20.0,' in lines
+        assert 'seconduser,Second User,,,,' in lines
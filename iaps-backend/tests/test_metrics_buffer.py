@@ -0,0 +1,70 @@
+"""Unit tests for utils/metrics_buffer.py"""
+import threading
+import mongomock
+import pytest
+from unittest.mock import MagicMock
+
+from utils.metrics_buffer import MetricsBuffer
+
+
+@pytest.fixture
+def collection():
+    return mongomock.MongoClient().db.metrics
+
+
+def test_record_does_not_write_until_flush(collection):
+    buf = MetricsBuffer(lambda: collection, batch_size=100, flush_interval=60)
+    buf.record({'n': 1})
+    buf.record({'n': 2})
+    assert collection.count_documents({}) == 0
+    assert buf.pending() == 2
+    assert buf.flush() == 2
+    assert collection.count_documents({}) == 2
+    assert buf.pending() == 0
+
+
+def test_flush_uses_one_insert_many():
+    col = MagicMock()
+    buf = MetricsBuffer(lambda: col, batch_size=100, flush_interval=60)
+    for i in range(5):
+        buf.record({'n': i})
+    buf.flush()
+    col.insert_many.assert_called_once()
+    assert len(col.insert_many.call_args.args[0]) == 5
+    col.insert_one.assert_not_called()
+
+
+def test_full_batch_wakes_flusher(collection):
+    buf = MetricsBuffer(lambda: collection, batch_size=3, flush_interval=60)
+    for i in range(3):
+        buf.record({'n': i})
+    # flush_interval is a minute — only the batch-size wakeup can land these quickly
+    for _ in range(50):
+        if collection.count_documents({}) == 3:
+            break
+        threading.Event().wait(0.05)
+    assert collection.count_documents({}) == 3
+
+
+def test_single_flusher_thread_regardless_of_volume(collection):
+    buf = MetricsBuffer(lambda: collection, batch_size=1000, flush_interval=60)
+    before = threading.active_count()
+    for i in range(200):
+        buf.record({'n': i})
+    assert threading.active_count() - before <= 1
+
+
+def test_failed_flush_drops_batch():
+    col = MagicMock()
+    col.insert_many.side_effect = Exception('mongo down')
+    buf = MetricsBuffer(lambda: col, batch_size=100, flush_interval=60)
+    buf.record({'n': 1})
+    assert buf.flush() == 0
+    assert buf.pending() == 0
+
+
+def test_pending_is_bounded():
+    buf = MetricsBuffer(lambda: MagicMock(), batch_size=1000, flush_interval=60, max_pending=10)
+    for i in range(25):
+        buf.record({'n': i})
+    assert buf.pending() == 10
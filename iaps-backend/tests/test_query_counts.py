@@ -0,0 +1,168 @@
+"""List endpoints must cost a fixed number of DB queries however many rows
+they return — one batched lookup per related collection, never one per row.
+
+Each test measures the endpoint with a single row and again with several,
+each from a different user/classroom, and checks both the count and that it
+didn't grow. Caches are cleared before each measurement so a warm
+utils.user_cache can't hide a per-row lookup.
+"""
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+from tests.conftest import auth_header
+from tests.helpers import make_classroom, make_subject
+
+
+def _make_users(db, n):
+    users = []
+    for i in range(n):
+        u = {'_id': ObjectId(), 'username': f'user{i}_{ObjectId()}', 'email': f'u{i}_{ObjectId()}@example.com',
+             'fullName': f'User {i}', 'profile_picture': None}
+        db.users.insert_one(u)
+        users.append(u)
+    return users
+
+
+def _measure(client, query_counter, method, url, token):
+    from utils import chat_cache, user_cache
+    chat_cache.clear()
+    user_cache.clear()
+    query_counter.reset()
+    resp = client.open(url, method=method, headers=auth_header(token))
+    assert resp.status_code == 200, resp.get_json()
+    return query_counter.total, resp.get_json()
+
+
+class TestListQueryCounts:
+    def test_list_todos(self, client, registered_user, db, query_counter):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        url = f"/api/todo/semester/{semester['_id']}/list"
+
+        def add_todos(n):
+            for i in range(n):
+                db.todos.insert_one({
+                    'classroom_id': str(classroom['_id']), 'semester_id': str(semester['_id']),
+                    'text': f'todo {i}', 'completed': False, 'created_by': str(user['_id']),
+                    'created_at': datetime.now(timezone.utc),
+                })
+        add_todos(1)
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_todos(5)
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        assert len(body['todos']) == 6
+        assert body['todos'][0]['created_by']['username'] == 'testuser'
+        assert one == many == 4
+
+    def test_list_analytics(self, client, registered_user, db, query_counter):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        subject = make_subject(db, classroom['_id'], semester['_id'], user['_id'])
+        url = f"/api/marks/analytics/{subject['_id']}"
+
+        def add_files(uploaders):
+            for u in uploaders:
+                db.subject_analytics.insert_one({
+                    'subject_id': str(subject['_id']), 'filename': 'a.pdf', 'size': 1,
+                    'uploaded_by': str(u['_id']), 'visibility': 'public',
+                    'created_at': datetime.now(timezone.utc),
+                })
+        add_files(_make_users(db, 1))
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_files(_make_users(db, 5))
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        assert len(body['files']) == 6
+        assert all(f['uploaded_by_name'].startswith('User ') for f in body['files'])
+        assert one == many == 5
+
+    def test_all_resources_documents(self, client, registered_user, db, query_counter, monkeypatch):
+        # mongomock has no $unionWith, so pin the per-source fallback up front
+        # rather than counting the one failed probe in whichever run hits it.
+        # (On MongoDB 4.4+ the three source queries are a single aggregate.)
+        from routes import academic_routes
+        monkeypatch.setattr(academic_routes, '_union_supported', False)
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        url = '/api/academics/all-resources'
+
+        def add_docs(uploaders):
+            for u in uploaders:
+                db.documents.insert_one({
+                    'semester_id': str(semester['_id']), 'filename': 'notes.pdf',
+                    'uploaded_by': str(u['_id']), 'created_at': datetime.now(timezone.utc),
+                })
+        add_docs(_make_users(db, 1))
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_docs(_make_users(db, 5))
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        docs = [r for r in body['resources'] if r['source'] == 'document']
+        assert len(docs) == 6
+        assert all(d['uploaded_by_name'].startswith('User ') for d in docs)
+        assert one == many == 7
+
+    def test_get_classroom_join_requests(self, client, registered_user, db, query_counter):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        url = f"/api/classroom/{classroom['_id']}"
+
+        def add_requests(users):
+            db.classrooms.update_one({'_id': classroom['_id']}, {'$push': {'join_requests': {'$each': [
+                {'user_id': u['_id'], 'requested_at': datetime.now(timezone.utc)} for u in users
+            ]}}})
+        add_requests(_make_users(db, 1))
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_requests(_make_users(db, 5))
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        assert len(body['classroom']['join_requests']) == 6
+        assert one == many
+
+    def test_get_chat_files(self, client, registered_user, db, query_counter):
+        user, token = registered_user
+        url = '/api/settings/chat-files'
+
+        def add_files(n):
+            for i in range(n):
+                classroom, semester = make_classroom(db, user['_id'], name=f'Class {i}')
+                db.chat_messages.insert_one({
+                    'semester_id': str(semester['_id']), 'user_id': str(user['_id']),
+                    'username': 'testuser', 'text': None,
+                    'file': {'name': 'f.pdf', 'path': 'uploads/chat/f.pdf', 'mime_type': 'application/pdf', 'size': 1},
+                    'created_at': datetime.now(timezone.utc),
+                })
+        add_files(1)
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_files(5)
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        assert len(body['files']) == 6
+        assert {f['classroom_name'] for f in body['files']} == {f'Class {i}' for i in range(5)}
+        assert one == many == 3
+
+    def test_get_classroom_semester_tree(self, client, registered_user, second_user, db, query_counter):
+        user, token = registered_user
+        nominator, _ = second_user
+        classroom, semester = make_classroom(db, user['_id'])
+        url = f"/api/classroom/{classroom['_id']}"
+
+        def add_semesters(n):
+            for i in range(n):
+                sem_id = ObjectId()
+                db.semesters.insert_one({
+                    '_id': sem_id, 'classroom_id': str(classroom['_id']), 'name': f'Sem {i}',
+                    'cr_ids': [], 'is_active': False, 'created_at': datetime.now(timezone.utc),
+                })
+                make_subject(db, classroom['_id'], sem_id, user['_id'], name=f'Subj {i}')
+                db.cr_nominations.insert_one({
+                    'semester_id': str(sem_id), 'nominated_user_id': str(user['_id']),
+                    'nominated_by_user_id': str(nominator['_id']), 'nomination_type': 'transfer',
+                })
+        add_semesters(1)
+        one, _ = _measure(client, query_counter, 'GET', url, token)
+        add_semesters(4)
+        many, body = _measure(client, query_counter, 'GET', url, token)
+        sems = [s for s in body['classroom']['semesters'] if s['name'].startswith('Sem ')]
+        assert len(sems) == 5
+        assert all(len(s['subjects']) == 1 for s in sems)
+        assert all(s['pending_nomination']['nominated_by'] == 'Second User' for s in sems)
+        assert one == many == 6
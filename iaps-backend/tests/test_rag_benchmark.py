@@ -0,0 +1,76 @@
+"""Tests for benchmarks/rag_benchmark.py — the scoring and regression logic.
+
+The end-to-end run needs the real embedding model and ChromaDB, so only the
+pure functions are covered here."""
+import pytest
+from benchmarks.rag_benchmark import (
+    recall_at_k, reciprocal_rank, percentile, summarize, find_regressions,
+)
+
+
+def test_recall_at_k_counts_relevant_in_top_k():
+    assert recall_at_k([3, 1, 0], [1], 1) == 0.0
+    assert recall_at_k([3, 1, 0], [1], 2) == 1.0
+    assert recall_at_k([3, 1, 0], [0, 1], 2) == 0.5
+
+
+def test_recall_at_k_empty_relevant_is_zero():
+    assert recall_at_k([0, 1], [], 5) == 0.0
+
+
+def test_reciprocal_rank():
+    assert reciprocal_rank([2, 0, 1], [0]) == 0.5
+    assert reciprocal_rank([0], [0]) == 1.0
+    assert reciprocal_rank([2, 3], [0]) == 0.0
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 95) == 95
+    assert percentile([], 95) == 0.0
+
+
+def test_summarize_aggregates_quality_and_stage_latency():
+    per_query = [
+        {'ranked': [0, 1], 'relevant': [0], 'timings': {'embed': 2.0, 'vector': 4.0}, 'total_ms': 10.0},
+        {'ranked': [1, 0], 'relevant': [0], 'timings': {'embed': 4.0, 'vector': 6.0, 'rerank': 8.0}, 'total_ms': 20.0},
+    ]
+    report = summarize(per_query, [1, 2])
+    assert report['queries'] == 2
+    assert report['recall@1'] == 0.5
+    assert report['recall@2'] == 1.0
+    assert report['mrr'] == 0.75
+    assert report['latency']['embed']['mean_ms'] == 3.0
+    # Stages that didn't run for a query (rerank off, BM25-only fallback) are
+    # averaged over the queries that did run them
+    assert report['latency']['rerank']['mean_ms'] == 8.0
+    assert report['latency']['rrf']['mean_ms'] == 0.0
+    assert report['latency']['total']['p95_ms'] == 20.0
+
+
+def _report(recall, mrr, p95):
+    return {'configs': {'hybrid': {
+        'recall@3': recall, 'mrr': mrr, 'latency': {'total': {'p95_ms': p95}},
+    }}}
+
+
+def test_find_regressions_flags_quality_drop():
+    problems = find_regressions(_report(0.80, 0.70, 100), _report(0.90, 0.70, 100))
+    assert len(problems) == 1
+    assert 'recall@3' in problems[0]
+
+
+def test_find_regressions_flags_latency_growth():
+    problems = find_regressions(_report(0.9, 0.7, 200), _report(0.9, 0.7, 100))
+    assert len(problems) == 1
+    assert 'p95' in problems[0]
+
+
+def test_find_regressions_within_tolerance_is_clean():
+    assert find_regressions(_report(0.89, 0.69, 110), _report(0.90, 0.70, 100)) == []
+
+
+def test_find_regressions_ignores_skipped_configs():
+    current = {'configs': {'hybrid': {'skipped': 'backend unavailable'}}}
+    assert find_regressions(current, _report(0.9, 0.7, 100)) == []
@@ -0,0 +1,111 @@
+"""Tests for routes/settings_routes.py — avatar upload and serving."""
+import io
+
+import pytest
+from PIL import Image
+
+from tests.conftest import auth_header
+
+
+def _png(color='red', size=(600, 400)):
+    buf = io.BytesIO()
+    Image.new('RGB', size, color).save(buf, format='PNG')
+    return buf.getvalue()
+
+
+@pytest.fixture
+def avatars_dir(upload_dirs):
+    return upload_dirs / 'avatars'
+
+
+def _upload(client, token, data):
+    return client.post('/api/settings/upload-avatar',
+                       data={'avatar': (io.BytesIO(data), 'me.png', 'image/png')},
+                       content_type='multipart/form-data', headers=auth_header(token))
+
+
+class TestAvatarUpload:
+    def test_writes_webp_renditions(self, client, registered_user, avatars_dir):
+        import hashlib
+        user, token = registered_user
+        resp = _upload(client, token, _png())
+        assert resp.status_code == 200
+        name = resp.get_json()['user']['profile_picture']
+        assert name == f"{user['_id']}_{hashlib.sha256(_png()).hexdigest()[:16]}"
+        assert sorted(p.name for p in avatars_dir.iterdir()) == sorted(
+            f'{name}_{r}.webp' for r in ('32', '64', '128', 'full'))
+        thumb = Image.open(avatars_dir / f'{name}_64.webp')
+        assert (thumb.format, thumb.size) == ('WEBP', (64, 64))
+        assert Image.open(avatars_dir / f'{name}_full.webp').size == (600, 400)
+
+    def test_replacing_deletes_only_the_old_files(self, client, registered_user, second_user, avatars_dir):
+        _, token = registered_user
+        _, token2 = second_user
+        other = _upload(client, token2, _png('green')).get_json()['user']['profile_picture']
+        _upload(client, token, _png())
+        name = _upload(client, token, _png('blue')).get_json()['user']['profile_picture']
+        stems = {p.name.rsplit('_', 1)[0] for p in avatars_dir.iterdir()}
+        assert stems == {name, other}
+
+    def test_legacy_picture_is_removed_on_replace(self, client, db, registered_user, avatars_dir):
+        user, token = registered_user
+        (avatars_dir / f"{user['_id']}_me.png").write_bytes(_png())
+        db.users.update_one({'_id': user['_id']}, {'$set': {'profile_picture': f"{user['_id']}_me.png"}})
+        _upload(client, token, _png('blue'))
+        assert not (avatars_dir / f"{user['_id']}_me.png").exists()
+
+    def test_rejects_undecodable_image(self, client, registered_user, avatars_dir):
+        _, token = registered_user
+        resp = _upload(client, token, b'\x89PNG\r\n\x1a\n' + b'\x00' * 64)
+        assert resp.status_code == 400
+        assert list(avatars_dir.iterdir()) == []
+
+    def test_deleted_user_gets_404_and_no_files(self, client, db, registered_user, avatars_dir):
+        user, token = registered_user
+        db.users.delete_one({'_id': user['_id']})
+        resp = _upload(client, token, _png())
+        assert resp.status_code == 404
+        assert list(avatars_dir.iterdir()) == []
+
+    def test_rejects_oversized_image(self, client, registered_user, avatars_dir, monkeypatch):
+        from routes import settings_routes
+        monkeypatch.setattr(settings_routes, 'MAX_AVATAR_SIZE', 1000)
+        _, token = registered_user
+        resp = _upload(client, token, _png() + b'\x00' * 2000)
+        assert resp.status_code == 413
+        assert list(avatars_dir.iterdir()) == []
+
+
+class TestServeAvatar:
+    @pytest.fixture
+    def avatar(self, client, registered_user, avatars_dir):
+        user, token = registered_user
+        name = _upload(client, token, _png()).get_json()['user']['profile_picture']
+        return f"/api/settings/avatar/{user['_id']}", name
+
+    @pytest.mark.parametrize('size, expected', [(20, 32), (36, 64), (72, 128), (256, 600), (None, 600)])
+    def test_size_selects_rendition(self, client, avatar, size, expected):
+        url, _ = avatar
+        resp = client.get(url, query_string={'size': size} if size else {})
+        assert resp.status_code == 200
+        assert resp.mimetype == 'image/webp'
+        assert Image.open(io.BytesIO(resp.data)).size[0] == expected
+
+    def test_versioned_url_is_immutable(self, client, avatar):
+        url, name = avatar
+        resp = client.get(url, query_string={'v': name, 'size': 64})
+        assert resp.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+
+        # unversioned (or stale-versioned) URLs revalidate
+        resp = client.get(url, query_string={'v': 'old', 'size': 64})
+        assert resp.headers['Cache-Control'] == 'public, no-cache'
+        again = client.get(url, query_string={'size': 64}, headers={'If-None-Match': resp.headers['ETag']})
+        assert again.status_code == 304
+
+    def test_legacy_picture_served_as_is(self, client, db, registered_user, avatars_dir):
+        user, _ = registered_user
+        (avatars_dir / 'legacy.png').write_bytes(_png())
+        db.users.update_one({'_id': user['_id']}, {'$set': {'profile_picture': 'legacy.png'}})
+        resp = client.get(f"/api/settings/avatar/{user['_id']}", query_string={'size': 32})
+        assert resp.status_code == 200
+        assert resp.data == _png()
@@ -0,0 +1,337 @@
+"""Tests for utils/storage.py — refcounted content-addressed blobs and the
+local cache of S3 objects."""
+import hashlib
+import io
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from tests.conftest import auth_header
+from tests.helpers import make_classroom, make_subject
+from utils import storage
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 20
+SHA = hashlib.sha256(PDF).hexdigest()
+
+
+def _blob_files(blob_dir):
+    return [name for _, _, names in os.walk(blob_dir) for name in names]
+
+
+def _incoming(data=PDF):
+    path = storage.incoming_path()
+    with open(path, 'wb') as f:
+        f.write(data)
+    return path
+
+
+class FakeBody(io.BytesIO):
+    def iter_chunks(self, size):
+        return iter(lambda: self.read(size), b'')
+
+
+class RangeError(Exception):
+    response = {'Error': {'Code': 'InvalidRange'}}
+
+
+class FakeS3:
+    """In-memory stand-in for the boto3 S3 client calls storage.py makes."""
+
+    def __init__(self, objects, delay=0):
+        self.objects = objects
+        self.delay = delay
+        self.downloads = []
+        self.ranges = []
+        self.uploads = {}
+        self.aborted = []
+
+    def download_file(self, bucket, key, path):
+        self.downloads.append(key)
+        time.sleep(self.delay)
+        with open(path, 'wb') as f:
+            f.write(self.objects[key])
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key):
+        upload_id = f'up{len(self.uploads)}'
+        self.uploads[upload_id] = {}
+        return {'UploadId': upload_id}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        self.uploads[UploadId][PartNumber] = Body
+        return {'ETag': f'"{PartNumber}"'}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        parts = self.uploads.pop(UploadId)
+        self.objects[Key] = b''.join(parts[p['PartNumber']] for p in MultipartUpload['Parts'])
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.uploads.pop(UploadId)
+        self.aborted.append(Key)
+
+    def head_object(self, Bucket, Key):
+        return {'ContentLength': len(self.objects[Key])}
+
+    def get_object(self, Bucket, Key, Range=None):
+        data = self.objects[Key]
+        self.ranges.append(Range)
+        if not Range:
+            return {'Body': FakeBody(data), 'ContentLength': len(data)}
+        start, end = Range[len('bytes='):].split('-')
+        start, end = int(start), min(int(end or len(data) - 1), len(data) - 1)
+        if start >= len(data):
+            raise RangeError()
+        return {'Body': FakeBody(data[start:end + 1]), 'ContentLength': end + 1 - start,
+                'ContentRange': f'bytes {start}-{end}/{len(data)}'}
+
+    def copy_object(self, Bucket, Key, CopySource):
+        self.objects[Key] = self.objects[CopySource['Key']]
+
+    def delete_object(self, Bucket, Key):
+        del self.objects[Key]
+
+
+@pytest.fixture
+def s3(tmp_path, monkeypatch):
+    fake = FakeS3({name: name.encode() * 250 for name in ('a.pdf', 'b.pdf', 'c.pdf')})
+    monkeypatch.setattr(storage, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(storage, '_client', lambda: fake)
+    return fake
+
+
+def _age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+class TestS3Cache:
+    def test_downloads_once_then_hits(self, s3):
+        before = storage.cache_stats()
+        first = storage.resolve_local('s3://bucket/a.pdf', 'unused', 'unused')
+        second = storage.resolve_local('s3://bucket/a.pdf', 'unused', 'unused')
+        assert first == second and first.endswith('.pdf')
+        with open(first, 'rb') as f:
+            assert f.read() == s3.objects['a.pdf']
+        assert s3.downloads == ['a.pdf']
+        after = storage.cache_stats()
+        assert after['misses'] - before['misses'] == 1
+        assert after['hits'] - before['hits'] == 1
+        assert after['bytes_downloaded'] - before['bytes_downloaded'] == 1250
+
+    def test_concurrent_misses_share_one_download(self, s3):
+        s3.delay = 0.2
+        paths = []
+        threads = [threading.Thread(target=lambda: paths.append(
+            storage.resolve_local('s3://bucket/b.pdf', 'unused', 'unused'))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        assert s3.downloads == ['b.pdf']
+        assert len(set(paths)) == 1 and len(paths) == 5
+        assert not [n for n in os.listdir(storage.CACHE_DIR) if n.endswith('.part')]
+
+    def test_evicts_least_recently_used_past_the_cap(self, s3, monkeypatch):
+        monkeypatch.setattr(storage, 'CACHE_MAX_BYTES', 2600)
+        a = storage.resolve_local('s3://bucket/a.pdf', 'unused', 'unused')
+        b = storage.resolve_local('s3://bucket/b.pdf', 'unused', 'unused')
+        _age(a, 300)
+        _age(b, 200)
+        storage.resolve_local('s3://bucket/a.pdf', 'unused', 'unused')   # a is now the recent one
+        c = storage.resolve_local('s3://bucket/c.pdf', 'unused', 'unused')
+        assert os.path.exists(a) and os.path.exists(c)
+        assert not os.path.exists(b)
+
+        storage.resolve_local('s3://bucket/b.pdf', 'unused', 'unused')
+        assert s3.downloads == ['a.pdf', 'b.pdf', 'c.pdf', 'b.pdf']
+
+    def test_eviction_keeps_lock_files_and_prunes_stale_ones(self, s3, monkeypatch):
+        monkeypatch.setattr(storage, 'CACHE_MAX_BYTES', 1300)
+        locks = os.path.join(storage.CACHE_DIR, 'locks')
+        a = storage.resolve_local('s3://bucket/a.pdf', 'unused', 'unused')
+        _age(a, 300)
+        a_lock = os.path.join(locks, os.path.basename(a) + '.lock')
+        os.makedirs(locks, exist_ok=True)
+        stale = os.path.join(locks, 'gone.pdf.lock')
+        open(stale, 'w').close()
+        _age(stale, 2 * 24 * 3600)
+
+        storage.resolve_local('s3://bucket/b.pdf', 'unused', 'unused')
+        assert not os.path.exists(a)
+        assert os.path.exists(a_lock)
+        assert not os.path.exists(stale)
+
+    def test_lock_pruned_while_waiting_is_taken_afresh(self, s3):
+        import fcntl
+        lock_path = os.path.join(storage.CACHE_DIR, 'locks', 'x.lock')
+        os.makedirs(os.path.dirname(lock_path))
+        other = open(lock_path, 'a')   # another process's hold on the lock
+        fcntl.flock(other, fcntl.LOCK_EX)
+        contended = []
+
+        def waiter():
+            with storage._single_flight('x'):
+                # a newcomer opening the path must still find it locked
+                with open(lock_path, 'a') as newcomer:
+                    try:
+                        fcntl.flock(newcomer, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        contended.append(False)
+                    except BlockingIOError:
+                        contended.append(True)
+
+        t = threading.Thread(target=waiter)
+        t.start()
+        time.sleep(0.1)
+        os.remove(lock_path)   # pruned while the waiter is blocked on it
+        fcntl.flock(other, fcntl.LOCK_UN)
+        other.close()
+        t.join()
+        assert contended == [True]
+
+
+class TestS3Streaming:
+    @pytest.fixture
+    def bucket(self, s3, monkeypatch):
+        monkeypatch.setenv('S3_BUCKET', 'bucket')
+        monkeypatch.setattr(storage, 'PART_SIZE', 1000)
+        return s3
+
+    def test_upload_streams_to_the_bucket_and_becomes_a_blob(self, bucket, db, blob_dir):
+        from utils import ingest
+        incoming = storage.incoming_path()
+        saved = ingest.save(io.BytesIO(PDF), incoming)
+        assert incoming.startswith('s3://bucket/incoming/')
+        assert bucket.objects[incoming.split('/', 3)[3]] == PDF
+
+        ref = storage.put_blob(db, incoming, saved.sha256, saved.size)
+        assert ref == f's3://bucket/{storage.blob_key(SHA)}'
+        again = storage.incoming_path()
+        ingest.save(io.BytesIO(PDF), again)
+        assert storage.put_blob(db, again, SHA, len(PDF)) == ref
+        assert set(bucket.objects) == {'a.pdf', 'b.pdf', 'c.pdf', storage.blob_key(SHA)}
+        assert not os.path.exists(blob_dir)
+
+    def test_rejected_upload_is_aborted(self, bucket):
+        from utils import ingest
+        class Trickle(io.BytesIO):
+            def read(self, n=-1):
+                return super().read(600)
+
+        with pytest.raises(ingest.TooLarge):
+            ingest.save(Trickle(PDF), 's3://bucket/incoming/x', max_size=2500)
+        assert bucket.aborted == ['incoming/x']
+        assert 'incoming/x' not in bucket.objects and not bucket.uploads
+
+    def test_open_read_fetches_only_what_is_read(self, bucket):
+        bucket.objects['big.pdf'] = PDF
+        with storage.open_read('s3://bucket/big.pdf') as f:
+            f.seek(-10, io.SEEK_END)
+            assert f.read() == PDF[-10:]
+            f.seek(100)
+            assert f.read(20) == PDF[100:120]
+        assert bucket.ranges == [f'bytes={len(PDF) - 10}-{len(PDF) - 1}', 'bytes=100-1099']
+        assert bucket.downloads == []
+
+    def test_proxied_download_passes_range_through(self, bucket, app, monkeypatch):
+        from utils import file_delivery
+        monkeypatch.setattr(file_delivery, 'S3_PROXY_DOWNLOADS', True)
+        bucket.objects['big.pdf'] = PDF
+        with app.test_request_context('/', headers={'Range': 'bytes=10-19'}):
+            resp = file_delivery.deliver('s3://bucket/big.pdf', etag=SHA, download_name='big.pdf')
+            assert resp.status_code == 206
+            assert resp.headers['Content-Range'] == f'bytes 10-19/{len(PDF)}'
+            assert b''.join(resp.response) == PDF[10:20]
+        with app.test_request_context('/', headers={'Range': 'bytes=10-19', 'If-Range': '"stale"'}):
+            resp = file_delivery.deliver('s3://bucket/big.pdf', etag=SHA)
+            assert resp.status_code == 200
+            assert b''.join(resp.response) == PDF
+        with app.test_request_context('/', headers={'Range': f'bytes={len(PDF)}-'}):
+            assert file_delivery.deliver('s3://bucket/big.pdf', etag=SHA).status_code == 416
+
+
+class TestBlobRefcount:
+    def test_same_content_is_stored_once(self, db, blob_dir):
+        first = storage.put_blob(db, _incoming(), SHA, len(PDF))
+        second = storage.put_blob(db, _incoming(), SHA, len(PDF))
+        assert first == second
+        assert _blob_files(blob_dir) == [SHA]
+        assert db.blobs.find_one({'_id': SHA})['refs'] == 2
+
+        storage.release_blob(db, SHA)
+        assert os.path.exists(first)
+        storage.release_blob(db, SHA)
+        assert not os.path.exists(first)
+        assert db.blobs.count_documents({}) == 0
+
+    def test_failed_store_gives_the_reference_back(self, db, blob_dir, monkeypatch):
+        save_file = storage.save_file
+
+        def broken(*args):
+            raise OSError('disk full')
+        monkeypatch.setattr(storage, 'save_file', broken)
+        incoming = _incoming()
+        with pytest.raises(OSError):
+            storage.put_blob(db, incoming, SHA, len(PDF))
+        assert db.blobs.count_documents({}) == 0
+        assert not os.path.exists(incoming)
+
+        monkeypatch.setattr(storage, 'save_file', save_file)
+        storage.put_blob(db, _incoming(), SHA, len(PDF))
+        assert db.blobs.find_one({'_id': SHA})['refs'] == 1
+
+    def test_retain_needs_a_live_blob(self, db):
+        assert not storage.retain_blob(db, SHA)
+        storage.put_blob(db, _incoming(), SHA, len(PDF))
+        db.blobs.update_one({'_id': SHA}, {'$set': {'deleting': True}})
+        assert not storage.retain_blob(db, SHA)
+        db.blobs.update_one({'_id': SHA}, {'$unset': {'deleting': ''}})
+        assert storage.retain_blob(db, SHA)
+        assert db.blobs.find_one({'_id': SHA})['refs'] == 2
+
+    def test_legacy_records_delete_their_own_file(self, db, tmp_path):
+        legacy = tmp_path / 'old.pdf'
+        legacy.write_bytes(PDF)
+        storage.release_file(db, None, str(legacy))
+        assert not legacy.exists()
+
+
+def test_chat_resource_and_ai_copies_share_one_blob(client, registered_user, db, blob_dir):
+    import routes.ai_routes as ai_routes
+    user, token = registered_user
+    _, semester = make_classroom(db, user['_id'])
+    sid = str(semester['_id'])
+    subject = make_subject(db, semester['classroom_id'], semester['_id'], user['_id'])
+
+    resp = client.post(f'/api/chat/{sid}/upload',
+                       data={'file': (io.BytesIO(PDF), 'week3.pdf', 'application/pdf')},
+                       content_type='multipart/form-data', headers=auth_header(token))
+    assert resp.status_code == 201, resp.get_json()
+    message_id = resp.get_json()['message']['id']
+    resp = client.post(f'/api/academics/{sid}/upload',
+                       data={'file': (io.BytesIO(PDF), 'week3.pdf', 'application/pdf'),
+                             'subject_id': str(subject['_id']), 'category': 'pyq'},
+                       content_type='multipart/form-data', headers=auth_header(token))
+    assert resp.status_code == 201, resp.get_json()
+    resource_id = resp.get_json()['resource']['id']
+    with patch.object(ai_routes, '_dispatch_index_pdf'):
+        resp = client.post('/api/ai/pdf/import-resource', headers=auth_header(token),
+                           json={'resource_id': message_id, 'source_type': 'chat'})
+    assert resp.status_code == 201, resp.get_json()
+    pdf_id = resp.get_json()['pdf_id']
+
+    assert _blob_files(blob_dir) == [SHA]
+    assert db.blobs.find_one({'_id': SHA})['refs'] == 3
+
+    assert client.delete(f'/api/chat/{sid}/messages/{message_id}', query_string={'mode': 'for_everyone'},
+                         headers=auth_header(token)).status_code == 200
+    assert client.delete(f'/api/academics/{sid}/resources/{resource_id}',
+                         headers=auth_header(token)).status_code == 200
+    assert _blob_files(blob_dir) == [SHA]
+    assert client.delete(f'/api/ai/pdf/{pdf_id}', headers=auth_header(token)).status_code == 200
+    assert _blob_files(blob_dir) == []
+    assert db.blobs.count_documents({}) == 0
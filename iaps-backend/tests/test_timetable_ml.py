@@ -0,0 +1,83 @@
+"""Tests for utils/timetable_ml.py — preprocessing, hashing, PDF rendering.
+The Groq client is mocked; nothing here calls the API."""
+import io
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+from PIL import Image
+
+from tests.helpers import make_grid_image
+from utils import timetable_ml
+
+
+def _groq_reply(data):
+    client = MagicMock()
+    client.chat.completions.create.return_value.choices[0].message.content = json.dumps(data)
+    return client
+
+
+class TestPrepareImage:
+    def test_downscales_and_grayscales(self):
+        photo = Image.effect_noise((4000, 3000), 30).convert('RGB')
+        buf = io.BytesIO()
+        photo.save(buf, format='JPEG', quality=95)
+        raw = buf.getvalue()
+        out, mime = timetable_ml.prepare_image(raw, 'image/jpeg')
+        assert mime == 'image/jpeg'
+        img = Image.open(io.BytesIO(out))
+        assert img.mode == 'L'
+        assert max(img.size) <= timetable_ml.MAX_IMAGE_EDGE
+        assert len(out) < len(raw) / 4
+
+    def test_estimates_tilt(self):
+        gray = Image.open(io.BytesIO(make_grid_image(angle=3))).convert('L')
+        assert timetable_ml._estimate_skew(gray) == pytest.approx(-3, abs=0.5)
+        straight = Image.open(io.BytesIO(make_grid_image())).convert('L')
+        assert timetable_ml._estimate_skew(straight) == 0
+
+    def test_unreadable_input_passes_through(self):
+        assert timetable_ml.prepare_image(b'not an image', 'image/heic') == (b'not an image', 'image/heic')
+
+
+class TestFingerprint:
+    def test_recompressed_copy_is_close(self):
+        png = timetable_ml.prepare_image(make_grid_image(), 'image/png')
+        jpeg = timetable_ml.prepare_image(make_grid_image(fmt='JPEG'), 'image/jpeg')
+        other = timetable_ml.prepare_image(make_grid_image(angle=30), 'image/png')
+        sha_a, phash_a = timetable_ml.image_fingerprint([png])
+        sha_b, phash_b = timetable_ml.image_fingerprint([jpeg])
+        _, phash_c = timetable_ml.image_fingerprint([other])
+        assert sha_a != sha_b
+        assert len(phash_a) == timetable_ml.DHASH_SIZE ** 2 // 4
+        assert timetable_ml.phash_distance(phash_a, phash_b) <= timetable_ml.PHASH_MAX_DISTANCE
+        assert timetable_ml.phash_distance(phash_a, phash_c) > timetable_ml.PHASH_MAX_DISTANCE
+        assert timetable_ml.phash_distance(phash_a, f'{phash_a}-{phash_a}') is None
+
+    def test_pages_join_hashes(self):
+        page = timetable_ml.prepare_image(make_grid_image(), 'image/png')
+        _, phash = timetable_ml.image_fingerprint([page, page])
+        assert phash.count('-') == 1
+
+
+def test_render_pdf_pages_in_order():
+    fitz = pytest.importorskip('fitz')
+    doc = fitz.open()
+    for i in range(7):
+        page = doc.new_page()
+        page.draw_rect(fitz.Rect(50, 50 + i * 40, 500, 60 + i * 40), fill=(0, 0, 0))
+    pages = timetable_ml.render_pdf_pages(doc.tobytes())
+    assert len(pages) == timetable_ml.MAX_PDF_PAGES
+    assert all(mime == 'image/jpeg' for _, mime in pages)
+    assert len({data for data, _ in pages}) == len(pages)
+
+
+def test_pages_sent_in_one_request():
+    client = _groq_reply({'days': ['Mon'], 'time_slots': ['9:00-10:00'], 'grid': {}})
+    page = (b'jpeg-bytes', 'image/jpeg')
+    with patch('utils.timetable_ml._get_groq_client', return_value=client):
+        result = timetable_ml.extract_timetable_from_images([page, page])
+    assert result['success']
+    assert result['data']['grid']['Mon']['9:00-10:00']['type'] == 'Free'
+    content = client.chat.completions.create.call_args.kwargs['messages'][0]['content']
+    assert [c['type'] for c in content] == ['image_url', 'image_url', 'text']
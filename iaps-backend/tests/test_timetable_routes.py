@@ -0,0 +1,530 @@
+"""Tests for routes/timetable_routes.py"""
+from datetime import date, datetime, timezone
+
+import pytest
+
+from tests.conftest import auth_header
+from tests.helpers import make_classroom, make_grid_image
+from utils import timetable_cache
+
+WEEK_OF = '2025-03-05'          # a Wednesday; its week runs 2025-03-03 … 03-09
+SLOTS = ['9:00-10:00', '10:00-11:00']
+
+
+@pytest.fixture(autouse=True)
+def inline_cascade(monkeypatch):
+    """Run save/patch cascades on the request thread so tests can assert on
+    them (and so no background thread outlives its test's database)."""
+    from routes import timetable_routes
+    started = []
+
+    class _InlineThread:
+        def __init__(self, target, args=(), daemon=None):
+            self.target, self.args = target, args
+
+        def start(self):
+            started.append(self.args)
+            self.target(*self.args)
+
+    monkeypatch.setattr(timetable_routes.threading, 'Thread', _InlineThread)
+    return started
+
+
+def _cell(subject, type_='Lecture'):
+    return {'subject': subject, 'teacher': 'T', 'room': 'R1', 'type': type_}
+
+
+@pytest.fixture
+def timetable(db, registered_user, second_user):
+    """A semester with a CR (registered_user), a student (second_user) and a
+    Mon–Wed base timetable."""
+    user, token = registered_user
+    user2, token2 = second_user
+    classroom, semester = make_classroom(db, user['_id'])
+    db.classrooms.update_one({'_id': classroom['_id']}, {'$push': {'members': user2['_id']}})
+    now = datetime.now(timezone.utc)
+    db.timetables.insert_one({
+        'semester_id': str(semester['_id']), 'classroom_id': str(classroom['_id']),
+        'days': ['Mon', 'Tue', 'Wed'], 'time_slots': SLOTS,
+        'grid': {d: {SLOTS[0]: _cell('Math'), SLOTS[1]: _cell('Physics')} for d in ('Mon', 'Tue', 'Wed')},
+        'created_by': str(user['_id']), 'created_at': now, 'updated_at': now,
+    })
+    return str(semester['_id']), token, token2
+
+
+def _week(client, token, semester_id, when=WEEK_OF):
+    resp = client.get(f'/api/timetable/semester/{semester_id}/week',
+                      query_string={'date': when}, headers=auth_header(token))
+    assert resp.status_code == 200, resp.get_json()
+    return resp.get_json()
+
+
+def _override(client, token, semester_id, **fields):
+    body = {'date': '2025-03-04', 'day': 'Tue', 'slot': SLOTS[0], 'action': 'cancel', 'scope': 'this_day'}
+    body.update(fields)
+    resp = client.post(f'/api/timetable/semester/{semester_id}/override', json=body, headers=auth_header(token))
+    assert resp.status_code == 201, resp.get_json()
+    return resp.get_json()['override']['id']
+
+
+class TestWeekViewCache:
+    def test_shared_week_is_built_once(self, client, db, timetable, query_counter):
+        semester_id, token, token2 = timetable
+        db.academic_calendars.insert_one({'semester_id': semester_id, 'events': [
+            {'date': '2025-03-01', 'end_date': '2025-03-04', 'type': 'Exam', 'title': 'Mids'},
+            {'date': '2025-04-01', 'type': 'Holiday', 'title': 'Later'},
+        ]})
+        first = _week(client, token, semester_id)
+        assert first['week_start'] == '2025-03-03'
+        assert sorted(first['ac_events']) == ['2025-03-03', '2025-03-04']
+
+        query_counter.reset()
+        second = _week(client, token2, semester_id)
+        assert second['week_grid'] == first['week_grid']
+        assert second['ac_events'] == first['ac_events']
+        for coll in ('timetables', 'timetable_overrides', 'academic_calendars'):
+            assert coll not in query_counter.by_collection
+        assert query_counter.by_collection['personal_skips'] == 1
+
+    def test_weeks_are_cached_separately(self, client, db, timetable):
+        semester_id, token, _ = timetable
+        db.timetable_overrides.insert_one({
+            'semester_id': semester_id, 'date': '2025-03-11', 'day': 'Tue', 'slot': SLOTS[0],
+            'action': 'cancel', 'scope': 'this_day', 'created_at': datetime.now(timezone.utc),
+        })
+        assert _week(client, token, semester_id)['week_grid']['Tue'][SLOTS[0]]['status'] == 'normal'
+        assert _week(client, token, semester_id, '2025-03-12')['week_grid']['Tue'][SLOTS[0]]['status'] == 'cancelled'
+
+    def test_add_and_delete_override_invalidate(self, client, timetable):
+        semester_id, token, token2 = timetable
+        assert _week(client, token2, semester_id)['week_grid']['Tue'][SLOTS[0]]['status'] == 'normal'
+
+        override_id = _override(client, token, semester_id)
+        assert _week(client, token2, semester_id)['week_grid']['Tue'][SLOTS[0]]['status'] == 'cancelled'
+
+        resp = client.delete(f'/api/timetable/semester/{semester_id}/override/{override_id}',
+                             headers=auth_header(token))
+        assert resp.status_code == 200
+        assert _week(client, token2, semester_id)['week_grid']['Tue'][SLOTS[0]]['status'] == 'normal'
+
+    def test_save_timetable_invalidates(self, client, timetable):
+        semester_id, token, token2 = timetable
+        _week(client, token2, semester_id)
+        resp = client.post(f'/api/timetable/semester/{semester_id}', json={
+            'days': ['Mon'], 'time_slots': SLOTS,
+            'grid': {'Mon': {SLOTS[0]: _cell('Chemistry'), SLOTS[1]: _cell('', 'Free')}},
+        }, headers=auth_header(token))
+        assert resp.status_code == 200
+        body = _week(client, token2, semester_id)
+        assert body['timetable']['days'] == ['Mon']
+        assert body['week_grid']['Mon'][SLOTS[0]]['subject'] == 'Chemistry'
+
+    def test_save_academic_calendar_invalidates(self, client, timetable):
+        semester_id, token, token2 = timetable
+        assert _week(client, token2, semester_id)['ac_events'] == {}
+        resp = client.post(f'/api/timetable/semester/{semester_id}/academic-calendar', json={
+            'events': [{'date': '2025-03-05', 'type': 'Holiday', 'title': 'Founders Day'}],
+        }, headers=auth_header(token))
+        assert resp.status_code == 200
+        body = _week(client, token2, semester_id)
+        assert body['ac_events']['2025-03-05'][0]['title'] == 'Founders Day'
+        assert body['week_grid']['Wed'][SLOTS[0]]['status'] == 'cancelled'
+
+    def test_personal_skips_stay_per_user(self, client, timetable):
+        semester_id, token, token2 = timetable
+        _week(client, token, semester_id)
+        resp = client.post(f'/api/timetable/semester/{semester_id}/personal-skip', json={
+            'day': 'Mon', 'slot': SLOTS[1], 'date': '2025-03-03',
+        }, headers=auth_header(token2))
+        assert resp.status_code == 201
+        assert [s['slot'] for s in _week(client, token2, semester_id)['personal_skips']] == [SLOTS[1]]
+        assert _week(client, token, semester_id)['personal_skips'] == []
+
+    def test_today_reads_the_cached_week(self, client, timetable, query_counter):
+        semester_id, token, _ = timetable
+        _week(client, token, semester_id, date.today().isoformat())
+        query_counter.reset()
+        resp = client.get(f'/api/timetable/semester/{semester_id}/today', headers=auth_header(token))
+        assert resp.status_code == 200
+        assert 'timetable_overrides' not in query_counter.by_collection
+        body = resp.get_json()
+        if body['day'] in ('Mon', 'Tue', 'Wed'):
+            assert [c['slot'] for c in body['classes']] == SLOTS
+        else:
+            assert body['classes'] == []
+
+
+def test_build_racing_with_invalidate_is_not_stored():
+    week_start = date(2025, 3, 3)
+    builds = []
+
+    def stale_build():
+        builds.append(1)
+        timetable_cache.invalidate('s1')   # a CR edit lands mid-build
+        return {'week_grid': 'old'}
+
+    assert timetable_cache.get_week('s1', week_start, stale_build) == {'week_grid': 'old'}
+    assert timetable_cache.get_week('s1', week_start, lambda: {'week_grid': 'new'}) == {'week_grid': 'new'}
+    assert timetable_cache.get_week('s1', week_start, stale_build) == {'week_grid': 'new'}
+    assert len(builds) == 1
+
+
+class TestAcademicCalendarIndex:
+    def _save(self, client, token, semester_id, events):
+        resp = client.post(f'/api/timetable/semester/{semester_id}/academic-calendar',
+                           json={'events': events}, headers=auth_header(token))
+        assert resp.status_code == 200, resp.get_json()
+
+    def test_index_covers_ranges_and_skips_bad_dates(self):
+        from routes.timetable_routes import _index_calendar_events, _week_ac_events
+        events = [
+            {'date': '2025-03-08', 'end_date': '2025-03-11', 'type': 'Exam', 'title': 'Mids'},
+            {'date': '2025-03-09', 'type': 'Event', 'title': 'Fest'},
+            {'date': 'soon', 'type': 'Other', 'title': 'Bad'},
+            {'date': '2025-03-20', 'end_date': '2025-03-19', 'type': 'Other', 'title': 'Backwards'},
+        ]
+        index = _index_calendar_events(events)
+        assert index['dates'] == ['2025-03-08', '2025-03-09', '2025-03-10', '2025-03-11']
+        assert index['events'][1] == [0, 1]
+
+        week = [f'2025-03-{d:02d}' for d in range(3, 10)]
+        found = _week_ac_events({'events': events, 'event_index': index}, week)
+        assert sorted(found) == ['2025-03-08', '2025-03-09']
+        assert [e['title'] for e in found['2025-03-09']] == ['Mids', 'Fest']
+        # Calendars saved before the index existed give the same answer
+        assert _week_ac_events({'events': events}, week) == found
+
+    def test_holidays_are_one_bulk_insert_of_day_overrides(self, client, db, timetable, query_counter):
+        semester_id, token, token2 = timetable
+        holidays = [{'date': f'2025-{m:02d}-{d:02d}', 'type': 'Holiday', 'title': f'H{m}-{d}'}
+                    for m in (3, 4, 5, 6) for d in range(1, 11)]
+        holidays.append({'date': '2025-07-01', 'end_date': '2025-07-03', 'type': 'Holiday', 'title': 'Break'})
+
+        query_counter.reset()
+        self._save(client, token, semester_id, holidays)
+        assert query_counter.by_collection['timetable_overrides'] == 2
+        assert query_counter.total <= 8
+
+        overrides = list(db.timetable_overrides.find({'semester_id': semester_id}))
+        assert len(overrides) == 43
+        assert {o['slot'] for o in overrides} == {'ALL'}
+
+        self._save(client, token, semester_id, holidays)
+        assert db.timetable_overrides.count_documents({'semester_id': semester_id}) == 43
+
+        body = _week(client, token2, semester_id, '2025-03-05')
+        assert body['day_overrides']['Mon']['reason'] == 'H3-3'
+        assert body['week_grid']['Tue'][SLOTS[1]]['status'] == 'cancelled'
+        assert _week(client, token2, semester_id, '2025-07-01')['day_overrides']['Thu']['reason'] == 'Break'
+
+
+class TestScheduleExpansion:
+    def _schedule(self, client, token, semester_id, start, end):
+        return client.get(f'/api/timetable/semester/{semester_id}/schedule',
+                          query_string={'start': start, 'end': end}, headers=auth_header(token))
+
+    def test_range_matches_week_views(self, client, db, timetable, query_counter):
+        semester_id, token, token2 = timetable
+        _override(client, token, semester_id)                                   # Tue 03-04 only
+        _override(client, token, semester_id, date='2025-03-10', day='Mon', slot=SLOTS[1],
+                  action='edit', scope='all_future', changes={'room': 'Lab 2'})
+        client.post(f'/api/timetable/semester/{semester_id}/academic-calendar', json={
+            'events': [{'date': '2025-03-19', 'type': 'Holiday', 'title': 'Spring Day'}],
+        }, headers=auth_header(token))
+
+        query_counter.reset()
+        resp = self._schedule(client, token2, semester_id, '2025-03-01', '2025-03-23')
+        assert resp.status_code == 200
+        assert query_counter.by_collection['timetable_overrides'] == 1
+        days = {d['date']: d for d in resp.get_json()['days']}
+        assert sorted(days)[0] == '2025-03-01' and len(days) == 23
+
+        for week_of in ('2025-03-05', '2025-03-12', '2025-03-19'):
+            week = _week(client, token2, semester_id, week_of)
+            for i, day in enumerate(('Mon', 'Tue', 'Wed')):
+                d = (date.fromisoformat(week['week_start']).toordinal() + i)
+                expanded = days[date.fromordinal(d).isoformat()]
+                assert expanded['day'] == day
+                assert {c['slot']: c['status'] for c in expanded['classes']} == \
+                    {slot: cell['status'] for slot, cell in week['week_grid'][day].items()}
+        assert days['2025-03-19']['day_override']['reason'] == 'Spring Day'
+        assert days['2025-03-19']['events'][0]['title'] == 'Spring Day'
+        assert days['2025-03-17']['classes'][1]['room'] == 'Lab 2'
+
+    def test_personal_skips_marked(self, client, timetable):
+        semester_id, token, token2 = timetable
+        client.post(f'/api/timetable/semester/{semester_id}/personal-skip', json={
+            'day': 'Mon', 'slot': SLOTS[0], 'date': '2025-03-03',
+        }, headers=auth_header(token2))
+        mine = self._schedule(client, token2, semester_id, '2025-03-03', '2025-03-03').get_json()
+        theirs = self._schedule(client, token, semester_id, '2025-03-03', '2025-03-03').get_json()
+        assert [c['skipped'] for c in mine['days'][0]['classes']] == [True, False]
+        assert [c['skipped'] for c in theirs['days'][0]['classes']] == [False, False]
+
+    def test_rejects_bad_ranges(self, client, timetable):
+        semester_id, token, _ = timetable
+        assert self._schedule(client, token, semester_id, 'x', '2025-03-03').status_code == 400
+        assert self._schedule(client, token, semester_id, '2025-03-05', '2025-03-03').status_code == 400
+        assert self._schedule(client, token, semester_id, '2025-01-01', '2025-12-31').status_code == 400
+
+
+class TestCalendarFeed:
+    def _feed_path(self, client, token):
+        resp = client.get('/api/timetable/feed', headers=auth_header(token))
+        assert resp.status_code == 200
+        return resp.get_json()['path']
+
+    def test_feed_lists_classes_and_supports_conditional_get(self, client, db, timetable):
+        semester_id, token, token2 = timetable
+        today = date.today()
+        db.academic_calendars.insert_one({'semester_id': semester_id, 'events': [
+            {'date': today.isoformat(), 'type': 'Event', 'title': 'Tech Fest'},
+        ]})
+        path = self._feed_path(client, token2)
+        assert self._feed_path(client, token2) == path
+
+        resp = client.get(path)
+        assert resp.status_code == 200
+        assert resp.mimetype == 'text/calendar'
+        body = resp.get_data(as_text=True)
+        assert body.startswith('BEGIN:VCALENDAR\r\n')
+        assert 'SUMMARY:Math — Test Classroom' in body
+        assert 'DTSTART:' in body and 'T090000' in body
+        assert f"DTSTART;VALUE=DATE:{today.strftime('%Y%m%d')}" in body
+        assert 'SUMMARY:Event: Tech Fest' in body
+
+        etag = resp.headers['ETag']
+        assert client.get(path, headers={'If-None-Match': etag}).status_code == 304
+
+        _override(client, token, semester_id, date=today.isoformat(), day='Mon',
+                  action='edit', scope='all_future', changes={'room': 'Annex'})
+        changed = client.get(path, headers={'If-None-Match': etag})
+        assert changed.status_code == 200
+        assert changed.headers['ETag'] != etag
+
+    def test_reset_revokes_old_url(self, client, timetable):
+        _, _, token2 = timetable
+        old = self._feed_path(client, token2)
+        new = client.post('/api/timetable/feed/reset', headers=auth_header(token2)).get_json()['path']
+        assert new != old
+        assert client.get(old).status_code == 404
+        assert client.get(new).status_code == 200
+
+
+class TestIcal:
+    def test_parse_slot(self):
+        from datetime import time
+        from utils.ical import parse_slot
+        assert parse_slot('9:00-10:00') == (time(9), time(10))
+        assert parse_slot('1:30 - 2:30') == (time(13, 30), time(14, 30))
+        assert parse_slot('11:00 AM to 12:30 PM') == (time(11), time(12, 30))
+        assert parse_slot('10.00–11.00 am') == (time(10), time(11))
+        assert parse_slot('Lunch') is None
+        assert parse_slot('10:00-9:00') is None
+
+    def test_escapes_and_folds(self):
+        from datetime import datetime, timezone
+        from utils.ical import render_calendar
+        body = render_calendar('T', [{
+            'uid': 'u1', 'start': date(2025, 3, 3), 'end': date(2025, 3, 4),
+            'summary': 'a, b; c\nd ' + 'x' * 100,
+        }], datetime(2025, 1, 1, tzinfo=timezone.utc))
+        lines = body.split('\r\n')
+        assert all(len(line.encode()) <= 75 for line in lines)
+        assert 'SUMMARY:a\\, b\\; c\\nd' in body
+        assert 'DTSTAMP:20250101T000000Z' in body
+
+
+class TestPatchCell:
+    def _patch(self, client, token, semester_id, day, slot, cell):
+        return client.patch(f'/api/timetable/semester/{semester_id}/cell',
+                            json={'day': day, 'slot': slot, 'cell': cell}, headers=auth_header(token))
+
+    def test_patch_writes_one_cell_and_cascades_it(self, client, db, timetable, query_counter, inline_cascade):
+        semester_id, token, token2 = timetable
+        db.attendance_sessions.insert_many([
+            {'semester_id': semester_id, 'day': 'Tue', 'slot': SLOTS[1], 'status': 'pending', 'subject': 'Physics'},
+            {'semester_id': semester_id, 'day': 'Mon', 'slot': SLOTS[1], 'status': 'pending', 'subject': 'Physics'},
+        ])
+        _week(client, token2, semester_id)
+
+        query_counter.reset()
+        resp = self._patch(client, token, semester_id, 'Tue', SLOTS[1], _cell('Biology', 'Lab'))
+        assert resp.status_code == 200
+        assert resp.get_json()['changed'] is True
+        # two for the request, two for the cascade's lease
+        assert query_counter.by_collection['timetables'] == 4
+        assert query_counter.by_collection['attendance_sessions'] == 1
+        assert len(inline_cascade) == 1
+
+        doc = db.timetables.find_one({'semester_id': semester_id})
+        assert doc['grid']['Tue'][SLOTS[1]]['subject'] == 'Biology'
+        assert doc['grid']['Mon'][SLOTS[1]]['subject'] == 'Physics'
+        sessions = {s['day']: s for s in db.attendance_sessions.find()}
+        assert (sessions['Tue']['subject'], sessions['Tue']['type']) == ('Biology', 'Lab')
+        assert sessions['Mon']['subject'] == 'Physics'
+        assert [s['name'] for s in db.subjects.find({'semester_id': semester_id})] == ['Biology']
+        assert _week(client, token2, semester_id)['week_grid']['Tue'][SLOTS[1]]['subject'] == 'Biology'
+
+    def test_renaming_a_subject_keeps_its_record(self, client, db, timetable):
+        semester_id, token, _ = timetable
+        assert self._patch(client, token, semester_id, 'Wed', SLOTS[0], _cell('Drawing')).status_code == 200
+        subject = db.subjects.find_one({'semester_id': semester_id, 'name': 'Drawing'})
+        db.attendance_records.insert_one({'semester_id': semester_id, 'subject': 'Drawing'})
+
+        assert self._patch(client, token, semester_id, 'Wed', SLOTS[0], _cell('Engineering Drawing')).status_code == 200
+        renamed = db.subjects.find_one({'_id': subject['_id']})
+        assert (renamed['name'], renamed['timetable_name']) == ('Engineering Drawing', 'Engineering Drawing')
+        assert db.subjects.count_documents({'semester_id': semester_id}) == 1
+        assert db.attendance_records.find_one()['subject'] == 'Engineering Drawing'
+
+    def test_dotted_slot_label(self, client, db, registered_user):
+        user, token = registered_user
+        classroom, semester = make_classroom(db, user['_id'])
+        semester_id = str(semester['_id'])
+        client.post(f'/api/timetable/semester/{semester_id}', json={
+            'days': ['Mon'], 'time_slots': ['9.00-10.00'], 'grid': {'Mon': {'9.00-10.00': _cell('Math')}},
+        }, headers=auth_header(token))
+        resp = self._patch(client, token, semester_id, 'Mon', '9.00-10.00', _cell('Art'))
+        assert resp.status_code == 200
+        grid = db.timetables.find_one({'semester_id': semester_id})['grid']
+        assert grid == {'Mon': {'9.00-10.00': {**_cell('Art')}}}
+
+    def test_unchanged_cell_skips_cascade(self, client, timetable, inline_cascade):
+        semester_id, token, _ = timetable
+        resp = self._patch(client, token, semester_id, 'Mon', SLOTS[0], _cell('Math'))
+        assert resp.get_json()['changed'] is False
+        assert inline_cascade == []
+
+    def test_rejects_non_cr_and_unknown_cells(self, client, timetable):
+        semester_id, token, token2 = timetable
+        assert self._patch(client, token2, semester_id, 'Mon', SLOTS[0], _cell('X')).status_code == 403
+        assert self._patch(client, token, semester_id, 'Sun', SLOTS[0], _cell('X')).status_code == 400
+        assert self._patch(client, token, semester_id, 'Mon', '7:00-8:00', _cell('X')).status_code == 400
+        assert self._patch(client, token, semester_id, 'Mon', SLOTS[0], 'Math').status_code == 400
+
+    def test_full_save_dispatches_cascade(self, client, db, timetable, inline_cascade):
+        semester_id, token, _ = timetable
+        resp = client.post(f'/api/timetable/semester/{semester_id}', json={
+            'days': ['Mon'], 'time_slots': SLOTS,
+            'grid': {'Mon': {SLOTS[0]: _cell('Chemistry'), SLOTS[1]: _cell('Physics')}},
+        }, headers=auth_header(token))
+        assert resp.status_code == 200
+        assert len(inline_cascade) == 1
+        assert sorted(s['name'] for s in db.subjects.find()) == ['Chemistry', 'Physics']
+        doc = db.timetables.find_one({'semester_id': semester_id})
+        assert doc['cascaded_grid'] == doc['grid']
+        assert 'cascade_lease' not in doc
+
+    def test_cascade_applies_the_current_grid_whatever_the_task_order(self, client, db, timetable, inline_cascade):
+        from routes import timetable_routes
+        semester_id, token, _ = timetable
+        db.attendance_sessions.insert_one(
+            {'semester_id': semester_id, 'day': 'Mon', 'slot': SLOTS[0], 'status': 'pending', 'subject': 'Math'})
+        queued = []
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(timetable_routes, '_dispatch_timetable_cascade', lambda *args: queued.append(args))
+            self._patch(client, token, semester_id, 'Mon', SLOTS[0], _cell('Art'))
+            self._patch(client, token, semester_id, 'Mon', SLOTS[0], _cell('Music'))
+        assert len(queued) == 2
+
+        # the second save's task runs first, then the first one's, late
+        timetable_routes._run_timetable_cascade(*queued[1])
+        timetable_routes._run_timetable_cascade(*queued[0])
+        assert db.attendance_sessions.find_one()['subject'] == 'Music'
+        assert [s['name'] for s in db.subjects.find()] == ['Music']
+
+    def test_cascade_retries_once_a_held_lease_lapses(self, client, db, timetable, monkeypatch):
+        from datetime import timedelta
+        from routes import timetable_routes
+        semester_id, token, _ = timetable
+        grid = db.timetables.find_one({'semester_id': semester_id})['grid']
+        db.timetables.update_one({'semester_id': semester_id}, {'$set': {
+            'cascaded_grid': grid,
+            'cascade_lease': 'other-worker',
+            'cascade_lease_until': datetime.now(timezone.utc) + timedelta(minutes=5),
+        }})
+        timers = []
+
+        class _Timer:
+            def __init__(self, interval, function, args=()):
+                timers.append((interval, function, args))
+
+            def start(self):
+                pass
+
+        monkeypatch.setattr(timetable_routes.threading, 'Timer', _Timer)
+        self._patch(client, token, semester_id, 'Mon', SLOTS[0], _cell('Art'))
+        assert db.timetables.find_one({'semester_id': semester_id})['cascade_pending'] is True
+        assert db.subjects.count_documents({}) == 0
+        (interval, function, args), = timers
+        assert 290 <= interval <= 302
+
+        # the holder died without releasing; the retry runs after it lapses
+        db.timetables.update_one({'semester_id': semester_id}, {'$set': {
+            'cascade_lease_until': datetime.now(timezone.utc) - timedelta(seconds=1),
+        }})
+        function(*args)
+        assert [s['name'] for s in db.subjects.find()] == ['Art']
+        assert 'cascade_lease' not in db.timetables.find_one({'semester_id': semester_id})
+
+
+class TestExtractionJobs:
+    EXTRACTED = {'days': ['Mon'], 'time_slots': [SLOTS[0]], 'grid': {'Mon': {SLOTS[0]: _cell('Math')}}}
+
+    def _upload(self, client, token, semester_id, data, name='timetable.png'):
+        import io
+        return client.post(f'/api/timetable/semester/{semester_id}/extract',
+                           data={'file': (io.BytesIO(data), name, 'image/png')},
+                           content_type='multipart/form-data', headers=auth_header(token))
+
+    def _image(self, fmt='PNG'):
+        return make_grid_image(fmt=fmt)
+
+    def test_job_then_cached_repeat(self, client, db, timetable, inline_cascade):
+        from unittest.mock import patch
+        semester_id, token, _ = timetable
+        reply = {'success': True, 'data': self.EXTRACTED}
+        with patch('utils.timetable_ml.extract_timetable_from_images', return_value=reply) as extract:
+            resp = self._upload(client, token, semester_id, self._image())
+            assert resp.status_code == 202
+            job_id = resp.get_json()['job_id']
+            assert len(inline_cascade) == 1
+
+            polled = client.get(f'/api/timetable/semester/{semester_id}/extract/{job_id}',
+                                headers=auth_header(token))
+            assert polled.get_json() == {'status': 'done', 'extracted': self.EXTRACTED}
+            assert 'images' not in db.timetable_extractions.find_one()
+
+            again = self._upload(client, token, semester_id, self._image())
+            assert again.status_code == 200
+            assert again.get_json() == {'extracted': self.EXTRACTED, 'cached': True}
+            # a re-saved copy matches on the perceptual hash
+            resaved = self._upload(client, token, semester_id, self._image('JPEG'), 'timetable.jpg')
+            assert resaved.get_json()['cached'] is True
+        assert extract.call_count == 1
+        assert db.timetable_extractions.count_documents({}) == 1
+
+    def test_failed_job_reports_retry(self, client, timetable):
+        from unittest.mock import patch
+        semester_id, token, _ = timetable
+        reply = {'success': False, 'error': 'Could not parse timetable from image. Try a clearer image.'}
+        with patch('utils.timetable_ml.extract_timetable_from_images', return_value=reply):
+            job_id = self._upload(client, token, semester_id, self._image()).get_json()['job_id']
+        polled = client.get(f'/api/timetable/semester/{semester_id}/extract/{job_id}', headers=auth_header(token))
+        assert polled.status_code == 422
+        assert polled.get_json()['retry'] is True
+
+    def test_stale_pending_job_times_out(self, client, db, timetable):
+        semester_id, token, _ = timetable
+        job_id = db.timetable_extractions.insert_one({
+            'semester_id': semester_id, 'status': 'pending',
+            'created_at': datetime(2020, 1, 1, tzinfo=timezone.utc),
+        }).inserted_id
+        polled = client.get(f'/api/timetable/semester/{semester_id}/extract/{job_id}', headers=auth_header(token))
+        assert polled.status_code == 422
+
+    def test_only_cr_can_extract(self, client, timetable, inline_cascade):
+        semester_id, _, token2 = timetable
+        assert self._upload(client, token2, semester_id, self._image()).status_code == 403
+        assert inline_cascade == []
@@ -0,0 +1,176 @@
+"""Tests for routes/upload_routes.py — resumable chunked uploads:
+  POST   /api/uploads                 - init_upload
+  PUT    /api/uploads/<id>            - put_chunk
+  GET    /api/uploads/<id>            - get_upload
+  POST   /api/uploads/<id>/finalize   - finalize_upload
+  DELETE /api/uploads/<id>            - abort_upload
+"""
+import hashlib
+import os
+from unittest.mock import patch
+
+import pytest
+
+from tests.conftest import auth_header
+from tests.helpers import make_classroom, make_subject
+from utils import resumable, storage
+
+CONTENT = bytes(range(256)) * 40   # 10 KiB
+
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setattr(resumable, 'TMP_DIR', str(tmp_path / 'tmp'))
+    return tmp_path
+
+
+@pytest.fixture
+def semester(db, registered_user):
+    user, _ = registered_user
+    _, semester = make_classroom(db, user['_id'])
+    return semester
+
+
+def _init(client, token, **body):
+    body.setdefault('filename', 'lecture.mp4')
+    body.setdefault('size', len(CONTENT))
+    body.setdefault('mime_type', 'video/mp4')
+    return client.post('/api/uploads', json=body, headers=auth_header(token))
+
+
+def _put(client, token, upload_id, start, data, total=len(CONTENT), length=None):
+    end = start + (len(data) if length is None else length) - 1
+    headers = dict(auth_header(token), **{'Content-Range': f'bytes {start}-{end}/{total}'})
+    return client.put(f'/api/uploads/{upload_id}', data=data, headers=headers)
+
+
+def _finalize(client, token, upload_id):
+    return client.post(f'/api/uploads/{upload_id}/finalize', headers=auth_header(token))
+
+
+class TestChunkedUpload:
+    def test_resumes_after_dropped_chunk(self, client, registered_user, semester, db, dirs):
+        _, token = registered_user
+        resp = _init(client, token, kind='chat',
+                     params={'semester_id': str(semester['_id']), 'text': 'week 3'})
+        assert resp.status_code == 201, resp.get_json()
+        upload_id = resp.get_json()['upload_id']
+
+        assert _put(client, token, upload_id, 0, CONTENT[:4096]).get_json()['received'] == 4096
+        # Connection drops partway through the next chunk
+        resp = _put(client, token, upload_id, 4096, CONTENT[4096:6000], length=4096)
+        assert resp.status_code == 400
+        assert client.get(f'/api/uploads/{upload_id}',
+                          headers=auth_header(token)).get_json()['received'] == 4096
+
+        # ...and the rest lands on another worker, without the in-memory hash state
+        resumable._hashers.clear()
+        assert _put(client, token, upload_id, 4096, CONTENT[4096:]).status_code == 200
+
+        resp = _finalize(client, token, upload_id)
+        assert resp.status_code == 201, resp.get_json()
+        msg = resp.get_json()['message']
+        assert msg['text'] == 'week 3'
+        assert msg['file']['size'] == len(CONTENT)
+        assert msg['file']['mime_type'] == 'video/mp4'
+        assert msg['file']['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+        stored = db.chat_messages.find_one()['file']
+        assert 'path' not in stored and 'path' not in msg['file']
+        with open(storage.blob_ref(stored['blob']), 'rb') as f:
+            assert f.read() == CONTENT
+        assert db.upload_sessions.count_documents({}) == 0
+        assert os.listdir(dirs / 'tmp') == []
+
+    def test_chunk_must_start_at_received_offset(self, client, registered_user, semester, dirs):
+        _, token = registered_user
+        upload_id = _init(client, token, kind='chat',
+                          params={'semester_id': str(semester['_id'])}).get_json()['upload_id']
+        _put(client, token, upload_id, 0, CONTENT[:1000])
+        resp = _put(client, token, upload_id, 2000, CONTENT[2000:3000])
+        assert resp.status_code == 409
+        assert resp.get_json()['received'] == 1000
+        assert _put(client, token, upload_id, 0, CONTENT[:10], total=99).status_code == 400
+
+    def test_finalize_requires_every_byte(self, client, registered_user, semester, dirs):
+        _, token = registered_user
+        upload_id = _init(client, token, kind='chat',
+                          params={'semester_id': str(semester['_id'])}).get_json()['upload_id']
+        _put(client, token, upload_id, 0, CONTENT[:1000])
+        resp = _finalize(client, token, upload_id)
+        assert resp.status_code == 409
+        assert resp.get_json()['received'] == 1000
+
+    def test_dangerous_file_rejected_at_finalize(self, client, registered_user, semester, db, dirs):
+        _, token = registered_user
+        data = b'MZ' + CONTENT
+        upload_id = _init(client, token, kind='chat', filename='setup.exe', size=len(data),
+                          params={'semester_id': str(semester['_id'])}).get_json()['upload_id']
+        _put(client, token, upload_id, 0, data, total=len(data))
+        resp = _finalize(client, token, upload_id)
+        assert resp.status_code == 400
+        assert db.chat_messages.count_documents({}) == 0
+        assert db.blobs.count_documents({}) == 0
+        assert os.listdir(dirs / 'tmp') == []
+
+    def test_session_is_private_and_abortable(self, client, registered_user, second_user, semester, db, dirs):
+        _, token = registered_user
+        _, other_token = second_user
+        upload_id = _init(client, token, kind='chat',
+                          params={'semester_id': str(semester['_id'])}).get_json()['upload_id']
+        assert client.get(f'/api/uploads/{upload_id}', headers=auth_header(other_token)).status_code == 404
+        assert _put(client, other_token, upload_id, 0, CONTENT[:10]).status_code == 404
+
+        assert client.delete(f'/api/uploads/{upload_id}', headers=auth_header(token)).status_code == 200
+        assert db.upload_sessions.count_documents({}) == 0
+        assert os.listdir(dirs / 'tmp') == []
+
+
+class TestInit:
+    def test_runs_feature_access_checks(self, client, registered_user, second_user, semester, dirs):
+        _, other_token = second_user
+        resp = _init(client, other_token, kind='chat', params={'semester_id': str(semester['_id'])})
+        assert resp.status_code == 403
+
+    def test_rejects_unknown_kind_and_oversize(self, client, registered_user, semester, dirs):
+        _, token = registered_user
+        assert _init(client, token, kind='nope').status_code == 400
+        resp = _init(client, token, kind='chat', size=51 * 1024 * 1024,
+                     params={'semester_id': str(semester['_id'])})
+        assert resp.status_code == 413
+        assert _init(client, token, kind='ai_pdf', filename='notes.docx').status_code == 400
+
+
+class TestFinalizeHooks:
+    def test_academic_resource(self, client, registered_user, semester, db, dirs):
+        user, token = registered_user
+        subject = make_subject(db, semester['classroom_id'], semester['_id'], user['_id'])
+        upload_id = _init(client, token, kind='academic', filename='pyq-2023.pdf',
+                          mime_type='application/pdf',
+                          params={'semester_id': str(semester['_id']),
+                                  'subject_id': str(subject['_id']),
+                                  'category': 'pyq', 'is_public': False}).get_json()['upload_id']
+        _put(client, token, upload_id, 0, CONTENT)
+        resp = _finalize(client, token, upload_id)
+        assert resp.status_code == 201, resp.get_json()
+        doc = db.academic_resources.find_one()
+        assert doc['category'] == 'pyq'
+        assert doc['is_public'] is False
+        assert doc['sha256'] == hashlib.sha256(CONTENT).hexdigest()
+        assert 'stored' not in doc
+        with open(storage.blob_ref(doc['blob']), 'rb') as f:
+            assert f.read() == CONTENT
+
+    def test_ai_pdf_starts_indexing(self, client, registered_user, db, dirs):
+        import routes.ai_routes as ai_routes
+        _, token = registered_user
+        data = b'%PDF-1.4 ' + CONTENT
+        upload_id = _init(client, token, kind='ai_pdf', filename='notes.pdf',
+                          size=len(data)).get_json()['upload_id']
+        _put(client, token, upload_id, 0, data, total=len(data))
+        with patch.object(ai_routes, '_dispatch_index_pdf') as dispatch:
+            resp = _finalize(client, token, upload_id)
+        assert resp.status_code == 201
+        pdf_id = resp.get_json()['pdf_id']
+        doc = db.ai_user_pdfs.find_one({'pdf_id': pdf_id})
+        dispatch.assert_called_once_with(storage.blob_ref(doc['blob']), pdf_id)
+        assert doc['size'] == len(data)
@@ -0,0 +1,91 @@
+"""Unit tests for utils/user_cache.py"""
+from bson import ObjectId
+
+from utils import user_cache
+
+
+def _counting_find(db):
+    calls = []
+    real_find = db.users.find
+
+    class _Users:
+        def find(self, *args, **kwargs):
+            calls.append(args)
+            return real_find(*args, **kwargs)
+
+    class _Db:
+        users = _Users()
+    return _Db(), calls
+
+
+def test_second_lookup_is_served_from_cache(registered_user, db):
+    user, _ = registered_user
+    uid = str(user['_id'])
+    cdb, calls = _counting_find(db)
+    assert user_cache.get_user(cdb, uid)['username'] == user['username']
+    db.users.update_one({'_id': user['_id']}, {'$set': {'username': 'renamed'}})
+    assert user_cache.get_user(cdb, uid)['username'] == user['username']
+    assert len(calls) == 1
+
+
+def test_invalidate_reloads(registered_user, db):
+    user, _ = registered_user
+    uid = str(user['_id'])
+    user_cache.get_user(db, uid)
+    db.users.update_one({'_id': user['_id']}, {'$set': {'profile_picture': 'p.png'}})
+    user_cache.invalidate(uid)
+    assert user_cache.get_user(db, uid)['profile_picture'] == 'p.png'
+
+
+def test_misses_are_batched(registered_user, second_user, db):
+    user1, _ = registered_user
+    user2, _ = second_user
+    cdb, calls = _counting_find(db)
+    users = user_cache.get_users(cdb, [user1['_id'], str(user2['_id']), str(ObjectId()), 'junk'])
+    assert set(users) == {str(user1['_id']), str(user2['_id'])}
+    assert len(calls) == 1
+    user_cache.get_users(cdb, [user1['_id'], user2['_id']])
+    assert len(calls) == 1
+
+
+def test_invalidation_during_load_is_not_overwritten(registered_user, db):
+    """A load that started before invalidate() must not be served afterwards."""
+    user, _ = registered_user
+    uid = str(user['_id'])
+    real_find = db.users.find
+
+    class _Users:
+        def find(self, *args, **kwargs):
+            docs = list(real_find(*args, **kwargs))   # snapshot read first...
+            db.users.update_one({'_id': user['_id']}, {'$set': {'fullName': 'New'}})
+            user_cache.invalidate(uid)                # ...then the profile edit lands
+            return docs
+
+    class _Db:
+        users = _Users()
+    assert user_cache.get_user(_Db(), uid).get('fullName') != 'New'
+    assert user_cache.get_user(db, uid)['fullName'] == 'New'
+
+
+def test_returns_copies(registered_user, db):
+    user, _ = registered_user
+    user_cache.get_user(db, user['_id'])['username'] = 'mutated'
+    assert user_cache.get_user(db, user['_id'])['username'] == user['username']
+
+
+class TestRouteInvalidation:
+    def test_update_profile_invalidates(self, client, registered_user, db):
+        user, token = registered_user
+        user_cache.get_user(db, user['_id'])
+        resp = client.patch('/api/settings/update-profile', json={'fullName': 'Renamed Person'},
+                            headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 200
+        assert user_cache.get_user(db, user['_id'])['fullName'] == 'Renamed Person'
+
+    def test_privacy_change_invalidates(self, client, registered_user, db):
+        user, token = registered_user
+        user_cache.get_user(db, user['_id'])
+        resp = client.patch('/api/settings/privacy', json={'show_online_status': False},
+                            headers={'Authorization': f'Bearer {token}'})
+        assert resp.status_code == 200
+        assert user_cache.get_user(db, user['_id'])['show_online_status'] is False
@@ -54,3 +54,78 @@ def cas_update_reactions(collection, base_filter, emoji, user_id, max_attempts=5
         if result.matched_count > 0:
             return doc, new_reactions
     raise ConcurrentUpdateError('reactions')
+
+
+def _unique_oids(ids):
+    """Distinct, valid ObjectIds from a mix of str/ObjectId/None, order kept."""
+    from bson import ObjectId
+    seen, out = set(), []
+    for i in ids:
+        if i is None:
+            continue
+        s = str(i)
+        if s in seen or not ObjectId.is_valid(s):
+            continue
+        seen.add(s)
+        out.append(ObjectId(s))
+    return out
+
+
+def resolve_users(db, ids, fields=('fullName', 'username')):
+    """Look up many users in one `$in` query instead of a find_one per row.
+
+    Returns {str(user_id): doc} containing only `fields`; ids that are missing,
+    invalid or None are simply absent from the map. When `fields` is covered
+    by utils.user_cache this goes through the cache, so a warm list page
+    makes no users query at all.
+    """
+    from utils import user_cache
+    oids = _unique_oids(ids)
+    if not oids:
+        return {}
+    if set(fields) <= set(user_cache.FIELDS):
+        return user_cache.get_users(db, oids)
+    projection = {f: 1 for f in fields}
+    return {str(u['_id']): u for u in db.users.find({'_id': {'$in': oids}}, projection)}
+
+
+def resolve_classrooms(db, ids, fields=('name',)):
+    """Classroom counterpart of resolve_users: {str(classroom_id): doc} from
+    one `$in` query."""
+    oids = _unique_oids(ids)
+    if not oids:
+        return {}
+    projection = {f: 1 for f in fields}
+    return {str(c['_id']): c for c in db.classrooms.find({'_id': {'$in': oids}}, projection)}
+
+
+def display_name(user, default=''):
+    """fullName, falling back to username — how every list shows a person."""
+    if not user:
+        return default
+    return user.get('fullName') or user.get('username') or default
+
+
+_transactions_supported = True
+
+
+def run_in_transaction(db, fn):
+    """Run fn(session) inside a multi-document transaction and return its
+    result. Standalone mongod (and mongomock) can't do transactions; there
+    fn(None) runs as plain sequential writes, and after the first refusal we
+    stop asking."""
+    global _transactions_supported
+    from pymongo.errors import OperationFailure
+    if _transactions_supported:
+        try:
+            with db.client.start_session() as session:
+                return session.with_transaction(fn)
+        except NotImplementedError:
+            _transactions_supported = False
+        except OperationFailure as e:
+            # 20 = IllegalOperation: "Transaction numbers are only allowed on
+            # a replica set member or mongos"
+            if e.code != 20:
+                raise
+            _transactions_supported = False
+    return fn(None)
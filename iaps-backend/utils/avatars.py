@@ -0,0 +1,89 @@
+"""
+avatars.py — profile picture files: WebP renditions made once at upload.
+
+Avatars are drawn at 28–36 px in chat bubbles, member lists and the navbar,
+but used to be served as the uploaded original (up to 2 MB) everywhere.
+`save_avatar()` now decodes the upload once and writes square WebP
+thumbnails at each of SIZES plus a 'full' rendition (longest edge FULL_EDGE)
+for the fullscreen viewer; `avatar_path()` picks the smallest rendition that
+covers the size the client asked for.
+
+Files are named `<user_id>_<content hash>_<rendition>.webp` and the user's
+`profile_picture` holds the `<user_id>_<content hash>` stem, so it doubles as
+the cache-busting version in /avatar/<id>?v=… and replacing or removing a
+picture deletes exactly its own files — no directory scan. Pictures stored
+before this (a `profile_picture` with an extension) are served as the single
+file they are.
+
+Usage:
+  name = avatars.save_avatar(user_id, file_stream)     # ValueError if not an image
+  path = avatars.avatar_path(name, size=64)            # or size=None for 'full'
+  avatars.delete_avatar(old_name)
+"""
+import io
+import os
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+AVATARS_DIR = os.path.join(os.getcwd(), 'uploads', 'avatars')
+SIZES = (32, 64, 128)
+FULL_EDGE = 1024
+WEBP_QUALITY = 80
+
+
+def _is_legacy(name):
+    return '.' in name
+
+
+def _file_name(name, rendition):
+    return f'{name}_{rendition}.webp'
+
+
+def save_avatar(user_id, stream):
+    """Write every rendition of the image in `stream` and return the new
+    `profile_picture` stem. Raises ValueError if Pillow can't decode it."""
+    from PIL import Image, ImageOps
+
+    data = stream.read()
+    try:
+        img = Image.open(io.BytesIO(data))
+        img = ImageOps.exif_transpose(img)
+        img = img.convert('RGBA' if img.mode in ('RGBA', 'LA', 'P') else 'RGB')
+    except Exception as e:
+        raise ValueError(f'Unreadable image: {e}')
+
+    name = f'{user_id}_{hashlib.sha256(data).hexdigest()[:16]}'
+    os.makedirs(AVATARS_DIR, exist_ok=True)
+
+    full = img.copy()
+    full.thumbnail((FULL_EDGE, FULL_EDGE), Image.LANCZOS)
+    full.save(os.path.join(AVATARS_DIR, _file_name(name, 'full')), 'WEBP', quality=WEBP_QUALITY)
+    for size in SIZES:
+        # Square crop from the centre — avatars are always drawn as circles
+        thumb = ImageOps.fit(img, (size, size), Image.LANCZOS)
+        thumb.save(os.path.join(AVATARS_DIR, _file_name(name, size)), 'WEBP', quality=WEBP_QUALITY)
+    return name
+
+
+def avatar_path(name, size=None):
+    """Path of the smallest rendition at least `size` px square, or the full
+    one when `size` is None or larger than every thumbnail."""
+    if _is_legacy(name):
+        return os.path.join(AVATARS_DIR, name)
+    rendition = next((s for s in SIZES if size is not None and s >= size), 'full')
+    return os.path.join(AVATARS_DIR, _file_name(name, rendition))
+
+
+def delete_avatar(name):
+    if not name:
+        return
+    files = [name] if _is_legacy(name) else [_file_name(name, r) for r in (*SIZES, 'full')]
+    for f_name in files:
+        try:
+            os.remove(os.path.join(AVATARS_DIR, f_name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Could not delete avatar file {f_name}: {e}")
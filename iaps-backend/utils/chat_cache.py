@@ -0,0 +1,318 @@
+"""
+chat_cache.py — per-semester hot cache of recent chat history.
+
+Opening a semester chat used to mean a Mongo query for the last page of
+messages, a users lookup for sender pictures, and an AES decrypt plus
+`_serialize_message` for every row — on every open, by every member. Almost
+all of those loads ask for the same tail of the same room, so this module
+keeps a bounded ring buffer of the last CHAT_HOT_CACHE_SIZE messages per
+semester, already serialized, and chat_routes serves the first page straight
+from it. Scroll-back (`before_id`) still goes to the database.
+
+Storage is in-process by default. With REDIS_URL set the buffers live in
+Redis instead, so every instance serves (and patches) the same copy — same
+opt-in as utils/presence.py.
+
+Each entry is `{'m': <serialized message>, 'h': [user ids it's hidden for]}`
+so "delete for me" can be applied per reader without a separate buffer.
+
+A room only exists in the cache once a full read from the database has been
+stored with `fill()`. Writes to a room that isn't cached are ignored — the
+next read repopulates it from Mongo, which already has them. To stop a slow
+`fill()` from storing a snapshot that's older than a write that landed while
+it was reading, callers take a token with `begin_fill()` first; any mutation
+in between marks the room dirty and the fill is discarded.
+
+Usage (chat_routes):
+  page = chat_cache.page(semester_id, user_id, limit)   # None → miss
+  token = chat_cache.begin_fill(semester_id)
+  ...read + serialize from Mongo...
+  chat_cache.fill(semester_id, entries, complete, token)
+  chat_cache.append(semester_id, payload)               # new_message
+  chat_cache.replace(semester_id, payload)              # edit / react / poll / list
+  chat_cache.hide(semester_id, message_id, user_id)     # delete for me
+  chat_cache.remove(semester_id, message_id)            # hard delete
+"""
+import os
+import json
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+HOT_SIZE = int(os.environ.get('CHAT_HOT_CACHE_SIZE', '200'))
+MAX_ROOMS = int(os.environ.get('CHAT_HOT_CACHE_ROOMS', '500'))
+REDIS_TTL_SECONDS = 24 * 3600
+FILL_TTL_SECONDS = 30
+
+_redis_client = None
+_redis_checked = False
+
+
+def _get_redis():
+    global _redis_client, _redis_checked
+    if not _redis_checked:
+        _redis_checked = True
+        redis_url = os.environ.get('REDIS_URL', '').strip()
+        if redis_url:
+            import redis
+            _redis_client = redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+
+def visible_page(entries, user_id, limit, complete):
+    """Last `limit` messages this user can see, or None if the buffer doesn't
+    hold enough of them to answer without the database."""
+    visible = [e['m'] for e in entries if user_id not in e.get('h', ())]
+    if len(visible) >= limit:
+        return visible[-limit:]
+    if complete:
+        return visible
+    return None
+
+
+# ─── In-process backend ──────────────────────────────────────────────────────
+
+class _Room:
+    __slots__ = ('entries', 'complete', 'token', 'dirty')
+
+    def __init__(self, token):
+        self.entries = []
+        self.complete = False
+        self.token = token      # set while a fill is in flight, None once ready
+        self.dirty = False
+
+
+_rooms = OrderedDict()  # semester_id → _Room, LRU-bounded at MAX_ROOMS
+_lock = threading.Lock()
+
+
+def _local_mutate(semester_id, fn):
+    with _lock:
+        room = _rooms.get(semester_id)
+        if room is None:
+            return
+        if room.token is not None:
+            room.dirty = True
+            return
+        room.entries = fn(room.entries)
+        room.complete = room.complete and len(room.entries) <= HOT_SIZE
+        room.entries = room.entries[-HOT_SIZE:]
+
+
+# ─── Redis backend ───────────────────────────────────────────────────────────
+
+def _list_key(semester_id):
+    return f'chat:hot:{semester_id}'
+
+
+def _state_key(semester_id):
+    return f'chat:hot:{semester_id}:state'
+
+
+def _redis_mutate(r, semester_id, fn):
+    """Apply fn to the room's entries inside a WATCH transaction so a
+    concurrent append/trim can't shift the list under us."""
+    import redis
+    lkey, skey = _list_key(semester_id), _state_key(semester_id)
+
+    def _txn(pipe):
+        state = pipe.get(skey)
+        if state is None:
+            pipe.multi()
+            return
+        if state.startswith('w:'):
+            pipe.multi()
+            pipe.set(skey, 'dirty', ex=FILL_TTL_SECONDS)
+            return
+        if state == 'dirty':
+            pipe.multi()
+            return
+        entries = [json.loads(raw) for raw in pipe.lrange(lkey, 0, -1)]
+        new_entries = fn(list(entries))
+        complete = state == 'complete' and len(new_entries) <= HOT_SIZE
+        new_entries = new_entries[-HOT_SIZE:]
+        pipe.multi()
+        pipe.delete(lkey)
+        if new_entries:
+            pipe.rpush(lkey, *[json.dumps(e) for e in new_entries])
+            pipe.expire(lkey, REDIS_TTL_SECONDS)
+        pipe.set(skey, 'complete' if complete else 'partial', ex=REDIS_TTL_SECONDS)
+
+    try:
+        r.transaction(_txn, lkey, skey)
+    except redis.RedisError as e:
+        # Can't tell what state the buffer is in now — drop it and let the
+        # next read rebuild it from Mongo.
+        logger.warning(f"chat_cache mutate failed for {semester_id}: {e}")
+        invalidate(semester_id)
+
+
+# ─── Public API ──────────────────────────────────────────────────────────────
+
+def page(semester_id, user_id, limit):
+    """Return the newest `limit` serialized messages visible to user_id
+    (oldest first), or None on a cache miss."""
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            room = _rooms.get(semester_id)
+            if room is None or room.token is not None:
+                return None
+            _rooms.move_to_end(semester_id)
+            return visible_page(room.entries, user_id, limit, room.complete)
+    try:
+        pipe = r.pipeline(transaction=False)
+        pipe.get(_state_key(semester_id))
+        pipe.lrange(_list_key(semester_id), 0, -1)
+        state, raw = pipe.execute()
+    except Exception as e:
+        logger.warning(f"chat_cache.page failed: {e}")
+        return None
+    if state not in ('complete', 'partial'):
+        return None
+    return visible_page([json.loads(x) for x in raw], user_id, limit, state == 'complete')
+
+
+def begin_fill(semester_id):
+    """Mark the room as being filled and return a token for fill(), or None if
+    the room is already cached (the miss was a reader with too many hidden
+    messages, not a cold room — nothing to refill)."""
+    token = uuid.uuid4().hex
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            room = _rooms.get(semester_id)
+            if room is not None and room.token is None:
+                return None
+            _rooms[semester_id] = _Room(token)
+            _rooms.move_to_end(semester_id)
+            while len(_rooms) > MAX_ROOMS:
+                _rooms.popitem(last=False)
+        return token
+    try:
+        skey = _state_key(semester_id)
+        if r.get(skey) in ('complete', 'partial'):
+            return None
+        r.set(skey, f'w:{token}', ex=FILL_TTL_SECONDS)
+    except Exception as e:
+        logger.warning(f"chat_cache.begin_fill failed: {e}")
+        return None
+    return token
+
+
+def fill(semester_id, entries, complete, token):
+    """Store a freshly-read buffer (oldest first). Discarded — returns False —
+    if the room was written to since begin_fill() handed out `token`."""
+    if token is None:
+        return False
+    entries = entries[-HOT_SIZE:]
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            room = _rooms.get(semester_id)
+            if room is None or room.token != token or room.dirty:
+                if room is not None and room.token == token:
+                    del _rooms[semester_id]
+                return False
+            room.entries = list(entries)
+            room.complete = complete
+            room.token = None
+            return True
+    import redis
+    lkey, skey = _list_key(semester_id), _state_key(semester_id)
+    stored = []
+
+    def _txn(pipe):
+        if pipe.get(skey) != f'w:{token}':
+            pipe.multi()
+            return
+        pipe.multi()
+        pipe.delete(lkey)
+        if entries:
+            pipe.rpush(lkey, *[json.dumps(e) for e in entries])
+            pipe.expire(lkey, REDIS_TTL_SECONDS)
+        pipe.set(skey, 'complete' if complete else 'partial', ex=REDIS_TTL_SECONDS)
+        stored.append(True)
+
+    try:
+        r.transaction(_txn, skey)
+    except redis.RedisError as e:
+        logger.warning(f"chat_cache.fill failed: {e}")
+        return False
+    return bool(stored)
+
+
+def append(semester_id, payload, hidden_for=()):
+    """Add a new message at the tail. A message the buffer already holds
+    (a fill raced the send) is replaced in place instead of duplicated."""
+    entry = {'m': dict(payload), 'h': list(hidden_for)}
+
+    def _append(entries):
+        for i, e in enumerate(entries):
+            if e['m'].get('id') == payload.get('id'):
+                entries[i] = entry
+                return entries
+        entries.append(entry)
+        return entries
+    _mutate(semester_id, _append)
+
+
+def replace(semester_id, payload):
+    """Swap in a re-serialized message (edit, reaction, poll vote, list entry,
+    tombstone). No-op if the message has already scrolled out of the buffer."""
+    def _replace(entries):
+        for e in entries:
+            if e['m'].get('id') == payload.get('id'):
+                e['m'] = dict(payload)
+        return entries
+    _mutate(semester_id, _replace)
+
+
+def hide(semester_id, message_id, user_id):
+    """Apply a "delete for me" to the cached copy."""
+    def _hide(entries):
+        for e in entries:
+            if e['m'].get('id') == message_id and user_id not in e['h']:
+                e['h'] = e['h'] + [user_id]
+        return entries
+    _mutate(semester_id, _hide)
+
+
+def remove(semester_id, message_id):
+    _mutate(semester_id, lambda entries: [e for e in entries if e['m'].get('id') != message_id])
+
+
+def invalidate(semester_id):
+    """Drop a room's buffer outright — for changes that touch many messages at
+    once (e.g. a sender's profile picture)."""
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            _rooms.pop(semester_id, None)
+        return
+    try:
+        # A fill in flight must not resurrect the old contents, so leave a
+        # dirty marker rather than just deleting the state key.
+        pipe = r.pipeline()
+        pipe.delete(_list_key(semester_id))
+        pipe.set(_state_key(semester_id), 'dirty', ex=FILL_TTL_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"chat_cache.invalidate failed: {e}")
+
+
+def clear():
+    """Forget every in-process room (tests)."""
+    with _lock:
+        _rooms.clear()
+
+
+def _mutate(semester_id, fn):
+    r = _get_redis()
+    if r is None:
+        _local_mutate(semester_id, fn)
+    else:
+        _redis_mutate(r, semester_id, fn)
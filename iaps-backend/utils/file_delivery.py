@@ -0,0 +1,157 @@
+"""
+file_delivery.py — signed, expiring file URLs and proxy-offloaded delivery.
+
+The file endpoints used to authenticate with the user's 7-day JWT in a
+`?token=` query string and then stream every byte through a gthread worker,
+so one 50 MB chat video held a web thread for the whole download.
+
+Signed URLs: each file route has a token_required `.../url` endpoint that runs
+the full access check and returns a link carrying `uid`, `exp` and an HMAC
+of (kind, object id, uid, exp) — the same idea as
+settings_routes.get_avatar_token, without the JWT. The file route accepts
+that signature in place of the JWT and skips the membership queries it
+stands for; checks on the file's own record (deleted, owner, visibility)
+still run. `exp` is rounded up to the next URL_TTL_SECONDS boundary so the
+URL stays identical across re-signs within a window and the browser's cache
+(see utils/http_cache.py) keeps working; a link therefore lives between one
+and two TTLs. The `?token=` path is kept for old clients.
+
+Delivery (`deliver()`), first match wins:
+  - an 's3://' ref (utils/storage.py) → 302 to a presigned bucket URL, or
+    with S3_PROXY_DOWNLOADS=True a ranged get_object relayed as it streams
+  - FILE_ACCEL_REDIRECT_PREFIX set (nginx) → empty response with
+    X-Accel-Redirect pointing at an `internal` location that maps to uploads/;
+    nginx does the streaming, Range and conditional handling
+  - USE_X_SENDFILE=True (Apache/lighttpd) → send_file sets X-Sendfile
+  - otherwise http_cache.send_cached streams it from Python
+
+nginx example for FILE_ACCEL_REDIRECT_PREFIX=/_protected/:
+  location /_protected/ { internal; alias /app/iaps-backend/uploads/; }
+
+Usage:
+  url = file_delivery.sign_path(f'/api/chat/file/{id}', 'chat', id, user_id)
+  user_id = file_delivery.signed_user('chat', id)   # None → fall back to ?token=
+  return file_delivery.deliver(path, etag=..., mimetype=..., download_name=...)
+"""
+import os
+import hmac
+import math
+import time
+import hashlib
+from urllib.parse import quote, urlencode
+
+from flask import current_app, redirect, request
+
+from middleware import SECRET_KEY
+from utils import http_cache, storage
+
+URL_TTL_SECONDS = int(os.environ.get('FILE_URL_TTL_SECONDS', '600'))
+ACCEL_REDIRECT_PREFIX = os.environ.get('FILE_ACCEL_REDIRECT_PREFIX', '').strip()
+UPLOADS_ROOT = os.path.join(os.getcwd(), 'uploads')
+# Stream S3 files through this app instead of redirecting to a presigned URL —
+# for buckets the browser can't reach (a private MinIO, an internal endpoint)
+S3_PROXY_DOWNLOADS = os.environ.get('S3_PROXY_DOWNLOADS', 'False') == 'True'
+_STREAM_CHUNK = 256 * 1024
+
+
+class InvalidSignature(Exception):
+    """The request carried a file signature that is wrong or expired."""
+
+
+def _mac(kind, object_id, user_id, exp):
+    msg = f'{kind}:{object_id}:{user_id}:{exp}'.encode()
+    return hmac.new(SECRET_KEY.encode(), msg, hashlib.sha256).hexdigest()
+
+
+def sign_path(path, kind, object_id, user_id):
+    """`path` with a signature granting `user_id` access to `kind`/`object_id`.
+    Only call after the caller's access has been checked."""
+    exp = math.ceil((time.time() + URL_TTL_SECONDS) / URL_TTL_SECONDS) * URL_TTL_SECONDS
+    query = urlencode({'uid': user_id, 'exp': exp, 'sig': _mac(kind, object_id, user_id, exp)})
+    return f'{path}?{query}'
+
+
+def signed_user(kind, object_id):
+    """The user a valid signature on the current request was issued to, or
+    None when the request isn't signed. Raises InvalidSignature for a bad or
+    expired one."""
+    sig = request.args.get('sig')
+    if not sig:
+        return None
+    user_id = request.args.get('uid', '')
+    try:
+        exp = int(request.args.get('exp', ''))
+    except ValueError:
+        raise InvalidSignature('Invalid signature')
+    if not hmac.compare_digest(sig, _mac(kind, object_id, user_id, exp)):
+        raise InvalidSignature('Invalid signature')
+    if exp < time.time():
+        raise InvalidSignature('Link expired')
+    return user_id
+
+
+def deliver(path, etag=None, mimetype=None, download_name=None, cache_control=http_cache.PRIVATE):
+    """Hand the file at `path` (a local path or storage ref) to whichever of
+    S3, the front proxy or Python should send it."""
+    if path.startswith('s3://'):
+        if S3_PROXY_DOWNLOADS:
+            return _stream_s3(path, etag, mimetype, download_name, cache_control)
+        resp = redirect(storage.presigned_url(path, download_name, mimetype))
+        resp.headers['Cache-Control'] = 'private, no-store'
+        return resp
+
+    abs_path = os.path.abspath(path)
+    if ACCEL_REDIRECT_PREFIX and abs_path.startswith(UPLOADS_ROOT + os.sep):
+        rel = os.path.relpath(abs_path, UPLOADS_ROOT).replace(os.sep, '/')
+        resp = current_app.response_class(mimetype=mimetype or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + quote(rel)
+        if download_name:
+            resp.headers['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(download_name)}"
+        if etag:
+            resp.set_etag(etag)
+        resp.headers['Cache-Control'] = cache_control
+        return resp
+
+    return http_cache.send_cached(abs_path, etag=etag, cache_control=cache_control, mimetype=mimetype,
+                                  as_attachment=False, download_name=download_name)
+
+
+def _stream_s3(ref, etag, mimetype, download_name, cache_control):
+    """Relay an S3 object to the client as it arrives, passing the request's
+    Range through to get_object so seeking a video fetches only that part."""
+    range_header = request.headers.get('Range')
+    # If-Range names the copy the client holds; a different one gets it whole
+    if range_header and request.headers.get('If-Range') and request.if_range.etag != etag:
+        range_header = None
+    try:
+        obj = storage.get_range(ref, range_header)
+    except Exception as e:
+        if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'InvalidRange':
+            raise
+        resp = current_app.response_class(status=416)
+        resp.headers['Accept-Ranges'] = 'bytes'
+        return resp
+
+    body = obj['Body']
+
+    def generate():
+        try:
+            yield from body.iter_chunks(_STREAM_CHUNK)
+        finally:
+            body.close()
+
+    resp = current_app.response_class(
+        generate(), status=206 if obj.get('ContentRange') else 200,
+        mimetype=mimetype or obj.get('ContentType') or 'application/octet-stream',
+        direct_passthrough=True,
+    )
+    resp.headers['Content-Length'] = str(obj['ContentLength'])
+    if obj.get('ContentRange'):
+        resp.headers['Content-Range'] = obj['ContentRange']
+    resp.headers['Accept-Ranges'] = 'bytes'
+    if download_name:
+        resp.headers['Content-Disposition'] = f"inline; filename*=UTF-8''{quote(download_name)}"
+    if etag:
+        resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    return resp
@@ -0,0 +1,69 @@
+"""
+http_cache.py — conditional GET / Range / Cache-Control for served uploads.
+
+The file routes (chat/DM attachments, academic resources, analytics files,
+documents, avatars) are hit again every time the browser redraws an <img>,
+re-opens a PDF or seeks in a <video>. Each hit decodes a JWT and runs one or
+more membership queries before send_file even opens the file.
+
+Uploads record a SHA-256 of their content (`hash_file`) next to the file's
+metadata; that hash is the ETag. With it a route can answer a revalidation
+with `not_modified()` as soon as it has read the file's own record — before
+the membership queries — since a 304 carries no body and only tells the
+client that the copy it already holds is still current. Checks that live on
+the record itself (deleted message, DM participants, visibility) still run
+first. Records from before the hash was stored fall back to send_file's own
+mtime/size ETag, after the full checks.
+
+`send_cached()` wraps send_file with conditional responses on (so Range
+requests get a 206 and <video>/<audio> seeking works) and replaces its
+`public` Cache-Control, which let shared proxies keep copies of files that
+sit behind a token.
+
+Usage:
+  info['sha256'] = http_cache.hash_file(path)          # at upload
+  cached = http_cache.not_modified(info.get('sha256'))  # after the record checks
+  if cached:
+      return cached
+  return http_cache.send_cached(path, etag=info.get('sha256'), mimetype=...)
+"""
+import hashlib
+
+from flask import current_app, request, send_file
+
+# Behind a token: the browser may keep it but must revalidate each use.
+PRIVATE = 'private, no-cache'
+# Public, but the URL doesn't change when the content does.
+PUBLIC_REVALIDATE = 'public, no-cache'
+# Content-addressed URL: the bytes behind it never change.
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+_CHUNK = 1024 * 1024
+
+
+def hash_file(path):
+    """Hex SHA-256 of a file's content, read in 1 MiB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def not_modified(etag, cache_control=PRIVATE):
+    """A 304 response if the request's If-None-Match already holds `etag`,
+    else None. Call only once the file's own record has been checked."""
+    if not etag or not request.if_none_match.contains_weak(etag):
+        return None
+    resp = current_app.response_class(status=304)
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    return resp
+
+
+def send_cached(path, etag=None, cache_control=PRIVATE, **kwargs):
+    """send_file with If-None-Match / If-Modified-Since / Range handling and
+    the given Cache-Control. `etag` is the stored content hash, if any."""
+    resp = send_file(path, conditional=True, etag=etag or True, **kwargs)
+    resp.headers['Cache-Control'] = cache_control
+    return resp
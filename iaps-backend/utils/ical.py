@@ -0,0 +1,126 @@
+"""
+ical.py — minimal RFC 5545 (iCalendar) writer for the timetable feed.
+
+No external dependencies. Only what the feed needs: VEVENTs with either
+timed (floating local time — the timetable has no timezone, so calendar
+apps show classes at the wall-clock time printed on the grid) or all-day
+dates, text escaping and 75-octet line folding.
+
+Usage:
+  start, end = ical.parse_slot('9:00-10:00')          # (time, time) or None
+  body = ical.render_calendar('IAPS timetable', events, stamp)
+"""
+import re
+from datetime import datetime, date, time
+
+# '9:00-10:00', '09.00 – 10.00', '9:00 AM - 10:00 AM', '2:00pm to 3:30pm'
+_SLOT_RE = re.compile(
+    r'(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?\s*(?:-|–|—|to)\s*'
+    r'(\d{1,2})(?:[:.](\d{2}))?\s*([ap]\.?m\.?)?',
+    re.IGNORECASE,
+)
+
+# Without am/pm, an hour this small is read as afternoon — college timetables
+# write "1:00-2:00" for the slot after lunch.
+_AFTERNOON_BEFORE = 8
+
+
+def _to_time(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute or 0)
+    if meridiem:
+        pm = meridiem.lower().startswith('p')
+        hour = hour % 12 + (12 if pm else 0)
+    elif hour < _AFTERNOON_BEFORE:
+        hour += 12
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError
+    return time(hour, minute)
+
+
+def parse_slot(slot):
+    """(start, end) times for a time-slot label, or None if it can't be read."""
+    m = _SLOT_RE.search(slot or '')
+    if not m:
+        return None
+    h1, m1, ap1, h2, m2, ap2 = m.groups()
+    try:
+        # "10:00-11:00 AM": the trailing meridiem covers both ends
+        start = _to_time(h1, m1, ap1 or ap2)
+        end = _to_time(h2, m2, ap2 or ap1)
+    except ValueError:
+        return None
+    if end <= start:
+        return None
+    return start, end
+
+
+def escape(text):
+    return (str(text or '').replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _fold(line):
+    """Split a content line into 75-octet chunks (RFC 5545 §3.1)."""
+    raw = line.encode('utf-8')
+    if len(raw) <= 75:
+        return line
+    parts, chunk = [], b''
+    for ch in line:
+        b = ch.encode('utf-8')
+        if len(chunk) + len(b) > (75 if not parts else 74):
+            parts.append(chunk.decode('utf-8'))
+            chunk = b''
+        chunk += b
+    parts.append(chunk.decode('utf-8'))
+    return '\r\n '.join(parts)
+
+
+def _value(v):
+    if isinstance(v, datetime):
+        return v.strftime('%Y%m%dT%H%M%S')
+    if isinstance(v, date):
+        return v.strftime('%Y%m%d')
+    return v
+
+
+def _dt_line(name, v):
+    if isinstance(v, datetime):
+        return f'{name}:{_value(v)}'
+    return f'{name};VALUE=DATE:{_value(v)}'
+
+
+def render_calendar(name, events, stamp):
+    """
+    The .ics body for `events`, each a dict with uid, start, end (datetimes
+    for timed events, dates for all-day ones), summary, and optionally
+    location, description and status ('CANCELLED' / 'CONFIRMED').
+    `stamp` (a UTC datetime) is used as every DTSTAMP so the body — and so
+    its ETag — only changes when the schedule does.
+    """
+    stamp_value = stamp.strftime('%Y%m%dT%H%M%SZ')
+    lines = [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//IAPS//Timetable//EN',
+        'CALSCALE:GREGORIAN',
+        'METHOD:PUBLISH',
+        f'X-WR-CALNAME:{escape(name)}',
+    ]
+    for ev in events:
+        lines += [
+            'BEGIN:VEVENT',
+            f"UID:{ev['uid']}",
+            f'DTSTAMP:{stamp_value}',
+            _dt_line('DTSTART', ev['start']),
+            _dt_line('DTEND', ev['end']),
+            f"SUMMARY:{escape(ev['summary'])}",
+        ]
+        if ev.get('location'):
+            lines.append(f"LOCATION:{escape(ev['location'])}")
+        if ev.get('description'):
+            lines.append(f"DESCRIPTION:{escape(ev['description'])}")
+        if ev.get('status'):
+            lines.append(f"STATUS:{ev['status']}")
+        lines.append('END:VEVENT')
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
@@ -0,0 +1,104 @@
+"""
+ingest.py — one pass over an upload: size limit, MIME sniff, SHA-256, write.
+
+Upload routes used to seek to the end of the file for its size, read its head
+for `mime_check.is_dangerous`, `save()` it, then open it again to hash it
+(http_cache.hash_file) — or copy it and `getsize` the copy. `save()` here
+reads the source once in CHUNK_SIZE blocks and does all four as it goes:
+
+  - stops as soon as more than `max_size` bytes have come through
+    (TooLarge), without reading the rest
+  - sniffs the first bytes with utils/mime_check and refuses executables and
+    scripts (DisallowedType) unless `allow_dangerous`
+  - hashes and writes each block through storage.open_write: to
+    `<dest>.part`, renamed onto `dest` only once the whole file is in, or —
+    for an 's3://' dest (storage.incoming_path() with S3 configured) —
+    straight to the bucket as multipart upload parts. Either way a rejected
+    or failed upload leaves nothing
+
+`body_too_large()` is the check before that. It parses the multipart body
+itself, from an input stream capped at the route's limit, instead of leaving
+it to `request.files` (which reads and spools the whole body, however big,
+since no app-wide MAX_CONTENT_LENGTH is set). A Content-Length over the
+limit is refused before anything is read; a chunked or unknown-length body
+is cut off as soon as it passes the limit.
+
+Usage:
+  if ingest.body_too_large(MAX_FILE_SIZE):
+      return jsonify({'error': 'File too large (max 50 MB)'}), 413
+  try:
+      saved = ingest.save(request.files['file'], path, max_size=MAX_FILE_SIZE)
+  except ingest.TooLarge: ...
+  except ingest.DisallowedType: ...
+  saved.size, saved.sha256, saved.mime
+"""
+import hashlib
+from collections import namedtuple
+
+from flask import request
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.wsgi import get_input_stream
+
+from utils import mime_check, storage
+
+CHUNK_SIZE = 1024 * 1024
+# Multipart boundaries, part headers and the small text fields sent with a file
+MULTIPART_OVERHEAD = 64 * 1024
+
+Ingested = namedtuple('Ingested', 'size sha256 mime')
+
+
+class TooLarge(Exception):
+    """The upload is bigger than the route allows."""
+
+
+class DisallowedType(Exception):
+    """The upload has an executable or script signature."""
+
+
+def body_too_large(max_size):
+    """True when the current request's body can't hold a file within `max_size`.
+    Otherwise the body has been parsed, within that limit, into request.form
+    and request.files."""
+    limit = max_size + MULTIPART_OVERHEAD
+    if (request.content_length or 0) > limit:
+        return True
+    if 'form' in request.__dict__:   # already parsed
+        return False
+    parser = request.make_form_data_parser()
+    try:
+        parsed = parser.parse(get_input_stream(request.environ, max_content_length=limit),
+                              request.mimetype, request.content_length, request.mimetype_params)
+    except RequestEntityTooLarge:
+        return True
+    # Where Request._load_form_data would have put them
+    request.__dict__['stream'], request.__dict__['form'], request.__dict__['files'] = parsed
+    return False
+
+
+def save(source, dest, max_size=None, allow_dangerous=False):
+    """Copy the file-like `source` to `dest` (a local path or 's3://' ref) in
+    one pass and return its Ingested(size, sha256, mime). `mime` is the
+    sniffed type, or None."""
+    digest = hashlib.sha256()
+    size = 0
+    head = b''
+    mime = None
+    with storage.open_write(dest) as out:
+        for block in iter(lambda: source.read(CHUNK_SIZE), b''):
+            if len(head) < mime_check.HEADER_SIZE:
+                head += block[:mime_check.HEADER_SIZE - len(head)]
+                mime = _check_type(head, allow_dangerous)
+            size += len(block)
+            if max_size is not None and size > max_size:
+                raise TooLarge(f'Upload exceeds {max_size} bytes')
+            digest.update(block)
+            out.write(block)
+    return Ingested(size, digest.hexdigest(), mime)
+
+
+def _check_type(head, allow_dangerous):
+    mime = mime_check.sniff(head)
+    if mime in mime_check.DANGEROUS and not allow_dangerous:
+        raise DisallowedType(mime)
+    return mime
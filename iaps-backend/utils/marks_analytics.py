@@ -0,0 +1,231 @@
+"""
+marks_analytics.py — whole-class marks analytics over NumPy arrays.
+
+marks_stats keeps running totals that answer "what's the class average"
+cheaply. Anything that needs every student at once — where one student
+stands, how hard each exam was, what a student still needs — used to mean
+looping `_compute_weighted_score` over every `subject_marks` document and
+re-parsing floats out of dicts each time. This module parses a subject's
+marks once into students × exams arrays and computes everything for the
+whole class in vectorized passes.
+
+Columns are the CR's exam structure first, then any exam a student entered
+that isn't in it, so `scores()` agrees with marks_stats.weighted_score for
+every student (each student's own max marks and weightage are kept per cell).
+
+Usage:
+  cm = marks_analytics.ClassMarks.load(structure_exams, marks_docs)
+  cm.scores()                      # (students,) weighted scores, NaN if none
+  cm.standing()                    # percentile rank + z-score per student
+  cm.exam_difficulty()             # per structure exam
+  cm.what_if(target)               # % needed in remaining exams per student
+
+`python -m benchmarks.marks_benchmark` compares this with the per-document loop.
+"""
+import numpy as np
+
+from utils.marks_stats import exam_key
+
+CLASS_PERCENTILES = (10, 25, 50, 75, 90)
+
+# Minimum weighted score for each letter grade, used when what-if is asked for
+# a grade rather than a numeric target. Grades are free text in subject_marks,
+# so this is only the default ladder — `target=` takes any score directly.
+GRADE_CUTOFFS = {
+    'AA': 90.0, 'AB': 80.0, 'BB': 70.0, 'BC': 60.0,
+    'CC': 50.0, 'CD': 45.0, 'DD': 40.0,
+}
+
+
+def _round(values):
+    """NaN-aware 2-dp rounding to plain Python floats/None for JSON."""
+    return [None if np.isnan(v) else round(float(v), 2) for v in values]
+
+
+class ClassMarks:
+    """One subject's marks as aligned arrays.
+
+    obtained / max_marks / weights are (students × exams); a NaN in
+    `obtained` means the student has no entry for that exam.
+    """
+
+    def __init__(self, user_ids, exam_names, structure_weights, obtained, max_marks, weights):
+        self.user_ids = user_ids
+        self.exam_names = exam_names
+        self.structure_weights = structure_weights   # (structure exams,)
+        self.obtained = obtained
+        self.max_marks = max_marks
+        self.weights = weights
+        self._scores = None
+
+    @classmethod
+    def load(cls, structure_exams, marks_docs):
+        structure_exams = structure_exams or []
+        keys = [exam_key(e.get('name')) for e in structure_exams]
+        names = [e.get('name', '') for e in structure_exams]
+        col = {k: i for i, k in enumerate(keys)}
+
+        # One pass over the documents collects flat (row, col, value) lists;
+        # NumPy then scatters them into the matrices in one assignment each.
+        # A student who enters the same exam name twice gets a second column
+        # so nothing is double-counted or lost.
+        user_ids, rows, cols, obtained, max_marks, weights = [], [], [], [], [], []
+        for i, doc in enumerate(marks_docs):
+            user_ids.append(str(doc.get('user_id', '')))
+            seen = {}
+            for e in doc.get('entries', []):
+                key = exam_key(e.get('name'))
+                n = seen.get(key, 0)
+                seen[key] = n + 1
+                slot = key if n == 0 else f'{key}#{n + 1}'
+                j = col.get(slot)
+                if j is None:
+                    j = col[slot] = len(names)
+                    names.append(e.get('name', ''))
+                rows.append(i)
+                cols.append(j)
+                obtained.append(float(e.get('marks_obtained', 0) or 0))
+                max_marks.append(float(e.get('max_marks', 0) or 0))
+                weights.append(float(e.get('weightage', 0) or 0))
+
+        shape = (len(user_ids), len(names))
+        matrices = (np.full(shape, np.nan), np.zeros(shape), np.zeros(shape))
+        for matrix, values in zip(matrices, (obtained, max_marks, weights)):
+            matrix[rows, cols] = values
+        structure_weights = np.array([float(e.get('weightage', 0) or 0) for e in structure_exams])
+        return cls(user_ids, names, structure_weights, *matrices)
+
+    @property
+    def structure_size(self):
+        return len(self.structure_weights)
+
+    def _fractions(self):
+        """obtained / max per cell; 0 where there's no entry or max is 0."""
+        valid = ~np.isnan(self.obtained) & (self.max_marks > 0)
+        frac = np.zeros_like(self.max_marks)
+        np.divide(np.nan_to_num(self.obtained), self.max_marks, out=frac, where=valid)
+        return frac, valid
+
+    def points(self):
+        """Unrounded weighted points each student has so far."""
+        frac, valid = self._fractions()
+        return (frac * self.weights * valid).sum(axis=1)
+
+    def scores(self):
+        """Weighted score per student — same rule as marks_stats.weighted_score."""
+        if self._scores is None:
+            has_entries = (~np.isnan(self.obtained)).any(axis=1)
+            total_weight = np.where(np.isnan(self.obtained), 0, self.weights).sum(axis=1)
+            # Round with Python's round() rather than np.round: the two can
+            # disagree on near-ties, and a student's score here must match
+            # the one the per-student views show.
+            rounded = np.array([round(p, 2) for p in self.points().tolist()])
+            self._scores = np.where(has_entries & (total_weight != 0), rounded, np.nan)
+        return self._scores
+
+    def summary(self):
+        s = self.scores()
+        scored = s[~np.isnan(s)]
+        if scored.size == 0:
+            return {'count': 0, 'mean': None, 'std_dev': None, 'min': None, 'max': None,
+                    'percentiles': {str(p): None for p in CLASS_PERCENTILES}}
+        return {
+            'count': int(scored.size),
+            'mean': round(float(scored.mean()), 2),
+            'std_dev': round(float(scored.std()), 2),
+            'min': round(float(scored.min()), 2),
+            'max': round(float(scored.max()), 2),
+            'percentiles': dict(zip(
+                (str(p) for p in CLASS_PERCENTILES),
+                _round(np.percentile(scored, CLASS_PERCENTILES)),
+            )),
+        }
+
+    def standing(self):
+        """(percentile_rank, z_score) arrays, NaN for students without a score.
+
+        Percentile rank is the share of scored students below this one, with
+        ties counted as half — so the class median sits at 50.
+        """
+        s = self.scores()
+        mask = ~np.isnan(s)
+        pct = np.full(s.shape, np.nan)
+        z = np.full(s.shape, np.nan)
+        scored = s[mask]
+        if scored.size == 0:
+            return pct, z
+        ordered = np.sort(scored)
+        below = np.searchsorted(ordered, scored, side='left')
+        upto = np.searchsorted(ordered, scored, side='right')
+        pct[mask] = (below + (upto - below) / 2) / scored.size * 100
+        std = scored.std()
+        z[mask] = (scored - scored.mean()) / std if std > 0 else 0.0
+        return pct, z
+
+    def exam_difficulty(self):
+        """Per structure exam: attempts, mean/std percentage, difficulty index
+        (1 − mean fraction; higher is harder) and discrimination (correlation
+        between the exam percentage and the overall score)."""
+        frac, valid = self._fractions()
+        pct = np.where(valid, frac * 100, np.nan)
+        scores = self.scores()
+        out = []
+        for j in range(self.structure_size):
+            col = pct[:, j]
+            taken = ~np.isnan(col)
+            n = int(taken.sum())
+            entry = {'name': self.exam_names[j], 'attempted': n, 'mean_pct': None,
+                     'std_pct': None, 'difficulty': None, 'discrimination': None}
+            if n:
+                vals = col[taken]
+                entry['mean_pct'] = round(float(vals.mean()), 2)
+                entry['std_pct'] = round(float(vals.std()), 2)
+                entry['difficulty'] = round(1 - float(vals.mean()) / 100, 3)
+                both = taken & ~np.isnan(scores)
+                if both.sum() >= 3 and col[both].std() > 0 and scores[both].std() > 0:
+                    entry['discrimination'] = round(float(np.corrcoef(col[both], scores[both])[0, 1]), 3)
+            out.append(entry)
+        return out
+
+    def remaining_exams(self, i):
+        """Names of the structure exams student `i` has no entry for."""
+        missing = np.isnan(self.obtained[i, :self.structure_size])
+        return [self.exam_names[j] for j in np.flatnonzero(missing)]
+
+    def what_if(self, target):
+        """For each student, the average percentage needed across the
+        structure exams they haven't entered yet to finish on `target`.
+
+        Returns arrays (current, remaining_weight, needed_pct, status) where
+        status is 'secured' (already there), 'reachable', or 'out_of_reach'.
+        needed_pct is NaN when nothing is left to sit.
+        """
+        current = self.points()
+        k = self.structure_size
+        missing = np.isnan(self.obtained[:, :k])
+        remaining = (missing * self.structure_weights).sum(axis=1)
+        gap = target - current
+        needed = np.full(current.shape, np.nan)
+        np.divide(gap * 100, remaining, out=needed, where=remaining > 0)
+        status = np.where(
+            gap <= 0, 'secured',
+            np.where((remaining > 0) & (needed <= 100), 'reachable', 'out_of_reach'),
+        )
+        needed = np.where(gap <= 0, 0.0, needed)
+        return current, remaining, needed, status
+
+
+def target_for(grade=None, target=None):
+    """Resolve the what-if goal from ?target= (score) or ?grade= (GRADE_CUTOFFS).
+    Raises ValueError on anything unusable."""
+    if target not in (None, ''):
+        value = float(target)
+        if not 0 <= value <= 100:
+            raise ValueError('target must be between 0 and 100')
+        return value
+    if grade:
+        key = grade.strip().upper()
+        if key not in GRADE_CUTOFFS:
+            raise ValueError(f'Unknown grade {grade!r}; pass target= instead')
+        return GRADE_CUTOFFS[key]
+    raise ValueError('Pass target= or grade=')
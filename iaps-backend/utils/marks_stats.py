@@ -0,0 +1,238 @@
+"""
+marks_stats.py — materialized per-subject score statistics.
+
+The CR class-average view used to load every student's `subject_marks`
+document for every subject and recompute each weighted score in Python.
+Instead, each subject keeps one `subject_mark_stats` document holding running
+aggregates of its students' weighted scores:
+
+  count, sum, sumsq   — mean and standard deviation without a scan
+  hist                — HIST_BUCKETS counts of scores (0–10, 10–20, … 90–100)
+  grades              — {grade: number of students who entered it}
+  exams               — the same count/sum/sumsq per exam in the CR's exam
+                        structure, as a percentage of that exam's max marks
+
+save_my_marks swaps the student's old contribution for the new one with a
+single `$inc`; save_exam_structure rebuilds the document, since it changes
+which exams are tracked. Both run inside a transaction on deployments that
+support one (see utils.run_in_transaction). A subject with no stats document
+yet — marks saved before this existed — is built from `subject_marks` the
+first time it's read.
+
+Usage:
+  marks_stats.record_change(db, subject_id, old_marks_doc, new_marks_doc)
+  marks_stats.rebuild(db, subject_id, semester_id, exams)
+  stats = marks_stats.get_stats(db, subject_ids)     # {subject_id: doc}
+  marks_stats.summarize(stats[subject_id])           # mean, std_dev, percentiles…
+"""
+import math
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+HIST_BUCKETS = 10
+
+
+def weighted_score(entries):
+    """
+    Given a list of exam entry dicts, return the weighted percentage score
+    (0–100) or None if there are no entries or zero total weightage.
+    """
+    if not entries:
+        return None
+    total_weight = sum(float(e.get('weightage', 0)) for e in entries)
+    if total_weight == 0:
+        return None
+    weighted_sum = sum(
+        (float(e.get('marks_obtained', 0)) / float(e.get('max_marks', 1)))
+        * float(e.get('weightage', 0))
+        for e in entries
+        if float(e.get('max_marks', 0)) > 0  # guard against zero/missing max_marks
+    )
+    return round(weighted_sum, 2)
+
+
+def exam_key(name):
+    """Exams are matched to the structure by name, ignoring case/whitespace."""
+    return (name or '').strip().lower()
+
+
+def _bucket(score):
+    return max(0, min(int(score * HIST_BUCKETS // 100), HIST_BUCKETS - 1))
+
+
+def _grade_key(grade):
+    # Grades become field names under `grades`; skip anything Mongo can't store
+    grade = (grade or '').strip()
+    if not grade or '.' in grade or grade.startswith('$'):
+        return None
+    return grade
+
+
+def _add_contribution(inc, marks_doc, exam_keys, sign):
+    """Accumulate one student's contribution (sign=+1) or its removal (-1)
+    into an `$inc` document."""
+    if not marks_doc:
+        return
+
+    def add(path, value):
+        inc[path] = inc.get(path, 0) + sign * value
+
+    entries = marks_doc.get('entries', [])
+    score = weighted_score(entries)
+    if score is not None:
+        add('count', 1)
+        add('sum', score)
+        add('sumsq', score * score)
+        add(f'hist.{_bucket(score)}', 1)
+    grade = _grade_key(marks_doc.get('grade'))
+    if grade:
+        add(f'grades.{grade}', 1)
+    for e in entries:
+        key = exam_key(e.get('name'))
+        max_m = float(e.get('max_marks', 0) or 0)
+        if key not in exam_keys or max_m <= 0:
+            continue
+        pct = float(e.get('marks_obtained', 0) or 0) / max_m * 100
+        i = exam_keys.index(key)
+        add(f'exams.{i}.count', 1)
+        add(f'exams.{i}.sum', pct)
+        add(f'exams.{i}.sumsq', pct * pct)
+
+
+def _empty_stats(subject_id, semester_id, exams):
+    return {
+        'subject_id': subject_id,
+        'semester_id': semester_id,
+        'exam_keys': [exam_key(e.get('name')) for e in exams],
+        'count': 0,
+        'sum': 0.0,
+        'sumsq': 0.0,
+        'hist': [0] * HIST_BUCKETS,
+        'grades': {},
+        'exams': [
+            {'name': e.get('name', ''), 'count': 0, 'sum': 0.0, 'sumsq': 0.0}
+            for e in exams
+        ],
+        'updated_at': datetime.now(timezone.utc),
+    }
+
+
+def _apply(doc, inc):
+    """Apply an `$inc` document to an in-memory stats doc (used by rebuild)."""
+    for path, value in inc.items():
+        parts = path.split('.')
+        target = doc
+        for part in parts[:-1]:
+            target = target[int(part)] if isinstance(target, list) else target.setdefault(part, {})
+        last = int(parts[-1]) if isinstance(target, list) else parts[-1]
+        if isinstance(target, list):
+            target[last] += value
+        else:
+            target[last] = target.get(last, 0) + value
+
+
+def rebuild(db, subject_id, semester_id=None, exams=None, session=None):
+    """Recompute a subject's stats from every `subject_marks` row and store
+    them. `exams` is the exam structure's list; read from the DB if omitted."""
+    if exams is None:
+        struct = db.exam_structures.find_one({'subject_id': subject_id}, {'exams': 1}, session=session)
+        exams = struct.get('exams', []) if struct else []
+    if semester_id is None:
+        subject = db.subjects.find_one({'_id': ObjectId(subject_id)}, {'semester_id': 1}, session=session)
+        semester_id = subject.get('semester_id') if subject else None
+    doc = _empty_stats(subject_id, semester_id, exams)
+    for marks in db.subject_marks.find({'subject_id': subject_id}, {'entries': 1, 'grade': 1}, session=session):
+        inc = {}
+        _add_contribution(inc, marks, doc['exam_keys'], 1)
+        _apply(doc, inc)
+    db.subject_mark_stats.replace_one({'subject_id': subject_id}, doc, upsert=True, session=session)
+    return doc
+
+
+def record_change(db, subject_id, old_marks, new_marks, session=None):
+    """Replace one student's contribution: `old_marks` is the subject_marks
+    document before the write (None for a first save), `new_marks` after it
+    (None for a removal)."""
+    current = db.subject_mark_stats.find_one(
+        {'subject_id': subject_id}, {'exam_keys': 1, 'semester_id': 1}, session=session,
+    )
+    if current is None:
+        # Never built — the next read builds it from subject_marks, which
+        # already holds this write.
+        return
+    exam_keys = current.get('exam_keys', [])
+    inc = {}
+    _add_contribution(inc, old_marks, exam_keys, -1)
+    _add_contribution(inc, new_marks, exam_keys, 1)
+    inc = {k: v for k, v in inc.items() if v}
+    update = {'$set': {'updated_at': datetime.now(timezone.utc)}}
+    if inc:
+        update['$inc'] = inc
+    # Guard on exam_keys: if the structure was rebuilt in between, the
+    # positional exam paths above no longer line up — rebuild instead.
+    result = db.subject_mark_stats.update_one(
+        {'subject_id': subject_id, 'exam_keys': exam_keys}, update, session=session,
+    )
+    if result.matched_count == 0:
+        rebuild(db, subject_id, current.get('semester_id'), session=session)
+
+
+def get_stats(db, subject_ids):
+    """{subject_id: stats doc} for every id, building any that don't exist yet."""
+    subject_ids = [str(s) for s in subject_ids]
+    if not subject_ids:
+        return {}
+    found = {s['subject_id']: s for s in db.subject_mark_stats.find({'subject_id': {'$in': subject_ids}})}
+    for sid in subject_ids:
+        if sid not in found:
+            found[sid] = rebuild(db, sid)
+    return found
+
+
+def _mean_std(count, total, sumsq):
+    if not count:
+        return None, None
+    mean = total / count
+    variance = max(sumsq / count - mean * mean, 0.0)
+    return round(mean, 2), round(math.sqrt(variance), 2)
+
+
+def _percentile(hist, count, q):
+    """Estimate the q-th percentile (0–1) from the histogram, interpolating
+    linearly inside the bucket it falls in."""
+    if not count:
+        return None
+    width = 100 / len(hist)
+    target = q * count
+    seen = 0
+    for i, n in enumerate(hist):
+        if n and seen + n >= target:
+            return round(i * width + (target - seen) / n * width, 2)
+        seen += n
+    return 100.0
+
+
+def summarize(doc):
+    """Derived statistics for one subject's stats document."""
+    count = doc.get('count', 0)
+    hist = list(doc.get('hist', [0] * HIST_BUCKETS))
+    mean, std_dev = _mean_std(count, doc.get('sum', 0), doc.get('sumsq', 0))
+    return {
+        'count': count,
+        'mean': mean,
+        'std_dev': std_dev,
+        'p25': _percentile(hist, count, 0.25),
+        'median': _percentile(hist, count, 0.5),
+        'p75': _percentile(hist, count, 0.75),
+        'histogram': hist,
+        'grades': {g: n for g, n in doc.get('grades', {}).items() if n > 0},
+        'exams': [
+            dict(zip(('mean', 'std_dev'), _mean_std(e['count'], e['sum'], e['sumsq'])),
+                 name=e['name'], count=e['count'])
+            for e in doc.get('exams', [])
+        ],
+    }
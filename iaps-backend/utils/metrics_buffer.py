@@ -0,0 +1,77 @@
+"""
+metrics_buffer.py — in-process batching for fire-and-forget metric writes.
+
+Metrics used to be written one `insert_one` per event on a freshly spawned
+daemon thread. Under load that's a thread created and torn down per chat
+question plus one Mongo round-trip each. A MetricsBuffer instead queues
+records in memory and a single background thread writes them with one
+`insert_many` every `flush_interval` seconds, or sooner once `batch_size`
+records are waiting.
+
+Metrics are non-critical: if Mongo is unreachable a batch is logged and
+dropped rather than retried, and the queue is bounded (`max_pending`) so an
+outage can't grow memory without limit — oldest records go first. Whatever
+is still queued at interpreter exit gets one last flush attempt.
+
+Usage:
+  buf = MetricsBuffer(lambda: get_db().ai_rag_metrics)
+  buf.record({'pdf_id': ..., 'latency_ms': ...})
+  buf.flush()   # force a synchronous write, e.g. before reading the collection
+"""
+import atexit
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class MetricsBuffer:
+    def __init__(self, get_collection, batch_size: int = 50, flush_interval: float = 10.0,
+                 max_pending: int = 5000):
+        self._get_collection = get_collection
+        self.batch_size      = max(1, int(batch_size))
+        self.flush_interval  = max(0.1, float(flush_interval))
+        self._pending        = deque(maxlen=max_pending)
+        self._lock           = threading.Lock()
+        self._flush_lock     = threading.Lock()  # one insert_many at a time
+        self._wake           = threading.Event()
+        self._thread         = None
+        atexit.register(self.flush)
+
+    def record(self, doc: dict):
+        """Queue one record. Never blocks on the database."""
+        with self._lock:
+            self._pending.append(doc)
+            full = len(self._pending) >= self.batch_size
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='metrics-flush', daemon=True)
+                self._thread.start()
+        if full:
+            self._wake.set()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> int:
+        """Write everything queued so far in a single insert_many. Returns the
+        number of records written (0 on failure — the batch is dropped)."""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._pending)
+                self._pending.clear()
+            if not batch:
+                return 0
+            try:
+                self._get_collection().insert_many(batch, ordered=False)
+                return len(batch)
+            except Exception as e:
+                logger.warning(f"Dropping {len(batch)} buffered metric records: {e}")
+                return 0
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
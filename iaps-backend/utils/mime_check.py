@@ -41,9 +41,19 @@ def _detect(header: bytes) -> str | None:
     return None
 
 
+HEADER_SIZE = 16
+DANGEROUS = ('__executable__', '__script__')
+
+
+def sniff(header: bytes) -> str | None:
+    """Detected MIME type of a file starting with `header` (its first
+    HEADER_SIZE bytes, or all of it if shorter), or None."""
+    return _detect(header)
+
+
 def detect_mime(file_stream) -> str | None:
     """Read the first 16 bytes and return a detected MIME type (or None)."""
-    header = file_stream.read(16)
+    header = file_stream.read(HEADER_SIZE)
     file_stream.seek(0)
     return _detect(header)
 
@@ -51,7 +61,7 @@ def detect_mime(file_stream) -> str | None:
 def is_dangerous(file_stream) -> bool:
     """Return True if the file has an executable or script signature."""
     mime = detect_mime(file_stream)
-    return mime in ('__executable__', '__script__')
+    return mime in DANGEROUS
 
 
 def is_image(file_stream) -> bool:
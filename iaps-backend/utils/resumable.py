@@ -0,0 +1,147 @@
+"""
+resumable.py — chunked, resumable uploads (init → PUT chunks → finalize).
+
+Chat/DM attachments, academic resources, analytics files and AI PDFs of up to
+50 MB used to go up as one multipart body: Werkzeug spooled all of it before
+the route ran, and a phone that dropped off Wi-Fi at 90% started again from
+zero. routes/upload_routes.py exposes a session protocol instead:
+
+  POST   /api/uploads                 {kind, filename, size, mime_type, params}
+  PUT    /api/uploads/<id>            body = bytes, Content-Range: bytes a-b/size
+  GET    /api/uploads/<id>            → {received}; resume from there
+  POST   /api/uploads/<id>/finalize   → whatever the feature's upload route returns
+  DELETE /api/uploads/<id>
+
+Each chunk is streamed from the request straight into uploads/tmp/<id>.part at
+its offset while a SHA-256 of the file so far is carried forward in memory, so
+finalize doesn't re-read 50 MB to hash it. The hash state is per process: a
+chunk landing on another worker (or after a restart) rebuilds it from the part
+file once and carries on. Sessions live in `upload_sessions` (TTL on
+expires_at, refreshed by every chunk); part files of expired sessions are
+swept on the next init.
+
+Features plug in with `register()`:
+  authorize(db, user, params, filename) → an error response, or None to allow.
+      Runs at init and again at finalize.
+  finalize(db, user, params, upload) → the response to return. `upload` is an
+      Upload(path, filename, size, mime_type, sha256); the hook runs the same
+      checks and post-processing as the feature's multipart route and moves
+      `upload.path` into place. Whatever it leaves behind is deleted.
+
+Usage (at the bottom of a routes module):
+  resumable.register('chat', _authorize_upload, _finalize_upload, MAX_FILE_SIZE)
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+TMP_DIR = os.path.join(os.getcwd(), 'uploads', 'tmp')
+CHUNK_MAX_BYTES = int(os.environ.get('UPLOAD_CHUNK_MAX_BYTES', str(8 * 1024 * 1024)))
+SESSION_TTL_SECONDS = int(os.environ.get('UPLOAD_SESSION_TTL_SECONDS', str(24 * 3600)))
+
+_READ_SIZE = 1024 * 1024
+
+Kind = namedtuple('Kind', 'authorize finalize max_size')
+Upload = namedtuple('Upload', 'path filename size mime_type sha256')
+
+_kinds = {}
+# upload_id → (offset, sha256 state of the first `offset` bytes)
+_hashers = {}
+_hashers_lock = threading.Lock()
+
+
+class IncompleteChunk(Exception):
+    """The request body ended before the announced chunk length."""
+
+
+def register(kind, authorize, finalize, max_size):
+    _kinds[kind] = Kind(authorize, finalize, max_size)
+
+
+def get_kind(kind):
+    return _kinds.get(kind)
+
+
+def part_path(upload_id):
+    return os.path.join(TMP_DIR, f'{upload_id}.part')
+
+
+def create(upload_id):
+    """Start an empty part file for a new session."""
+    os.makedirs(TMP_DIR, exist_ok=True)
+    open(part_path(upload_id), 'wb').close()
+
+
+def _hasher_at(upload_id, offset):
+    with _hashers_lock:
+        entry = _hashers.pop(upload_id, None)
+    if entry and entry[0] == offset:
+        return entry[1]
+    digest = hashlib.sha256()
+    remaining = offset
+    with open(part_path(upload_id), 'rb') as f:
+        while remaining:
+            block = f.read(min(_READ_SIZE, remaining))
+            if not block:
+                break
+            digest.update(block)
+            remaining -= len(block)
+    return digest
+
+
+def write_chunk(upload_id, offset, stream, length):
+    """Copy `length` bytes from `stream` into the part file at `offset`,
+    dropping anything past it first (the tail of an earlier attempt that died
+    mid-chunk). Raises IncompleteChunk if the stream ends early."""
+    digest = _hasher_at(upload_id, offset)
+    written = 0
+    with open(part_path(upload_id), 'r+b') as f:
+        f.seek(offset)
+        f.truncate()
+        while written < length:
+            block = stream.read(min(_READ_SIZE, length - written))
+            if not block:
+                break
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+    if written != length:
+        raise IncompleteChunk(f'Expected {length} bytes, got {written}')
+    with _hashers_lock:
+        _hashers[upload_id] = (offset + length, digest)
+
+
+def hexdigest(upload_id, size):
+    return _hasher_at(upload_id, size).hexdigest()
+
+
+def discard(upload_id):
+    with _hashers_lock:
+        _hashers.pop(upload_id, None)
+    try:
+        os.remove(part_path(upload_id))
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not delete upload part {upload_id}: {e}")
+
+
+def sweep():
+    """Delete part files untouched for longer than a session lives."""
+    cutoff = time.time() - SESSION_TTL_SECONDS
+    try:
+        names = os.listdir(TMP_DIR)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if name.endswith('.part'):
+            try:
+                if os.path.getmtime(os.path.join(TMP_DIR, name)) < cutoff:
+                    discard(name[:-len('.part')])
+            except OSError:
+                pass
@@ -15,26 +15,106 @@ same machine/volume as the web process; required once it doesn't.
 Usage:
   ref = save_file(local_path, key)      # after writing a file locally
   ...  store `ref` wherever you used to store a bare filename ...
-  local = resolve_local(ref, fallback_dir, fallback_name)  # before reading it
+  local = resolve_local(ref, fallback_dir, fallback_name)  # before reading it (S3: cached copy)
+  url = presigned_url(ref, download_name, mime_type)        # hand an S3 ref to the browser
+  path = resolve_ref(stored_path)                           # relative/absolute/S3 → servable
   delete_file(ref, fallback_dir, fallback_name)
+
+Streaming, so a file needn't sit on local disk on its way in or out of S3:
+  with open_write(dest) as out: ...   # local temp + rename, or S3 multipart upload
+  with open_read(ref) as f: ...       # seekable; S3 reads are ranged GETs
+  obj = get_range(ref, request.headers.get('Range'))   # relay to a client
+All S3 calls share one client per process, with a connection pool of
+S3_MAX_POOL_CONNECTIONS.
+
+S3 objects read through resolve_local() (for callers that need a real path;
+open_read() also uses a copy already there) are downloaded into uploads/cache
+and kept there as a bounded LRU: once the directory holds more than STORAGE_CACHE_MAX_BYTES, the least
+recently used files go. Downloads land under a temp name and are renamed into
+place, so a reader never sees half a file, and concurrent misses for the same
+object wait for one download rather than racing to fetch it. cache_stats()
+reports this process's hits, misses and evictions.
+
+Content-addressed blobs: chat/DM attachments, academic resources and AI PDFs
+are stored once per distinct content, keyed by SHA-256, however many records
+point at them — the same lecture PDF posted to chat, uploaded as a resource
+and imported into AI tools is one file (and one S3 object). The `blobs`
+collection holds {_id: sha256, size, refs, stored}; each record that uses a
+blob keeps its sha256 in a `blob` field, and holds one reference. Where the
+file is comes from the hash (blob_ref) — records never store a path or bucket. Deleting the record releases the reference;
+the file goes with the last one.
+
+  path = incoming_path()                          # write the upload here (S3: a ref under incoming/)
+  ref = put_blob(db, path, sha256, size)          # moves it in (or drops the duplicate)
+  ref = blob_ref(record['blob'])                  # to serve or read it later
+  retain_blob(db, sha256)                         # another record now points at it
+  release_file(db, record.get('blob'), legacy_path)   # on record delete
+
+Records from before blobs (no `blob` field) own their file outright;
+release_file deletes `legacy_path` for those. With S3, an upload that fails
+after landing under incoming/ but before put_blob() is left there — expire
+that prefix with a bucket lifecycle rule.
 """
+import io
 import os
+import time
+import hashlib
 import logging
+import threading
+from contextlib import contextmanager
+from uuid import uuid4
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+try:
+    import fcntl
+except ImportError:   # Windows: downloads are single-flight within a process only
+    fcntl = None
 
 logger = logging.getLogger(__name__)
 
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '32'))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
 
 def _bucket() -> str:
     return os.environ.get('S3_BUCKET', '').strip()
 
 
 def _client():
-    import boto3
-    kwargs = {}
-    endpoint = os.environ.get('S3_ENDPOINT_URL', '').strip()
-    if endpoint:
-        kwargs['endpoint_url'] = endpoint
-    return boto3.client('s3', **kwargs)
+    """The process's S3 client, built once. boto3 clients are thread-safe and
+    keep a pool of HTTPS connections, so sharing one saves a client build and
+    a TLS handshake on every call."""
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.config import Config
+                kwargs = {'config': Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS,
+                                           retries={'mode': 'standard'})}
+                endpoint = os.environ.get('S3_ENDPOINT_URL', '').strip()
+                if endpoint:
+                    kwargs['endpoint_url'] = endpoint
+                _s3_client = boto3.client('s3', **kwargs)
+    return _s3_client
+
+
+def _forget_client():
+    # A forked Celery/gunicorn child mustn't share the parent's sockets
+    global _s3_client
+    _s3_client = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_forget_client)
+
+
+def _split_ref(ref):
+    return ref[len('s3://'):].split('/', 1)
 
 
 def save_file(local_path: str, key: str) -> str:
@@ -60,17 +140,37 @@ def resolve_local(ref: str, fallback_dir: str, fallback_name: str) -> str:
     if not ref:
         return os.path.join(fallback_dir, fallback_name)
     if ref.startswith('s3://'):
-        bucket, key = ref[len('s3://'):].split('/', 1)
-        local_path = os.path.join(fallback_dir, os.path.basename(key))
-        if not os.path.exists(local_path):
-            os.makedirs(fallback_dir, exist_ok=True)
-            _client().download_file(bucket, key, local_path)
-        return local_path
+        return _cached_copy(ref)
     if os.path.isabs(ref) or os.path.exists(ref):
         return ref
     return os.path.join(fallback_dir, ref)  # legacy bare-filename record
 
 
+def presigned_url(ref: str, download_name: str = None, mime_type: str = None,
+                  expires: int = 300) -> str:
+    """A time-limited GET URL for an 's3://bucket/key' ref, so the browser
+    downloads straight from the bucket instead of through a web worker."""
+    bucket, key = ref[len('s3://'):].split('/', 1)
+    params = {'Bucket': bucket, 'Key': key}
+    if download_name:
+        from urllib.parse import quote
+        params['ResponseContentDisposition'] = f"inline; filename*=UTF-8''{quote(download_name)}"
+    if mime_type:
+        params['ResponseContentType'] = mime_type
+    return _client().generate_presigned_url('get_object', Params=params, ExpiresIn=expires)
+
+
+def resolve_ref(ref: str) -> str:
+    """A stored file path as deliver() and resolve_local() take it: S3 refs
+    unchanged, local paths made absolute (chat/DM paths are stored relative
+    to the working directory)."""
+    return ref if ref.startswith('s3://') else os.path.join(os.getcwd(), ref)
+
+
+def exists(ref: str) -> bool:
+    return ref.startswith('s3://') or os.path.exists(ref)
+
+
 def delete_file(ref: str, fallback_dir: str, fallback_name: str):
     if not ref:
         ref = fallback_name
@@ -80,6 +180,7 @@ def delete_file(ref: str, fallback_dir: str, fallback_name: str):
             _client().delete_object(Bucket=bucket, Key=key)
         except Exception:
             logger.exception(f"S3 delete failed for {ref}")
+        _remove_local(os.path.join(CACHE_DIR, _cache_name(ref)))
         return
     local_path = ref if (os.path.isabs(ref) or os.path.exists(ref)) else os.path.join(fallback_dir, ref)
     try:
@@ -87,3 +188,477 @@ def delete_file(ref: str, fallback_dir: str, fallback_name: str):
             os.remove(local_path)
     except OSError:
         pass
+
+
+# ─── Local cache of S3 objects ───────────────────────────────────────────────
+
+CACHE_DIR = os.path.join(os.getcwd(), 'uploads', 'cache')
+CACHE_MAX_BYTES = int(os.environ.get('STORAGE_CACHE_MAX_BYTES', str(2 * 1024 ** 3)))
+# An entry used this recently is never evicted, so a caller that has just been
+# handed its path can still open it
+_EVICT_GRACE_SECONDS = 60
+# Leftovers of downloads killed mid-way
+_STALE_PART_SECONDS = 3600
+# Lock files live in CACHE_DIR/locks and outlast the entries they guard;
+# one unused for this long is pruned
+_STALE_LOCK_SECONDS = 24 * 3600
+
+_key_locks = {}   # cache name → [lock, holders + waiters]
+_key_locks_guard = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_downloaded': 0}
+_stats_lock = threading.Lock()
+
+
+def _count(**deltas):
+    with _stats_lock:
+        for name, n in deltas.items():
+            _stats[name] += n
+
+
+def cache_stats() -> dict:
+    """This process's counters for the S3 download cache."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def _cache_name(ref):
+    # Hashed so same-named keys under different prefixes don't collide; the
+    # extension is kept for readers that go by it
+    return hashlib.sha256(ref.encode()).hexdigest()[:40] + os.path.splitext(ref)[1]
+
+
+def _touch(path):
+    """Mark a cache entry as just used — mtime is the LRU clock, shared by
+    every process using the directory. False if it isn't cached."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def _single_flight(name):
+    """Hold the download lock for one cache entry: a thread lock within this
+    process, and an flock on locks/<name>.lock across processes (web
+    workers and Celery workers sharing the volume) where the platform has
+    one."""
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(name, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if fcntl is None:
+                yield
+                return
+            lock_dir = os.path.join(CACHE_DIR, 'locks')
+            lock_path = os.path.join(lock_dir, f'{name}.lock')
+            os.makedirs(lock_dir, exist_ok=True)
+            while True:
+                lock_file = open(lock_path, 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # Pruned while we waited: the flock is on an unlinked file
+                # nobody else will open, so start over on the new one
+                try:
+                    if os.stat(lock_path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                        break
+                except FileNotFoundError:
+                    pass
+                lock_file.close()
+            try:
+                os.utime(lock_file.fileno())
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[name]
+
+
+def _cached_copy(ref):
+    """A local copy of the S3 object `ref`, downloaded once and then served
+    from CACHE_DIR until evicted. Concurrent misses on the same ref wait for
+    one download instead of each starting their own."""
+    name = _cache_name(ref)
+    path = os.path.join(CACHE_DIR, name)
+    if _touch(path):
+        _count(hits=1)
+        return path
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    with _single_flight(name):
+        if _touch(path):   # fetched by whoever held the lock before us
+            _count(hits=1)
+            return path
+        bucket, key = ref[len('s3://'):].split('/', 1)
+        tmp = f'{path}.{uuid4().hex}.part'
+        try:
+            _client().download_file(bucket, key, tmp)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except BaseException:
+            _remove_local(tmp)
+            raise
+
+    _count(misses=1, bytes_downloaded=size)
+    stats = cache_stats()
+    logger.info(f"Storage cache miss for {ref} ({size} bytes; "
+                f"{stats['hits']} hits / {stats['misses']} misses in this process)")
+    _evict(keep=path)
+    return path
+
+
+def _evict(keep):
+    """Delete least recently used entries until the cache fits CACHE_MAX_BYTES."""
+    now = time.time()
+    entries, total = [], 0
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.part'):
+                if st.st_mtime < now - _STALE_PART_SECONDS:
+                    _remove_local(entry.path)
+                continue
+            if not entry.is_file():
+                continue
+            entries.append((st.st_mtime, st.st_size, entry.path))
+            total += st.st_size
+
+    for mtime, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES:
+            break
+        if path == keep or mtime > now - _EVICT_GRACE_SECONDS:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            continue   # gone already, or still open by a reader on Windows
+        total -= size
+        _count(evictions=1)
+    _prune_locks(now)
+
+
+def _prune_locks(now):
+    """Remove lock files nobody has taken for _STALE_LOCK_SECONDS. Each is
+    unlinked under its own flock, so never from under a holder; a process
+    already waiting on it notices in _single_flight and takes the new one."""
+    if fcntl is None:
+        return
+    try:
+        it = os.scandir(os.path.join(CACHE_DIR, 'locks'))
+    except FileNotFoundError:
+        return
+    with it:
+        for entry in it:
+            try:
+                if entry.stat().st_mtime >= now - _STALE_LOCK_SECONDS:
+                    continue
+                with open(entry.path, 'a') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    os.remove(entry.path)
+            except OSError:
+                continue   # in use, or pruned by another process
+
+
+# ─── Streaming S3 reads and writes ───────────────────────────────────────────
+
+# Multipart part size; S3 wants at least 5 MiB for every part but the last
+PART_SIZE = 8 * 1024 * 1024
+
+
+class _MultipartWriter:
+    """Write-only file object that uploads to S3 as data arrives: PART_SIZE
+    parts of a multipart upload, or a single put_object for a file that
+    never fills one."""
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self._buf = bytearray()
+        self._upload_id = None
+        self._parts = []
+
+    def write(self, data):
+        self._buf += data
+        while len(self._buf) >= PART_SIZE:
+            self._send_part(bytes(self._buf[:PART_SIZE]))
+            del self._buf[:PART_SIZE]
+        return len(data)
+
+    def _send_part(self, body):
+        client = _client()
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+        number = len(self._parts) + 1
+        part = client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                  PartNumber=number, Body=body)
+        self._parts.append({'PartNumber': number, 'ETag': part['ETag']})
+
+    def complete(self):
+        if self._upload_id is None:
+            _client().put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self._buf))
+        else:
+            if self._buf:
+                self._send_part(bytes(self._buf))
+            _client().complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id,
+                                                MultipartUpload={'Parts': self._parts})
+        self._buf = bytearray()
+
+    def abort(self):
+        if self._upload_id is None:
+            return
+        try:
+            _client().abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+        except Exception:
+            logger.exception(f"S3 abort failed for multipart upload of {self.key}")
+
+
+@contextmanager
+def open_write(dest: str):
+    """Write a new file at `dest`, a local path or an 's3://' ref. It only
+    appears once the block exits cleanly — a temp file renamed into place, or
+    a completed multipart upload — and nothing is left behind if it raises."""
+    if dest.startswith('s3://'):
+        writer = _MultipartWriter(*_split_ref(dest))
+        try:
+            yield writer
+            writer.complete()
+        except BaseException:
+            writer.abort()
+            raise
+        return
+    tmp = f'{dest}.part'
+    try:
+        with open(tmp, 'wb') as out:
+            yield out
+        os.replace(tmp, dest)
+    except BaseException:
+        _remove_local(tmp)
+        raise
+
+
+class _S3Reader(io.RawIOBase):
+    """Seekable read-only view of an S3 object; every read is a ranged GET.
+    Wrapped in a BufferedReader by open_read() so small reads share one."""
+
+    def __init__(self, bucket, key, size):
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def _get(self, end):
+        body = _client().get_object(Bucket=self.bucket, Key=self.key,
+                                    Range=f'bytes={self._pos}-{end}')['Body']
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        self._pos += len(data)
+        return data
+
+    def readinto(self, b):
+        if self._pos >= self.size:
+            return 0
+        data = self._get(min(self._pos + len(b), self.size) - 1)
+        b[:len(data)] = data
+        return len(data)
+
+    def readall(self):
+        # One GET for the rest, not RawIOBase's loop of small reads
+        if self._pos >= self.size:
+            return b''
+        return self._get(self.size - 1)
+
+
+def open_read(ref: str, fallback_dir: str = '', fallback_name: str = ''):
+    """A binary file object for `ref`. S3 objects are read from the bucket in
+    ranged GETs as the caller asks for bytes (or from the local cache, if
+    resolve_local() already has them) — nothing is downloaded up front."""
+    if ref and ref.startswith('s3://'):
+        cached = os.path.join(CACHE_DIR, _cache_name(ref))
+        if _touch(cached):
+            _count(hits=1)
+            return open(cached, 'rb')
+        bucket, key = _split_ref(ref)
+        size = _client().head_object(Bucket=bucket, Key=key)['ContentLength']
+        return io.BufferedReader(_S3Reader(bucket, key, size), buffer_size=PART_SIZE)
+    return open(resolve_local(ref, fallback_dir, fallback_name), 'rb')
+
+
+def get_range(ref: str, range_header: str = None) -> dict:
+    """get_object for an S3 ref with an HTTP Range header passed through, for
+    streaming it to a client. The result has 'Body' (a streaming body to
+    iter_chunks() and close()), 'ContentLength', and 'ContentRange' when S3
+    served a range. Raises botocore's ClientError (code InvalidRange) for an
+    unsatisfiable one."""
+    bucket, key = _split_ref(ref)
+    kwargs = {'Range': range_header} if range_header else {}
+    return _client().get_object(Bucket=bucket, Key=key, **kwargs)
+
+
+# ─── Content-addressed blobs ─────────────────────────────────────────────────
+
+BLOBS_DIR = os.path.join(os.getcwd(), 'uploads', 'blobs')
+
+
+def blob_key(sha256: str) -> str:
+    return f'blobs/{sha256[:2]}/{sha256}'
+
+
+def blob_ref(sha256: str) -> str:
+    """Where the blob for `sha256` is stored. Worked out from the hash at use
+    time rather than saved with records, so records hold no server path or
+    bucket name and survive the app moving directory: the local file if
+    there is one (where it stays if its S3 upload failed), else the object."""
+    path = os.path.join(BLOBS_DIR, sha256[:2], sha256)
+    bucket = _bucket()
+    if bucket and not os.path.exists(path):
+        return f's3://{bucket}/{blob_key(sha256)}'
+    return path
+
+
+def message_file_ref(file_info: dict):
+    """Storage ref for a chat/DM message's `file`: its blob, or the
+    cwd-relative `path` messages from before blobs keep. None if neither."""
+    if file_info.get('blob'):
+        return blob_ref(file_info['blob'])
+    if file_info.get('path'):
+        # Paths saved on Windows use backslashes
+        return resolve_ref(file_info['path'].replace('\\', '/'))
+    return None
+
+
+def incoming_path() -> str:
+    """A fresh place to write an upload to (with open_write(), e.g. via
+    ingest.save) before put_blob(): an 's3://' ref under incoming/ when S3 is
+    configured, so the upload streams to the bucket, else a local path."""
+    bucket = _bucket()
+    if bucket:
+        return f's3://{bucket}/incoming/{uuid4().hex}'
+    incoming = os.path.join(BLOBS_DIR, 'incoming')
+    os.makedirs(incoming, exist_ok=True)
+    return os.path.join(incoming, uuid4().hex)
+
+
+def _remove_local(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        logger.warning(f"Could not delete {path}: {e}")
+
+
+def _drop_incoming(path):
+    if path.startswith('s3://'):
+        delete_file(path, '', '')
+    else:
+        _remove_local(path)
+
+
+def put_blob(db, path: str, sha256: str, size: int) -> str:
+    """Take a reference on the blob for `sha256`, storing the file at `path`
+    (local, or an incoming_path() S3 ref) as that blob unless it's already
+    stored (then `path` is just deleted). Returns the blob's storage ref."""
+    for _ in range(20):
+        try:
+            blob = db.blobs.find_one_and_update(
+                {'_id': sha256, 'deleting': {'$ne': True}},
+                {'$inc': {'refs': 1}, '$setOnInsert': {'size': size, 'stored': False}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            break
+        except DuplicateKeyError:
+            time.sleep(0.05)   # its last reference is being released right now
+    else:
+        raise RuntimeError(f'Blob {sha256} stayed locked')
+
+    if blob.get('stored') and exists(blob_ref(sha256)):
+        _drop_incoming(path)
+        return blob_ref(sha256)
+
+    # New blob (or a concurrent upload of the same bytes hasn't landed yet):
+    # same content, same name, so whichever copy or replace lands last is fine
+    try:
+        if path.startswith('s3://'):
+            # Already in the bucket: a server-side copy, no bytes through us
+            bucket, key = _split_ref(path)
+            _client().copy_object(Bucket=bucket, Key=blob_key(sha256),
+                                  CopySource={'Bucket': bucket, 'Key': key})
+            _drop_incoming(path)
+        else:
+            blob_path = os.path.join(BLOBS_DIR, sha256[:2], sha256)
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            os.replace(path, blob_path)
+            save_file(blob_path, blob_key(sha256))
+        db.blobs.update_one({'_id': sha256}, {'$set': {'stored': True}})
+    except BaseException:
+        # No record will own the reference taken above — give it back
+        _drop_incoming(path)
+        release_blob(db, sha256)
+        raise
+    return blob_ref(sha256)
+
+
+def retain_blob(db, sha256: str) -> bool:
+    """Add a reference to an existing blob; False if there is none to share."""
+    result = db.blobs.update_one(
+        {'_id': sha256, 'deleting': {'$ne': True}, 'refs': {'$gt': 0}},
+        {'$inc': {'refs': 1}},
+    )
+    return result.modified_count == 1
+
+
+def release_blob(db, sha256: str):
+    """Drop one reference; the last one deletes the file or object."""
+    blob = db.blobs.find_one_and_update(
+        {'_id': sha256}, {'$inc': {'refs': -1}}, return_document=ReturnDocument.AFTER,
+    )
+    if not blob or blob['refs'] > 0:
+        return
+    # Lock it so a put_blob racing with us waits instead of reviving a
+    # blob whose file is about to go
+    if not db.blobs.find_one_and_update(
+            {'_id': sha256, 'refs': {'$lte': 0}, 'deleting': {'$ne': True}},
+            {'$set': {'deleting': True}}):
+        return
+    if blob.get('stored'):
+        delete_file(blob_ref(sha256), BLOBS_DIR, sha256)
+    db.blobs.delete_one({'_id': sha256})
+
+
+def release_file(db, blob, legacy_path=None):
+    """Let go of a deleted record's file: release its blob reference, or
+    delete the file it owns outright if it predates blobs."""
+    if blob:
+        release_blob(db, blob)
+    elif legacy_path:
+        _remove_local(legacy_path)
+
+
+def release_message_file(db, file_info: dict):
+    """release_file for a chat/DM message's `file`."""
+    path = file_info.get('path')
+    release_file(db, file_info.get('blob'), os.path.join(os.getcwd(), path) if path else None)
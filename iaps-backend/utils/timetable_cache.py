@@ -0,0 +1,121 @@
+"""
+timetable_cache.py — in-process cache of computed week views.
+
+Every member of a semester who opens the timetable gets the same week: the
+base grid with the CR's overrides merged in and the academic calendar's
+events for those seven dates. Building it takes a timetables read, an `$or`
+over timetable_overrides and a scan of the whole academic_calendars event
+list, and used to happen on every /week and /today request by every
+student. This keeps the shared part per (semester, week) so a request only
+has to add the caller's own personal skips on top.
+
+Invalidation is per semester and versioned, same as utils/user_cache.py:
+`invalidate()` bumps the semester's version, and a week is only served if it
+was built under the current one, so a build that races with a CR's edit
+can't store the pre-edit week after the invalidation. Without REDIS_URL the
+versions live in this process; with it they live in a Redis hash and an
+edit on one instance invalidates every instance's copy.
+TIMETABLE_CACHE_TTL_SECONDS is a backstop for writes that bypass
+`invalidate()`.
+
+Writers that must call invalidate(semester_id): save_timetable,
+add_override, delete_override, save_academic_calendar.
+
+Usage:
+  week = timetable_cache.get_week(semester_id, week_start, build)
+      # build() → the shared week dict, or None to skip caching
+  timetable_cache.invalidate(semester_id)
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+MAX_WEEKS = int(os.environ.get('TIMETABLE_CACHE_MAX', '2000'))
+TTL_SECONDS = float(os.environ.get('TIMETABLE_CACHE_TTL_SECONDS', '3600'))
+VERSIONS_KEY = 'timetable_cache:versions'
+
+_entries = OrderedDict()   # (semester_id, week_start iso) → (version, built_at, week)
+_versions = {}             # semester_id → version, when Redis isn't configured
+_lock = threading.Lock()
+
+_redis_client = None
+_redis_checked = False
+
+
+def _get_redis():
+    global _redis_client, _redis_checked
+    if not _redis_checked:
+        _redis_checked = True
+        redis_url = os.environ.get('REDIS_URL', '').strip()
+        if redis_url:
+            import redis
+            _redis_client = redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+
+def _current_version(semester_id):
+    """The semester's version, or None if it can't be read right now (treat
+    that as a miss and don't store)."""
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            return _versions.get(semester_id, 0)
+    try:
+        return int(r.hget(VERSIONS_KEY, semester_id) or 0)
+    except Exception as e:
+        logger.warning(f"timetable_cache version lookup failed: {e}")
+        return None
+
+
+def get_week(semester_id, week_start, build):
+    """Return the cached week for (semester_id, week_start), calling
+    `build()` on a miss. Callers must not mutate the returned dict — it is
+    the cached copy, shared by every request for that week."""
+    semester_id = str(semester_id)
+    key = (semester_id, week_start.isoformat())
+    version = _current_version(semester_id)
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(key)
+        if (entry is not None and version is not None and entry[0] == version
+                and now - entry[1] < TTL_SECONDS):
+            _entries.move_to_end(key)
+            return entry[2]
+
+    week = build()
+    if week is None or version is None:
+        return week
+    with _lock:
+        _entries[key] = (version, now, week)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_WEEKS:
+            _entries.popitem(last=False)
+    return week
+
+
+def invalidate(semester_id):
+    """Call after changing a semester's timetable, overrides or academic
+    calendar."""
+    semester_id = str(semester_id)
+    r = _get_redis()
+    with _lock:
+        for key in [k for k in _entries if k[0] == semester_id]:
+            del _entries[key]
+        if r is None:
+            _versions[semester_id] = _versions.get(semester_id, 0) + 1
+    if r is not None:
+        try:
+            r.hincrby(VERSIONS_KEY, semester_id, 1)
+        except Exception as e:
+            logger.warning(f"timetable_cache.invalidate failed for {semester_id}: {e}")
+
+
+def clear():
+    """Forget every cached week (tests)."""
+    with _lock:
+        _entries.clear()
+        _versions.clear()
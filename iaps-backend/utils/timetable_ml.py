@@ -1,13 +1,34 @@
-"""Groq Vision utility for extracting timetable data from images/PDFs."""
+"""Groq Vision utility for extracting timetable data from images/PDFs.
+
+Uploads are shrunk before they're sent: prepare_image() downscales to
+MAX_IMAGE_EDGE, converts to grayscale and straightens small camera tilts,
+then re-encodes as JPEG — a phone photo of a notice board goes from several
+MB of base64 to a couple of hundred KB, which the vision model reads just as
+well. PDFs are rendered page by page (render_pdf_pages, in parallel) and up
+to MAX_PDF_PAGES pages go to the model in one request.
+
+image_fingerprint() gives the keys routes/timetable_routes.py caches
+extraction results under: a SHA-256 of the prepared bytes for exact repeats
+and a difference hash that survives re-compression and resizing, compared
+with phash_distance().
+"""
+import io
 import json
 import os
 import base64
+import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 
 logger = logging.getLogger(__name__)
 
 VISION_MODEL = 'meta-llama/llama-4-scout-17b-16e-instruct'  # only free-tier Groq model with vision support
+MAX_IMAGE_EDGE = int(os.getenv('TIMETABLE_IMAGE_MAX_EDGE', '1600'))
+MAX_PDF_PAGES = 5          # Groq's per-request image limit
+PDF_RENDER_DPI = 150
+JPEG_QUALITY = 85
+DESKEW_MAX_DEGREES = 5.0
 
 
 def _get_groq_client():
@@ -47,6 +68,158 @@ STRICT RULES — follow every one:
 """
 
 
+# ── Preprocessing ─────────────────────────────────────────────────────────────
+
+def _estimate_skew(gray):
+    """Angle (degrees) that makes the text rows of a grayscale image most
+    horizontal: the rotation whose row-darkness profile has the highest
+    variance, searched on a small thumbnail."""
+    import numpy as np
+    from PIL import Image
+
+    thumb = gray.copy()
+    thumb.thumbnail((400, 400))
+
+    def score(angle):
+        rotated = thumb.rotate(angle, resample=Image.BILINEAR, fillcolor=255)
+        dark = np.asarray(rotated, dtype=np.float32) < 128
+        return float(dark.sum(axis=1).var())
+
+    steps = int(DESKEW_MAX_DEGREES * 2)
+    scores = {i / 2: score(i / 2) for i in range(-steps, steps + 1)}
+    best_angle = max(scores, key=scores.get)
+    # No clear winner (photos, noise, no ruled rows): leave it as it is
+    if scores[best_angle] < scores[0.0] * 1.1:
+        return 0.0
+    return best_angle
+
+
+def prepare_image(image_data: bytes, mime_type: str = 'image/jpeg'):
+    """Downscale, grayscale and deskew an upload for the vision model.
+    Returns (jpeg_bytes, 'image/jpeg'), or the input unchanged if Pillow
+    can't read it."""
+    try:
+        from PIL import Image, ImageOps
+
+        img = Image.open(io.BytesIO(image_data))
+        img = ImageOps.exif_transpose(img).convert('L')
+        img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        angle = _estimate_skew(img)
+        if angle:
+            img = img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+            img.thumbnail((MAX_IMAGE_EDGE, MAX_IMAGE_EDGE), Image.LANCZOS)
+        buf = io.BytesIO()
+        img.save(buf, format='JPEG', quality=JPEG_QUALITY, optimize=True)
+        return buf.getvalue(), 'image/jpeg'
+    except Exception as e:
+        logger.warning(f"Image preprocessing skipped: {e}")
+        return image_data, mime_type
+
+
+def _render_page(pdf_data, index):
+    import fitz  # PyMuPDF
+    # Each worker opens its own Document — PyMuPDF objects aren't shared across threads
+    with fitz.open(stream=pdf_data, filetype='pdf') as doc:
+        pix = doc[index].get_pixmap(dpi=PDF_RENDER_DPI)
+        return pix.tobytes('png')
+
+
+def render_pdf_pages(pdf_data: bytes, max_pages: int = MAX_PDF_PAGES):
+    """Render the first `max_pages` pages of a PDF to prepared JPEGs, pages in
+    parallel. Returns a list of (bytes, mime_type)."""
+    import fitz  # PyMuPDF
+    with fitz.open(stream=pdf_data, filetype='pdf') as doc:
+        count = min(doc.page_count, max_pages)
+    if count == 0:
+        return []
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        pages = list(pool.map(lambda i: _render_page(pdf_data, i), range(count)))
+    return [prepare_image(png, 'image/png') for png in pages]
+
+
+DHASH_SIZE = 16   # 16×16 = 256-bit hash
+
+
+def _dhash(image_data: bytes) -> str:
+    """Difference hash (DHASH_SIZE² bits, as hex; '' if unreadable)."""
+    try:
+        from PIL import Image
+        n = DHASH_SIZE
+        img = Image.open(io.BytesIO(image_data)).convert('L').resize((n + 1, n), Image.LANCZOS)
+        px = list(img.getdata())
+        bits = 0
+        for row in range(n):
+            for col in range(n):
+                bits = (bits << 1) | (px[row * (n + 1) + col] > px[row * (n + 1) + col + 1])
+        return f'{bits:0{n * n // 4}x}'
+    except Exception:
+        return ''
+
+
+# Two uploads whose hashes differ in at most this many bits (per page, out of
+# DHASH_SIZE²) are treated as the same picture.
+PHASH_MAX_DISTANCE = 12
+
+
+def phash_distance(a: str, b: str):
+    """Largest per-page Hamming distance between two image_fingerprint()
+    phashes, or None if they can't be compared (page count, unreadable)."""
+    pages_a, pages_b = a.split('-'), b.split('-')
+    if len(pages_a) != len(pages_b) or not all(pages_a) or not all(pages_b):
+        return None
+    try:
+        return max(bin(int(x, 16) ^ int(y, 16)).count('1') for x, y in zip(pages_a, pages_b))
+    except ValueError:
+        return None
+
+
+def image_fingerprint(images):
+    """(sha256, phash) for a list of prepared (bytes, mime) images. Multi-page
+    uploads join their per-page hashes."""
+    sha = hashlib.sha256()
+    for data, _ in images:
+        sha.update(hashlib.sha256(data).digest())
+    return sha.hexdigest(), '-'.join(_dhash(data) for data, _ in images)
+
+
+# ── Vision calls ──────────────────────────────────────────────────────────────
+
+def _vision_json(prompt, images):
+    """Send `images` (list of (bytes, mime)) plus `prompt` in one request and
+    parse the JSON reply."""
+    client = _get_groq_client()
+    content = [
+        {
+            "type": "image_url",
+            "image_url": {
+                "url": f"data:{mime};base64,{base64.b64encode(data).decode('utf-8')}"
+            }
+        }
+        for data, mime in images
+    ]
+    content.append({"type": "text", "text": prompt})
+
+    response = client.chat.completions.create(
+        model=VISION_MODEL,
+        messages=[{"role": "user", "content": content}],
+        temperature=0,
+        max_tokens=4096,
+    )
+
+    result_text = response.choices[0].message.content.strip()
+
+    # model ignores the "no markdown" instruction often enough that we still guard for it
+    if result_text.startswith('```'):
+        parts = result_text.split('```')
+        if len(parts) >= 3:
+            result_text = parts[1]
+            if result_text.startswith('json'):
+                result_text = result_text[4:]
+    result_text = result_text.strip()
+
+    return json.loads(result_text)
+
+
 def extract_timetable_from_image(image_data: bytes, mime_type: str = 'image/jpeg') -> dict:
     """
     Extract timetable structure from an image using Groq Vision.
@@ -56,46 +229,17 @@ def extract_timetable_from_image(image_data: bytes, mime_type: str = 'image/jpeg
         or
         {'success': False, 'error': '...message...'}
     """
+    return extract_timetable_from_images([(image_data, mime_type)])
+
+
+def extract_timetable_from_images(images) -> dict:
+    """Same as extract_timetable_from_image for one or more already-prepared
+    (bytes, mime) images — the pages of a PDF timetable go in one request."""
     try:
-        client = _get_groq_client()
-
-        b64_image = base64.b64encode(image_data).decode('utf-8')
-
-        response = client.chat.completions.create(
-            model=VISION_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{b64_image}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": TIMETABLE_PROMPT
-                        }
-                    ]
-                }
-            ],
-            temperature=0,
-            max_tokens=4096,
-        )
-
-        result_text = response.choices[0].message.content.strip()
-
-        # model ignores the "no markdown" instruction often enough that we still guard for it
-        if result_text.startswith('```'):
-            parts = result_text.split('```')
-            if len(parts) >= 3:
-                result_text = parts[1]
-                if result_text.startswith('json'):
-                    result_text = result_text[4:]
-        result_text = result_text.strip()
-
-        data = json.loads(result_text)
+        prompt = TIMETABLE_PROMPT
+        if len(images) > 1:
+            prompt += "\nThe timetable continues across these pages; merge them into ONE timetable.\n"
+        data = _vision_json(prompt, images)
 
         for key in ('days', 'time_slots', 'grid'):
             if key not in data:
@@ -155,43 +299,7 @@ Rules:
 def extract_academic_calendar_from_image(image_data: bytes, mime_type: str = 'image/jpeg') -> dict:
     """Extract academic calendar events from an image using Groq Vision."""
     try:
-        client = _get_groq_client()
-
-        b64_image = base64.b64encode(image_data).decode('utf-8')
-
-        response = client.chat.completions.create(
-            model=VISION_MODEL,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:{mime_type};base64,{b64_image}"
-                            }
-                        },
-                        {
-                            "type": "text",
-                            "text": ACADEMIC_CALENDAR_PROMPT
-                        }
-                    ]
-                }
-            ],
-            temperature=0,
-            max_tokens=4096,
-        )
-
-        result_text = response.choices[0].message.content.strip()
-        if result_text.startswith('```'):
-            parts = result_text.split('```')
-            if len(parts) >= 3:
-                result_text = parts[1]
-                if result_text.startswith('json'):
-                    result_text = result_text[4:]
-        result_text = result_text.strip()
-
-        data = json.loads(result_text)
+        data = _vision_json(ACADEMIC_CALENDAR_PROMPT, [(image_data, mime_type)])
 
         if 'events' not in data:
             data['events'] = []
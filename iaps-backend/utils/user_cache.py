@@ -0,0 +1,141 @@
+"""
+user_cache.py — in-process cache of the small slice of a user profile that
+almost every route needs: username, display name, profile picture and the
+show_online_status privacy flag.
+
+Chat sends, reactions, poll votes, DMs, presence checks and todo listings all
+used to do their own `db.users.find_one` for one or two of these fields on
+every call. They change rarely (settings edits, avatar uploads, a CR removing
+a photo), so this keeps them in a bounded LRU and lets those routes batch
+their misses into a single `$in` query.
+
+Invalidation is versioned rather than just "pop the key": every user has a
+version number that `invalidate()` bumps, and a cached entry is only served
+if it was loaded under the current version. A lookup that races with a
+profile update therefore can't store the pre-update document after the
+invalidation has happened — its snapshot is already one version behind.
+Without REDIS_URL the versions live in this process; with it they live in a
+Redis hash, so an edit handled by one instance invalidates every instance's
+copy at the cost of one HMGET per lookup (still far cheaper than Mongo).
+USER_CACHE_TTL_SECONDS is a backstop for anything that edits users without
+going through `invalidate()`.
+
+Usage:
+  user = user_cache.get_user(db, user_id)            # doc-shaped dict or None
+  users = user_cache.get_users(db, user_ids)         # {user_id: doc}
+  user_cache.invalidate(user_id)                     # after writing any of FIELDS
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from bson import ObjectId
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('username', 'fullName', 'profile_picture', 'show_online_status')
+MAX_USERS = int(os.environ.get('USER_CACHE_MAX', '5000'))
+TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '600'))
+VERSIONS_KEY = 'user_cache:versions'
+
+_entries = OrderedDict()   # user_id → (version, loaded_at, doc)
+_versions = {}             # user_id → version, when Redis isn't configured
+_lock = threading.Lock()
+
+_redis_client = None
+_redis_checked = False
+
+
+def _get_redis():
+    global _redis_client, _redis_checked
+    if not _redis_checked:
+        _redis_checked = True
+        redis_url = os.environ.get('REDIS_URL', '').strip()
+        if redis_url:
+            import redis
+            _redis_client = redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+
+def _current_versions(user_ids):
+    """{user_id: version}, or None if the versions can't be read right now
+    (treat everything as a miss rather than risk serving a stale entry)."""
+    r = _get_redis()
+    if r is None:
+        with _lock:
+            return {uid: _versions.get(uid, 0) for uid in user_ids}
+    try:
+        return {uid: int(v or 0) for uid, v in zip(user_ids, r.hmget(VERSIONS_KEY, user_ids))}
+    except Exception as e:
+        logger.warning(f"user_cache version lookup failed: {e}")
+        return None
+
+
+def get_users(db, user_ids):
+    """Return {user_id: profile} for every id that exists. Profiles are
+    doc-shaped — `_id` plus FIELDS — so they drop in where a projected
+    `db.users.find_one` result was used. Callers get copies."""
+    ids = []
+    for uid in user_ids:
+        uid = str(uid)
+        if uid not in ids and ObjectId.is_valid(uid):
+            ids.append(uid)
+    if not ids:
+        return {}
+
+    versions = _current_versions(ids)
+    now = time.monotonic()
+    found, misses = {}, []
+    with _lock:
+        for uid in ids:
+            entry = _entries.get(uid)
+            if (entry is not None and versions is not None and entry[0] == versions[uid]
+                    and now - entry[1] < TTL_SECONDS):
+                _entries.move_to_end(uid)
+                found[uid] = dict(entry[2])
+            else:
+                misses.append(uid)
+    if not misses:
+        return found
+
+    projection = {f: 1 for f in FIELDS}
+    loaded = list(db.users.find({'_id': {'$in': [ObjectId(uid) for uid in misses]}}, projection))
+    with _lock:
+        for doc in loaded:
+            uid = str(doc['_id'])
+            found[uid] = dict(doc)
+            if versions is not None:
+                _entries[uid] = (versions[uid], now, doc)
+                _entries.move_to_end(uid)
+        while len(_entries) > MAX_USERS:
+            _entries.popitem(last=False)
+    return found
+
+
+def get_user(db, user_id):
+    """Single-user form of get_users(); None if the user doesn't exist."""
+    return get_users(db, [user_id]).get(str(user_id))
+
+
+def invalidate(user_id):
+    """Call after changing any of FIELDS for this user."""
+    user_id = str(user_id)
+    r = _get_redis()
+    with _lock:
+        _entries.pop(user_id, None)
+        if r is None:
+            _versions[user_id] = _versions.get(user_id, 0) + 1
+    if r is not None:
+        try:
+            r.hincrby(VERSIONS_KEY, user_id, 1)
+        except Exception as e:
+            logger.warning(f"user_cache.invalidate failed for {user_id}: {e}")
+
+
+def clear():
+    """Forget every cached profile (tests)."""
+    with _lock:
+        _entries.clear()
+        _versions.clear()
@@ -101,7 +101,7 @@ describe('API service', () => {
     expect(typeof marksAPI.uploadAnalytics).toBe('function');
     expect(typeof marksAPI.deleteAnalytics).toBe('function');
     expect(typeof marksAPI.updateAnalyticsVisibility).toBe('function');
-    expect(typeof marksAPI.analyticsFileUrl).toBe('function');
+    expect(typeof marksAPI.getSignedAnalyticsFileUrl).toBe('function');
   });
 
   it('exports todoAPI with correct methods', async () => {
@@ -116,7 +116,7 @@ describe('API service', () => {
     const { chatAPI } = await import('../services/api');
     expect(typeof chatAPI.getMessages).toBe('function');
     expect(typeof chatAPI.uploadFile).toBe('function');
-    expect(typeof chatAPI.getFileUrl).toBe('function');
+    expect(typeof chatAPI.getSignedFileUrl).toBe('function');
     expect(typeof chatAPI.deleteMessage).toBe('function');
     expect(typeof chatAPI.warnUser).toBe('function');
     expect(typeof chatAPI.getMyWarnings).toBe('function');
@@ -165,7 +165,7 @@ describe('API service', () => {
     expect(typeof dmAPI.getMemberStats).toBe('function');
     expect(typeof dmAPI.getUnreadBySender).toBe('function');
     expect(typeof dmAPI.getUnreadByClassroom).toBe('function');
-    expect(typeof dmAPI.getDmFileUrl).toBe('function');
+    expect(typeof dmAPI.getSignedDmFileUrl).toBe('function');
   });
 
   it('exports settingsAPI with correct methods', async () => {
@@ -182,7 +182,7 @@ describe('API service', () => {
     expect(typeof settingsAPI.acknowledgePhotoRemoval).toBe('function');
     expect(typeof settingsAPI.listPersonalDocs).toBe('function');
     expect(typeof settingsAPI.uploadPersonalDoc).toBe('function');
-    expect(typeof settingsAPI.getPersonalDocUrl).toBe('function');
+    expect(typeof settingsAPI.getSignedPersonalDocUrl).toBe('function');
     expect(typeof settingsAPI.deletePersonalDoc).toBe('function');
     expect(typeof settingsAPI.verifyPassword).toBe('function');
     expect(typeof settingsAPI.getLoginActivity).toBe('function');
@@ -193,7 +193,8 @@ describe('API service', () => {
     expect(typeof academicAPI.getMySemesters).toBe('function');
     expect(typeof academicAPI.getAllResources).toBe('function');
     expect(typeof academicAPI.upload).toBe('function');
-    expect(typeof academicAPI.getFileUrl).toBe('function');
+    expect(typeof academicAPI.getSignedFileUrl).toBe('function');
+    expect(typeof academicAPI.getSignedResourceUrl).toBe('function');
     expect(typeof academicAPI.deleteResource).toBe('function');
     expect(typeof academicAPI.getResources).toBe('function');
     expect(typeof academicAPI.toggleResourcePublic).toBe('function');
@@ -228,12 +229,16 @@ describe('API service', () => {
     expect(typeof linksAPI.delete).toBe('function');
   });
 
-  it('analyticsFileUrl includes token from localStorage', async () => {
+  it('file URLs are signed by the backend, never built from the token', async () => {
     localStorage.setItem('token', 'test-token-123');
+    const axios = (await import('axios')).default;
     const { marksAPI } = await import('../services/api');
-    const url = marksAPI.analyticsFileUrl('file-id-1');
-    expect(url).toContain('test-token-123');
+    const instance = axios.create.mock.results[0].value;
+    instance.get.mockResolvedValueOnce({ data: { url: '/api/marks/analytics/file/file-id-1?sig=abc' } });
+    const url = await marksAPI.getSignedAnalyticsFileUrl('file-id-1');
+    expect(instance.get).toHaveBeenCalledWith('/marks/analytics/file/file-id-1/url');
     expect(url).toContain('file-id-1');
+    expect(url).not.toContain('test-token-123');
   });
 
   it('getAvatarUrl includes userId in URL', async () => {
@@ -242,22 +247,18 @@ describe('API service', () => {
     expect(url).toContain('user-abc');
   });
 
-  it('chatAPI.getFileUrl includes messageId in URL', async () => {
-    const { chatAPI } = await import('../services/api');
-    const url = chatAPI.getFileUrl('msg-123');
-    expect(url).toContain('msg-123');
-  });
-
-  it('dmAPI.getDmFileUrl includes messageId in URL', async () => {
-    const { dmAPI } = await import('../services/api');
-    const url = dmAPI.getDmFileUrl('dm-msg-456');
-    expect(url).toContain('dm-msg-456');
-  });
-
-  it('settingsAPI.getPersonalDocUrl includes docId in URL', async () => {
-    const { settingsAPI } = await import('../services/api');
-    const url = settingsAPI.getPersonalDocUrl('doc-789');
-    expect(url).toContain('doc-789');
+  it.each([
+    ['chatAPI', 'getSignedFileUrl', 'msg-123', '/chat/file/msg-123/url'],
+    ['dmAPI', 'getSignedDmFileUrl', 'dm-msg-456', '/dm/file/dm-msg-456/url'],
+    ['settingsAPI', 'getSignedPersonalDocUrl', 'doc-789', '/settings/personal-docs/doc-789/url'],
+  ])('%s.%s asks for a signed URL', async (apiName, method, id, endpoint) => {
+    const axios = (await import('axios')).default;
+    const mod = await import('../services/api');
+    const instance = axios.create.mock.results[0].value;
+    instance.get.mockResolvedValueOnce({ data: { url: `/api${endpoint.slice(0, -4)}?sig=abc` } });
+    const url = await mod[apiName][method](id);
+    expect(instance.get).toHaveBeenCalledWith(endpoint);
+    expect(url).toContain(id);
   });
 });
 
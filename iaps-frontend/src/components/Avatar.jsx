@@ -41,7 +41,7 @@ function Avatar({ user, size = 36, showOnline = null, dotBg = 'var(--card-bg)',
     return (
       <span style={{ position: 'relative', display: 'inline-flex', flexShrink: 0 }}>
         <img
-          src={settingsAPI.getAvatarUrl(userId)}
+          src={settingsAPI.getAvatarUrl(userId, user.profile_picture, size)}
           alt={user.username}
           onError={() => setImgFailed(true)}
           style={{ width: size, height: size, borderRadius: '50%', objectFit: 'cover', display: 'block' }}
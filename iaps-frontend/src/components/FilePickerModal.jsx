@@ -1,15 +1,8 @@
 import React, { useState, useEffect, useMemo } from 'react';
-import { academicAPI, chatAPI, documentAPI, BACKEND_URL } from '../services/api';
+import { academicAPI, chatAPI, documentAPI } from '../services/api';
 import { sizeLabel, FileTypeIcon } from '../utils/fileUtils';
 import { Trash2, X, FileText, BookOpen, Calendar, ClipboardList, FolderOpen, MessageSquare, Folder, GraduationCap, FlaskConical } from 'lucide-react';
 
-function getResourceUrl(r) {
-  const token = localStorage.getItem('token') || '';
-  if (r.source === 'chat_unlinked') return chatAPI.getFileUrl(r.chat_message_id);
-  if (r.source === 'document') return `${BACKEND_URL}/api/document/${r.document_id}/download?token=${encodeURIComponent(token)}`;
-  return academicAPI.getFileUrl(r.id);
-}
-
 const SECTION_ICON_MAP = {
   'PYQ':         FileText,
   'Books':       BookOpen,
@@ -37,7 +30,8 @@ export default function FilePickerModal({ onSelect, onClose, user, excludePdf =
   const [deletingId,    setDeletingId]    = useState(null);
 
   useEffect(() => {
-    academicAPI.getAllResources()
+    // The picker filters client-side, so take the largest page the API allows
+    academicAPI.getAllResources({ limit: 500 })
       .then(res => setResources(res.data.resources || []))
       .catch(() => setError('Failed to load files'))
       .finally(() => setLoading(false));
@@ -69,8 +63,7 @@ export default function FilePickerModal({ onSelect, onClose, user, excludePdf =
   const handleSelect = async (resource) => {
     setFetching(true);
     try {
-      const url = getResourceUrl(resource);
-      const res = await fetch(url);
+      const res = await fetch(await academicAPI.getSignedResourceUrl(resource));
       if (!res.ok) throw new Error('Failed to fetch file');
       const blob = await res.blob();
       const file = new File([blob], resource.name, {
@@ -0,0 +1,80 @@
+import React from 'react';
+
+// Files are served from short-lived signed URLs (the .../url endpoints in
+// services/api.js), never from URLs carrying the login JWT. Each component
+// here takes getSignedUrl: () => Promise<string>.
+
+/** Resolve a signed URL once per `key`; { url, failed }. */
+export function useSignedUrl(getSignedUrl, key) {
+  const [state, setState] = React.useState({ url: null, failed: false });
+
+  React.useEffect(() => {
+    let cancelled = false;
+    setState({ url: null, failed: false });
+    getSignedUrl()
+      .then(url => { if (!cancelled) setState({ url, failed: false }); })
+      .catch(() => { if (!cancelled) setState({ url: null, failed: true }); });
+    return () => { cancelled = true; };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [key]);
+
+  return state;
+}
+
+/** Open a freshly signed URL in a new tab. The tab is opened before the
+ *  request so the popup blocker still sees the click. */
+export async function openSignedUrl(getSignedUrl) {
+  const win = window.open('', '_blank');
+  try {
+    const url = await getSignedUrl();
+    if (win) win.location.href = url;
+    else window.location.href = url;
+  } catch {
+    if (win) win.close();
+  }
+}
+
+// <video>/<audio> whose src is a signed URL, so the player's Range requests
+// can be served by the proxy instead of a backend worker.
+function SignedMedia({ kind = 'video', getSignedUrl, signKey, type, style }) {
+  const { url } = useSignedUrl(getSignedUrl, signKey);
+  const Tag = kind === 'audio' ? 'audio' : 'video';
+  return (
+    <Tag controls preload="metadata" style={style}>
+      {url && <source src={url} type={type} />}
+    </Tag>
+  );
+}
+
+/** <img> whose src is a signed URL; onError also fires if signing fails. */
+export function SignedImage({ getSignedUrl, signKey, onError, ...imgProps }) {
+  const { url, failed } = useSignedUrl(getSignedUrl, signKey);
+
+  React.useEffect(() => {
+    if (failed && onError) onError();
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [failed]);
+
+  if (!url) return null;
+  return <img src={url} onError={onError} {...imgProps} />;
+}
+
+/** A link that signs its URL when clicked, so it never goes stale and a
+ *  long list doesn't sign every row up front. */
+export function SignedLink({ getSignedUrl, children, ...anchorProps }) {
+  return (
+    <a
+      href="#"
+      {...anchorProps}
+      onClick={(e) => {
+        e.preventDefault();
+        e.stopPropagation();
+        openSignedUrl(getSignedUrl);
+      }}
+    >
+      {children}
+    </a>
+  );
+}
+
+export default SignedMedia;
@@ -3,6 +3,7 @@ import { useParams, useNavigate, useLocation, Link } from 'react-router-dom';
 import { semesterAPI, academicAPI, todoAPI, subjectAPI } from '../services/api';
 import { useSocket } from '../hooks/useSocket';
 import FilePickerModal from '../components/FilePickerModal';
+import { SignedLink } from '../components/SignedMedia';
 import { sizeLabel, FileTypeIcon } from '../utils/fileUtils';
 import {
   Calendar, ClipboardList, GraduationCap, BookMarked, Folder,
@@ -28,7 +29,6 @@ function SectionIcon({ id, name, size = 14 }) {
 // ── File row ────────────────────────────────────────────────────────────────
 
 function FileRow({ resource, onDelete, onDragStart, canDelete, isCr, semesterId, onTogglePublic, onHide, userId, folderName }) {
-  const url = academicAPI.getFileUrl(resource.id);
   const isPyqOrBooks = resource.category === 'pyq' || resource.category === 'books';
   const isPublic = resource.is_public !== false; // default true
   // Members (non-CR) can hide CR's public PYQ/Books files from their own view
@@ -51,10 +51,8 @@ function FileRow({ resource, onDelete, onDragStart, canDelete, isCr, semesterId,
       <span style={{ color: 'var(--text-secondary)', opacity: 0.35, fontSize: '13px', flexShrink: 0, userSelect: 'none', letterSpacing: '-1px' }} title="Drag to move between folders">⠿⠿</span>
       <FileTypeIcon mime={resource.mime_type} size={18} />
       <div style={{ flex: 1, minWidth: 0 }}>
-        <a
-          href={url}
-          target="_blank"
-          rel="noreferrer"
+        <SignedLink
+          getSignedUrl={() => academicAPI.getSignedFileUrl(resource.id)}
           style={{
             fontSize: '13px', fontWeight: 600, color: 'var(--text-primary)',
             textDecoration: 'none', display: 'block',
@@ -63,7 +61,7 @@ function FileRow({ resource, onDelete, onDragStart, canDelete, isCr, semesterId,
           title={resource.name}
         >
           {resource.name}
-        </a>
+        </SignedLink>
         <div style={{ fontSize: '11px', color: 'var(--text-secondary)', marginTop: '1px', display: 'flex', alignItems: 'center', gap: '6px', flexWrap: 'wrap' }}>
           {resource.uploaded_by_name}
           {resource.size ? ` · ${sizeLabel(resource.size)}` : ''}
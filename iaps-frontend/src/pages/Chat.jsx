@@ -1,11 +1,12 @@
 import React, { useState, useEffect, useRef, useCallback, useMemo } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
-import { chatAPI, semesterAPI, classroomAPI, settingsAPI, documentAPI, BACKEND_URL } from '../services/api';
+import { chatAPI, semesterAPI, classroomAPI, settingsAPI, documentAPI } from '../services/api';
 import EmojiMartPicker from '@emoji-mart/react';
 import emojiData from '@emoji-mart/data';
 import Avatar from '../components/Avatar';
 import { useSocket } from '../hooks/useSocket';
 import FilePickerModal from '../components/FilePickerModal';
+import SignedMedia, { SignedImage, SignedLink, openSignedUrl } from '../components/SignedMedia';
 import { Image, Video, Music, FileText, Paperclip, Pin, PinOff, Trash2, EyeOff, Eye, AlertTriangle, Folder, FolderOpen, Lock, Clock, X, UserX, CornerUpLeft, BarChart2, Smile, Info, Edit2, List, Plus, Check } from 'lucide-react';
 import { FileTypeIcon, sizeLabel } from '../utils/fileUtils';
 import { formatTime, relativeTime, formatDate } from '../utils/timeUtils';
@@ -110,7 +111,7 @@ function FilesPanel({ messages }) {
               <div style={{ display: 'flex', flexDirection: 'column', gap: '1px', padding: '4px 0' }}>
                 {items.map(msg => {
                   const { name, mime_type, size } = msg.file;
-                  const fileUrl = chatAPI.getFileUrl(msg.id);
+                  const signFile = () => chatAPI.getSignedFileUrl(msg.id);
                   const isImage = mime_type?.startsWith('image/');
                   const isVideo = mime_type?.startsWith('video/');
                   const isAudio = mime_type?.startsWith('audio/');
@@ -125,7 +126,7 @@ function FilesPanel({ messages }) {
                     }}
                       onMouseEnter={e => !isBroken && (e.currentTarget.style.background = 'var(--bg-color)')}
                       onMouseLeave={e => e.currentTarget.style.background = 'transparent'}
-                      onClick={() => !isBroken && window.open(fileUrl, '_blank')}
+                      onClick={() => !isBroken && openSignedUrl(signFile)}
                     >
                       <div style={{
                         width: '40px', height: '40px', borderRadius: '6px',
@@ -134,8 +135,8 @@ function FilesPanel({ messages }) {
                         overflow: 'hidden', fontSize: '20px',
                       }}>
                         {isImage ? (
-                          <img
-                            src={fileUrl}
+                          <SignedImage
+                            getSignedUrl={signFile} signKey={msg.id}
                             alt=""
                             style={{ width: '100%', height: '100%', objectFit: 'cover' }}
                             onError={() => setBrokenFiles(prev => new Set([...prev, msg.id]))}
@@ -539,6 +540,7 @@ function Chat({ user }) {
   const [currentPinIdx, setCurrentPinIdx]   = useState(0);   // WhatsApp-style cycling index
   const [highlightedMsgId, setHighlightedMsgId] = useState(null); // brief highlight on scroll
   const [hasMore, setHasMore]             = useState(false);
+  const [nextCursor, setNextCursor]       = useState(null);
   const [loadingMore, setLoadingMore]     = useState(false);
   const [warnModal, setWarnModal]         = useState(null);   // { userId, name, messageId }
   const [warnReason, setWarnReason]       = useState('');
@@ -661,7 +663,8 @@ function Chat({ user }) {
     ]).then(([msgRes, , onlineRes, receiptsRes]) => {
       const msgs = msgRes.data.messages || [];
       setMessages(msgs);
-      setHasMore(msgs.length === 50);
+      setNextCursor(msgRes.data.next_cursor || null);
+      setHasMore(!!msgRes.data.next_cursor);
       setOnlineUsers(new Set(onlineRes.data.online_user_ids || []));
       setOnlineLoaded(true);
       setReadReceipts(receiptsRes.data.receipts || {});
@@ -957,16 +960,16 @@ function Chat({ user }) {
 
   // ── Load earlier messages (#8) ─────────────────────────────────────────────
   const loadMore = async () => {
-    if (!hasMore || loadingMore || messages.length === 0) return;
+    if (!hasMore || loadingMore || !nextCursor) return;
     setLoadingMore(true);
     const container = messagesContainerRef.current;
     const prevScrollHeight = container?.scrollHeight || 0;
     try {
-      const oldest = messages[0].id;
-      const res = await chatAPI.getMessages(semesterId, 50, oldest);
+      const res = await chatAPI.getMessages(semesterId, 50, nextCursor);
       const older = res.data.messages || [];
       setMessages(prev => [...older, ...prev]);
-      setHasMore(older.length === 50);
+      setNextCursor(res.data.next_cursor || null);
+      setHasMore(!!res.data.next_cursor);
       // Restore scroll position after prepend
       requestAnimationFrame(() => {
         if (container) {
@@ -1100,17 +1103,14 @@ function Chat({ user }) {
     } finally { setPersDocsPwChecking(false); }
   };
 
-  // ── Fetch a doc URL and stage it for sending ───────────────────────────────
-  const attachDocToChat = async (fileUrl, fileName) => {
+  // ── Fetch a doc from its signed URL and stage it for sending ───────────────
+  const attachDocToChat = async (getSignedUrl, fileName) => {
     setAttachingDoc(true);
     setSemDocsModal(false);
     setPersDocsModal(false);
     setError('');
     try {
-      const token = localStorage.getItem('token') || '';
-      const resp = await fetch(fileUrl.includes('?') ? fileUrl : `${fileUrl}?token=${encodeURIComponent(token)}`, {
-        headers: { 'Authorization': `Bearer ${token}` },
-      });
+      const resp = await fetch(await getSignedUrl());
       if (!resp.ok) throw new Error('Download failed');
       const blob = await resp.blob();
       const file = new File([blob], fileName, { type: blob.type });
@@ -1190,6 +1190,8 @@ function Chat({ user }) {
       setRemovePhotoReason('');
       const res = await chatAPI.getMessages(semesterId);
       setMessages(res.data.messages || []);
+      setNextCursor(res.data.next_cursor || null);
+      setHasMore(!!res.data.next_cursor);
     } catch (err) {
       setError(err.response?.data?.error || 'Failed to remove photo');
     } finally {
@@ -1406,17 +1408,17 @@ function Chat({ user }) {
     }
 
     const { mime_type, name, size } = msg.file;
-    const fileUrl = chatAPI.getFileUrl(msg.id);
+    const signFile = () => chatAPI.getSignedFileUrl(msg.id);
 
     if (mime_type?.startsWith('image/')) {
       return (
         <div>
           {msg.text && <p style={{ margin: '0 0 6px', whiteSpace: 'pre-wrap' }}>{msg.text}</p>}
-          <img
-            src={fileUrl} alt={name}
+          <SignedImage
+            getSignedUrl={signFile} signKey={msg.id} alt={name}
             style={{ maxWidth: '280px', maxHeight: '220px', borderRadius: '8px', display: 'block', cursor: 'pointer' }}
-            onClick={() => window.open(fileUrl, '_blank')}
-            onError={(e) => { e.target.style.display = 'none'; e.target.onclick = null; }}
+            onClick={() => openSignedUrl(signFile)}
+            onError={(e) => { if (e) { e.target.style.display = 'none'; e.target.onclick = null; } }}
           />
         </div>
       );
@@ -1426,9 +1428,11 @@ function Chat({ user }) {
       return (
         <div>
           {msg.text && <p style={{ margin: '0 0 6px', whiteSpace: 'pre-wrap' }}>{msg.text}</p>}
-          <audio controls style={{ maxWidth: '280px' }}>
-            <source src={fileUrl} type={mime_type} />
-          </audio>
+          <SignedMedia
+            kind="audio" type={mime_type} signKey={msg.id}
+            getSignedUrl={signFile}
+            style={{ maxWidth: '280px' }}
+          />
         </div>
       );
     }
@@ -1437,9 +1441,11 @@ function Chat({ user }) {
       return (
         <div>
           {msg.text && <p style={{ margin: '0 0 6px', whiteSpace: 'pre-wrap' }}>{msg.text}</p>}
-          <video controls style={{ maxWidth: '320px', maxHeight: '220px', borderRadius: '8px' }}>
-            <source src={fileUrl} type={mime_type} />
-          </video>
+          <SignedMedia
+            kind="video" type={mime_type} signKey={msg.id}
+            getSignedUrl={signFile}
+            style={{ maxWidth: '320px', maxHeight: '220px', borderRadius: '8px' }}
+          />
         </div>
       );
     }
@@ -1447,8 +1453,8 @@ function Chat({ user }) {
     return (
       <div>
         {msg.text && <p style={{ margin: '0 0 6px', whiteSpace: 'pre-wrap' }}>{msg.text}</p>}
-        <a
-          href={fileUrl} target="_blank" rel="noreferrer"
+        <SignedLink
+          getSignedUrl={signFile}
           style={{
             display: 'inline-flex', alignItems: 'center', gap: '8px',
             background: isMe ? 'rgba(255,255,255,0.2)' : 'var(--bg-color)',
@@ -1459,7 +1465,7 @@ function Chat({ user }) {
         >
           <FileTypeIcon mime={mime_type} size={18} />
           <span style={{ wordBreak: 'break-all' }}>{name}{size ? ` · ${sizeLabel(size)}` : ''}</span>
-        </a>
+        </SignedLink>
       </div>
     );
   };
@@ -1818,7 +1824,7 @@ function Chat({ user }) {
             }
 
             const avatarUser = { id: msg.user_id, username: msg.username, profile_picture: msg.profile_picture };
-            const avatarUrl = msg.profile_picture ? settingsAPI.getAvatarUrl(msg.user_id) : null;
+            const avatarUrl = msg.profile_picture ? settingsAPI.getAvatarUrl(msg.user_id, msg.profile_picture) : null;
 
             return (
               <div key={msg.id} data-msg-id={msg.id} style={{
@@ -2085,7 +2091,7 @@ function Chat({ user }) {
                             ));
                             chatAPI.reactToMessage(semesterId, msg.id, emoji).catch(err => {
                               setError(err.response?.data?.error || 'Failed to react');
-                              chatAPI.getMessages(semesterId, 50).then(r => setMessages(r.data.messages || [])).catch(() => {});
+                              chatAPI.getMessages(semesterId, 50).then(r => { setMessages(r.data.messages || []); setNextCursor(r.data.next_cursor || null); setHasMore(!!r.data.next_cursor); }).catch(() => {});
                             });
                           }}
                         />
@@ -2153,7 +2159,7 @@ function Chat({ user }) {
                                 ));
                                 chatAPI.reactToMessage(semesterId, msg.id, r.emoji).catch(err => {
                                   setError(err.response?.data?.error || 'Failed to react');
-                                  chatAPI.getMessages(semesterId, 50).then(res => setMessages(res.data.messages || [])).catch(() => {});
+                                  chatAPI.getMessages(semesterId, 50).then(res => { setMessages(res.data.messages || []); setNextCursor(res.data.next_cursor || null); setHasMore(!!res.data.next_cursor); }).catch(() => {});
                                 });
                               }}
                               onMouseEnter={e => {
@@ -2849,12 +2855,10 @@ function Chat({ user }) {
             ) : (
               <div style={{ overflowY: 'auto', display: 'flex', flexDirection: 'column', gap: '6px' }}>
                 {semDocs.map(doc => {
-                  const token = localStorage.getItem('token') || '';
-                  const url = `${BACKEND_URL}/api/document/${doc.id}/download?token=${encodeURIComponent(token)}`;
                   return (
                     <button
                       key={doc.id}
-                      onClick={() => attachDocToChat(url, doc.name || doc.filename || 'document')}
+                      onClick={() => attachDocToChat(() => documentAPI.getSignedDownloadUrl(doc.id), doc.name || doc.filename || 'document')}
                       style={{ display: 'flex', alignItems: 'center', gap: '10px', padding: '10px 12px', borderRadius: '8px', background: 'var(--bg-color)', border: '1px solid var(--border-color)', cursor: 'pointer', textAlign: 'left' }}
                       onMouseEnter={e => e.currentTarget.style.background = 'rgba(102,126,234,0.08)'}
                       onMouseLeave={e => e.currentTarget.style.background = 'var(--bg-color)'}
@@ -2917,11 +2921,10 @@ function Chat({ user }) {
                 ) : (
                   <div style={{ overflowY: 'auto', display: 'flex', flexDirection: 'column', gap: '6px' }}>
                     {persDocs.map(doc => {
-                      const url = settingsAPI.getPersonalDocUrl(doc.id);
                       return (
                         <button
                           key={doc.id}
-                          onClick={() => attachDocToChat(url, doc.label || doc.filename || 'document')}
+                          onClick={() => attachDocToChat(() => settingsAPI.getSignedPersonalDocUrl(doc.id), doc.label || doc.filename || 'document')}
                           style={{ display: 'flex', alignItems: 'center', gap: '10px', padding: '10px 12px', borderRadius: '8px', background: 'var(--bg-color)', border: '1px solid var(--border-color)', cursor: 'pointer', textAlign: 'left' }}
                           onMouseEnter={e => e.currentTarget.style.background = 'rgba(102,126,234,0.08)'}
                           onMouseLeave={e => e.currentTarget.style.background = 'var(--bg-color)'}
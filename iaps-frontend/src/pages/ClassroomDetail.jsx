@@ -2,6 +2,7 @@ import React, { useState, useEffect, useRef, useCallback } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { classroomAPI, semesterAPI, settingsAPI, dmAPI, chatAPI, BACKEND_URL } from '../services/api';
 import FilePickerModal from '../components/FilePickerModal';
+import { SignedLink } from '../components/SignedMedia';
 import { useDMSocket } from '../hooks/useDMSocket';
 import { io } from 'socket.io-client';
 import Avatar from '../components/Avatar';
@@ -1648,7 +1649,6 @@ function DMModal({ target, messages, loading, error, text, onTextChange, pending
             const isMe = msg.sender_id === userId;
             const isDeleted = msg.deleted_for_everyone;
             const hasFile = !!msg.file && !isDeleted;
-            const fileUrl = hasFile ? dmAPI.getDmFileUrl(msg.id) : null;
             const isRead = isMe && msg.read_by?.includes(target.id);
             const isLastMine = isMe && idx === lastMyMsgIdx;
             const isPending = !!msg.pending;
@@ -1794,11 +1794,11 @@ function DMModal({ target, messages, loading, error, text, onTextChange, pending
                             </div>
                           )}
                           {hasFile && (
-                            <a href={fileUrl} target="_blank" rel="noreferrer" style={{ display: 'flex', alignItems: 'center', gap: '6px', color: isMe ? 'rgba(255,255,255,0.9)' : '#667eea', textDecoration: 'none', marginBottom: msg.text ? '6px' : 0 }}>
+                            <SignedLink getSignedUrl={() => dmAPI.getSignedDmFileUrl(msg.id)} style={{ display: 'flex', alignItems: 'center', gap: '6px', color: isMe ? 'rgba(255,255,255,0.9)' : '#667eea', textDecoration: 'none', marginBottom: msg.text ? '6px' : 0 }}>
                               <FileTypeIcon mime={msg.file.mime_type} size={18} />
                               <span style={{ fontSize: '13px', fontWeight: 500 }}>{msg.file.name}</span>
                               <span style={{ fontSize: '11px', opacity: 0.75 }}>{sizeLabel(msg.file.size)}</span>
-                            </a>
+                            </SignedLink>
                           )}
                           {msg.text && <span>{msg.text}</span>}
                         </>
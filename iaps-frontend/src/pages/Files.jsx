@@ -1,33 +1,52 @@
 import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
-import { academicAPI, chatAPI, BACKEND_URL } from '../services/api';
+import { academicAPI } from '../services/api';
 import { FileTypeIcon, sizeLabel } from '../utils/fileUtils';
+import { SignedLink } from '../components/SignedMedia';
 
 function Files({ user }) {
   const [resources, setResources] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [search, setSearch] = useState('');
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
+  // Search runs server-side; debounce so each keystroke isn't a request
   useEffect(() => {
-    academicAPI.getAllResources()
-      .then(resRes => setResources(resRes.data.resources || []))
-      .catch(() => setError('Failed to load files'))
-      .finally(() => setLoading(false));
-  }, []);
+    const q = search.trim();
+    const t = setTimeout(() => {
+      setLoading(true);
+      academicAPI.getAllResources(q ? { q } : {})
+        .then(resRes => {
+          setResources(resRes.data.resources || []);
+          setNextCursor(resRes.data.next_cursor || null);
+          setError('');
+        })
+        .catch(() => setError('Failed to load files'))
+        .finally(() => setLoading(false));
+    }, q ? 300 : 0);
+    return () => clearTimeout(t);
+  }, [search]);
 
-  const filtered = search
-    ? resources.filter(r =>
-        r.name.toLowerCase().includes(search.toLowerCase()) ||
-        r.classroom_name?.toLowerCase().includes(search.toLowerCase()) ||
-        r.semester_name?.toLowerCase().includes(search.toLowerCase()) ||
-        r.subject_name?.toLowerCase().includes(search.toLowerCase())
-      )
-    : resources;
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const q = search.trim();
+      const res = await academicAPI.getAllResources({ cursor: nextCursor, ...(q && { q }) });
+      setResources(prev => [...prev, ...(res.data.resources || [])]);
+      setNextCursor(res.data.next_cursor || null);
+    } catch {
+      setError('Failed to load files');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   // Group: classroom+semester key → subject key → section key → files
   const groups = {};
-  filtered.forEach(r => {
+  resources.forEach(r => {
     const semKey = `${r.classroom_name || 'Unknown Classroom'} / ${r.semester_name || 'Unknown Semester'}`;
     const semMeta = { classroomId: r.classroom_id, semesterId: r.semester_id };
     if (!groups[semKey]) groups[semKey] = { meta: semMeta, subjects: {} };
@@ -43,7 +62,7 @@ function Files({ user }) {
       <div style={{ display: 'flex', alignItems: 'center', justifyContent: 'space-between', marginBottom: '8px' }}>
         <h1 style={{ margin: 0, fontSize: '26px', fontWeight: 800, color: 'var(--text-primary)' }}>Files</h1>
         <span style={{ fontSize: '13px', color: 'var(--text-secondary)' }}>
-          {filtered.length} file{filtered.length !== 1 ? 's' : ''}
+          {resources.length}{nextCursor ? '+' : ''} file{resources.length !== 1 ? 's' : ''}
         </span>
       </div>
       <p style={{ color: 'var(--text-secondary)', marginTop: 0, marginBottom: '24px', fontSize: '14px' }}>
@@ -68,7 +87,7 @@ function Files({ user }) {
         <div style={{ color: 'var(--text-secondary)', textAlign: 'center', padding: '40px 0' }}>Loading…</div>
       ) : error ? (
         <div style={{ color: '#dc2626', padding: '12px 16px', background: '#fef2f2', borderRadius: '8px' }}>{error}</div>
-      ) : filtered.length === 0 ? (
+      ) : resources.length === 0 ? (
         <div style={{ color: 'var(--text-secondary)', textAlign: 'center', padding: '40px 0', fontSize: '15px' }}>
           {search ? 'No files match your search.' : 'No files uploaded yet.'}
         </div>
@@ -126,12 +145,6 @@ function Files({ user }) {
                     </div>
                     <div style={{ display: 'flex', flexDirection: 'column', gap: '6px' }}>
                       {files.map(r => {
-                        const token = localStorage.getItem('token') || '';
-                        const url = r.source === 'chat_unlinked'
-                          ? chatAPI.getFileUrl(r.chat_message_id)
-                          : r.source === 'document'
-                          ? `${BACKEND_URL}/api/document/${r.document_id}/download?token=${encodeURIComponent(token)}`
-                          : academicAPI.getFileUrl(r.id);
                         return (
                           <div key={r.id} style={{
                             display: 'flex', alignItems: 'center', gap: '10px',
@@ -140,10 +153,8 @@ function Files({ user }) {
                           }}>
                             <FileTypeIcon mime={r.mime_type} size={18} />
                             <div style={{ flex: 1, minWidth: 0 }}>
-                              <a
-                                href={url}
-                                target="_blank"
-                                rel="noreferrer"
+                              <SignedLink
+                                getSignedUrl={() => academicAPI.getSignedResourceUrl(r)}
                                 style={{
                                   fontSize: '13px', fontWeight: 600, color: 'var(--text-primary)',
                                   textDecoration: 'none', display: 'block',
@@ -152,7 +163,7 @@ function Files({ user }) {
                                 title={r.name}
                               >
                                 {r.name}
-                              </a>
+                              </SignedLink>
                               <div style={{ fontSize: '11px', color: 'var(--text-secondary)', marginTop: '1px' }}>
                                 {r.uploaded_by_name}
                                 {r.size ? ` · ${sizeLabel(r.size)}` : ''}
@@ -177,6 +188,22 @@ function Files({ user }) {
             ))}
           </div>
         ))}
+        {nextCursor && (
+          <div style={{ textAlign: 'center' }}>
+            <button
+              onClick={loadMore}
+              disabled={loadingMore}
+              style={{
+                background: 'var(--bg-color)', color: '#667eea', border: '1px solid var(--border-color)',
+                borderRadius: '20px', padding: '6px 20px', fontSize: '12px',
+                fontWeight: 600, cursor: loadingMore ? 'not-allowed' : 'pointer',
+                opacity: loadingMore ? 0.6 : 1,
+              }}
+            >
+              {loadingMore ? 'Loading…' : 'Load more files'}
+            </button>
+          </div>
+        )}
         </>
       )}
     </div>
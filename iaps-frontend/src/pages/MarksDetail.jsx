@@ -5,6 +5,7 @@ import { semesterAPI, marksAPI, subjectAPI } from '../services/api';
 import '../styles/Classroom.css';
 import { Edit2, Check, X, Plus, Upload, FileText } from 'lucide-react';
 import FilePickerModal from '../components/FilePickerModal';
+import { SignedLink } from '../components/SignedMedia';
 
 function MarksDetail({ user }) {
   const { classroomId, semesterId, subjectId } = useParams();
@@ -749,13 +750,12 @@ function MarksDetail({ user }) {
                 }}>
                   <FileText size={16} strokeWidth={1.5} style={{ flexShrink: 0, color: 'var(--text-secondary)' }} />
                   <div style={{ flex: 1, minWidth: 0 }}>
-                    <a
-                      href={marksAPI.analyticsFileUrl(f.id)}
-                      target="_blank" rel="noopener noreferrer"
+                    <SignedLink
+                      getSignedUrl={() => marksAPI.getSignedAnalyticsFileUrl(f.id)}
                       style={{ fontSize: '13px', color: '#667eea', textDecoration: 'none', fontWeight: 600, display: 'block', overflow: 'hidden', textOverflow: 'ellipsis', whiteSpace: 'nowrap' }}
                     >
                       {f.filename}
-                    </a>
+                    </SignedLink>
                     <div style={{ fontSize: '11px', color: 'var(--text-secondary)', display: 'flex', gap: '10px', marginTop: '4px', flexWrap: 'wrap', alignItems: 'center' }}>
                       <span>{f.uploaded_by_name}</span>
                       <span>{new Date(f.created_at).toLocaleDateString()}</span>
@@ -1,7 +1,8 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
 import SemesterSubnav from '../components/SemesterSubnav';
-import { semesterAPI, subjectAPI, documentAPI, todoAPI, classroomAPI, announcementAPI, linksAPI, timetableAPI, BACKEND_URL } from '../services/api';
+import { SignedLink } from '../components/SignedMedia';
+import { semesterAPI, subjectAPI, documentAPI, todoAPI, classroomAPI, announcementAPI, linksAPI, timetableAPI } from '../services/api';
 import '../styles/Classroom.css';
 import { Link as LinkIcon, X, FileText, Megaphone, Clock, ClipboardList, ChevronDown, ChevronRight, Pencil, Check } from 'lucide-react';
 
@@ -322,11 +323,6 @@ function SemesterDetail({ user }) {
     }
   };
 
-  const docUrl = (doc) => {
-    const token = localStorage.getItem('token') || '';
-    return `${BACKEND_URL}/api/document/${doc.id}/download?token=${encodeURIComponent(token)}`;
-  };
-
   // ── Todos ───────────────────────────────────────────────────────────────────
 
   const handleAddTodo = async (e) => {
@@ -890,10 +886,10 @@ function SemesterDetail({ user }) {
                     border: '1px solid #e0e7ff',
                   }}>
                     <div style={{ flex: 1, minWidth: 0 }}>
-                      <a href={docUrl(doc)} target="_blank" rel="noopener noreferrer" style={{
+                      <SignedLink getSignedUrl={() => documentAPI.getSignedDownloadUrl(doc.id)} style={{
                         color: '#4338ca', fontWeight: 600, fontSize: '14px', textDecoration: 'none',
                         overflow: 'hidden', textOverflow: 'ellipsis', whiteSpace: 'nowrap', display: 'block',
-                      }}>{doc.filename}</a>
+                      }}>{doc.filename}</SignedLink>
                       <span style={{ fontSize: '12px', color: '#9ca3af' }}>
                         {doc.uploaded_by?.username} · {new Date(doc.created_at).toLocaleDateString()}
                       </span>
@@ -3,6 +3,7 @@ import { settingsAPI, BACKEND_URL } from '../services/api';
 import { formatDate } from '../utils/timeUtils';
 import { useTheme } from '../contexts/ThemeContext';
 import Avatar from '../components/Avatar';
+import { SignedLink } from '../components/SignedMedia';
 import { FileTypeIcon, sizeLabel } from '../utils/fileUtils';
 import { AlertTriangle, Pencil, Eye, Trash2 } from 'lucide-react';
 
@@ -624,14 +625,12 @@ function PersonalDocumentsSection() {
                     {sizeLabel(doc.size)} · {doc.created_at ? formatDate(doc.created_at) : ''}
                   </div>
                 </div>
-                <a
-                  href={settingsAPI.getPersonalDocUrl(doc.id)}
-                  target="_blank"
-                  rel="noopener noreferrer"
+                <SignedLink
+                  getSignedUrl={() => settingsAPI.getSignedPersonalDocUrl(doc.id)}
                   style={{ ...ghostBtnStyle, textDecoration: 'none', padding: '4px 10px', fontSize: '13px' }}
                 >
                   Open
-                </a>
+                </SignedLink>
                 <button
                   onClick={() => handleDelete(doc.id, doc.label)}
                   style={{ ...ghostBtnStyle, color: '#ef4444', borderColor: '#ef4444', padding: '4px 10px', fontSize: '13px' }}
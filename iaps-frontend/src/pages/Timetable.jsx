@@ -1053,7 +1053,13 @@ export default function Timetable({ user }) {
     try {
       const fd = new FormData();
       fd.append('file', file);
-      const res = await timetableAPI.extract(semesterId, fd);
+      let res = await timetableAPI.extract(semesterId, fd);
+      // New images are extracted in the background — poll until the job finishes
+      const jobId = res.data.job_id;
+      while (res.data.status === 'pending') {
+        await new Promise(r => setTimeout(r, 1500));
+        res = await timetableAPI.getExtraction(semesterId, jobId);
+      }
       setExtractedData(res.data.extracted);
       setExtractStep('review');
     } catch (err) {
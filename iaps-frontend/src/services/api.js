@@ -3,12 +3,6 @@ import axios from 'axios';
 export const BACKEND_URL = import.meta.env.VITE_API_URL || 'http://localhost:5000';
 const API_BASE_URL = BACKEND_URL + '/api';
 
-/** Build an authenticated file URL (token passed as query param for direct browser fetch). */
-function fileUrl(path) {
-  const token = localStorage.getItem('token') || '';
-  return `${BACKEND_URL}/api/${path}?token=${encodeURIComponent(token)}`;
-}
-
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
@@ -44,6 +38,52 @@ api.interceptors.response.use(
   }
 );
 
+/** Fetch a short-lived signed URL for a file endpoint (no JWT in the URL; the
+ *  backend may hand delivery to the proxy or S3). `path` is the file URL path. */
+async function signedFileUrl(path) {
+  const res = await api.get(`/${path}/url`);
+  return `${BACKEND_URL}${res.data.url}`;
+}
+
+// Files above this go through the resumable protocol (/api/uploads) in
+// chunks, so a dropped connection resumes instead of starting over.
+const RESUMABLE_THRESHOLD = 5 * 1024 * 1024;
+const MAX_CHUNK_RETRIES = 5;
+
+/** Upload `file` in chunks and hand it to `kind`'s finalize hook; resolves to
+ *  the same response the feature's multipart upload route returns. */
+async function resumableUpload(kind, file, params = {}, onUploadProgress) {
+  const init = await api.post('/uploads', {
+    kind, filename: file.name, size: file.size, mime_type: file.type, params,
+  });
+  const { upload_id: id, chunk_size: chunkSize } = init.data;
+  let received = 0;
+  let failures = 0;
+  while (received < file.size) {
+    const end = Math.min(received + chunkSize, file.size);
+    try {
+      const res = await api.put(`/uploads/${id}`, file.slice(received, end), {
+        headers: {
+          'Content-Type': 'application/octet-stream',
+          'Content-Range': `bytes ${received}-${end - 1}/${file.size}`,
+        },
+      });
+      received = res.data.received;
+      failures = 0;
+      onUploadProgress?.({ loaded: received, total: file.size });
+    } catch (err) {
+      if (++failures > MAX_CHUNK_RETRIES || (err.response && err.response.status !== 409 && err.response.status < 500)) {
+        api.delete(`/uploads/${id}`).catch(() => {});
+        throw err;
+      }
+      await new Promise(r => setTimeout(r, 1000 * failures));
+      // Ask the server where to pick up — part of the chunk may have landed
+      received = (await api.get(`/uploads/${id}`)).data.received;
+    }
+  }
+  return api.post(`/uploads/${id}/finalize`);
+}
+
 // Auth endpoints
 export const authAPI = {
   signup: (data) => api.post('/auth/signup', data),
@@ -94,6 +134,7 @@ export const documentAPI = {
   list: (semesterId, params) => api.get(`/document/semester/${semesterId}/list`, { params }),
   delete: (documentId) => api.delete(`/document/${documentId}`),
   toggleAI: (documentId) => api.patch(`/document/${documentId}/toggle-ai`),
+  getSignedDownloadUrl: (documentId) => signedFileUrl(`document/${documentId}/download`),
 };
 
 // Todo endpoints
@@ -124,22 +165,41 @@ export const marksAPI = {
   saveMyMarks: (subjectId, data) => api.post(`/marks/my/${subjectId}`, data),
   listAnalytics: (subjectId) => api.get(`/marks/analytics/${subjectId}`),
   uploadAnalytics: (subjectId, formData, visibility = 'public') => {
+    const file = formData.get('file');
+    if (file?.size > RESUMABLE_THRESHOLD) {
+      return resumableUpload('analytics', file, { subject_id: subjectId, visibility });
+    }
     formData.append('visibility', visibility);
     return api.post(`/marks/analytics/${subjectId}`, formData, { headers: { 'Content-Type': 'multipart/form-data' } });
   },
   deleteAnalytics: (subjectId, fileId) => api.delete(`/marks/analytics/${subjectId}/${fileId}`),
   updateAnalyticsVisibility: (subjectId, fileId, visibility) => api.post(`/marks/analytics/${subjectId}/${fileId}/visibility`, { visibility }),
-  analyticsFileUrl: (fileId) => fileUrl(`marks/analytics/file/${fileId}`),
+  getSignedAnalyticsFileUrl: (fileId) => signedFileUrl(`marks/analytics/file/${fileId}`),
   getTrend: (classroomId) => api.get(`/marks/trend/${classroomId}`),
   getSemesterAnalytics: (semesterId) => api.get(`/marks/semester-analytics/${semesterId}`),
   getCrClassAverage: (semesterId) => api.get(`/marks/cr-class-average/${semesterId}`),
+  getClassAnalytics: (subjectId, params = {}) => api.get(`/marks/class-analytics/${subjectId}`, { params }),
+  getStanding: (subjectId) => api.get(`/marks/standing/${subjectId}`),
+  getWhatIf: (subjectId, params) => api.get(`/marks/what-if/${subjectId}`, { params }),
+  importMarks: (subjectId, file) => {
+    const fd = new FormData();
+    fd.append('file', file);
+    return api.post(`/marks/import/${subjectId}`, fd, { headers: { 'Content-Type': 'multipart/form-data' } });
+  },
+  exportMarks: (subjectId, format = 'csv') =>
+    api.get(`/marks/export/${subjectId}`, { params: { format }, responseType: 'blob' }),
 };
 
 // Chat endpoints
 export const chatAPI = {
-  getMessages: (semesterId, limit = 50, beforeId = null) =>
-    api.get(`/chat/${semesterId}/messages`, { params: { limit, ...(beforeId && { before_id: beforeId }) } }),
+  getMessages: (semesterId, limit = 50, cursor = null) =>
+    api.get(`/chat/${semesterId}/messages`, { params: { limit, ...(cursor && { cursor }) } }),
   uploadFile: (semesterId, file, text = '', replyToId = null) => {
+    if (file.size > RESUMABLE_THRESHOLD) {
+      return resumableUpload('chat', file, {
+        semester_id: semesterId, text, ...(replyToId && { reply_to_id: replyToId }),
+      });
+    }
     const fd = new FormData();
     fd.append('file', file);
     if (text) fd.append('text', text);
@@ -148,7 +208,7 @@ export const chatAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
-  getFileUrl: (messageId) => fileUrl(`chat/file/${messageId}`),
+  getSignedFileUrl: (messageId) => signedFileUrl(`chat/file/${messageId}`),
   deleteMessage: (semesterId, messageId, mode = '') =>
     api.delete(`/chat/${semesterId}/messages/${messageId}`, { params: mode ? { mode } : {} }),
   warnUser: (semesterId, userId, reason, messageId, warnType = 'chat') => api.post(`/chat/${semesterId}/warn`, { user_id: userId, reason, message_id: messageId, warn_type: warnType }),
@@ -186,7 +246,16 @@ export const settingsAPI = {
       headers: { 'Content-Type': 'multipart/form-data' },
     });
   },
-  getAvatarUrl: (userId) => `${BACKEND_URL}/api/settings/avatar/${userId}`,
+  // Pass the user's profile_picture as `version`: the URL then changes with the
+  // picture, so the browser can cache it indefinitely. `size` (CSS px) picks a
+  // thumbnail instead of the full picture.
+  getAvatarUrl: (userId, version, size) => {
+    const params = new URLSearchParams();
+    if (version) params.set('v', version);
+    if (size) params.set('size', Math.ceil(size * (window.devicePixelRatio || 1)));
+    const query = params.toString();
+    return `${BACKEND_URL}/api/settings/avatar/${userId}${query ? `?${query}` : ''}`;
+  },
   getSignedAvatarUrl: async (userId) => {
     const res = await api.get(`/settings/avatar-token/${userId}`);
     return `${BACKEND_URL}/api/settings/avatar/full/${userId}?sig=${res.data.token}`;
@@ -202,7 +271,7 @@ export const settingsAPI = {
     if (label) fd.append('label', label);
     return api.post('/settings/personal-docs/upload', fd, { headers: { 'Content-Type': 'multipart/form-data' } });
   },
-  getPersonalDocUrl: (docId) => fileUrl(`settings/personal-docs/${docId}`),
+  getSignedPersonalDocUrl: (docId) => signedFileUrl(`settings/personal-docs/${docId}`),
   deletePersonalDoc: (docId) => api.delete(`/settings/personal-docs/${docId}`),
   verifyPassword: (password) => api.post('/settings/verify-password', { password }),
   getLoginActivity: () => api.get('/settings/login-activity'),
@@ -226,7 +295,7 @@ export const announcementAPI = {
 // Academic endpoints
 export const academicAPI = {
   getMySemesters: () => api.get('/academics/my-semesters'),
-  getAllResources: () => api.get('/academics/all-resources'),
+  getAllResources: (params = {}) => api.get('/academics/all-resources', { params }),
   getSubjectSections: (semesterId, subjectId) =>
     api.get(`/academics/${semesterId}/subjects/${subjectId}/sections`),
   createSubjectSection: (semesterId, subjectId, name) =>
@@ -247,6 +316,12 @@ export const academicAPI = {
     api.delete(`/academics/${semesterId}/subjects/${subjectId}/sections/${sectionId}/folders/${folderId}`),
   getResources: (semesterId, params) => api.get(`/academics/${semesterId}/resources`, { params }),
   upload: (semesterId, file, subjectId, category, onUploadProgress, folderId, isPublic = true) => {
+    if (file.size > RESUMABLE_THRESHOLD) {
+      return resumableUpload('academic', file, {
+        semester_id: semesterId, subject_id: subjectId, category,
+        ...(folderId && { folder_id: folderId }), is_public: isPublic,
+      }, onUploadProgress);
+    }
     const fd = new FormData();
     fd.append('file', file);
     if (subjectId) fd.append('subject_id', subjectId);
@@ -274,7 +349,13 @@ export const academicAPI = {
   deleteResource: (semesterId, resourceId) =>
     api.delete(`/academics/${semesterId}/resources/${resourceId}`),
   getChatFiles: (semesterId) => api.get(`/academics/${semesterId}/chat-files`),
-  getFileUrl: (resourceId) => fileUrl(`academics/file/${resourceId}`),
+  getSignedFileUrl: (resourceId) => signedFileUrl(`academics/file/${resourceId}`),
+  /** Signed URL for an entry of getAllResources, whichever store it comes from. */
+  getSignedResourceUrl: (r) => {
+    if (r.source === 'chat_unlinked') return signedFileUrl(`chat/file/${r.chat_message_id}`);
+    if (r.source === 'document') return signedFileUrl(`document/${r.document_id}/download`);
+    return signedFileUrl(`academics/file/${r.id}`);
+  },
 };
 
 // DM (direct message) endpoints
@@ -282,6 +363,9 @@ export const dmAPI = {
   sendMessage: (classroomId, toUserId, text, extra = {}) =>
     api.post(`/dm/${classroomId}/send`, { to_user_id: toUserId, text, ...extra }),
   uploadFile: (classroomId, toUserId, file, text = '') => {
+    if (file.size > RESUMABLE_THRESHOLD) {
+      return resumableUpload('dm', file, { classroom_id: classroomId, to_user_id: toUserId, text });
+    }
     const fd = new FormData();
     fd.append('file', file);
     if (text) fd.append('text', text);
@@ -298,7 +382,7 @@ export const dmAPI = {
   getUnreadCount: () => api.get('/dm/unread-count'),
   deleteMessage: (classroomId, messageId, mode = '') =>
     api.delete(`/dm/${classroomId}/messages/${messageId}`, { params: mode ? { mode } : {} }),
-  getDmFileUrl: (messageId) => fileUrl(`dm/file/${messageId}`),
+  getSignedDmFileUrl: (messageId) => signedFileUrl(`dm/file/${messageId}`),
   getMemberStats: (classroomId) => api.get(`/dm/${classroomId}/member-stats`),
   getUnreadBySender: (classroomId) => api.get(`/dm/${classroomId}/unread-by-sender`),
   getUnreadByClassroom: () => api.get('/dm/unread-by-classroom'),
@@ -313,11 +397,18 @@ export const timetableAPI = {
     api.post(`/timetable/semester/${semesterId}/extract`, formData, {
       headers: { 'Content-Type': 'multipart/form-data' },
     }),
+  getExtraction: (semesterId, jobId) => api.get(`/timetable/semester/${semesterId}/extract/${jobId}`),
   save: (semesterId, data) => api.post(`/timetable/semester/${semesterId}`, data),
+  patchCell: (semesterId, day, slot, cell) =>
+    api.patch(`/timetable/semester/${semesterId}/cell`, { day, slot, cell }),
   get: (semesterId) => api.get(`/timetable/semester/${semesterId}`),
   getWeek: (semesterId, date) =>
     api.get(`/timetable/semester/${semesterId}/week`, { params: date ? { date } : {} }),
   getToday: (semesterId) => api.get(`/timetable/semester/${semesterId}/today`),
+  getSchedule: (semesterId, start, end) =>
+    api.get(`/timetable/semester/${semesterId}/schedule`, { params: { start, end } }),
+  getCalendarFeed: () => api.get('/timetable/feed'),
+  resetCalendarFeed: () => api.post('/timetable/feed/reset'),
 
   // Overrides
   addOverride: (semesterId, data) => api.post(`/timetable/semester/${semesterId}/override`, data),
@@ -346,8 +437,11 @@ export const timetableAPI = {
 // AI Study Tools endpoints  (all per-document — no subject/semester dependency)
 export const aiAPI = {
   // ── PDF management ────────────────────────────────────────────────────────
-  uploadPdf: (formData) =>
-    api.post('/ai/pdf/upload', formData, { headers: { 'Content-Type': 'multipart/form-data' } }),
+  uploadPdf: (formData) => {
+    const file = formData.get('file');
+    if (file?.size > RESUMABLE_THRESHOLD) return resumableUpload('ai_pdf', file);
+    return api.post('/ai/pdf/upload', formData, { headers: { 'Content-Type': 'multipart/form-data' } });
+  },
   listPdfs:          ()                  => api.get('/ai/pdf/list'),
   reindexPdf:        (pdfId)             => api.post(`/ai/pdf/${pdfId}/reindex`),
   deletePdf:         (pdfId)             => api.delete(`/ai/pdf/${pdfId}`),